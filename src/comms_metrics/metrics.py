@@ -26,8 +26,10 @@ import pandas as pd
 import numpy as np
 from sklearn.metrics import mean_squared_error
 import itertools
-import networkx as nx
 import pyproj
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial import cKDTree, ConvexHull, Delaunay, QhullError
 import os
 from joblib import Parallel, delayed
 import logging
@@ -47,6 +49,164 @@ with open(config_file, 'r') as file:
 logger = logging.getLogger(__name__)
 
 
+class MeterNeighbors:
+    """ Spatial index of the meter positions for the metrics.
+
+    The meters are put in a KD-tree once, so the metrics for a
+    radius only look at the meters near each other instead of
+    all the pairs of meters. This keeps the memory linear in
+    the number of meters, so models with 100k+ meters can be
+    evaluated.
+
+    Args:
+        names (list) - Names of the meters.
+
+        pos_x (list) - The 'x' positions of the meters, for
+        example the longitude values.
+
+        pos_y (list) - The 'y' positions of the meters, for
+        example the latitude values.
+
+        unit (str) - The unit of measurement of the positions,
+        'feet' or 'geo'.
+
+    Returns:
+        MeterNeighbors (obj) - An object that answers the radius
+        counts, ranges and island counts of the meters.
+    """
+
+    def __init__(self, names, pos_x, pos_y, unit):
+        """ This initializes the class."""
+        self.names = np.asarray(names)
+        self.index = {n: i for i, n in enumerate(self.names)}
+        x = np.asarray(pos_x, dtype=float)
+        y = np.asarray(pos_y, dtype=float)
+        if unit == 'geo':
+            # Projecting the longitude-latitude pairs once to an
+            # azimuthal equidistant plane, in feet, centered on the
+            # meters. Over the size of a feeder, the distances in
+            # this plane match the geodesic distances closely.
+            #   IMPORTANT: The longitude MUST be the "x" values.
+            proj = pyproj.Proj(proj='aeqd', lon_0=np.mean(x), lat_0=np.mean(y),
+                               datum='WGS84', units='ft')
+            x, y = proj(x, y)
+        self.xy = np.column_stack([x, y])
+        self.tree = cKDTree(self.xy)
+        self.mst_distances = None
+        self.mst_radius = 0.0
+        self.far_points = None
+
+    def counts(self, radius):
+        """ Counts the meters within the radius of each meter,
+        not counting the meter itself.
+
+        Args:
+            radius (float) - Distance (in feet) to count the
+            meters near each meter.
+
+        Returns:
+            counts (array) - Number of meters near each meter.
+        """
+        return self.tree.query_ball_point(self.xy, radius, return_length=True) - 1
+
+    def meter_count(self, meter, radius):
+        """ Counts the meters within the radius of one meter,
+        not counting the meter itself."""
+        return self.tree.query_ball_point(self.xy[self.index[meter]], radius, return_length=True) - 1
+
+    def ranges(self, chunk=10000):
+        """ Finds the distance from each meter to the meter
+        farthest from it.
+
+        The farthest meter is always a corner of the convex hull
+        of the meters, so only the distances to those corners are
+        calculated.
+
+        Args:
+            chunk (int) - Number of meters to calculate at once.
+
+        Returns:
+            ranges (array) - The maximum distance from each meter.
+        """
+        far = self.xy[self._far_points()]
+        ranges = np.empty(len(self.xy))
+        for i in range(0, len(self.xy), chunk):
+            delta = self.xy[i:i + chunk, None, :] - far[None, :, :]
+            ranges[i:i + chunk] = np.sqrt(np.square(delta).sum(axis=2)).max(axis=1)
+        return ranges
+
+    def meter_range(self, meter):
+        """ Finds the distance from one meter to the meter
+        farthest from it."""
+        delta = self.xy[self._far_points()] - self.xy[self.index[meter]]
+        return np.sqrt(np.square(delta).sum(axis=1)).max()
+
+    def island_counts(self, radii):
+        """ Counts the islands of meters for each radius.
+
+        Two meters are in the same island when there is a path
+        between them with hops no longer than the radius. The
+        islands for all radii come from one minimum spanning
+        tree of the meters: each tree edge no longer than the
+        radius joins two islands.
+
+        Args:
+            radii (list) - List of distances (in feet).
+
+        Returns:
+            islands (array) - Number of islands for each radius.
+        """
+        max_radius = np.max(radii)
+        if self.mst_distances is None or max_radius > self.mst_radius:
+            self.mst_distances, self.mst_radius = self._spanning_tree(max_radius)
+        joined = np.searchsorted(self.mst_distances, np.asarray(radii, dtype=float), side='right')
+        return len(self.xy) - joined
+
+    def _candidate_edges(self, max_radius):
+        # The minimum spanning tree of points in a plane only
+        # uses edges of their Delaunay triangulation, so these
+        # are the only pairs of meters we need to look at.
+        # Duplicate positions are left out of the triangulation,
+        # so they get joined to their twin meter here.
+        # Also returns the longest radius the edges are good for.
+        try:
+            tri = Delaunay(self.xy)
+        except (QhullError, ValueError):
+            # Fewer than 3 meters, or all of them on one line:
+            # the pairs within max_radius only give the tree
+            # edges up to that radius.
+            pairs = self.tree.query_pairs(max_radius, output_type='ndarray')
+            return pairs[:, 0], pairs[:, 1], max_radius
+        simplices = tri.simplices
+        start = np.concatenate([simplices[:, 0], simplices[:, 1], simplices[:, 2], tri.coplanar[:, 0]])
+        end = np.concatenate([simplices[:, 1], simplices[:, 2], simplices[:, 0], tri.coplanar[:, 2]])
+        return start, end, np.inf
+
+    def _spanning_tree(self, max_radius):
+        n = len(self.xy)
+        if n < 2:
+            return np.zeros(0), np.inf
+        start, end, covered = self._candidate_edges(max_radius)
+        dist = np.sqrt(np.square(self.xy[start] - self.xy[end]).sum(axis=1))
+        # Shifting all the weights by 1 keeps the same tree, and keeps
+        # the edges of meters at the same position (zero weight is
+        # "no edge" for a sparse graph).
+        graph = coo_matrix((dist + 1.0, (start, end)), shape=(n, n)).tocsr()
+        mst = minimum_spanning_tree(graph)
+        return np.sort(mst.data - 1.0), covered
+
+    def _far_points(self):
+        if self.far_points is None:
+            try:
+                self.far_points = ConvexHull(self.xy).vertices
+            except (QhullError, ValueError):
+                # Fewer than 3 meters, or all of them on one line:
+                # the ends of the line are the extremes of x or y.
+                self.far_points = np.unique([np.argmin(self.xy[:, 0]), np.argmax(self.xy[:, 0]),
+                                             np.argmin(self.xy[:, 1]), np.argmax(self.xy[:, 1])])
+        return self.far_points
+
+
 class EvaluateSystem:
     """ Evaluates the power distribution system model.
 
@@ -113,6 +273,7 @@ class EvaluateSystem:
         # are provided in the functions below.
         self.distance_dataframe = None
         self.perm_df = None
+        self.neighbors = None
         self.dens_df = None
         self.range_df = None
         self.iso_df = None
@@ -265,6 +426,37 @@ class EvaluateSystem:
         logger.info('finished calculating the distances.')
         return distance_dataframe
 
+    def get_neighbors(self):
+        """ This function builds the spatial index of the meters
+        that the metrics below use and saves it as an attribute.
+
+        Unlike get_distances, it does not keep the distance
+        between every pair of meters, so it also works for
+        models with a very large number of meters.
+
+        Args:
+            (null)
+
+        Returns:
+            neighbors (MeterNeighbors) - The spatial index of
+            the meters in a given meter network (aka model).
+        """
+        logger.info('........................................')
+        logger.info('building the spatial index of the meters')
+        # The names and positions of the meters, in the same
+        # order as the model:
+        df = self.dataframe.drop_duplicates('name')
+        self.neighbors = MeterNeighbors(
+            df['name'].values, df[self.pos_x].values,
+            df[self.pos_y].values, self.unit)
+        logger.info('finished building the spatial index.')
+        return self.neighbors
+
+    def _neighbors(self):
+        if self.neighbors is None:
+            self.get_neighbors()
+        return self.neighbors
+
     def meter_density(self, meter, radius):
         """ This function returns the number of meters within
         a distance of x from the meter in question.
@@ -290,14 +482,9 @@ class EvaluateSystem:
         logger.info('Finding all the meters within {} (ft) of {}'.format(radius, meter))
         assert isinstance(radius, float), \
             'Oops, {} is not a float.'.format(radius)
-        # Grabbing the dataframe that has all the calculated
-        # distances between all the meters:
-        dd = self.distance_dataframe
-        reduced_dd = dd[(dd.start == meter)
-                        & (dd.distance <= radius)]
         # Counting the total number of meters within a certain
         # distance:
-        total_meters = len(reduced_dd)
+        total_meters = int(self._neighbors().meter_count(meter, radius))
         logger.info('The number of meters within {} (ft) of {} is {}.'.format(radius, meter, total_meters))
         return total_meters
 
@@ -320,13 +507,9 @@ class EvaluateSystem:
         """
         logger.info('........................................')
         logger.info('Finding the largest radius where {} is the center'.format(meter))
-        # Grabbing the dataframe that has all the calculated
-        # distances between all the meters:
-        dd = self.distance_dataframe
-        # Setting the given meter as the center:
-        reduced_dd = dd[dd.start == meter]
-        # Finding the maximum distance:
-        radius = np.max(reduced_dd['distance'])
+        # Finding the maximum distance with the given meter
+        # as the center:
+        radius = self._neighbors().meter_range(meter)
         logger.info('{} (ft) captures all meters with {} as the center'.format(radius, meter))
         return radius
 
@@ -354,19 +537,14 @@ class EvaluateSystem:
         assert isinstance(radius, float), 'Oops, {} is not a float.'.format(radius)
         logger.info('........................................')
         logger.info('Counting all the isolated meters within {} (ft)'.format(radius))
-        # Grabbing the dataframe that has all the calculated
-        # distances between all the meters:
-        dd = self.distance_dataframe.copy()
-        # Checking whether the calculated distances are
-        # bigger than the given radius:
-        bools = ['T' if d > radius else 'F' for d in dd.distance]
-        dd['is_isolated'] = bools
-        gpd = dd.groupby('start')
-        # Counting all the isolated meters:
-        gpd_df = gpd['is_isolated'].value_counts().to_frame(name='total_count').reset_index()
-        isolated_count = len(gpd_df[
-                                 (gpd_df.is_isolated == 'T') &
-                                 (gpd_df.total_count == len(self.meters) - 1)]['start'].values[:])
+        # Counting the meters with no other meters within
+        # the given radius (a single meter is not isolated
+        # from anything):
+        nb = self._neighbors()
+        if len(nb.names) < 2:
+            isolated_count = 0
+        else:
+            isolated_count = int(np.count_nonzero(nb.counts(radius) == 0))
         logger.info('{} meters are isolated within {} (ft)'.format(isolated_count, radius))
         return isolated_count
 
@@ -397,25 +575,12 @@ class EvaluateSystem:
         logger.info('Checking to see if paths exist between any {} {} {}'.
                     format('two meters within', radius, 'feet.'))
         assert isinstance(radius, float), 'Oops, {} is not a float.'.format(radius)
-        # Grabbing the dataframe that has all the calculated
-        # distances between all meters:
-        dd = self.distance_dataframe.copy()
-        # Reducing the dataframe to meters that have distances
-        # less than or equal to the given radius:
-        reduced_dd = dd[dd.distance <= radius]
-        # Creating sets of the "start" and "end" meters:
-        dd_set1 = set(dd.start.unique())
-        dd_set2 = set(dd.end.unique())
-        r_set1 = set(reduced_dd.start.unique())
-        r_set2 = set(reduced_dd.end.unique())
-        # If the reduced dataframe still has all the
-        # "start" and "end" meters from the original
-        # dataframe, then a path exists between any two
-        # meters in the model because all their distances
-        # are less than or equal to the given radius.
+        # If every meter has at least one other meter within
+        # the given radius, then a path exists between any two
+        # meters in the model.
         # Otherwise, a path doesn't exist and the model
         # is not continuous.
-        if dd_set1 == r_set1 and dd_set2 == r_set2:
+        if self.isolated_meter_count(radius) == 0:
             logger.info('\tPaths exists between any two nodes.')
             logger.info('\tThus, there is continuity across the network of meters.')
             continuity = True
@@ -455,20 +620,10 @@ class EvaluateSystem:
         logger.info('Counting how many meters have {} meters within {}'.format(y, radius))
         assert isinstance(radius, float), 'Oops! {} is not a float.'.format(radius)
         assert isinstance(y, int), 'Oops! {} is not an int.'.format(y)
-        # Grabbing the dataframe that has all the calculated
-        # distances between all meters:
-        dd = self.distance_dataframe.copy()
-        # Checking if the distance is less than or equal to
-        # the given radius:
-        bools = ['T' if d <= radius else 'F' for d in dd.distance]
-        dd['within_radius'] = bools
-        gpd = dd.groupby('start')
         # Counting how may meters have "y" meters
-        # within a certain radius:
-        gpd_df = gpd['within_radius'].value_counts().to_frame(name='total_count').reset_index()
-        single_hop_count = len(gpd_df[
-                                   (gpd_df.within_radius == 'T') &
-                                   (gpd_df.total_count >= y)]['start'].values[:])
+        # within a certain radius (and at least one):
+        counts = self._neighbors().counts(radius)
+        single_hop_count = int(np.count_nonzero((counts >= y) & (counts > 0)))
         logger.info(
             'There are {} meters that have {} meters within {} feet.'.format(
                 single_hop_count, y, radius))
@@ -496,30 +651,30 @@ class EvaluateSystem:
             the model.
         """
         assert isinstance(radius, float), 'Oops! {} is not a float.'.format(radius)
-        # Grabbing the dataframe that has all the calculated
-        # distances between all meters:
-        dd = self.distance_dataframe.copy()
-        # Creating a NetworkX object:
-        G = nx.Graph()
-        # Adding data from the dataframe to
-        # the graph:
-        G.add_edges_from(
-            [(u, v, {'distance': d}) for u, v, d in zip(
-                dd['start'], dd['end'], dd['distance'])])
-        for e in G.edges:
-            d = G.get_edge_data(e[0], e[1])['distance']
-            # If the distance between two meters is
-            # greater than the given radius, we remove
-            # the edge from the graph.
-            # Checking if the distance between two
-            # meters is greater than the specified radius:
-            if d > radius:
-                G.remove_edge(e[0], e[1])
-        # Counting the number of connected components,
-        # which we treat as islands:
-        island_count = nx.number_connected_components(G)
+        # Counting the groups of meters connected by hops
+        # no longer than the given radius, which we treat
+        # as islands:
+        island_count = int(self.all_island_counts([radius])[0])
         return island_count
 
+    def all_island_counts(self, radii):
+        """ This function returns the number of islands in
+        the model for each of the radii.
+
+        Args:
+            radii (list) - List of distances to count how
+            many islands there are in the model.
+
+        Returns:
+            islands (array) - The number of islands for each
+            radius.
+        """
+        nb = self._neighbors()
+        # A model with a single meter has no connections at all:
+        if len(nb.names) < 2:
+            return np.zeros(len(radii), dtype=int)
+        return nb.island_counts(radii)
+
     def all_densities(self, radii):
         """ Calculates all densities for all meters for
         all radii.
@@ -542,18 +697,12 @@ class EvaluateSystem:
         """
         logger.info('........................................')
         logger.info('Counting the number of meters nearby within each radius.')
-        # Grabbing the dataframe that has all the calculated
-        # distances between all meters:
-        dd = self.distance_dataframe.copy()
         df_list = []
         for rad in radii:
             assert isinstance(rad, float), 'Oops! {} is not a float.'.format(rad)
-            # Reducing the dataframe to meters with distances
-            # less than or equal to the given radius:
-            reduced_dd = dd[dd.distance <= rad]
             # Counting how many meters are within that radius
             # of each of the meters as the center:
-            gpd_df = reduced_dd.groupby('start')['start'].count().to_frame(name='count').reset_index()
+            gpd_df = self._radius_counts(rad, 'count')
             gpd_df['radius'] = [rad] * len(gpd_df)
             gpd_df['meter'] = gpd_df['start']
             df_list.append(gpd_df)
@@ -574,6 +723,15 @@ class EvaluateSystem:
             'Finished counting the number of meters nearby.')
         return dens
 
+    def _radius_counts(self, radius, name):
+        # The number of meters within the radius of each meter, for
+        # the meters that have any, sorted by the meter name:
+        nb = self._neighbors()
+        counts = nb.counts(radius)
+        keep = counts > 0
+        gpd_df = pd.DataFrame({'start': nb.names[keep], name: counts[keep]})
+        return gpd_df.sort_values('start', kind='stable', ignore_index=True)
+
     def all_ranges(self):
         """ Calculates all the meter ranges for all meters
         as the center of each circle.
@@ -595,14 +753,14 @@ class EvaluateSystem:
             '........................................')
         logger.info(
             'Getting all the maximum radii for each meter as the center.')
-        # Grabbing the dataframe that has all the calculated
-        # distances between all meters:
-        dd = self.distance_dataframe.copy()
         # Finding the maximum distance to capture all
         # the meters in the circle around each meter
         # as the center:
-        gpd_df = dd.groupby('start')['distance'].max().to_frame(
-            name='radius').reset_index()
+        nb = self._neighbors()
+        gpd_df = pd.DataFrame({'start': nb.names, 'radius': nb.ranges()})
+        if len(gpd_df) < 2:
+            gpd_df = gpd_df.iloc[:0]
+        gpd_df = gpd_df.sort_values('start', kind='stable', ignore_index=True)
         gpd_df['model_name'] = [self.model_name] * len(gpd_df)
         gpd_df['feeder'] = [self.feeder] * len(gpd_df)
         ranges = gpd_df['radius']
@@ -720,20 +878,13 @@ class EvaluateSystem:
         logger.info('........................................')
         logger.info('Counting the number of meters that have {}'.format(
                 'a given number of meters nearby within each radius.'))
-        # Grabbing the dataframe that has all the calculated
-        # distances between all meters:
-        dd = self.distance_dataframe.copy()
         df_list = []
         for rad in radii:
             assert isinstance(rad, float), \
                 'Oops! {} is not a float.'.format(rad)
-            # Reducing the dataframe to meters with distances
-            # less than or equal to the given radius:
-            reduced_dd = dd[dd.distance <= rad]
             # Counting how many meters are withing the given
             # radius near each of the meters as the center:
-            gpd_df = reduced_dd.groupby('start')['start'].count() \
-                .to_frame(name='total_count').reset_index()
+            gpd_df = self._radius_counts(rad, 'total_count')
             gpd_df['radius'] = [rad] * len(gpd_df)
             df_list.append(gpd_df)
         dens_df = pd.concat(df_list, axis=0, ignore_index=True)
@@ -781,9 +932,9 @@ class EvaluateSystem:
         """
         for rad in radii:
             assert isinstance(rad, float), 'Oops! {} is not a float.'.format(rad)
-        # Getting the island count for each radius:
-        islands_tup = [
-            (rad, self.island_count(rad)) for rad in radii]
+        # Getting the island count for each radius, all
+        # at once from the same spanning tree:
+        islands_tup = list(zip(radii, self.all_island_counts(radii).tolist()))
         # Creating a dataframe of the results to be used
         # elsewhere:
         island_df = pd.DataFrame({
@@ -955,6 +1106,9 @@ class EvaluateSystem:
             fns = [self.all_isolates, self.all_single_hops,
                    self.all_continuous, self.all_densities,
                    self.all_islands]
+            # Building the spatial index once, before the
+            # threads share it:
+            self._neighbors()
             # This speeds up going through the functions by
             # parallelization:
             delayed_fns = [delayed(fn)(radii) for fn in fns]
@@ -151,10 +151,9 @@ class Entity:
         Returns:
              Item:
         """
-        try:
-            return self.__getattribute__(item)
-        except:
-            return None
+        if type(item) == str:
+            return getattr(self, item, None)
+        return None
 
     def set_instance(self, object_name, params):
         """ Set the Entity instance the given set of parameters
@@ -166,23 +165,16 @@ class Entity:
             Entity instance: an object with name and values
         """
         if type(object_name) == str:
-            try:
-                instance = self.instances[object_name]
-            except:
-                self.instances[object_name] = {}
-                instance = self.instances[object_name]
+            instance = self.instances.get(object_name)
+            if instance is None:
+                instance = self.instances[object_name] = {}
 
             for attr in params:
                 item = self.find_item(attr)
                 if type(item) == Item:
-                    try:
-                        _ = instance[attr]
-                    except:
-                        if type(attr) == str:
-                            instance[attr] = {}
-                        else:
-                            print("Attribute id is not a string in", self.entity, "named", object_name)
-                            continue
+                    if type(attr) != str and attr not in instance:
+                        print("Attribute id is not a string in", self.entity, "named", object_name)
+                        continue
                 else:
                     # add to dictionary datatype, label, unit, item, value
                     if self.find_item("parent") or self.find_item("configuration"):
@@ -205,11 +197,10 @@ class Entity:
             Entity instance: an object with name and values or None when object_name is invalid
         """
         if type(object_name) == str:
-            try:
-                return self.instances[object_name]
-            except:
-                self.instances[object_name] = {}
-                return self.instances[object_name]
+            instance = self.instances.get(object_name)
+            if instance is None:
+                instance = self.instances[object_name] = {}
+            return instance
         else:
             print("object name is not a string in", self.entity)
         return None
@@ -43,6 +43,10 @@ Public Functions:
         based on household income level, vintage, and building type.
     :selectResidentialBuilding: Retrieve the thermal integrity level by
         building type and region.
+    :getDsoThermalCdf: Cumulative distribution of the DSO thermal table,
+        computed once per income level.
+    :selectResidentialBuildings: Retrieve the building type and thermal
+        integrity level of many transformers at once.
     :selectThermalProperties: Retrieve the building thermal properties by
         building type and thermal integrity level.
     :add_houses: Add houses, along with solar panels, batteries, and electric
@@ -75,9 +79,11 @@ Public Functions:
         parentage of the parent_mtr.
 
     Electric_Vehicle
-    :add_ev: Define and add electric vehicle charging object to the house, under the parentage of the house object
+    :add_ev: Select an electric vehicle for the house, to be added by add_pending_evs
+    :add_pending_evs: Match driving schedules for all selected vehicles at once and add their charging objects
     :selectEVmodel: Select the EV model based on available sale distribution data
     :match_driving_schedule: Method to match the schedule of each vehicle from NHTS data based on vehicle ev_range
+    :match_driving_schedules: Match the schedules of many vehicles in one call
     :is_drive_time_valid: Check if work arrival time and home arrival time add up properly
     :process_nhts_data: Read the large NHTS survey data file containing driving data, process it, and return a dataframe
 
@@ -90,25 +96,33 @@ Public Functions:
     transformer to determine the number of houses it should have
     :identify_commercial_loads: For the full-order feeders, scan each load with
     load_class==C to determine the number of zones it should have
+    :populate_partitions: Populate each secondary transformer and commercial
+    load as its own partition, in a process pool when num_core allows
+    :merge_partition: Add the objects of one populated partition to the model
 
 """
 
+import hashlib
 import logging as log
 import math
 import json
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
 
 from tesp_support.api.helpers import gld_strict_name, random_norm_trunc, randomize_residential_skew
 from tesp_support.api.modify_GLM import GLMModifier
-from tesp_support.api.time_helpers import get_secs_from_hhmm, get_hhmm_from_secs, get_duration, get_dist
-from tesp_support.api.time_helpers import is_hhmm_valid, subtract_hhmm_secs, add_hhmm_secs
+from tesp_support.api.time_helpers import get_secs_from_hhmm, get_hhmm_from_secs_array, get_dist
+from tesp_support.api.time_helpers import add_hhmm_secs
 from tesp_support.api.entity import assign_defaults
 from tesp_support.api.recs_gld_house_parameters import get_RECS_jsons
 
 extra_billing_meters = set()
+CACHE_VERSION = 1
+NHTS_COLUMNS = ['STRTTIME', 'TRAVDAY', 'ENDTIME', 'TRPMILES']
 
 log.basicConfig(level=log.WARNING)
 log.getLogger('matplotlib.font_manager').disabled = True
@@ -117,6 +131,9 @@ class Config:
     def __init__(self, config=None):
         # Assign default values to those not defined in config file
         self.keys = list(assign_defaults(self, config).keys())
+        # folder of the cached metadata in data_path, none if not configured
+        cache_dir = getattr(self, 'cache_dir', '')
+        self.cache_path = os.path.join(self.data_path, cache_dir) if cache_dir else None
         self.glm = GLMModifier()
         self.mdl = self.glm.glm
         self.base = self.glm.defaults
@@ -207,7 +224,8 @@ class Config:
                 self.sample,
                 self.bin_size_threshold,
                 self.region,
-                self.wh_shift
+                self.wh_shift,
+                self.cache_path
             )
 
     def load_recs(self) -> None:
@@ -246,7 +264,8 @@ class Config:
 
         assign_defaults(self.batt, os.path.join(self.data_path, self.file_battery_meta))
         assign_defaults(self.ev, os.path.join(self.data_path, self.file_ev_meta))
-        self.base.ev_driving_metadata = self.ev.process_nhts_data(os.path.join(self.data_path, self.file_ev_driving_meta))
+        self.base.ev_driving_metadata = self.ev.process_nhts_data(os.path.join(self.data_path, self.file_ev_driving_meta),
+                                                                  self.cache_path)
 
     def load_position(self) -> dict | None:
         """ Read in positional data from feeder, if specified in config, to
@@ -279,6 +298,8 @@ class Residential_Build:
         self.config = config
         self.glm = config.glm
         self.mdl = config.glm.glm
+        # getDsoThermalCdf by state, DSO type and income level
+        self.thermal_cdf = {}
 
     def buildingTypeLabel(self, rgn: int, bldg: int, therm_int: int) -> list:
         """Assign formatted name of region, building type name, and thermal
@@ -523,6 +544,48 @@ class Residential_Build:
         col = len(rgnTable[row]) - 1
         return row, col
 
+    def getDsoThermalCdf(self, inc_lev: int) -> np.ndarray:
+        """Cumulative distribution of getDsoThermalTable, flattened by
+        building type, computed once per state, DSO type and income level.
+
+        Args:
+            inc_lev (int): index of the income level in the config income_level
+
+        Returns:
+            np.ndarray: cumulative fraction of each building type and vintage
+        """
+
+        income = self.config.income_level[inc_lev]
+        key = (self.config.state, self.config.res_dso_type, income)
+        cdf = self.thermal_cdf.get(key)
+        if cdf is None:
+            cdf = np.cumsum(self.getDsoThermalTable(income))
+            self.thermal_cdf[key] = cdf
+        return cdf
+
+    def selectResidentialBuildings(self, inc_levs: np.ndarray, probs: np.ndarray) -> tuple:
+        """Retrieve the building type and thermal integrity level of many
+        transformers at once, as selectResidentialBuilding does for one.
+
+        Args:
+            inc_levs (np.ndarray): income level of each transformer
+            probs (np.ndarray): probability of each transformer
+
+        Returns:
+            np.ndarray: building type of each transformer
+            np.ndarray: thermal integrity level of each transformer
+        """
+
+        idx = np.zeros(len(probs), dtype=int)
+        ncol = 1
+        for inc_lev in np.unique(inc_levs):
+            cdf = self.getDsoThermalCdf(int(inc_lev))
+            sel = inc_levs == inc_lev
+            idx[sel] = np.minimum(np.searchsorted(cdf, probs[sel]), len(cdf) - 1)
+            # three building types, in rows of vintage
+            ncol = len(cdf) // 3
+        return np.divmod(idx, ncol)
+
     def selectThermalProperties(self, bldg: int, therm_int: int) -> list:
         """Retrieve the building thermal properties by building type and
         thermal integrity level.
@@ -1733,25 +1796,18 @@ class Electric_Vehicle:
         self.config = config
         self.glm = config.glm
         self.ev_count = 0
+        # vehicles selected by add_ev, waiting for add_pending_evs
+        self.pending = []
 
     def add_ev(self, ev_prob: float, house_name: str) -> None:
-        """Define and add electric vehicle charging object to the house, under
-        the parentage of the house object.
+        """Select an electric vehicle and charger for the house. The vehicle
+        is added to the model by add_pending_evs, which matches the driving
+        schedules of all the selected vehicles at once.
 
         Args:
             ev_prob (float): probability distribution of houses with EVs 
             house_name (str): name of house object
 
-        Raises:
-            UserWarning: Raises "daily travel miles for EV cannot be more than 
-                range of the vehicle!" if daily drive miles exceeds EV range.
-            UserWarning: Raises "invalid HHMM format of driving time!" if home
-                arrival, leave, or work arrival times are of invalid format.
-            UserWarning: Raises: "invalid home or work duration for ev!" if home
-                or work duration exceeds hours of day.
-            UserWarning: Raises: "home and work arrival time are not consistent
-                with durations!" if EV drive time is not valid.
-
         Returns:
             None
         """
@@ -1760,7 +1816,6 @@ class Electric_Vehicle:
         ev_name = Electric_Vehicle.selectEVmodel(self.config.ev.sale_probability, rng.random())
         ev_range = self.config.ev.Range_miles[ev_name]
         ev_mileage = self.config.ev.Miles_per_kWh[ev_name]
-        ev_charge_eff = self.config.ev.charging_efficiency
         # Check if level 1 charger is used or level 2
         if rng.random() <= self.config.ev.Level_1_usage:
             ev_max_charge = self.config.ev.Level_1_max_power_kW
@@ -1768,39 +1823,73 @@ class Electric_Vehicle:
         else:
             ev_max_charge = self.config.ev.Level_2_max_power_kW[ev_name]
             volt_conf = 'IS220'  # for level 2 charger, must be 220 V
-        # Map a random driving schedule with this vehicle ensuring daily miles
-        # doesn't exceed the vehicle range and home duration is enough to charge the vehicle
-        drive_sch = self.config.ev.match_driving_schedule(ev_range, ev_mileage, ev_max_charge)
-        if drive_sch['daily_miles'] > ev_range:
+
+        if rng.random() <= ev_prob:
+            self.pending.append((house_name, ev_name, volt_conf, ev_range, ev_mileage, ev_max_charge))
+
+    def add_pending_evs(self) -> None:
+        """Map a random driving schedule to each vehicle selected by add_ev,
+        ensuring daily miles don't exceed the vehicle range and home duration
+        is enough to charge the vehicle, then add the charging objects.
+
+        Raises:
+            UserWarning: Raises "daily travel miles for EV cannot be more than 
+                range of the vehicle!" if daily drive miles exceeds EV range.
+            UserWarning: Raises "invalid HHMM format of driving time!" if home
+                arrival, leave, or work arrival times are of invalid format.
+            UserWarning: Raises: "invalid home or work duration for ev!" if home
+                or work duration exceeds hours of day.
+            UserWarning: Raises: "home and work arrival time are not consistent
+                with durations!" if EV drive time is not valid.
+
+        Returns:
+            None
+        """
+
+        if len(self.pending) == 0:
+            return
+        house_name, ev_name, volt_conf, ev_range, ev_mileage, ev_max_charge = zip(*self.pending)
+        self.pending = []
+        drive_sch = self.match_driving_schedules(ev_range, ev_mileage, ev_max_charge)
+
+        if np.any(drive_sch['daily_miles'] > np.array(ev_range)):
             raise UserWarning('daily travel miles for EV cannot be more than range of the vehicle!')
-        if (not is_hhmm_valid(drive_sch['home_arr_time']) or
-            not is_hhmm_valid(drive_sch['home_leave_time']) or
-            not is_hhmm_valid(drive_sch['work_arr_time'])):
+        hhmm = np.concatenate([drive_sch['home_arr_time'], drive_sch['home_leave_time'], drive_sch['work_arr_time']])
+        if np.any((hhmm < 0) | (hhmm // 100 > 23) | (hhmm % 100 > 59)):
             raise UserWarning('invalid HHMM format of driving time!')
-        if drive_sch['home_duration'] > 24 * 3600 or drive_sch['home_duration'] < 0 or \
-                drive_sch['work_duration'] > 24 * 3600 or drive_sch['work_duration'] < 0:
+        durations = np.concatenate([drive_sch['home_duration'], drive_sch['work_duration']])
+        if np.any((durations > 24 * 3600) | (durations < 0)):
             raise UserWarning('invalid home or work duration for ev!')
-        if not Electric_Vehicle.is_drive_time_valid(drive_sch):
+        # as is_drive_time_valid, for all the vehicles
+        leave_secs = get_secs_from_hhmm(drive_sch['home_arr_time']) + drive_sch['home_duration']
+        leave_secs = np.where(leave_secs > 24 * 3600, leave_secs - 24 * 3600, leave_secs)
+        commute_secs = np.minimum(3600, 24 * 3600 - drive_sch['home_duration'])
+        work_arr_secs = get_secs_from_hhmm(get_hhmm_from_secs_array(leave_secs)) + commute_secs / 2
+        work_arr_secs = np.where(work_arr_secs > 24 * 3600, work_arr_secs - 24 * 3600, work_arr_secs)
+        work_duration = 24 * 3600 - drive_sch['home_duration'] - commute_secs
+        if (np.any(get_hhmm_from_secs_array(work_arr_secs) != drive_sch['work_arr_time']) or
+                np.any(np.round(work_duration / 60) != np.round(drive_sch['work_duration'] / 60))):
             raise UserWarning('home and work arrival time are not consistent with durations!')
 
-        if rng.random() <= ev_prob:
+        drive_sch = {key: val.tolist() for key, val in drive_sch.items()}
+        for i in range(len(house_name)):
             self.ev_count += 1
-            params = {"parent": house_name,
-                        "configuration": volt_conf,
+            params = {"parent": house_name[i],
+                        "configuration": volt_conf[i],
                         "breaker_amps": 1000,
                         "battery_SOC": 100.0,
-                        "travel_distance": drive_sch['daily_miles'],
-                        "arrival_at_work": drive_sch['work_arr_time'],
-                        "duration_at_work": drive_sch['work_duration'],
-                        "arrival_at_home": drive_sch['home_arr_time'],
-                        "duration_at_home": '{}; // (secs)'.format(drive_sch['home_duration']),
+                        "travel_distance": drive_sch['daily_miles'][i],
+                        "arrival_at_work": drive_sch['work_arr_time'][i],
+                        "duration_at_work": drive_sch['work_duration'][i],
+                        "arrival_at_home": drive_sch['home_arr_time'][i],
+                        "duration_at_home": '{}; // (secs)'.format(drive_sch['home_duration'][i]),
                         "work_charging_available": "FALSE",
-                        "maximum_charge_rate": ev_max_charge * 1000,
-                        "mileage_efficiency": ev_mileage,
-                        "mileage_classification": ev_range,
-                        "charging_efficiency": ev_charge_eff}
-            ev_name = ev_name.replace(" ","_")
-            self.glm.add_object("evcharger_det", f'{ev_name}_{self.ev_count}', params)
+                        "maximum_charge_rate": ev_max_charge[i] * 1000,
+                        "mileage_efficiency": ev_mileage[i],
+                        "mileage_classification": ev_range[i],
+                        "charging_efficiency": self.config.ev.charging_efficiency}
+            name = ev_name[i].replace(" ","_")
+            self.glm.add_object("evcharger_det", f'{name}_{self.ev_count}', params)
             self.glm.add_collector("class=evcharger_det", "sum(actual_charge_rate)", "EV_charging_total.csv")
             self.glm.add_group_recorder("class=evcharger_det", "actual_charge_rate", "EV_charging_power.csv")
             self.glm.add_group_recorder("class=evcharger_det", "battery_SOC", "EV_SOC.csv")
@@ -1857,45 +1946,81 @@ class Electric_Vehicle:
             home_leave_time, home_duration, work_arr_time, work_duration}
         """
 
-        while True:
-            mile_ind = rng.integers(0, len(self.config.base.ev_driving_metadata['TRPMILES']))
-            daily_miles = self.config.base.ev_driving_metadata['TRPMILES'].iloc[mile_ind]
-            if ev_range * 0.0 < daily_miles < ev_range * (1 - self.config.ev_reserved_soc / 100):
-                break
-        daily_miles = max(daily_miles, ev_range * 0.2)
-        home_leave_time = self.config.base.ev_driving_metadata['STRTTIME'].iloc[mile_ind]
-        home_arr_time = self.config.base.ev_driving_metadata['ENDTIME'].iloc[mile_ind]
-        home_duration = get_duration(home_arr_time, home_leave_time)
+        driving_sch = self.match_driving_schedules([ev_range], [ev_mileage], [ev_max_charge])
+        return {key: val.tolist()[0] for key, val in driving_sch.items()}
+
+    def match_driving_schedules(self, ev_range, ev_mileage, ev_max_charge) -> dict:
+        """Match the schedules of many vehicles from NHTS data in one call,
+        as match_driving_schedule does for one. The NHTS trips are sorted by
+        daily miles, so the trips within the range of a vehicle are a slice
+        and each vehicle draws one of them uniformly.
+
+        Args:
+            ev_range (list): range of each EV, in miles
+            ev_mileage (list): miles per kWh of each EV
+            ev_max_charge (list): max charge rate of each EV, in kW
+
+        Raises:
+            UserWarning: if no NHTS trip is within the range of an EV, raise:
+                'No NHTS driving schedule is within the range of a particular EV!'
+            UserWarning: if the required charge time exceeds 23 hours, raise: 
+                'A particular EV can not be charged fully even within 23 hours!'
+
+        Returns:
+            dict: driving_sch of arrays, one entry per vehicle, containing
+            {daily_miles, home_arr_time, home_leave_time, home_duration,
+            work_arr_time, work_duration}
+        """
+
+        trips = self.config.base.ev_driving_metadata
+        miles = trips['TRPMILES'].to_numpy()
+        ev_range = np.asarray(ev_range, dtype=float)
+        ev_mileage = np.asarray(ev_mileage, dtype=float)
+        ev_max_charge = np.asarray(ev_max_charge, dtype=float)
+
+        low = np.searchsorted(miles, 0.0, side='right')
+        high = np.searchsorted(miles, ev_range * (1 - self.config.ev_reserved_soc / 100), side='left')
+        if np.any(high <= low):
+            raise UserWarning('No NHTS driving schedule is within the range of a particular EV!')
+        mile_ind = rng.integers(low, high)
+        daily_miles = np.maximum(miles[mile_ind], ev_range * 0.2)
+        home_leave_time = trips['STRTTIME'].to_numpy()[mile_ind].astype(int)
+        home_arr_time = trips['ENDTIME'].to_numpy()[mile_ind]
+        leave_secs = get_secs_from_hhmm(home_leave_time)
+        home_duration = leave_secs - get_secs_from_hhmm(home_arr_time)
+        home_duration = np.where(home_leave_time > home_arr_time, home_duration, home_duration + 24 * 3600)
 
         margin_miles = daily_miles * 0.10  # 10% extra miles
         charge_hour_need = (daily_miles + margin_miles) / (ev_max_charge * ev_mileage)  # hours
 
         min_home_need = charge_hour_need + 2
-        if min_home_need >= 23:
+        if np.any(min_home_need >= 23):
             raise UserWarning('A particular EV can not be charged fully even within 23 hours!')
-        if home_duration < min_home_need * 3600:  # if home duration is less than required minimum
-            home_duration = min_home_need * 3600
-        if home_duration > 23 * 3600:
-            home_duration = 23 * 3600 - 1  # -1 to ensure work duration is not 0 with 1 hour commute time
+        # if home duration is less than required minimum
+        home_duration = np.maximum(home_duration, min_home_need * 3600)
+        # -1 to ensure work duration is not 0 with 1 hour commute time
+        home_duration = np.where(home_duration > 23 * 3600, 23 * 3600 - 1, home_duration)
         # Update home arrival time
-        home_arr_time = subtract_hhmm_secs(home_leave_time, home_duration)
+        arr_secs = leave_secs - home_duration
+        arr_secs = np.where(arr_secs < 0, arr_secs + 24 * 3600, arr_secs)
+        home_arr_time = get_hhmm_from_secs_array(arr_secs)
 
         # Estimate work duration and arrival time, in secs
-        commute_duration = min(3600, 24 * 3600 - home_duration)
-         
+        commute_duration = np.minimum(3600, 24 * 3600 - home_duration)
+
         # Estimate remaining time at work
-        work_duration = max(24 * 3600 - (home_duration + commute_duration), 1)  
+        work_duration = np.maximum(24 * 3600 - (home_duration + commute_duration), 1)
         # minimum work duration is 1 sec to avoid 0 that may give error in GridLABD
-        work_arr_secs = get_secs_from_hhmm(home_leave_time) + int(commute_duration / 2)
-        if work_arr_secs > 24 * 3600:  # if midnight crossing
-            work_arr_secs = work_arr_secs - 24 * 3600
-        work_arr_time = get_hhmm_from_secs(work_arr_secs)
+        work_arr_secs = leave_secs + np.trunc(commute_duration / 2)
+        # if midnight crossing
+        work_arr_secs = np.where(work_arr_secs > 24 * 3600, work_arr_secs - 24 * 3600, work_arr_secs)
+        work_arr_time = get_hhmm_from_secs_array(work_arr_secs)
 
         driving_sch = {'daily_miles': daily_miles,
-                       'home_arr_time': int(home_arr_time),
-                       'home_leave_time': int(home_leave_time),
+                       'home_arr_time': home_arr_time,
+                       'home_leave_time': home_leave_time,
                        'home_duration': home_duration,
-                       'work_arr_time': int(work_arr_time),
+                       'work_arr_time': work_arr_time,
                        'work_duration': work_duration
                        }
         return driving_sch
@@ -1922,18 +2047,36 @@ class Electric_Vehicle:
         return True
 
     # EV population functions
-    def process_nhts_data(self, data_file: str) -> pd.DataFrame:
+    def process_nhts_data(self, data_file: str, cache_dir=None) -> pd.DataFrame:
         """Read the large NHTS survey data file containing driving data, process
-            it, and return a dataframe.
+            it, and return a dataframe sorted by daily miles, for
+            match_driving_schedules. With a cache_dir, the processed data are
+            saved there as .npz, keyed by the size and time of the data file
+            and the EV ranges, so the survey is only read again after either
+            changes.
 
         Args:
             data_file (str): path of the file
+            cache_dir (str): folder of the processed data, or None to always read the survey
 
         Returns:
             dataframe: df_fin, containing start_time, end_time, travel_day
                 (weekday/weekend) and daily miles driven
         """
 
+        max_ev_range = max(self.Range_miles.values())
+        cache_file = None
+        if cache_dir:
+            st = os.stat(data_file)
+            stamp = '{}|{}|{}|{!r}'.format(CACHE_VERSION, st.st_size, st.st_mtime_ns, max_ev_range)
+            digest = hashlib.sha1(stamp.encode('utf-8')).hexdigest()
+            name = os.path.splitext(os.path.basename(data_file))[0]
+            cache_file = os.path.join(cache_dir, '{}_{}.npz'.format(name, digest[:16]))
+            if os.path.isfile(cache_file):
+                with np.load(cache_file) as npz:
+                    index = pd.MultiIndex.from_arrays([npz['HOUSEID'], npz['VEHID']], names=['HOUSEID', 'VEHID'])
+                    return pd.DataFrame({col: npz[col] for col in NHTS_COLUMNS}, index=index)
+
         # Read data from NHTS survey
         df_data = pd.read_csv(data_file, index_col=[0, 1])
         # Filter based on trip leaving only from home and not from work or other
@@ -1949,7 +2092,6 @@ class Electric_Vehicle:
         # Limit daily miles to maximum possible range of EV from the EV model
         # data, as EVs can't travel more than their range in a day if we don't
         # consider highway charging.
-        max_ev_range = max(self.Range_miles.values())
         df_data_miles = df_data_miles[df_data_miles < max_ev_range]
         df_data_miles = df_data_miles[df_data_miles > 0]
 
@@ -1957,6 +2099,22 @@ class Electric_Vehicle:
         # Ignore vehicle IDs that don't have both leaving and arrival time at home
         temp = df_data_leave.merge(df_data_arrive['ENDTIME'], left_index=True, right_index=True)
         df_fin = temp.merge(df_data_miles, left_index=True, right_index=True)
+        df_fin = df_fin.sort_values('TRPMILES', kind='stable')[NHTS_COLUMNS]
+
+        if cache_file is not None:
+            arrays = {col: df_fin[col].to_numpy() for col in NHTS_COLUMNS}
+            for level in ['HOUSEID', 'VEHID']:
+                values = df_fin.index.get_level_values(level).to_numpy()
+                arrays[level] = values.astype(str) if values.dtype == object else values
+            tmp_file = cache_file + '.' + str(os.getpid())
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(tmp_file, 'wb') as fp:
+                    np.savez(fp, **arrays)
+                # concurrent feeder runs only ever see a complete file
+                os.replace(tmp_file, cache_file)
+            except OSError as ex:
+                print("Could not cache NHTS data {} in {}: {}".format(data_file, cache_dir, ex))
         return df_fin
 
 class Feeder:
@@ -1978,15 +2136,29 @@ class Feeder:
 
         # Identify and add residential loads
         self.identify_xfmr_houses('transformer', self.seg_loads, 0.001 * self.config.avg_house, self.config.region)
-        for key in self.config.base.house_nodes:
-            self.config.res_bld.add_houses(key, 120.0)
-        for key in self.config.base.small_nodes:
-            self.config.res_bld.add_small_loads(key, 120.0)
-
-        # Identify and add commercial loads
-        self.identify_commercial_loads('load', 0.001 * self.config.avg_commercial)
-        for key in self.config.base.comm_loads:
-            self.config.com_bld.define_commercial_zones(config.region, key, self.config.com_bld.total_comm_kva)
+        num_core = getattr(self.config, 'num_core', 0)
+        if num_core == 0:
+            for key in self.config.base.house_nodes:
+                self.config.res_bld.add_houses(key, 120.0)
+            self.config.ev.add_pending_evs()
+            for key in self.config.base.small_nodes:
+                self.config.res_bld.add_small_loads(key, 120.0)
+
+            # Identify and add commercial loads
+            self.identify_commercial_loads('load', 0.001 * self.config.avg_commercial)
+            for key in self.config.base.comm_loads:
+                self.config.com_bld.define_commercial_zones(config.region, key, self.config.com_bld.total_comm_kva)
+        else:
+            # Identify commercial loads up front, so that one pool populates both
+            self.identify_commercial_loads('load', 0.001 * self.config.avg_commercial)
+            results = self.populate_partitions(num_core)
+            houses = len(self.config.base.house_nodes)
+            for result in results[:houses]:
+                self.merge_partition(result)
+            for key in self.config.base.small_nodes:
+                self.config.res_bld.add_small_loads(key, 120.0)
+            for result in results[houses:]:
+                self.merge_partition(result)
         #self.glm.add_voltage_class('node', self.config.vln, self.config.vll, self.secnode)
         #self.glm.add_voltage_class('meter',config.vln, self.config.vll, self.secnode)
         #self.glm.add_voltage_class('load', self.config.vln, self.config.vll, self.secnode)
@@ -2172,6 +2344,7 @@ class Feeder:
             entity = self.mdl.__getattribute__(gld_class)
         except:
             return
+        nodes = []
         for e_name, e_object in entity.items():
             if e_name in seg_loads:
                 tkva = seg_loads[e_name][0]
@@ -2187,18 +2360,22 @@ class Feeder:
                         total_houses += 1
                         lg_v_sm = tkva / avg_house - self.config.res_bld.nhouse
                         # > 0 if we rounded down the number of houses
-                        # Get the income level for the dso_type and state
-                        inc_lev = self.config.res_bld.selectIncomeLevel(dso_income_pct, rng.random())
-                        # Get the vintage table for dso_type, state, and income level
-                        dsoThermalPct = self.config.res_bld.getDsoThermalTable(self.config.income_level[inc_lev])
-                        bldg, ti = self.config.res_bld.selectResidentialBuilding(dsoThermalPct, rng.random())
-                        if bldg == 0:
-                            total_sf += 1
-                        elif bldg == 1:
-                            total_apt += 1
-                        else:
-                            total_mh += 1
-                        self.config.base.house_nodes[node] = [self.config.res_bld.nhouse, rgn, lg_v_sm, phs, bldg, ti, inc_lev]
+                        nodes.append([node, self.config.res_bld.nhouse, lg_v_sm, phs])
+
+        # Select the income level, then the building type and vintage, for
+        # all the transformers; the draws alternate as in one at a time
+        probs = rng.random((len(nodes), 2))
+        income_cdf = np.cumsum(dso_income_pct)
+        inc_levs = np.minimum(np.searchsorted(income_cdf, probs[:, 0]), len(income_cdf) - 1)
+        bldgs, tis = self.config.res_bld.selectResidentialBuildings(inc_levs, probs[:, 1])
+        for (node, nhouse, lg_v_sm, phs), bldg, ti, inc_lev in zip(nodes, bldgs.tolist(), tis.tolist(), inc_levs.tolist()):
+            if bldg == 0:
+                total_sf += 1
+            elif bldg == 1:
+                total_apt += 1
+            else:
+                total_mh += 1
+            self.config.base.house_nodes[node] = [nhouse, rgn, lg_v_sm, phs, bldg, ti, inc_lev]
         print('Results in a populated feeder with:')
         print(f"    {total_small} small loads totaling {total_small_kva:.2f} kVA")
         print(f"    {total_houses} houses added to {len(self.config.base.house_nodes)} transformers")
@@ -2306,8 +2483,9 @@ class Feeder:
                 extra_billing_meters.add(mtr)
                 self.config.base.comm_loads[e_name] = [mtr, comm_type, comm_size, kva, nphs, phases, vln, total_commercial, comm_name]
                 removenames.append(e_name)
-        for e_name in removenames:
-            self.glm.del_object(gld_class, e_name)
+        with self.glm.model.batch():
+            for e_name in removenames:
+                self.glm.del_object(gld_class, e_name)
         
         if e_object['load_class'] != 'C':
             return None
@@ -2330,6 +2508,123 @@ class Feeder:
         log.info('The {} commercial loads and {} streetlights (ZIPloads) totaling {:.2f} kVA added to this feeder'.
                  format(total_commercial, total_zipload, self.config.com_bld.total_comm_kva))
 
+    def populate_partitions(self, num_core: int = None) -> list:
+        """ Populate each secondary transformer in house_nodes and each
+        load in comm_loads as its own partition. Every partition draws from
+        a random stream seeded by the config seed and its position, so the
+        result does not depend on the number of workers.
+
+        Args:
+            num_core (int): number of worker processes, None for all cores, 1 to populate in this process
+        Returns:
+            list: the result of each partition, houses first, for merge_partition
+        """
+        jobs = [(_HOUSES, i, key) for i, key in enumerate(self.config.base.house_nodes)]
+        jobs += [(_COMMERCIAL, i, key) for i, key in enumerate(self.config.base.comm_loads)]
+        payload = _partition_payload(self.config)
+        if num_core == 1:
+            _init_partition(payload)
+            return [_populate_partition(*job) for job in jobs]
+        # a few chunks per worker keeps them busy without a round trip per partition
+        chunk = max(1, len(jobs) // (4 * (num_core or os.cpu_count())))
+        with ProcessPoolExecutor(max_workers=num_core, initializer=_init_partition, initargs=(payload,)) as pool:
+            return list(pool.map(_populate_partition, *zip(*jobs), chunksize=chunk))
+
+    def merge_partition(self, result: dict) -> None:
+        """ Add the objects of one populated partition to the model, in the
+        order they were generated, and add its DER to the feeder totals. EV
+        chargers are numbered again across the whole feeder.
+
+        Args:
+            result (dict): one partition returned by populate_partitions
+        Returns:
+            None
+        """
+        ev = self.config.ev
+        for gld_type, name, params in result['objects']:
+            if gld_type == 'evcharger_det':
+                ev.ev_count += 1
+                name = '{}_{}'.format(name.rsplit('_', 1)[0], ev.ev_count)
+            self.glm.add_object(gld_type, name, params)
+        self.config.pos.update(result['pos'])
+        self.config.sol.solar_count += result['solar_count']
+        self.config.sol.solar_kw += result['solar_kw']
+        self.config.batt.battery_count += result['battery_count']
+        self.config.batt.battery_capacity_count += result['battery_capacity_count']
+
+
+_HOUSES = 0
+_COMMERCIAL = 1
+_partition_config = None
+
+
+def _partition_holders(config):
+    return [config, config.res_bld, config.com_bld, config.sol, config.batt, config.ev]
+
+
+def _partition_payload(config):
+    # everything but the model being populated, which the workers rebuild,
+    # and the defaults, which are class attributes and do not pickle
+    holders = _partition_holders(config)
+    saved = [dict(holder.__dict__) for holder in holders]
+    try:
+        for holder in holders:
+            holder.glm = None
+            if hasattr(holder, 'mdl'):
+                holder.mdl = None
+        base = {key: val for key, val in vars(config.base).items() if not key.startswith('__')}
+        return pickle.dumps((config, base), protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for holder, state in zip(holders, saved):
+            holder.__dict__.update(state)
+
+
+def _init_partition(payload):
+    global _partition_config
+    config, base = pickle.loads(payload)
+    glm = GLMModifier()
+    for key, val in base.items():
+        setattr(glm.defaults, key, val)
+    for holder in _partition_holders(config):
+        holder.glm = glm
+        if hasattr(holder, 'mdl'):
+            holder.mdl = glm.glm
+    config.base = glm.defaults
+    _partition_config = config
+
+
+def _populate_partition(kind, index, key):
+    global rng
+    config = _partition_config
+    model = config.glm.model
+    rng = np.random.default_rng([config.seed, kind, index])
+    np.random.seed([config.seed, kind, index])
+    config.pos = {}
+    config.sol.solar_count = config.sol.solar_kw = 0
+    config.batt.battery_count = config.batt.battery_capacity_count = 0
+    config.ev.ev_count = 0
+
+    model.journal = []
+    if kind == _HOUSES:
+        config.res_bld.add_houses(key, 120.0)
+        config.ev.add_pending_evs()
+    else:
+        config.com_bld.define_commercial_zones(config.region, key, config.com_bld.total_comm_kva)
+    objects = model.journal
+    model.journal = None
+    # start the next partition from an empty model
+    model.model = {}
+    for entity in model.object_entities.values():
+        entity.instances.clear()
+
+    return {'objects': objects,
+            'pos': config.pos,
+            'solar_count': config.sol.solar_count,
+            'solar_kw': config.sol.solar_kw,
+            'battery_count': config.batt.battery_count,
+            'battery_capacity_count': config.batt.battery_capacity_count}
+
+
 def _test1():
     data_path = os.path.expandvars('$TESPDIR/examples/capabilities/feeder-generator/')
     config_file = 'feeder_config.json5'
@@ -2,6 +2,7 @@
 # See LICENSE file at https://github.com/pnnl/tesp
 # file: metrics_api.py
 
+import numpy as np
 import pandas as pd
 import logging as log_msg
 
@@ -82,6 +83,53 @@ def synch_series(time_series, synch_interval, interval_unit):
     return sampled_series
 
 
+def _get_window_frame(time_series, metrics, window_starts, window_minutes=60, skipna=True):
+    if not time_series.index.is_monotonic_increasing:
+        order = np.argsort(time_series.index.values, kind='stable')
+    else:
+        order = None
+    index = time_series.index if order is None else time_series.index[order]
+    lo, hi = bc.get_window_bounds(index, window_starts, window_minutes)
+    # stack the metrics that share a reduction, so each reduction is one pass over the data
+    groups = {}
+    for name, (data, how) in metrics.items():
+        if np.ndim(data) == 0:
+            data = time_series[data]
+        values = np.asarray(data, dtype=float)
+        if order is not None:
+            values = values[order]
+        groups.setdefault(how, []).append((name, values))
+    columns = {}
+    for how, group in groups.items():
+        reduced = bc.window_reduce(np.column_stack([values for _, values in group]), lo, hi, how, skipna)
+        for j, (name, _) in enumerate(group):
+            columns[name] = reduced[:, j]
+    return pd.DataFrame({name: columns[name] for name in metrics}, index=window_starts)
+
+
+def get_window_metrics(time_series, metrics, start_date_time, duration, window_minutes=60):
+    """ Function evaluates a set of metrics over the same consecutive time windows in one pass
+
+    The windows start at start_date_time and cover duration hours; each window includes the
+    records at both its starting and ending times, as the hourly valuation metrics do.
+
+    Args:
+        time_series (dataframe): time series dataframe that contains the data
+        metrics (dict): maps the name of each result column to a tuple of its data, which is either the id of
+            a time_series column or values aligned with the time_series rows, and its reduction, which is one of
+            "min", "max", "mean", "sum", "count" or "size"
+        start_date_time (str): the starting date and time when the calculation should start
+        duration (int): the length of time in hours which the calculations should be executed
+        window_minutes (int): the length of each window in minutes
+    Returns:
+        dataframe: time series dataframe indexed by the start of each window, with one column per metric
+    """
+    st_time = pd.to_datetime(start_date_time)
+    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
+    calc_times = bc.get_window_starts(st_time, ts_end_time, window_minutes)
+    return _get_window_frame(time_series, metrics, calc_times, window_minutes)
+
+
 def get_avg_customer_demand(time_series, start_date, val_col_id):
     """ This function calculates the average of customer demand based on 8,760 hours of the year
 
@@ -118,17 +166,10 @@ def get_under_voltage_count(time_series, val_col_id, minimum_value):
     """
     st_time = time_series.index[0]
     ts_end_time = time_series.index[-1]
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_counts = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        count_dataframe = calc_dataframe.loc[calc_dataframe[val_col_id] < minimum_value]
-        calc_counts.append(len(count_dataframe.index))
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(calc_counts), index=calc_times)
+    calc_times = bc.get_window_starts(st_time, ts_end_time)
+    under = time_series[val_col_id] < minimum_value
+    counts = _get_window_frame(time_series, {0: (under, 'sum')}, calc_times)
+    df = counts.astype(int)
     return df
 
 
@@ -147,22 +188,24 @@ def get_valuation(time_series, start_date, column_index):
             values as a time series, a float representing the 14th percentile of the values, and a float representing
             the 86th percentile of the values
     """
-    time_indexes = []
-    time_values = []
     val_df = []
     avg_start = pd.to_datetime(start_date)
-    end_date = bc.adjust_date_time(avg_start, "hours", 24)
-    averaging_time_series = time_series.query('index >= @avg_start and index < @end_date')
-    while len(averaging_time_series.index) > 0:
-        avg_df = averaging_time_series.mean()
-        valuation = avg_df[column_index]
-        time_indexes.append(end_date)
-        time_values.append(valuation)
-        avg_start = end_date
-        end_date = bc.adjust_date_time(avg_start, "hours", 24)
-        averaging_time_series = time_series.query('index >= @avg_start and index <= @end_date')
-    if len(time_indexes) > 0:
-        val_df = pd.DataFrame(time_values, index=time_indexes)
+    time_series = time_series.sort_index(kind='stable')
+    index = time_series.index
+    if len(index) > 0:
+        # the first day excludes its ending time; the rest include it, and the valuation
+        # stops at the first day without any records
+        day = pd.Timedelta(hours=24)
+        count = max(int((index[-1] - avg_start) // day) + 2, 1)
+        starts = bc.get_window_starts(avg_start, avg_start + count * day, 24 * 60)
+        lo, hi = bc.get_window_bounds(index, starts, 24 * 60)
+        hi[0] = index.searchsorted(avg_start + day, side='left')
+        empty = np.flatnonzero(hi <= lo)
+        days = empty[0] if len(empty) > 0 else len(starts)
+        time_values = bc.window_reduce(time_series[column_index].to_numpy(dtype=float), lo[:days], hi[:days], 'mean')
+        time_indexes = starts[:days] + day
+        if len(time_indexes) > 0:
+            val_df = pd.DataFrame(time_values, index=time_indexes)
     percentile_14 = time_series[column_index].quantile(0.14)
     percentile_86 = time_series[column_index].quantile(0.86)
     return val_df, percentile_14, percentile_86
@@ -318,24 +361,11 @@ def get_transmission_voltage_magnitude(time_series, column_id, start_date, durat
     Returns:
         dataframe: the calculated hourly min, max, and average values in a time series dataframe
     """
-    col_names = ["min", "max", "avg"]
-    calc_times = []
-    calc_mins = []
-    calc_maxs = []
-    calc_avgs = []
-    st_time = pd.to_datetime(start_date)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_mins.append(calc_dataframe.min()[column_id])
-        calc_maxs.append(calc_dataframe.max()[column_id])
-        calc_avgs.append(calc_dataframe.mean()[column_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-
-    df = pd.DataFrame(list(zip(calc_mins, calc_maxs, calc_avgs)), columns=col_names, index=calc_times)
+    df = get_window_metrics(time_series, {
+        'min': (column_id, 'min'),
+        'max': (column_id, 'max'),
+        'avg': (column_id, 'mean')
+    }, start_date, duration)
     return df
 
 
@@ -356,31 +386,26 @@ def get_feeder_energy_losses(feeder_gen_df, gen_column_id, feeder_load_df, load_
     Returns:
         dataframe: a dataframe object containing the generation, load, and losses data
     """
-    calc_times = []
-    calc_losses = []
-    calc_gens = []
-    calc_loads = []
-    col_names = ['feeder_generation', 'feeder_load', 'energy_loss']
     check_string = bc.check_dataframe_synchronization(feeder_gen_df, feeder_load_df)
     if check_string != "Synchronized":
         log_msg.log(log_msg.ERROR, check_string)
         return None
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    total_loss = 0
-    while end_time <= ts_end_time:
-        gen_dataframe = feeder_gen_df.query('index >= @st_time and index <= @end_time')
-        load_dataframe = feeder_load_df.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_gens.append(gen_dataframe.mean()[gen_column_id])
-        calc_loads.append(load_dataframe.mean()[load_column_id])
-        total_loss = 0
-        total_loss = gen_dataframe.sum()[gen_column_id] - load_dataframe.sum()[load_column_id]
-        calc_losses.append(total_loss / (len(gen_dataframe.index) - 1))
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_gens, calc_loads, calc_losses)), columns=col_names, index=calc_times)
+    gen_df = get_window_metrics(feeder_gen_df, {
+        'feeder_generation': (gen_column_id, 'mean'),
+        'total': (gen_column_id, 'sum'),
+        'records': (gen_column_id, 'size')
+    }, start_date_time, duration)
+    load_df = get_window_metrics(feeder_load_df, {
+        'feeder_load': (load_column_id, 'mean'),
+        'total': (load_column_id, 'sum')
+    }, start_date_time, duration)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calc_losses = (gen_df['total'] - load_df['total']) / (gen_df['records'] - 1)
+    df = pd.DataFrame({
+        'feeder_generation': gen_df['feeder_generation'],
+        'feeder_load': load_df['feeder_load'],
+        'energy_loss': calc_losses
+    })
     return df
 
 
@@ -444,27 +469,8 @@ def get_max_under_voltage(time_series, column_id, threshold_val, start_date_time
     Returns:
         dataframe: time series dataframe containing the calculated hourly over voltage maximum values
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_maxs = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_diffs = []
-        calc_diffs_times = []
-        i = 0
-        while i < len(calc_dataframe.index):
-            calc_diffs.append(abs(threshold_val - calc_dataframe.iloc[i][column_id]))
-            calc_diffs_times.append(calc_dataframe.index[i])
-            i += 1
-        result_dataframe = pd.DataFrame(list(zip(calc_diffs)), columns=["max_under_voltage"], index=calc_diffs_times)
-        calc_maxs.append(result_dataframe.max()["max_under_voltage"])
-#        calc_dataframe["voltage_violation"] = abs(threshold_val - calc_dataframe[column_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_maxs)), columns=["minimums"], index=calc_times)
+    deviations = (threshold_val - time_series[column_id]).abs()
+    df = get_window_metrics(time_series, {"minimums": (deviations, 'max')}, start_date_time, duration)
     return df
 
 
@@ -482,28 +488,8 @@ def get_max_over_voltage(time_series, column_id, threshold_val, start_date_time,
     Returns:
         dataframe: time series dataframe containing the calculated hourly over voltage maximum values
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_maxs = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-#        calc_dataframe2 = calc_dataframe
-#        calc_dataframe2.loc[:, "voltage_violation_max"] = abs(calc_dataframe[column_id] - threshold_val)
-        calc_diffs = []
-        calc_diffs_times = []
-        i = 0
-        while i < len(calc_dataframe.index):
-            calc_diffs.append(abs(calc_dataframe.iloc[i][column_id] - threshold_val))
-            calc_diffs_times.append(calc_dataframe.index[i])
-            i += 1
-        result_dataframe = pd.DataFrame(list(zip(calc_diffs)), columns=["max_violation"], index=calc_diffs_times)
-        calc_maxs.append(result_dataframe.max()["max_violation"])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_maxs)), columns=["maximums"], index=calc_times)
+    deviations = (time_series[column_id] - threshold_val).abs()
+    df = get_window_metrics(time_series, {"maximums": (deviations, 'max')}, start_date_time, duration)
     return df
 
 
@@ -521,26 +507,8 @@ def get_indoor_air_temp_deviation(time_series, column_id, set_point, start_date_
     Returns:
         dataframe: time series dataframe containing the maximum deviations calculated hourly from the input data
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_maxs = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_diffs = []
-        calc_diffs_times = []
-        i = 0
-        while i < len(calc_dataframe.index):
-            calc_diffs.append(abs(calc_dataframe.iloc[i][column_id] - set_point))
-            calc_diffs_times.append(calc_dataframe.index[i])
-            i += 1
-        result_dataframe = pd.DataFrame(list(zip(calc_diffs)), columns=["max_deviation"], index=calc_diffs_times)
-        calc_maxs.append(result_dataframe.max()["max_deviation"])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_maxs)), columns=["temp_deviations"], index=calc_times)
+    deviations = (time_series[column_id] - set_point).abs()
+    df = get_window_metrics(time_series, {"temp_deviations": (deviations, 'max')}, start_date_time, duration)
     return df
 
 
@@ -559,19 +527,9 @@ def get_max_duration_under_voltage(time_series, column_id, limit_val, start_date
         dataframe: hourly time series dataframe containing the calculated maximum duration of voltage violating
         under-voltage limit
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_durations = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        duration_df = calc_dataframe.loc[calc_dataframe[column_id] < limit_val]
-        calc_durations.append(duration_df.max()[column_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_durations)), columns=["max_durations"], index=calc_times)
+    voltages = time_series[column_id]
+    under = voltages.where(voltages < limit_val)
+    df = get_window_metrics(time_series, {"max_durations": (under, 'max')}, start_date_time, duration)
     return df
 
 
@@ -590,19 +548,9 @@ def get_max_duration_over_voltage(time_series, column_id, limit_val, start_date_
         dataframe: hourly time series dataframe containing the calculated maximum duration of voltage violating
         under-voltage limit
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_durations = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        duration_df = calc_dataframe.loc[calc_dataframe[column_id] > limit_val]
-        calc_durations.append(duration_df.max()[column_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_durations)), columns=["max_durations"], index=calc_times)
+    voltages = time_series[column_id]
+    over = voltages.where(voltages > limit_val)
+    df = get_window_metrics(time_series, {"max_durations": (over, 'max')}, start_date_time, duration)
     return df
 
 
@@ -656,26 +604,15 @@ def get_hot_water_deficit(water_temperatures, water_column_id, desired_temperatu
     if check_string != "Synchronized":
         log_msg.log(log_msg.ERROR, check_string)
         return None
+    index = water_temperatures.index
+    flow_rate = flow_rates[flow_column_id].reindex(index)
+    desired_temp = desired_temperatures[desired_column_id].reindex(index)
+    deficits = flow_rate * (desired_temp - water_temperatures[water_column_id]) * delta_t
     st_time = pd.to_datetime(start_date_time)
     ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_durations = []
-    while end_time <= ts_end_time:
-        calc_dataframe = water_temperatures.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        i = 0
-        hwsd = 0
-        while i < len(calc_dataframe.index):
-            flow_rate = flow_rates.loc[calc_dataframe.index[i]][flow_column_id]
-            desired_temp = desired_temperatures.loc[calc_dataframe.index[i]][desired_column_id]
-            water_temp = water_temperatures.loc[calc_dataframe.index[i]][water_column_id]
-            hwsd += flow_rate * (desired_temp - water_temp) * delta_t
-            i += 1
-        calc_durations.append(hwsd)
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_durations)), columns=["water_deficits"], index=calc_times)
+    calc_times = bc.get_window_starts(st_time, ts_end_time)
+    # a missing value spoils the deficit for its whole hour
+    df = _get_window_frame(water_temperatures, {"water_deficits": (deficits, 'sum')}, calc_times, skipna=False)
     return df
 
 
@@ -847,18 +784,7 @@ def get_substation_peak_power(time_series, power_col_id, start_date_time, durati
     Returns:
         dataframe: time series dataframe containing the calculated hourly peak power flow
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_peaks = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_peaks.append(calc_dataframe.max()[power_col_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_peaks)), columns=["peak_power"], index=calc_times)
+    df = get_window_metrics(time_series, {"peak_power": (power_col_id, 'max')}, start_date_time, duration)
     return df
 
 
@@ -877,20 +803,10 @@ def get_reactive_power_demand(time_series, max_col_id, avg_col_id, start_date_ti
         dataframe: time series dataframe containing the hourly maximum and average values calculated
         by the function
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_maxs = []
-    calc_avgs = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_maxs.append(calc_dataframe.max()[max_col_id])
-        calc_avgs.append(calc_dataframe.mean()[avg_col_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_maxs, calc_avgs)), columns=["hourly_maximum", "hourly_average"], index=calc_times)
+    df = get_window_metrics(time_series, {
+        "hourly_maximum": (max_col_id, 'max'),
+        "hourly_average": (avg_col_id, 'mean')
+    }, start_date_time, duration)
     return df
 
 
@@ -914,19 +830,9 @@ def get_system_energy_losses(feeder_generation_df, gen_col_id, feeder_load_df, f
     if check_string != "Synchronized":
         log_msg.log(log_msg.ERROR, check_string)
         return None
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_losses = []
-    while end_time <= ts_end_time:
-        generation_df = feeder_generation_df.query('index >= @st_time and index <= @end_time')
-        load_df = feeder_load_df.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_losses.append(generation_df.sum()[gen_col_id] - load_df.sum()[feeder_col_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_losses)), columns=["energy_losses"], index=calc_times)
+    generation_df = get_window_metrics(feeder_generation_df, {"total": (gen_col_id, 'sum')}, start_date_time, duration)
+    load_df = get_window_metrics(feeder_load_df, {"total": (feeder_col_id, 'sum')}, start_date_time, duration)
+    df = pd.DataFrame({"energy_losses": generation_df["total"] - load_df["total"]})
     return df
 
 
@@ -943,18 +849,7 @@ def get_total_pv_reactive_power(time_series, pv_col_id, start_date_time, duratio
     Returns:
         dataframe: time series dataframe containing the calculated hourly total reactive power values
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_pv_power = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_pv_power.append(calc_dataframe.sum()[pv_col_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_pv_power)), columns=["pv_reactive_power"], index=calc_times)
+    df = get_window_metrics(time_series, {"pv_reactive_power": (pv_col_id, 'sum')}, start_date_time, duration)
     return df
 
 
@@ -971,18 +866,7 @@ def get_total_pv_real_power(time_series, pv_col_id, start_date_time, duration):
     Returns:
         dataframe:
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_pv_power = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_pv_power.append(calc_dataframe.sum()[pv_col_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_pv_power)), columns=["pv_real_power"], index=calc_times)
+    df = get_window_metrics(time_series, {"pv_real_power": (pv_col_id, 'sum')}, start_date_time, duration)
     return df
 
 
@@ -1006,20 +890,10 @@ def get_system_energy_loss(energy_sold_df, sold_col_id, energy_purchased_df, pur
     if check_string != "Synchronized":
         log_msg.log(log_msg.ERROR, check_string)
         return None
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    purchased_vals = []
-    diffs = []
-    while end_time <= ts_end_time:
-        sold_dataframe = energy_sold_df.query('index >= @st_time and index <= @end_time')
-        purchased_dataframe = energy_purchased_df.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        diffs.append(sold_dataframe.sum()[sold_col_id] - purchased_dataframe.sum()[purchased_col_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(diffs)), columns=["energy_loss"], index=calc_times)
+    sold_df = get_window_metrics(energy_sold_df, {"total": (sold_col_id, 'sum')}, start_date_time, duration)
+    purchased_df = get_window_metrics(energy_purchased_df, {"total": (purchased_col_id, 'sum')},
+                                      start_date_time, duration)
+    df = pd.DataFrame({"energy_loss": sold_df["total"] - purchased_df["total"]})
     return df
 
 
@@ -1036,18 +910,7 @@ def get_total_wind_reactive_power(time_series, power_col_id, start_date_time, du
     Returns:
         dataframe: time series dataframe containing the hourly wind power results
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_wind_power = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_wind_power.append(calc_dataframe.sum()[power_col_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_wind_power)), columns=["wind_reactive_power"], index=calc_times)
+    df = get_window_metrics(time_series, {"wind_reactive_power": (power_col_id, 'sum')}, start_date_time, duration)
     return df
 
 
@@ -1064,18 +927,7 @@ def get_total_wind_real_power(time_series, power_col_id, start_date_time, durati
     Returns:
         dataframe: time series dataframe containing the hourly total wind data results
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_wind_power = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_wind_power.append(calc_dataframe.sum()[power_col_id])
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_wind_power)), columns=["real_wind_power"], index=calc_times)
+    df = get_window_metrics(time_series, {"real_wind_power": (power_col_id, 'sum')}, start_date_time, duration)
     return df
 
 
@@ -1093,18 +945,11 @@ def get_transmission_over_voltage(time_series, voltage_col_id, compare_val, star
     Returns:
         dataframe: time series dataframe containing the hourly transmission over voltage results
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_over_voltage = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_over_voltage.append(bc.get_time_series_max_value_over(calc_dataframe, voltage_col_id, compare_val))
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_over_voltage)), columns=["max_over_voltages"], index=calc_times)
+    voltages = time_series[voltage_col_id]
+    over = voltages.where(voltages > compare_val)
+    df = get_window_metrics(time_series, {"max_over_voltages": (over, 'max')}, start_date_time, duration)
+    # hours without a violation report zero
+    df["max_over_voltages"] = np.fmax(df["max_over_voltages"], 0.0)
     return df
 
 
@@ -1122,18 +967,9 @@ def get_transmission_under_voltage(time_series, voltage_col_id, compare_val, sta
     Returns:
         dataframe: time series dataframe containing the calculated hourly under voltage results
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_under_voltage = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_under_voltage.append(bc.get_time_series_max_value_under(calc_dataframe, voltage_col_id, compare_val))
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_under_voltage)), columns=["max_under_voltage"], index=calc_times)
+    voltages = time_series[voltage_col_id]
+    under = voltages.where(voltages < compare_val)
+    df = get_window_metrics(time_series, {"max_under_voltage": (under, 'max')}, start_date_time, duration)
     return df
 
 
@@ -1150,16 +986,5 @@ def get_wind_energy_production(time_series, prod_col_id, start_date_time, durati
     Returns:
         dataframe: time series dataframe containing the calculated hourly total wind energy results
     """
-    st_time = pd.to_datetime(start_date_time)
-    ts_end_time = bc.adjust_date_time(st_time, "hours", duration)
-    end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    calc_times = []
-    calc_production = []
-    while end_time <= ts_end_time:
-        calc_dataframe = time_series.query('index >= @st_time and index <= @end_time')
-        calc_times.append(st_time)
-        calc_production.append(bc.get_column_total_value(calc_dataframe, prod_col_id))
-        st_time = end_time
-        end_time = bc.adjust_date_time(st_time, "minutes", 60)
-    df = pd.DataFrame(list(zip(calc_production)), columns=["total_production"], index=calc_times)
+    df = get_window_metrics(time_series, {"total_production": (prod_col_id, 'sum')}, start_date_time, duration)
     return df
@@ -47,10 +47,97 @@ def get_time_series_average(time_series, start_date, duration):
     """
     begin_date = pd.to_datetime(start_date)
     end_date = begin_date + pd.offsets.Hour(duration)
-    averaging_time_series = time_series.query('index >= @begin_date and index <= @end_date')
+    averaging_time_series = time_series[(time_series.index >= begin_date) & (time_series.index <= end_date)]
     return averaging_time_series.mean()
 
 
+def get_window_starts(start_date, end_date, window_minutes=60):
+    """ Function returns the starting times of the consecutive windows that fit between two dates
+
+    Args:
+        start_date (datetime): the starting date and time of the first window
+        end_date (datetime): no window may end after this date and time
+        window_minutes (int): the length of each window in minutes
+    Returns:
+        DatetimeIndex: the starting date and time of each window
+    """
+    begin_date = pd.to_datetime(start_date)
+    width = pd.Timedelta(minutes=window_minutes)
+    count = max(int((pd.to_datetime(end_date) - begin_date) // width), 0)
+    return begin_date + pd.to_timedelta(np.arange(count) * window_minutes, unit='min')
+
+
+def get_window_bounds(index, window_starts, window_minutes=60):
+    """ Function locates the records of each window in a sorted time series index
+
+    A window includes the records at both its starting and ending times, so a record on
+    the boundary between two windows belongs to both of them.
+
+    Args:
+        index (DatetimeIndex): sorted index of the time series
+        window_starts (DatetimeIndex): the starting date and time of each window
+        window_minutes (int): the length of each window in minutes
+    Returns:
+        ndarray, ndarray: the position of the first record of each window, and the position after its last record
+    """
+    width = pd.Timedelta(minutes=window_minutes)
+    lo = index.searchsorted(window_starts, side='left')
+    hi = index.searchsorted(window_starts + width, side='right')
+    return lo, hi
+
+
+def window_reduce(values, lo, hi, how, skipna=True):
+    """ Function reduces the records of every window in one pass over the data
+
+    Args:
+        values (ndarray): data in time order, one row per record and optionally one column per series
+        lo (ndarray): position of the first record of each window
+        hi (ndarray): position after the last record of each window
+        how (str): the reduction, one of "min", "max", "mean", "sum", "count" or "size"
+        skipna (bool): if False, a NaN in a window makes its sum NaN, otherwise NaN values are skipped
+    Returns:
+        ndarray: one row per window with the reduced values; windows without data give NaN,
+        except for the sums and counts, which are zero
+    """
+    values = np.asarray(values, dtype=float)
+    lo = np.asarray(lo, dtype=np.intp)
+    hi = np.asarray(hi, dtype=np.intp)
+    size = hi - lo
+    empty = size <= 0
+    if how == 'size':
+        size = np.maximum(size, 0).reshape(size.shape + (1,) * (values.ndim - 1))
+        return size * np.ones(values.shape[1:], dtype=int)
+    if len(lo) < 1:
+        return np.empty(shape=(0,) + values.shape[1:], dtype=float)
+    # reduceat over interleaved (lo, hi) pairs; the odd results span the gaps and are dropped,
+    # and a trailing NaN row keeps hi == len(values) a valid position
+    pad = np.full(shape=(1,) + values.shape[1:], fill_value=np.nan)
+    edges = np.empty(2 * len(lo), dtype=np.intp)
+    edges[0::2] = lo
+    edges[1::2] = hi
+    missing = np.isnan(values)
+    if how == 'max':
+        result = np.fmax.reduceat(np.concatenate([values, pad]), edges)[0::2]
+    elif how == 'min':
+        result = np.fmin.reduceat(np.concatenate([values, pad]), edges)[0::2]
+    elif how == 'count':
+        result = np.add.reduceat(np.concatenate([~missing, pad == 0]), edges)[0::2].astype(float)
+    elif how in ('sum', 'mean'):
+        if skipna:
+            values = np.where(missing, 0.0, values)
+        result = np.add.reduceat(np.concatenate([values, pad]), edges)[0::2]
+        if how == 'mean':
+            count = np.add.reduceat(np.concatenate([~missing, pad == 0]), edges)[0::2]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = np.where(count > 0, result / count, np.nan)
+    else:
+        raise ValueError('Unknown window reduction ' + str(how))
+    empty = empty.reshape(empty.shape + (1,) * (result.ndim - 1))
+    if how in ('sum', 'count'):
+        return np.where(empty, 0.0, result)
+    return np.where(empty, np.nan, result)
+
+
 def get_avg_column_value(time_series, val_index):
     """ Function calculates the mean of the values in a data column of a dataframe
 
@@ -1,34 +1,116 @@
 # Copyright (C) 2017-2024 Battelle Memorial Institute
 # See LICENSE file at https://github.com/pnnl/tesp
 # file: metrics_collector.py
-""" Utility functions for metrics collection within tesp_support, able to write to JSON and HDF5 """
+""" Utility functions for metrics collection within tesp_support, able to write to JSON, HDF5 and Parquet """
 
 import collections
+import copy
 import itertools
 import json
 import logging
 import os.path
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
 
+# size of the array chunks that buffer the rows of a MetricsTable
+CHUNK_BYTES = 4 * 1024 * 1024
+# PyTables is not thread safe, only the frames of different stores are built concurrently
+_hdf_lock = threading.Lock()
+
 
 class MetricsTable(object):
-    def __init__(self, columns, units):
+    """
+    Buffers the rows of the columns sharing one shape. Numeric rows go into a typed array that grows in
+    chunks, other rows (text, or shapes changing between rows) are kept as lists.
+
+    Attributes:
+        columns (list): column names
+        units (list): units of each column
+        num_rows (int): number of rows appended since the last clear
+    """
+
+    def __init__(self, columns, units, chunk_bytes=CHUNK_BYTES):
         assert len(columns) == len(units), 'len(columns) = {} should be equal to len(units) = {}'.format(len(columns),
                                                                                                          len(units))
         self.columns = columns
         self.units = units
-        self.data = list()
+        self.chunk_bytes = chunk_bytes
+        self.num_rows = 0
+        self.row_bytes = 0
+        self.buffer = None
+        self.items = None
+
+    @property
+    def data(self):
+        """ Rows appended since the last clear, an array when they are numeric, else a list """
+        if self.items is not None:
+            return self.items
+        if self.buffer is None:
+            return []
+        return self.buffer[:self.num_rows]
+
+    @property
+    def num_bytes(self):
+        return self.num_rows * self.row_bytes
 
     def append_data(self, data):
         assert len(data) == len(self.columns), 'len(data) = {} should be equal to len(columns) = {}'.format(len(data),
                                                                                                             len(self.columns))
-        self.data.append(data)
+        if self.items is None:
+            row = np.asarray(data)
+            if row.dtype.kind in 'biuf' and (self.buffer is None or row.shape == self.buffer.shape[1:]):
+                self._append_row(row)
+                return
+            # np.asarray converts these rows only when the table is written, as before
+            self.items = [] if self.buffer is None else self.buffer[:self.num_rows].tolist()
+            self.buffer = None
+            self.row_bytes = max(self.row_bytes, 8 * row.size)
+        self.items.append([deepish_copy(v) for v in data])
+        self.num_rows += 1
+
+    def _append_row(self, row):
+        if self.buffer is None:
+            self.row_bytes = max(row.nbytes, 1)
+            rows = max(self.chunk_bytes // self.row_bytes, 1)
+            self.buffer = np.empty((rows,) + row.shape, dtype=row.dtype)
+        elif self.num_rows == len(self.buffer):
+            rows = len(self.buffer) + max(self.chunk_bytes // self.row_bytes, len(self.buffer))
+            grown = np.empty((rows,) + row.shape, dtype=self.buffer.dtype)
+            grown[:self.num_rows] = self.buffer[:self.num_rows]
+            self.buffer = grown
+        dtype = np.result_type(self.buffer.dtype, row.dtype)
+        if dtype != self.buffer.dtype:
+            self.buffer = self.buffer.astype(dtype)
+            self.row_bytes = self.buffer[0].nbytes
+        self.buffer[self.num_rows] = row
+        self.num_rows += 1
+
+    def to_list(self):
+        """ Rows as nested lists of python values """
+        data = self.data
+        return data.tolist() if isinstance(data, np.ndarray) else data
+
+    def detach(self):
+        """ Moves the buffered rows into a new table and leaves this one empty
+
+        Returns:
+            MetricsTable: table holding the rows
+        """
+        table = MetricsTable(self.columns, self.units, self.chunk_bytes)
+        table.num_rows, table.row_bytes, table.buffer, table.items = self.num_rows, self.row_bytes, self.buffer, self.items
+        self.num_rows = 0
+        self.buffer = None
+        self.items = None
+        return table
 
     def clear(self):
-        # this is now compatible with python 2 and 3, as 'list.clear' did not exist pre-3.2
-        del self.data[:]
+        # keeps the array buffer for the next rows
+        self.num_rows = 0
+        self.items = None
 
     def to_frame(self, times, uids, shape, filename=''):
         # logging.debug('times {}'.format(times))
@@ -91,6 +173,7 @@ class MetricsStore(object):
         index_to_shapes (list): shapes of incoming column's units
         file_string (str): the file path (barring extension) which will be appended with "_metrics.{h5, json}"
         collector (MetricsCollector): a common store for these metrics, to ease writing out all metrics/tables
+        num_writes (int): number of times this store has been written out
     """
 
     def __init__(self, name_units_pairs, file_string, collector):
@@ -115,28 +198,50 @@ class MetricsStore(object):
             shape_to_units[shape].append(units)
         # TODO: decide if we want to assert if file_string shouldn't already exist (I don't think so, we may want to append after this metadata dict is wiped every 1-day or so)
         self.file_string = file_string
+        self.collector = collector
+        self.num_writes = 0
         collector.register_metrics_store(self)
         self.shape_to_tables = {s: MetricsTable(columns=shape_to_cols[s], units=shape_to_units[s]) for s in
                                 shape_to_cols.keys()}
 
+    @property
+    def num_bytes(self):
+        return sum(t.num_bytes for t in self.shape_to_tables.values())
+
     def append_data(self, time, uid, *args):
         """
-        Appends a single (time, uid) pair's metrics to appropriate tables (depends on shape of each arg)
+        Appends a single (time, uid) pair's metrics to appropriate tables (depends on shape of each arg),
+        and hands the store to its collector when the buffered rows pass the collector's flush_bytes
 
             time (str or int): time in seconds after start of simulation
             uid (str or int or ?): unique identifier of an object (e.g. a name)
             args (list): an list of length/order equal to name_units_pairs seen when constructing this store
         """
         self.time_uid_pairs.append([time, uid])
-        # bin columns by shape, then update corresponding subtables
+        # bin columns by shape, then update corresponding subtables (which copy the values)
         dct = collections.defaultdict(list)
         assert len(args) == len(
             self.index_to_shapes), 'len(args) = {} should be equal to len(index_to_shape) = {}'.format(len(args),
                                                                                                        len(self.index_to_shapes))
         for s, v in zip(self.index_to_shapes, args):
-            dct[s].append(deepish_copy(v))
+            dct[s].append(v)
         for s, vs in dct.items():
             self.shape_to_tables[s].append_data(vs)
+        flush_bytes = self.collector.flush_bytes
+        if flush_bytes is not None and self.num_bytes >= flush_bytes:
+            self.collector.flush(self)
+
+    def detach(self):
+        """
+        Moves the buffered data into a new store, so it can be written out while this one keeps collecting
+
+        Returns:
+            MetricsStore: store holding the data appended since the last write
+        """
+        store = copy.copy(self)
+        store.shape_to_tables = {s: t.detach() for s, t in self.shape_to_tables.items()}
+        self.time_uid_pairs = list()
+        return store
 
     def clear(self):
         # this is now compatible with python 2 and 3, as 'list.clear' did not exist pre-3.2
@@ -150,26 +255,52 @@ class MetricsCollector(object):
     """
     Metrics collector base class that handles collecting and writing data to disk (.json).
 
+    A store is written out at every write_metrics call and, when flush_bytes is given, as soon as its
+    buffered rows pass that size, so memory use does not grow with the simulation length. With background
+    set, the writes run in a separate thread and the simulation only waits when max_pending stores are queued.
+    Otherwise, with num_threads > 1, write_metrics writes the stores concurrently from a thread pool.
+
     Attributes:
         start_time (pd.Timestamp): the start time of the simulation
         metrics_stores (list): list of MetricsStores holding/growing data
-
+        flush_bytes (int): size of the buffered rows of a store that triggers writing it, None to write only on request
+        writer (threading.Thread): background writer, None when writing in the calling thread
+        executor (ThreadPoolExecutor): pool writing the stores at write_metrics, None when writing them in turn
     """
 
-    def __init__(self, start_time='1970-01-01 00:00:00'):
+    def __init__(self, start_time='1970-01-01 00:00:00', flush_bytes=None, background=False, max_pending=4,
+                 num_threads=1):
         self.start_time = pd.Timestamp(start_time)
         self.metrics_stores = list()
+        self.flush_bytes = flush_bytes
+        self.writer = None
+        self.executor = None
+        if background:
+            self.pending = queue.Queue(maxsize=max_pending)
+            self.writer = threading.Thread(target=self._write_loop, name='MetricsWriter', daemon=True)
+            self.writer.start()
+        elif num_threads > 1:
+            self.executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix='MetricsWriter')
 
     @classmethod
-    def factory(cls, start_time='1970-01-01 00:00:00', write_hdf5=False):
+    def factory(cls, start_time='1970-01-01 00:00:00', write_hdf5=False, write_parquet=False, flush_bytes=None,
+                background=False, num_threads=1):
         """
         Args:
             start_time (str): start time of simulation in datetime string format
             write_hdf5 (bool): flag to determine if we write to .h5 (if True) or .json (if False; defaults to this)
+            write_parquet (bool): flag to write to .parquet instead, needs pyarrow
+            flush_bytes (int): size of the buffered rows of a store that triggers writing it, None to write only on request
+            background (bool): flag to write in a separate thread
+            num_threads (int): number of threads writing the stores at write_metrics, when not in the background
         Returns:
-            MetricsCollector: MetricsCollectorHDF or Base instance, depending on write_hdf5 flag
+            MetricsCollector: MetricsCollectorHDF, MetricsCollectorParquet or Base instance, depending on the flags
         """
-        return MetricsCollectorHDF(start_time) if write_hdf5 else MetricsCollector(start_time)
+        if write_hdf5:
+            return MetricsCollectorHDF(start_time, flush_bytes, background, num_threads=num_threads)
+        if write_parquet:
+            return MetricsCollectorParquet(start_time, flush_bytes, background, num_threads=num_threads)
+        return MetricsCollector(start_time, flush_bytes, background, num_threads=num_threads)
 
     def register_metrics_store(self, metrics_store):
         """
@@ -179,35 +310,120 @@ class MetricsCollector(object):
         logging.debug('registering metrics store with file_string {}'.format(metrics_store.file_string))
         self.metrics_stores.append(metrics_store)
 
+    def _write_loop(self):
+        while True:
+            store = self.pending.get()
+            try:
+                if store is None:
+                    break
+                self.write_store(store)
+            except Exception as e:
+                logging.error('got error when writing metrics for {}: {}'.format(store.file_string, e))
+            finally:
+                self.pending.task_done()
+
+    def write_store(self, metrics_store):
+        """ Write the data of one store to disk (.json)."""
+        to_json(metrics_store, self.start_time)
+
+    def flush(self, metrics_store):
+        """
+        Write the data of one store to disk and reset it, or queue it for the background writer
+
+        Args:
+            metrics_store (MetricsStore): store to write out
+        """
+        if self.writer is None:
+            self.write_store(metrics_store)
+            metrics_store.clear()
+        else:
+            self.pending.put(metrics_store.detach())
+        metrics_store.num_writes += 1
+
     def write_metrics(self):
-        """ Write all known metrics to disk (.json) and reset data within each metric."""
-        logging.debug('writing metrics (to json, in serial)')
-        # TODO: look into 'ray' package?: https://towardsdatascience.com/10x-faster-parallel-python-without-python-multiprocessing-e5017c93cce1
+        """ Write all known metrics to disk and reset data within each metric."""
+        if self.executor is None:
+            logging.debug('writing metrics (in serial)')
+            for m in self.metrics_stores:
+                self.flush(m)
+            return
+        logging.debug('writing metrics (with {} threads)'.format(self.executor._max_workers))
+        stores = []
         for m in self.metrics_stores:
-            to_json(m, self.start_time)
-            m.clear()
+            stores.append(m.detach())
+            m.num_writes += 1
+        # list() waits for all the stores and raises the first error
+        list(self.executor.map(self.write_store, stores))
 
     def finalize_writing(self):
-        pass
+        """ Wait for the background writer to finish the queued stores."""
+        if self.writer is not None:
+            self.pending.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
 
 
 class MetricsCollectorHDF(MetricsCollector):
-    def __init__(self, start_time='1970-01-01 00:00:00'):
-        super(MetricsCollectorHDF, self).__init__(start_time=start_time)
+    """
+    Appends each store to its .h5 file, which stays open between writes so a write only costs the new rows.
+
+    Attributes:
+        hdf_stores (dict): open pd.HDFStore for each file name
+    """
+
+    def __init__(self, start_time='1970-01-01 00:00:00', flush_bytes=None, background=False, max_pending=4,
+                 num_threads=1):
+        super(MetricsCollectorHDF, self).__init__(start_time, flush_bytes, background, max_pending, num_threads)
         self.num_writes_counter = 0
+        self.hdf_stores = dict()
+
+    def write_store(self, metrics_store):
+        """ Write the data of one store to disk (.h5)."""
+        filename = '{}_metrics.h5'.format(metrics_store.file_string)
+        if filename not in self.hdf_stores:
+            with _hdf_lock:
+                # overwrite possibly already existing file only at onset of sim
+                self.hdf_stores[filename] = pd.HDFStore(filename, mode='w' if metrics_store.num_writes == 0 else 'a',
+                                                        complevel=9)
+        to_hdf(metrics_store, self.start_time, metrics_store.num_writes, self.hdf_stores[filename])
 
     def write_metrics(self):
         """ Write all known metrics to disk (.h5)."""
-        logging.debug('writing metrics (to h5, in serial)')
-        # TODO: look into 'ray' package?: https://towardsdatascience.com/10x-faster-parallel-python-without-python-multiprocessing-e5017c93cce1
-        for m in self.metrics_stores:
-            to_hdf(m, self.start_time, self.num_writes_counter)
-            m.clear()
+        super(MetricsCollectorHDF, self).write_metrics()
         self.num_writes_counter += 1
 
     def finalize_writing(self):
+        """ Finish the writes, then index the time column of every table and close the files."""
+        super(MetricsCollectorHDF, self).finalize_writing()
         for m in self.metrics_stores:
-            finalize_hdf(m)
+            finalize_hdf(m, self.hdf_stores.pop('{}_metrics.h5'.format(m.file_string), None))
+
+
+class MetricsCollectorParquet(MetricsCollector):
+    """
+    Writes each table of a store to its own .parquet file, one row group per write.
+
+    Attributes:
+        writers (dict): open pyarrow ParquetWriter for each file name
+    """
+
+    def __init__(self, start_time='1970-01-01 00:00:00', flush_bytes=None, background=False, max_pending=4,
+                 num_threads=1):
+        super(MetricsCollectorParquet, self).__init__(start_time, flush_bytes, background, max_pending, num_threads)
+        self.writers = dict()
+
+    def write_store(self, metrics_store):
+        """ Write the data of one store to disk (.parquet)."""
+        to_parquet(metrics_store, self.start_time, self.writers)
+
+    def finalize_writing(self):
+        super(MetricsCollectorParquet, self).finalize_writing()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
 
 
 def deepish_copy(obj):
@@ -227,6 +443,27 @@ def deepish_copy(obj):
             return obj  # ints
 
 
+def _table_keys(metrics_store):
+    """
+    Names the tables of a store by the number of dimensions of their shape
+
+    Args:
+        metrics_store (MetricsStore): a store containing metrics tables
+    Returns:
+        list: (shape, table, key) for each table, key like 'metrics_df2' or 'metrics_df2a'
+    """
+    # it's possible some shape's len is repeated (e.g. shapes (4, 2) and (48, 100) would compete for same key...)
+    shapelen_counters = collections.defaultdict(int)
+    keys = []
+    for shape, table in metrics_store.shape_to_tables.items():
+        num_dims = len(shape)
+        # appends a letter to key if more than one shape of same len appears for that shape len
+        extra = ['', 'a', 'b', 'c', 'd'][shapelen_counters[num_dims]]
+        shapelen_counters[num_dims] += 1
+        keys.append((shape, table, 'metrics_df{}{}'.format(num_dims, extra)))
+    return keys
+
+
 def to_json(metrics_store, start_time):
     """
     This function writes the metric data to JSON files (and clears the data)
@@ -243,7 +480,7 @@ def to_json(metrics_store, start_time):
     None, [])
     # collect data
     dct = collections.defaultdict(dict)
-    for row in zip(metrics_store.time_uid_pairs, *[t.data for t in tables]):
+    for row in zip(metrics_store.time_uid_pairs, *[t.to_list() for t in tables]):
         t, uid = row[0]
         data = [v for subrow in row[1:] for v in subrow]
         dct[t][uid] = data
@@ -258,7 +495,7 @@ def to_json(metrics_store, start_time):
         json.dump(dct, f, ensure_ascii=False)
 
 
-def to_hdf(metrics_store, start_time, num_writes_counter):
+def to_hdf(metrics_store, start_time, num_writes_counter, hdf_store=None):
     """
     This function writes the metric data to HDF5 files (and clears the data)
 
@@ -266,6 +503,7 @@ def to_hdf(metrics_store, start_time, num_writes_counter):
         metrics_store (MetricsStore): a store containing metrics tables to dump to file
         start_time (pd.Timestamp): start time of simulation times
         num_writes_counter (int): interval counter
+        hdf_store (pd.HDFStore): open file to append to, if None the file is opened for this write only
     """
 
     filename = '{}_metrics.h5'.format(metrics_store.file_string)
@@ -274,14 +512,7 @@ def to_hdf(metrics_store, start_time, num_writes_counter):
     times, uids = zip(*metrics_store.time_uid_pairs) if len(metrics_store.time_uid_pairs) > 0 else ([], [])
     times = start_time + pd.to_timedelta(times, unit='s')
     # times = start_time + np.asarray([pd.Timedelta(seconds=int(t)) for t in times])
-    # it's possible some shape's len is repeated (e.g. shapes (4, 2) and (48, 100) would compete for same key...)
-    shapelen_to_count = collections.Counter(map(len, metrics_store.shape_to_tables.keys()))
-    logging.debug('shapelen_to_count {} for filename {}'.format(shapelen_to_count, filename))
-    shapelen_counters = {x: 0 for x in shapelen_to_count.keys()}
-    # assumes we never visit this key in this file after this function after the next outer for loop
-    # keys_to_index = []
-    # now collect data
-    for num_local_writes_counter, (shape, table) in enumerate(metrics_store.shape_to_tables.items()):
+    for num_local_writes_counter, (shape, table, key) in enumerate(_table_keys(metrics_store)):
         num_dims = len(shape)
         df = table.to_frame(times=times, uids=uids, shape=shape, filename=filename)  # index is now ['time', 'uid']
         # write to file and clear stored data
@@ -292,29 +523,27 @@ def to_hdf(metrics_store, start_time, num_writes_counter):
         #  More efficiently we could append to a file each day which would require changes to the call such that the
         #  write mode is not always 'w'.
         logging.debug('-----df examination----')
-        logging.debug(
-            'len(shape) = {}, shape {}, df.shape {}, shapelen_counter[len(shape)] {}'.format(num_dims, shape, df.shape,
-                                                                                             shapelen_counters[
-                                                                                                 num_dims]))
+        logging.debug('len(shape) = {}, shape {}, df.shape {}, key {}'.format(num_dims, shape, df.shape, key))
         logging.debug('df.head() {}'.format(df.head()))
         # logging.debug('df.info() {}'.format(df.info()))
-        extra = ['', 'a', 'b', 'c', 'd'][shapelen_counters[
-            num_dims]]  # appends a letter to key if more than one shape of same len appears for that shape len
-        shapelen_counters[num_dims] += 1
-        key = 'metrics_df{}{}'.format(num_dims,
-                                      extra)  # why not just append to same growing table (by eliminating num_writes_counter)
         if df.shape[0] > 0:
             try:
-                df.to_hdf(filename,
-                          key=key,
-                          mode='w' if num_local_writes_counter == num_writes_counter == 0 else 'a',
-                          # overwrite possibly already existing file only at onset of sim
-                          append=True,  # enabling appending to each possibly existing table (setting up for chunking)
-                          format='table',
-                          # use 'table' (slower i/o) if indexing and want subsets of data retrievable (not indexing here, perhaps in post-processing
-                          data_columns=['time'],
-                          complevel=9,  # compress on the fly (can't do at end!)
-                          index=False)  # don't index here (can only do so with 'table') since we may chunk first, then index (possibly in post-processing even)
+                with _hdf_lock:
+                    if hdf_store is not None:
+                        # the file stays open, appending extends the chunked, compressed table
+                        hdf_store.append(key, df, format='table', data_columns=['time'], complevel=9, index=False)
+                        hdf_store.flush()
+                    else:
+                        df.to_hdf(filename,
+                                  key=key,
+                                  mode='w' if num_local_writes_counter == num_writes_counter == 0 else 'a',
+                                  # overwrite possibly already existing file only at onset of sim
+                                  append=True,  # enabling appending to each possibly existing table (setting up for chunking)
+                                  format='table',
+                                  # use 'table' (slower i/o) if indexing and want subsets of data retrievable (not indexing here, perhaps in post-processing
+                                  data_columns=['time'],
+                                  complevel=9,  # compress on the fly (can't do at end!)
+                                  index=False)  # don't index here (can only do so with 'table') since we may chunk first, then index (possibly in post-processing even)
             except Exception as e:
                 logging.error('got error when attempting to write table to hdf {}: {}'.format(filename, e))
         else:
@@ -325,22 +554,68 @@ def to_hdf(metrics_store, start_time, num_writes_counter):
         del df
 
 
-def finalize_hdf(metrics_store):
+def finalize_hdf(metrics_store, hdf_store=None):
+    """
+    Builds the index on the time column of every metrics table, so reads with a time condition are fast
+
+    Args:
+        metrics_store (MetricsStore): a store whose file has been written
+        hdf_store (pd.HDFStore): the file if still open, closed here, if None the file is opened
+    """
     filename = '{}_metrics.h5'.format(metrics_store.file_string)
     # TODO: decide if we want to index (past time/uid?) and if we want such high levels of compression or indexing opt
     # # once all appends done, run this to create index
-    if os.path.isfile(filename):
+    if hdf_store is None:
+        if not os.path.isfile(filename):
+            logging.warning('No file {} to try and compress at end of sim, passing!'.format(filename))
+            return
         logging.debug('opening file {} to compress'.format(filename))
-        with pd.HDFStore(filename, 'r+', complevel=9) as ostore:
-            for key in ostore:
-                if 'metrics_df' in key:
-                    ostore.create_table_index(key, columns=['time'], optlevel=9,
-                                              kind='full')  # 9 is highest; testing with low index?
-                    logging.debug('successfully indexed key {}'.format(key))
-    else:
-        logging.warning('No file {} to try and compress at end of sim, passing!'.format(filename))
+        hdf_store = pd.HDFStore(filename, 'r+', complevel=9)
+    with hdf_store as ostore:
+        for key in ostore:
+            if 'metrics_df' in key:
+                # the times are the frame index, stored in the 'index' column of the table
+                ostore.create_table_index(key, columns=['index'], optlevel=9,
+                                          kind='full')  # 9 is highest; testing with low index?
+                logging.debug('successfully indexed key {}'.format(key))
     # can now access with a simple pd.read_hdf(filename, key, where='time >= pd.Timestamp(...) and uid in [uid1, ...]')
 
+
+def to_parquet(metrics_store, start_time, writers):
+    """
+    This function appends the metric data to Parquet files, one file per table and one row group per call
+
+    Args:
+        metrics_store (MetricsStore): a store containing metrics tables to dump to file
+        start_time (pd.Timestamp): start time of simulation times
+        writers (dict): open pyarrow ParquetWriter for each file name, updated with the new files
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    times, uids = zip(*metrics_store.time_uid_pairs) if len(metrics_store.time_uid_pairs) > 0 else ([], [])
+    times = start_time + pd.to_timedelta(times, unit='s')
+    for shape, table, key in _table_keys(metrics_store):
+        filename = '{}_{}.parquet'.format(metrics_store.file_string, key)
+        df = table.to_frame(times=times, uids=uids, shape=shape, filename=filename)
+        if df.shape[0] == 0:
+            logging.debug('passing on trying to append an empty dataframe to file {}'.format(filename))
+            continue
+        df = df.reset_index()
+        try:
+            if filename in writers:
+                # later row groups must match the schema of the first
+                writers[filename].write_table(pa.Table.from_pandas(df, schema=writers[filename].schema,
+                                                                   preserve_index=False))
+            else:
+                data = pa.Table.from_pandas(df, preserve_index=False)
+                writers[filename] = pq.ParquetWriter(filename, data.schema, compression='zstd')
+                writers[filename].write_table(data)
+        except Exception as e:
+            logging.error('got error when attempting to write table to parquet {}: {}'.format(filename, e))
+        del df
+
+
 # TODO: move these timeit-enabling functions?
 # def setup_factory(n_times, n_uids, n_stores, write_hdf5):
 #     def inner():
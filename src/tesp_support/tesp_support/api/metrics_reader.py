@@ -0,0 +1,315 @@
+# Copyright (C) 2017-2024 Battelle Memorial Institute
+# See LICENSE file at https://github.com/pnnl/tesp
+# file: metrics_reader.py
+"""Streaming reader and writer for the GridLAB-D *_metrics.json files
+
+The metrics files hold one JSON object with a 'StartTime', a 'Metadata'
+dictionary and one entry per sample time, each mapping an object name to
+its list of metric values.  Loading them with json.loads needs several
+times the file size in memory, so this module walks the top level of the
+file one sample at a time and copies each sample straight into a
+preallocated (object x time x metric) array.  Agents write the same
+layout one sample at a time with MetricsJsonWriter, so a run that stops
+early leaves every finished sample readable with partial=True.
+
+Public Functions:
+    :iter_metrics_json: Yields the top level (key, value) pairs of a metrics file.
+    :read_metrics_file: Reads a metrics file into a NumPy array, optionally through a binary cache.
+
+Public Classes:
+    :MetricsJsonWriter: Appends the sample times of a metrics file as they are produced.
+
+"""
+import json
+import os
+import re
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 22
+CACHE_VERSION = 1
+
+_WS = re.compile(r'[ \t\n\r]*')
+
+
+class _NeedMore(Exception):
+    pass
+
+
+def _parse_pair(decoder, buf, pos):
+    key, pos = decoder.raw_decode(buf, pos)
+    pos = _WS.match(buf, pos).end()
+    if pos >= len(buf):
+        raise _NeedMore
+    if buf[pos] != ':':
+        raise ValueError('Expecting ":" at position {:d}'.format(pos))
+    pos = _WS.match(buf, pos + 1).end()
+    if pos >= len(buf):
+        raise _NeedMore
+    val, pos = decoder.raw_decode(buf, pos)
+    return key, val, pos
+
+
+def iter_metrics_json(path, chunk_size=CHUNK_SIZE, partial=False):
+    """ Yields the top level (key, value) pairs of a metrics JSON file
+
+    Only one sample time is decoded at once; the read buffer grows only
+    when a single entry is larger than it.
+
+    Args:
+        path (str): name of the metrics JSON file
+        chunk_size (int): number of characters to read at once
+        partial (bool): if True, a file that ends before its closing brace, as left by a run that did not finish, yields its complete entries instead of raising ValueError
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as fp:
+        buf = fp.read(chunk_size)
+        eof = len(buf) < chunk_size
+        pos = _WS.match(buf).end()
+        if pos >= len(buf) or buf[pos] != '{':
+            raise ValueError('{:s} does not hold a JSON object'.format(path))
+        pos += 1
+        while True:
+            pos = _WS.match(buf, pos).end()
+            if pos < len(buf):
+                ch = buf[pos]
+                if ch == '}':
+                    return
+                if ch == ',':
+                    pos += 1
+                    continue
+                try:
+                    key, val, end = _parse_pair(decoder, buf, pos)
+                except (_NeedMore, ValueError):
+                    if eof:
+                        if partial:
+                            return
+                        raise
+                else:
+                    yield key, val
+                    pos = end
+                    continue
+            elif eof:
+                if partial:
+                    return
+                raise ValueError('{:s} ends before the closing brace'.format(path))
+            # keep the unparsed tail and at least double what is buffered
+            more = fp.read(max(chunk_size, len(buf) - pos))
+            eof = len(more) == 0
+            buf = buf[pos:] + more
+            pos = 0
+
+
+def _cache_name(path):
+    return os.path.splitext(path)[0] + '.npz'
+
+
+def _load_cache(path):
+    cache_file = _cache_name(path)
+    if not os.path.exists(cache_file):
+        return None
+    st = os.stat(path)
+    try:
+        with np.load(cache_file) as npz:
+            if (int(npz['version']) != CACHE_VERSION or int(npz['size']) != st.st_size or
+                    int(npz['mtime']) != st.st_mtime_ns):
+                return None
+            return {
+                'start_time': json.loads(str(npz['start_time'])),
+                'metadata': json.loads(str(npz['metadata'])),
+                'times': npz['times'],
+                'keys': npz['keys'].tolist(),
+                'count': int(npz['count']),
+                'data': npz['data']
+            }
+    except Exception as ex:
+        print("Could not read metrics cache {}: {}".format(cache_file, ex))
+        return None
+
+
+def _save_cache(path, metrics):
+    cache_file = _cache_name(path)
+    st = os.stat(path)
+    try:
+        with open(cache_file, 'wb') as fp:
+            np.savez(fp,
+                     version=CACHE_VERSION,
+                     size=st.st_size,
+                     mtime=st.st_mtime_ns,
+                     start_time=json.dumps(metrics['start_time']),
+                     metadata=json.dumps(metrics['metadata']),
+                     times=metrics['times'],
+                     keys=np.array(metrics['keys'], dtype=str),
+                     count=metrics['count'],
+                     data=metrics['data'])
+    except Exception as ex:
+        print("Could not cache {}: {}".format(cache_file, ex))
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+
+
+def _select(metrics, keys, fill):
+    if keys is None:
+        return metrics
+    rows = {key: j for j, key in enumerate(metrics['keys'])}
+    sel = dict(metrics)
+    if fill is None:
+        keys = [key for key in keys if key in rows]
+        sel['data'] = metrics['data'][[rows[key] for key in keys]]
+    else:
+        data = metrics['data']
+        sel['data'] = np.full((len(keys), data.shape[1], data.shape[2]), fill, dtype=float)
+        for j, key in enumerate(keys):
+            if key in rows:
+                sel['data'][j] = data[rows[key]]
+    sel['keys'] = list(keys)
+    return sel
+
+
+def _stream_metrics(path, keys, partial=False, fill=None):
+    start_time = None
+    metadata = {}
+    times = []
+    data = None
+    flat = False
+    count = 0
+    n = 0
+    size = os.path.getsize(path)
+
+    for key, val in iter_metrics_json(path, partial=partial):
+        if key == 'StartTime':
+            start_time = val
+            continue
+        if key == 'Metadata':
+            metadata = val
+            continue
+        if data is None:
+            # the first sample fixes the objects and metric count, and
+            # its length in the file estimates the number of samples
+            if isinstance(val, list):
+                flat = True
+                keys = []
+                count = 1
+                width = len(val)
+                rows = 1
+            else:
+                if val is None:
+                    val = {}
+                count = len(val)
+                if keys is None:
+                    keys = list(val.keys())
+                elif fill is None:
+                    keys = [x for x in keys if x in val]
+                else:
+                    keys = list(keys)
+                present = [x for x in keys if x in val]
+                if len(present) > 0:
+                    width = len(val[present[0]])
+                elif fill is not None:
+                    width = len(metadata)
+                else:
+                    width = 0
+                rows = len(keys)
+                fill_row = [fill] * width
+            rec_size = len(json.dumps({key: val}))
+            est = size // max(rec_size, 1) + 2
+            # filled time-major, so growing and trimming can resize in place
+            data = np.empty(shape=(est, rows, width), dtype=float)
+        if n >= data.shape[0]:
+            data.resize((n + n // 2 + 1, data.shape[1], data.shape[2]), refcheck=False)
+        if flat:
+            data[n, 0, :] = val
+        elif len(keys) > 0:
+            if fill is None:
+                data[n, :, :] = [val[x] for x in keys]
+            else:
+                data[n, :, :] = [val.get(x, fill_row) for x in keys]
+        times.append(int(key))
+        n += 1
+
+    if data is None:
+        keys = []
+        data = np.empty(shape=(0, 0, 0), dtype=float)
+    data.resize((n, data.shape[1], data.shape[2]), refcheck=False)
+    times = np.array(times, dtype=np.int64)
+    order = np.argsort(times, kind='stable')
+    if np.any(order != np.arange(n)):
+        times = times[order]
+        data = data[order]
+    data = data.transpose(1, 0, 2)
+    return {
+        'start_time': start_time,
+        'metadata': metadata,
+        'times': times,
+        'keys': keys,
+        'count': count,
+        'data': data
+    }
+
+
+def read_metrics_file(path, keys=None, cache=False, partial=False, fill=None):
+    """ Reads a GridLAB-D metrics JSON file into a NumPy array
+
+    The objects kept are *keys*, in that order, less any that are not
+    written at the first sample time; with no *keys*, every object of
+    the first sample is kept in file order.  A sample written as a plain
+    list, as for the precooler agent, becomes a single row with no keys.
+    With a *fill* value, every one of *keys* is kept, and objects left
+    out of a sample, like agents that did not bid, read as *fill*.
+
+    Args:
+        path (str): name of the metrics JSON file
+        keys (list): names of the objects to keep, or None for all of them
+        cache (bool): if True, keep a binary copy of the whole file next to it, named *.npz*, and reuse it while the JSON file is unchanged
+        partial (bool): if True, read the complete samples of a file whose writer did not finish
+        fill (float): value of the metrics of objects missing from a sample, None when they must all be present
+
+    Returns:
+        dict: 'start_time', 'metadata', sorted integer 'times' in seconds, the 'keys' kept, the 'count' of objects at the first sample, and 'data' with shape (object, time, metric)
+    """
+    if cache:
+        metrics = _load_cache(path)
+        if metrics is None:
+            metrics = _stream_metrics(path, None, partial, fill)
+            _save_cache(path, metrics)
+        return _select(metrics, keys, fill)
+    return _stream_metrics(path, keys, partial, fill)
+
+
+class MetricsJsonWriter:
+    """ Writes a metrics JSON file one sample time at a time
+
+    The file has the layout of the *_metrics.json files, byte for byte as
+    json.dumps of the whole dictionary would write it, but only the sample
+    being added is held in memory.  Each sample is flushed to disk as it is
+    added; the closing brace is written by close.
+
+    Args:
+        path (str): name of the metrics JSON file, overwritten
+        metadata (dict): metric names mapped to their 'units' and 'index'
+        start_time (str): the 'StartTime' of the file
+    """
+
+    def __init__(self, path, metadata, start_time):
+        self.path = path
+        self.fp = open(path, 'w')
+        self.fp.write('{"Metadata": ' + json.dumps(metadata) + ', "StartTime": ' + json.dumps(start_time))
+        self.fp.flush()
+
+    def add_sample(self, time_key, sample):
+        """ Appends the metrics of one sample time
+
+        Args:
+            time_key (str or int): the sample time, in seconds
+            sample (dict): object names mapped to their lists of metric values
+        """
+        self.fp.write(', ' + json.dumps(str(time_key)) + ': ' + json.dumps(sample))
+        self.fp.flush()
+
+    def close(self):
+        """ Writes the closing brace and closes the file
+        """
+        if self.fp is not None:
+            self.fp.write('}\n')
+            self.fp.close()
+            self.fp = None
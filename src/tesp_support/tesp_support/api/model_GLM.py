@@ -4,10 +4,15 @@
 """GridLAB-D model I/O for TESP api
 """
 
+import gc
+import hashlib
+import pickle
 import pyjson5
 import os.path
 import re
 import sqlite3
+import time
+from contextlib import contextmanager
 
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
@@ -19,6 +24,16 @@ from .entity import Entity
 from .parse_helpers import parse_kva
 from .helpers import gld_strict_name
 
+CACHE_VERSION = 1
+
+# patterns used for every line of an object, compiled once
+_OBJECT_TYPE = re.compile(r'object ([^:{\s]+)[:{\s]', re.IGNORECASE)
+_OBJECT_ID = re.compile(r'object ([^:]+:[^{\s]+)', re.IGNORECASE)
+_OBJECT_PARAM = re.compile(r'\s*(\S+) ([^;{]+)[;{]')
+_MODULE_PARAM = re.compile(r'\s*(\S+) ([^;]+);')
+_SCHEDULE = re.compile(r'schedule\W+(\w+)\s*([;{])', re.IGNORECASE)
+
+
 class O_Entity(Entity):
     def __init__(self, model, entity, config):
         super().__init__(entity, config)
@@ -39,6 +54,12 @@ class O_Entity(Entity):
     def __getitem__(self, key):
         return self.instances.get(key)
 
+    def __getstate__(self):
+        # the model is reattached when a cached model is loaded
+        state = self.__dict__.copy()
+        del state['_m']
+        return state
+
 class GLM:
     pass
 
@@ -140,6 +161,12 @@ class GLMModel:
         self.inside_comments = dict()
         self.outside_comments = dict()
         self.inline_comments = dict()
+        # only kept inside a batch, see batch()
+        self._refs = None
+        self._graph = None
+        self._undo = None
+        # when a list, add_object appends (type, name, params) to it
+        self.journal = None
         with open(glm_entities_path, 'r', encoding='utf-8') as json_file:
             self.classes = pyjson5.load(json_file)
             entity = Entity("clock", None)
@@ -419,15 +446,17 @@ class GLMModel:
         # recorder, player, metrics_collector don't apply to the network, there are others
         # this work for the network (powerflow)
         G = self.draw_network()
-        power_entities = []
+        # write each network node once, under the first class holding its name
+        owners = {}
+        for object_name in self.object_entities:
+            for name in self.object_entities[object_name].instances:
+                if name not in owners:
+                    owners[name] = object_name
+        power_entities = set()
         for node_name in G:
-            for object_name in self.object_entities:
-                for name in self.object_entities[object_name].instances:
-                    if node_name == name:
-                        if node_name in power_entities:
-                            continue
-                        diction += self.get_diction(self.object_entities, object_name, self.instanceToObject, name)
-                        power_entities.append(name)
+            if node_name in owners:
+                diction += self.get_diction(self.object_entities, owners[node_name], self.instanceToObject, node_name)
+                power_entities.add(node_name)
 
         # Write the objects
         for object_name in self.object_entities:
@@ -576,22 +605,226 @@ class GLMModel:
                 self.set_object_instance(class_name, value_name, {"file": default})
 
     def add_object(self, _type, name, params):
+        if self.journal is not None:
+            self.journal.append((_type, name, dict(params)))
         # add the new object type to the model
         if _type not in self.model:
             self.model[_type] = {}
+        self._unlink(_type, name)
         # add name and set object entity instance to model type
         # self.model[_type][name] = {}
         self.model[_type][name] = self.set_object_instance(_type, name, params)
+        self._link(_type, name)
         return self.model[_type][name]
 
     def del_object(self, _type, name):
         # del name and set object entity instance to model type
-        del self.model[_type][name]
+        self._unlink(_type, name)
+        if name in self.model.get(_type, {}):
+            del self.model[_type][name]
+        if _type in self.object_entities:
+            self.object_entities[_type].del_instance(name)
+
+    def set_object_item(self, _type, name, item, val):
+        self._unlink(_type, name)
+        val = self.object_entities[_type].set_item(name, item, val)
+        self._link(_type, name)
+        return val
+
+    def del_object_item(self, _type, name, item):
+        self._unlink(_type, name)
+        self.object_entities[_type].del_item(name, item)
+        self._link(_type, name)
+
+    def rename_object(self, _type, old_name, new_name):
+        """ Renames an object and every attribute value that refers to it
+
+        Args:
+            _type (str): class of the object
+            old_name (str): name of the object
+            new_name (str): new name of the object
+        Returns:
+            bool: True if the object was renamed
+        """
+        entity = self.object_entities[_type]
+        if not entity.instances[old_name]:
+            return False
+        refs = self.find_references(old_name)
+        holders = list(dict.fromkeys([(obj_type, name) for obj_type, name, attr in refs]))
+        for obj_type, name in holders:
+            self._unlink(obj_type, name)
+        for obj_type, name, attr in refs:
+            self.object_entities[obj_type].instances[name][attr] = new_name
+        for obj_type, name in holders:
+            self._link(obj_type, name)
+        if new_name != old_name:
+            self._unlink(_type, old_name)
+            entity.instances[new_name] = entity.instances[old_name]
+            del entity.instances[old_name]
+            if _type in self.model:
+                self.model[_type][new_name] = self.model[_type][old_name]
+                del self.model[_type][old_name]
+            self._link(_type, new_name)
+        return True
+
+    def find_references(self, value):
+        """ Finds the object attributes that hold a value, usually an object name
+
+        Args:
+            value (str): the value to look for
+        Returns:
+            list: (class, name, attribute) of every match
+        """
+        if self._refs is not None:
+            return list(self._refs.get(value, ()))
+        refs = []
+        for obj_type in self.object_entities:
+            instances = self.object_entities[obj_type].instances
+            for name in instances:
+                for attr, val in instances[name].items():
+                    if val == value:
+                        refs.append((obj_type, name, attr))
+        return refs
+
+    def find_children(self, parent):
+        """ Finds the objects whose parent is the named object
+
+        Args:
+            parent (str): name of the parent object
+        Returns:
+            list: (class, name) of every child
+        """
+        return [(obj_type, name) for obj_type, name, attr in self.find_references(parent) if attr == 'parent']
+
+    @contextmanager
+    def batch(self):
+        """ Groups edits of the model into one transaction
+
+        While the batch is open, the references between objects and the
+        network graph are indexed once and kept up to date by add_object,
+        del_object and rename_object, so each edit costs the same however
+        large the model is, and draw_network returns the indexed graph.
+        Edits must go through those methods (or the GLMModifier ones) while
+        the batch is open, not through the instance dictionaries.  If the
+        batch raises, the objects are restored to what they were when it
+        started.  A batch opened inside another one joins it.
+        """
+        if self._refs is not None:
+            yield self
+            return
+        self._undo = ({_type: (table, dict(table)) for _type, table in self.model.items()},
+                      {obj_type: [(name, instance, dict(instance))
+                                  for name, instance in self.object_entities[obj_type].instances.items()]
+                       for obj_type in self.object_entities})
+        self._refs = {}
+        for obj_type in self.object_entities:
+            for name in self.object_entities[obj_type].instances:
+                self._index_object(obj_type, name)
+        self._graph = self.draw_network()
+        try:
+            yield self
+        except BaseException:
+            self._rollback()
+            raise
+        finally:
+            self._refs = None
+            self._graph = None
+            self._undo = None
+
+    def _rollback(self):
+        tables, entities = self._undo
+        self.model.clear()
+        for _type, (table, values) in tables.items():
+            table.clear()
+            table.update(values)
+            self.model[_type] = table
+        for obj_type in self.object_entities:
+            instances = self.object_entities[obj_type].instances
+            instances.clear()
+            for name, instance, values in entities.get(obj_type, []):
+                instance.clear()
+                instance.update(values)
+                instances[name] = instance
+
+    def _index_object(self, obj_type, name):
+        for attr, val in self.object_entities[obj_type].instances[name].items():
+            if type(val) == str:
+                if val not in self._refs:
+                    self._refs[val] = {}
+                self._refs[val][(obj_type, name, attr)] = None
+
+    def _link(self, obj_type, name):
+        # index an object that has been added or changed inside a batch
+        if self._refs is None or obj_type not in self.object_entities or \
+                name not in self.object_entities[obj_type].instances:
+            return
+        self._index_object(obj_type, name)
+        if obj_type not in self.model or name not in self.model[obj_type]:
+            return
+        data = self.model[obj_type][name]
+        G = self._graph
+        touched = []
+        if self.is_edge_class(obj_type) and 'from' in data and 'to' in data:
+            G.add_edge(data['from'], data['to'], eclass=obj_type, ename=name, edata=data)
+            touched += [data['from'], data['to']]
+        if self.is_node_class(obj_type):
+            if 'parent' in data:
+                G.add_edge(name, data['parent'], eclass='parent', ename=name, edata={})
+                touched.append(data['parent'])
+            touched.append(name)
+        for node in touched:
+            self._set_node_data(node)
+
+    def _unlink(self, obj_type, name):
+        # drop an object from the indexes before it is changed or deleted inside a batch
+        if self._refs is None or obj_type not in self.object_entities or \
+                name not in self.object_entities[obj_type].instances:
+            return
+        for attr, val in self.object_entities[obj_type].instances[name].items():
+            if type(val) == str and val in self._refs:
+                self._refs[val].pop((obj_type, name, attr), None)
+                if len(self._refs[val]) == 0:
+                    del self._refs[val]
+        if obj_type not in self.model or name not in self.model[obj_type]:
+            return
+        data = self.model[obj_type][name]
+        G = self._graph
+        touched = []
+        if self.is_edge_class(obj_type) and 'from' in data and 'to' in data:
+            n1 = data['from']
+            n2 = data['to']
+            if G.has_edge(n1, n2) and G[n1][n2]['ename'] == name and G[n1][n2]['eclass'] == obj_type:
+                G.remove_edge(n1, n2)
+            touched += [n1, n2]
+        if self.is_node_class(obj_type):
+            if 'parent' in data:
+                p = data['parent']
+                if G.has_edge(name, p) and G[name][p]['ename'] == name and G[name][p]['eclass'] == 'parent':
+                    G.remove_edge(name, p)
+                touched.append(p)
+            touched.append(name)
+        for node in touched:
+            if node in G:
+                if G.degree(node) == 0:
+                    G.remove_node(node)
+                elif node == name:
+                    # the node stays for the edges of other objects, but without this object's data
+                    G.nodes[node].pop('nclass', None)
+                    G.nodes[node].pop('ndata', None)
+
+    def _set_node_data(self, node):
+        G = self._graph
+        if node not in G:
+            return
+        for t in self.model:
+            if self.is_node_class(t) and node in self.model[t]:
+                G.nodes[node]['nclass'] = t
+                G.nodes[node]['ndata'] = self.model[t][node]
 
     def glm_schedule(self, line, itr):
         # This only grab the lines, real parsing of the schedule
 
-        m_sched = re.search('schedule\W+(\w+)\s*([;{])', line, re.IGNORECASE)
+        m_sched = _SCHEDULE.search(line)
         if m_sched:
             # schedule found
             self.schedule_types[m_sched.group(1)] = []
@@ -602,12 +835,12 @@ class GLMModel:
                 tab = ["  "]
                 while oend:
                     line = next(itr)
-                    if re.search('}', line):
+                    if '}' in line:
                         # end of the schedule
                         tab.remove("  ")
                         oend -= 1
                     self.schedule_types[m_sched.group(1)].append(''.join(tab) + line)
-                    if re.search('{', line):
+                    if '{' in line:
                         # start of the sub schedule
                         tab.append("  ")
                         oend += 1
@@ -667,13 +900,13 @@ class GLMModel:
                 inline_comments[tokens[0]] = substring
 
             # find a parameter
-            m = re.match('\s*(\S+) ([^;]+);', line)
+            m = _MODULE_PARAM.match(line)
             if m:
                 params[m.group(1)] = m.group(2)
                 if len(comments) > 0:
                     inside_comments[m.group(1)] = comments
                     comments = []
-            if re.search('}', line):
+            if '}' in line:
                 done = 1
             else:
                 line = next(itr).strip()
@@ -702,10 +935,10 @@ class GLMModel:
         """
         # Identify the object type
         oid = ""
-        m = re.search('object ([^:{\s]+)[:{\s]', line, re.IGNORECASE)
+        m = _OBJECT_TYPE.search(line)
         _type = m.group(1)
         # If the object has an id number, store it
-        n = re.search('object ([^:]+:[^{\s]+)', line, re.IGNORECASE)
+        n = _OBJECT_ID.search(line)
         if n:
             oid = n.group(1)
         # else:
@@ -745,7 +978,7 @@ class GLMModel:
                     inline_comments[tokens[0]] = substring
 
             intobj = 0
-            m = re.match('\s*(\S+) ([^;{]+)[;{]', line)
+            m = _OBJECT_PARAM.match(line)
             if m:
                 param = m.group(1)
                 val = m.group(2)
@@ -776,7 +1009,7 @@ class GLMModel:
                         inside_comments[param] = comments
                         comments = []
 
-            if re.search('}', line):
+            if '}' in line:
                 if intobj:
                     intobj -= 1
                     line = next(itr)
@@ -804,82 +1037,163 @@ class GLMModel:
             self.inline_comments[name] = inline_comments
         return line, counter, name
 
-    def readModel(self, filename):
-        """ Reads and parses the model from the provided filename.
+    def _is_new(self):
+        # true until something has been read into or added to the model
+        if len(self.model) > 0:
+            return False
+        for entities in (self.module_entities, self.object_entities):
+            for name in entities:
+                if len(entities[name].instances) > 0:
+                    return False
+        return True
 
-        Args:
-            filename (str): fully qualified model path/name
+    def _load_cache(self, cache_file):
+        if not os.path.isfile(cache_file):
+            return False
+        # the collector only slows down loading this many new containers
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(cache_file, 'rb') as fp:
+                state = pickle.load(fp)
+        except Exception as ex:
+            print("Could not read model cache {}: {}".format(cache_file, ex))
+            return False
+        finally:
+            if enabled:
+                gc.enable()
+        # keep the glm object, it may already be held by a modifier
+        glm = state.pop('glm')
+        self.glm.__dict__.clear()
+        self.glm.__dict__.update(glm)
+        self.__dict__.update(state)
+        for name in self.object_entities:
+            entity = self.object_entities[name]
+            if isinstance(entity, O_Entity):
+                entity._m = self
+        return True
 
-        Returns:
-            bool: Indicates whether the model was read-in successfully.
-        """
+    def _save_cache(self, cache_file):
+        state = {'model': self.model,
+                 'hash': self.hash,
+                 'set_lines': self.set_lines,
+                 'define_lines': self.define_lines,
+                 'include_lines': self.include_lines,
+                 'inside_comments': self.inside_comments,
+                 'outside_comments': self.outside_comments,
+                 'inline_comments': self.inline_comments,
+                 'schedule_types': self.schedule_types,
+                 'class_types': self.class_types,
+                 'module_entities': self.module_entities,
+                 'object_entities': self.object_entities,
+                 'glm': self.glm.__dict__}
+        tmp_file = cache_file + '.' + str(os.getpid())
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(tmp_file, 'wb') as fp:
+                pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            # readers in other processes only ever see a complete file
+            os.replace(tmp_file, cache_file)
+        except Exception as ex:
+            print("Could not cache model in {}: {}".format(cache_file, ex))
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def parseModel(self, lines):
+        """ Parses the model from the stripped, non-empty lines of a GLM file.
 
+        Args:
+            lines (list): lines of the model, without tabs or surrounding white space
+        """
         name = ""
         counter = 0
         h = {}  # OID hash
-        lines = []
         self.model = {}
         self.set_lines = []
         self.define_lines = []
         self.include_lines = []
         outside_comments = []
-        if os.path.isfile(filename):
-            ip = open(filename, 'r')
-            line = ip.readline()
-            while line != '':
-                line = line.replace("\t", " ")
-                # skip white space lines
-                while re.match('\s+$', line):
-                    line = ip.readline()
-                line = line.strip()
-                if len(line) > 0:
-                    lines.append(line)
-                line = ip.readline()
-            ip.close()
-
-            itr = iter(lines)
-            for line in itr:
-                if re.match('^//', line):
-                    if re.search('#set', line):
-                        self.set_lines.append(line)
-                    elif re.search('#include', line):
-                        self.include_lines.append(line)
-                    elif re.search('#define', line):
-                        self.define_lines.append(line)
-                    else:
-                        outside_comments.append(line)
-                elif re.search('#set', line):
+        itr = iter(lines)
+        for line in itr:
+            if line.startswith('//'):
+                if '#set' in line:
                     self.set_lines.append(line)
-                elif re.search('#include', line):
+                elif '#include' in line:
                     self.include_lines.append(line)
-                elif re.search('#define', line):
+                elif '#define' in line:
                     self.define_lines.append(line)
-                elif re.search('clock', line):
-                    name = self.glm_module("date", line, itr)
-                elif re.search('class', line):
-                    name = self.glm_module("class", line, itr)
-                elif re.search('module', line):
-                    name = self.glm_module("module", line, itr)
-                elif re.search('schedule', line):
-                    name = self.glm_schedule(line, itr)
-                elif re.search('object', line):
-                    line, counter, name = self.glm_object("", line, itr, h, counter)
                 else:
-                    print('Un-parsed line "' + line + '"')
-
-                if name != "":
-                    if len(outside_comments) > 0:
-                        self.outside_comments[name] = outside_comments
-                    outside_comments = []
-                    name = ""
-            self.hash = h
-            return True
-        else:
+                    outside_comments.append(line)
+            elif '#set' in line:
+                self.set_lines.append(line)
+            elif '#include' in line:
+                self.include_lines.append(line)
+            elif '#define' in line:
+                self.define_lines.append(line)
+            elif 'clock' in line:
+                name = self.glm_module("date", line, itr)
+            elif 'class' in line:
+                name = self.glm_module("class", line, itr)
+            elif 'module' in line:
+                name = self.glm_module("module", line, itr)
+            elif 'schedule' in line:
+                name = self.glm_schedule(line, itr)
+            elif 'object' in line:
+                line, counter, name = self.glm_object("", line, itr, h, counter)
+            else:
+                print('Un-parsed line "' + line + '"')
+
+            if name != "":
+                if len(outside_comments) > 0:
+                    self.outside_comments[name] = outside_comments
+                outside_comments = []
+                name = ""
+        self.hash = h
+
+    def readModel(self, filename, cache_dir=None):
+        """ Reads and parses the model from the provided filename.
+
+        With a cache_dir, a model read into a new GLMModel is also pickled
+        there, keyed by the contents of the file and of the entity definitions,
+        so reading the same file again loads the pickle instead of parsing.
+        Only give a folder that no one else writes to, as its pickles are loaded.
+
+        Args:
+            filename (str): fully qualified model path/name
+            cache_dir (str): folder of the parsed models, or None to always parse the file
+
+        Returns:
+            bool: Indicates whether the model was read-in successfully.
+        """
+        if not os.path.isfile(filename):
             raise FileNotFoundError(f"{filename} not found")
+        with open(filename, 'r') as ip:
+            text = ip.read()
+
+        cache_file = None
+        if cache_dir and self._is_new():
+            st = os.stat(glm_entities_path)
+            stamp = '{}|{}|{}|'.format(CACHE_VERSION, st.st_size, st.st_mtime_ns) + text
+            digest = hashlib.sha1(stamp.encode('utf-8')).hexdigest()
+            root = os.path.splitext(os.path.basename(filename))[0]
+            cache_file = os.path.join(cache_dir, '{}_{}.pkl'.format(root, digest[:16]))
+            if self._load_cache(cache_file):
+                return True
 
-    def readBackboneModel(self, root_name):
+        lines = []
+        for line in text.split('\n'):
+            line = line.replace("\t", " ").strip()
+            # skip white space lines
+            if len(line) > 0:
+                lines.append(line)
+        self.parseModel(lines)
+        if cache_file is not None:
+            self._save_cache(cache_file)
+        return True
+
+    def readBackboneModel(self, root_name, cache_dir=None):
         filename = os.path.join(feeders_path, root_name)
-        if self.readModel(filename):
+        if self.readModel(filename, cache_dir):
             self.root = root_name
             self.in_file = filename
             return self.glm, True
@@ -887,8 +1201,8 @@ class GLMModel:
         self.model = {}
         return None, False
 
-    def read(self, filename):
-        if self.readModel(filename):
+    def read(self, filename, cache_dir=None):
+        if self.readModel(filename, cache_dir):
             root = os.path.split(filename)
             self.root = root[1]
             self.in_file = filename
@@ -909,6 +1223,9 @@ class GLMModel:
         return True
 
     def draw_network(self):
+        # inside a batch the graph is kept up to date as objects change
+        if self._graph is not None:
+            return self._graph
         # construct a graph of the model, starting with known links
         G = nx.Graph()
         for t in self.model:
@@ -1211,6 +1528,46 @@ def _test2():
             print(testMod.object_entities[name].toHelp())
 
 
+def _bench(cache_dir=None):
+    """ Times parsing the taxonomy feeders against reading them back from the model cache
+
+    Args:
+        cache_dir (str): folder of the parsed models, a temporary folder that is removed afterwards if None
+    """
+    import glob
+    import shutil
+    import tempfile
+
+    files = sorted(glob.glob(os.path.join(feeders_path, "R*-*.glm")) +
+                   glob.glob(os.path.join(feeders_path, "GC-*.glm")))
+    temp_dir = None
+    if cache_dir is None:
+        cache_dir = temp_dir = tempfile.mkdtemp()
+    print("{:20s} {:>8s} {:>8s} {:>8s} {:>8s}".format("feeder", "objects", "parse", "cached", "speedup"))
+    total = [0.0, 0.0]
+    try:
+        for filename in files:
+            # parse, fill the cache, then read it back, each into a new model
+            models = [GLMModel() for _ in range(3)]
+            model = models[0]
+            t0 = time.perf_counter()
+            model.read(filename, False)
+            t1 = time.perf_counter()
+            models[1].read(filename, cache_dir)
+            t2 = time.perf_counter()
+            models[2].read(filename, cache_dir)
+            t3 = time.perf_counter()
+            objects = sum(len(model.model[name]) for name in model.model)
+            total[0] += t1 - t0
+            total[1] += t3 - t2
+            print("{:20s} {:8d} {:8.3f} {:8.3f} {:8.1f}".format(
+                os.path.basename(filename), objects, t1 - t0, t3 - t2, (t1 - t0) / (t3 - t2)))
+        print("{:20s} {:>8s} {:8.3f} {:8.3f} {:8.1f}".format("total", "", total[0], total[1], total[0] / total[1]))
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
 # Press the green button in the gutter to run the script.
 if __name__ == '__main__':
     _test1()
@@ -129,46 +129,23 @@ class GLMModifier:
         Returns:
             bool: Indicates whether the rename succeeded
         """
-        object_entity = self.model.object_entities[gld_type]
-        if object_entity:
-            if object_entity.instances[old_name]:
-                model_object = self.model.model[gld_type]
-                for object_name in self.model.object_entities:
-                    _instances = self.model.object_entities[object_name].instances
-                    for _instance_name, _instance in _instances.items():
-                        for _attr, _val in _instance.items():
-                            if _val == old_name:
-                                _instances[_instance_name][_attr] = new_name
-                if new_name != old_name:
-                    object_entity.instances[new_name] = object_entity.instances[old_name]
-                    del object_entity.instances[old_name]
-                    model_object[new_name] = model_object[old_name]
-                    del model_object[old_name]
-                return True
-        return False
+        return self.model.rename_object(gld_type, old_name, new_name)
 
     def del_object(self, gld_type: str, name: str) -> None:
         """Deletes an existing GridLAB-D object (those that start "object ..." in a .glm
-        like transformers, lines, houses, and triplex_meters) from the GLMModel object.
+        like transformers, lines, houses, and triplex_meters) from the GLMModel object,
+        along with its children and their children.
 
         Args:
             gld_type (str): Type of GridLAB-D object being renamed
             name (str): Name of GridLAB-D object being
         """
-        self.model.object_entities[gld_type].del_instance(name)
-        for obj in self.model.object_entities:
-            myObj = self.model.object_entities[obj]
-            myArr = []
-            if myObj.find_item('parent'):
-                for myName in myObj.instances:
-                    instance = myObj.instances[myName]
-                    if 'parent' in instance.keys():
-                        if instance['parent'] == name:
-                            myArr.append(myName)
-            # TODO from-to relations
-            for myName in myArr:
-                self.model.del_object(gld_type, name)
-                myObj.del_instance(myName)
+        # TODO from-to relations
+        objects = [(gld_type, name)]
+        while len(objects):
+            obj_type, obj_name = objects.pop()
+            objects += self.model.find_children(obj_name)
+            self.model.del_object(obj_type, obj_name)
 
     def replace_object_type(self) -> None:
         """UNIMPLEMENTED
@@ -191,7 +168,7 @@ class GLMModifier:
         Returns:
             None
         """
-        return self.model.object_entities[gld_type].set_item(name, item_name, item_value)
+        return self.model.set_object_item(gld_type, name, item_name, item_value)
 
     def del_object_attr(self, gld_type: str, name: str, item_name: str) -> None:
         """Deletes an attribute of an existing object (those that start "object ..." in a .glm
@@ -204,19 +181,20 @@ class GLMModifier:
             attribute is being removed
             item_name (string): Name of attribute to remove
         """
-        self.model.object_entities[gld_type].del_item(name, item_name)
+        self.model.del_object_item(gld_type, name, item_name)
 
     # Read and Write .GLM files
-    def read_model(self, filepath: str) -> bool:
+    def read_model(self, filepath: str, cache_dir=None) -> bool:
         """Reads in GridLAB-D model from a file (.glm) and stores it as an instance of the GLMModel object.
 
         Args:
             filepath (string): Path to the GridLAB-D model to be read in
+            cache_dir (string): Folder of the parsed models, see GLMModel.readModel
 
         Returns:
             bool: Indicates whether the model was read in successfully
         """
-        return self.model.read(filepath)
+        return self.model.read(filepath, cache_dir)
 
     def write_model(self, filepath: str) -> bool:
         """Writes out a GridLAB-D model to a file (.glm) based on the current
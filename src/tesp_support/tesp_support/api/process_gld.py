@@ -14,11 +14,13 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 
+from .metrics_reader import read_metrics_file
+
 # Setting up logging
 logger = logging.getLogger(__name__)
 
 
-def read_gld_metrics(path, name_root, diction_name=''):
+def read_gld_metrics(path, name_root, diction_name='', cache=False):
     glm_dict_path = os.path.join(path, f'{name_root}_glm_dict.json')
     sub_dict_path = os.path.join(path, f'substation_{name_root}_metrics.json')
     house_dict_path = os.path.join(path, f'house_{name_root}_metrics.json')
@@ -65,24 +67,19 @@ def read_gld_metrics(path, name_root, diction_name=''):
 
     # parse the substation metrics file first; there should just be one entity per time sample
     # each metrics file should have matching time points
-    lp_s = open(sub_dict_path).read()
-    lst_s = json.loads(lp_s)
-    print('\nMetrics data starting', lst_s['StartTime'])
+    lst_s = read_metrics_file(sub_dict_path, cache=cache)
+    print('\nMetrics data starting', lst_s['start_time'])
 
     # make a sorted list of the sample times in hours
-    lst_s.pop('StartTime')
-    meta_s = lst_s.pop('Metadata')
-    times = list(map(int, list(lst_s.keys())))
-    times.sort()
+    meta_s = lst_s['metadata']
+    times = lst_s['times'].tolist()
     print('There are', len(times), 'sample times at', times[1] - times[0], 'second intervals')
     hrs = np.array(times, dtype=float)
     denom = 3600.0
     hrs /= denom
 
-    time_key = str(times[0])
-
     # find the actual substation name (not a feeder name) as GridLAB-D wrote it to the metrics file
-    sub_key = list(lst_s[time_key].keys())[0]
+    sub_key = lst_s['keys'][0]
     print('\n\nFile', sub_dict_path, 'has substation', sub_key, 'at bulk system bus',
           bulkBus, 'with', xfMVA, 'MVA transformer')
     print('\nFeeder Dictionary:')
@@ -91,7 +88,7 @@ def read_gld_metrics(path, name_root, diction_name=''):
         print(key, 'has', row['house_count'], 'houses and', row['inverter_count'], 'inverters')
 
     # parse the substation metadata for 2 things of specific interest
-    # print ('\nSubstation Metadata for', len(lst_s[time_key]), 'objects')
+    # print ('\nSubstation Metadata for', lst_s['count'], 'objects')
     idx_s = {}
     for key, val in meta_s.items():
         # print (key, val['index'], val['units'])
@@ -103,16 +100,8 @@ def read_gld_metrics(path, name_root, diction_name=''):
             idx_s['SUB_LOSSES_UNITS'] = val['units']
 
     # create a NumPy array of all metrics for the substation
-    data_s = np.empty(shape=(1, len(times), len(lst_s[time_key][sub_key])), dtype=float)
+    data_s = lst_s['data'][:1]
     print('\nConstructed', data_s.shape, 'NumPy array for Substations')
-    j = 0
-    for key in [sub_key]:
-        i = 0
-        for t in times:
-            ary = lst_s[str(t)][key]
-            data_s[j, i, :] = ary
-            i = i + 1
-        j = j + 1
 
     # display some averages
     print('Maximum power =',
@@ -123,23 +112,19 @@ def read_gld_metrics(path, name_root, diction_name=''):
           '{:.3f}'.format(data_s[0, :, idx_s['SUB_LOSSES_IDX']].mean()), idx_s['SUB_LOSSES_UNITS'])
 
     # read the other JSON files; their times (hrs) should be the same
-    lp_h = open(house_dict_path).read()
-    lst_h = json.loads(lp_h)
-    lp_m = open(bm_dict_path).read()
-    lst_m = json.loads(lp_m)
-    lp_i = open(inv_dict_path).read()
-    lst_i = json.loads(lp_i)
-    lp_c = open(cap_dict_path).read()
-    lst_c = json.loads(lp_c)
-    lp_r = open(reg_dict_path).read()
-    lst_r = json.loads(lp_r)
+    # there may be some houses and meters in the dictionary that we don't write metrics for,
+    # e.g., write_node_houses with default node_metrics_interval=None
+    lst_h = read_metrics_file(house_dict_path, hse_keys, cache)
+    lst_m = read_metrics_file(bm_dict_path, mtr_keys, cache)
+    lst_i = read_metrics_file(inv_dict_path, inv_keys, cache)
+    lst_c = read_metrics_file(cap_dict_path, cap_keys, cache)
+    lst_r = read_metrics_file(reg_dict_path, reg_keys, cache)
 
     # houses
     idx_h = {}
     data_h = None
-    lst_h.pop('StartTime')
-    meta_h = lst_h.pop('Metadata')
-    # print('\nHouse Metadata for', len(lst_h[time_key]), 'objects')
+    meta_h = lst_h['metadata']
+    # print('\nHouse Metadata for', lst_h['count'], 'objects')
     for key, val in meta_h.items():
         # print (key, val['index'], val['units'])
         if key == 'air_temperature_avg':
@@ -170,20 +155,10 @@ def read_gld_metrics(path, name_root, diction_name=''):
             idx_h['HSE_WH_AVG_IDX'] = val['index']
             idx_h['HSE_WH_AVG_UNITS'] = val['units']
     if len(hse_keys) > 0:
-        # there may be some houses in the dictionary that we don't write metrics for,
-        # e.g., write_node_houses with default node_metrics_interval=None
-        hse_keys = [x for x in hse_keys if x in lst_h[time_key]]
+        hse_keys = lst_h['keys']
         print(len(hse_keys), 'houses left')
-        data_h = np.empty(shape=(len(hse_keys), len(times), len(lst_h[time_key][hse_keys[0]])), dtype=float)
+        data_h = lst_h['data']
         print('\nConstructed', data_h.shape, 'NumPy array for Houses')
-        j = 0
-        for _ in hse_keys:
-            i = 0
-            for t in times:
-                ary = lst_h[str(t)][hse_keys[j]]
-                data_h[j, i, :] = ary
-                i = i + 1
-            j = j + 1
 
         print('average all house temperatures Noon-8 pm first day:',
               '{:.3f}'.format(data_h[:, 144:240, idx_h['HSE_AIR_AVG_IDX']].mean()))
@@ -191,11 +166,8 @@ def read_gld_metrics(path, name_root, diction_name=''):
     # Billing Meters
     idx_m = {}
     data_m = None
-    lst_m.pop('StartTime')
-    meta_m = lst_m.pop('Metadata')
-    nBillingMeters = 0
-    if not lst_m[time_key] is None:
-        nBillingMeters = len(lst_m[time_key])
+    meta_m = lst_m['metadata']
+    nBillingMeters = lst_m['count']
     #  print('\nBilling Meter Metadata for', nBillingMeters, 'objects')
     for key, val in meta_m.items():
         #    print(key, val['index'], val['units'])
@@ -258,20 +230,10 @@ def read_gld_metrics(path, name_root, diction_name=''):
             idx_m['MTR_REAL_POWER_MIN_IDX'] = val['index']
 
     if nBillingMeters > 0:
-        # there may be some meters in the dictionary that we don't write metrics for,
-        # e.g., write_node_houses with default node_metrics_interval=None
-        mtr_keys = [x for x in mtr_keys if x in lst_m[time_key]]
+        mtr_keys = lst_m['keys']
         print(len(mtr_keys), 'meters left, expecting', nBillingMeters)
-        data_m = np.empty(shape=(len(mtr_keys), len(times), len(lst_m[time_key][mtr_keys[0]])), dtype=float)
+        data_m = lst_m['data']
         print('\nConstructed', data_m.shape, 'NumPy array for Meters')
-        j = 0
-        for _ in mtr_keys:
-            i = 0
-            for t in times:
-                ary = lst_m[str(t)][mtr_keys[j]]
-                data_m[j, i, :] = ary
-                i = i + 1
-            j = j + 1
 
     # normalize the meter voltages to 100 percent
     j = 0
@@ -287,8 +249,7 @@ def read_gld_metrics(path, name_root, diction_name=''):
 
     idx_i = {}
     data_i = None
-    lst_i.pop('StartTime')
-    meta_i = lst_i.pop('Metadata')
+    meta_i = lst_i['metadata']
     # assemble the total solar and battery inverter power
     solar_kw = np.zeros(len(times), dtype=float)
     battery_kw = np.zeros(len(times), dtype=float)
@@ -302,17 +263,10 @@ def read_gld_metrics(path, name_root, diction_name=''):
             idx_i['INV_Q_AVG_IDX'] = val['index']
             idx_i['INV_Q_AVG_UNITS'] = val['units']
     if len(inv_keys) > 0:
-        data_i = np.empty(shape=(len(inv_keys), len(times), len(lst_i[time_key][inv_keys[0]])), dtype=float)
+        inv_keys = lst_i['keys']
+        data_i = lst_i['data']
         print('\nConstructed', data_i.shape, 'NumPy array for Inverters')
         j = 0
-        for _ in inv_keys:
-            i = 0
-            for t in times:
-                ary = lst_i[str(t)][inv_keys[j]]
-                data_i[j, i, :] = ary
-                i = i + 1
-            j = j + 1
-        j = 0
         for key in inv_keys:
             res = diction['inverters'][key]['resource']
             if res == 'solar':
@@ -323,46 +277,30 @@ def read_gld_metrics(path, name_root, diction_name=''):
 
     idx_c = {}
     data_c = None
-    lst_c.pop('StartTime')
-    meta_c = lst_c.pop('Metadata')
+    meta_c = lst_c['metadata']
     #  print('\nCapacitor Metadata for', len(cap_keys), 'objects')
     for key, val in meta_c.items():
         if key == 'operation_count':
             idx_c['CAP_COUNT_IDX'] = val['index']
             idx_c['CAP_COUNT_UNITS'] = val['units']
     if len(cap_keys) > 0 and bCollectedRegCapMetrics:
-        data_c = np.empty(shape=(len(cap_keys), len(times), len(lst_c[time_key][cap_keys[0]])), dtype=float)
+        cap_keys = lst_c['keys']
+        data_c = lst_c['data']
         print('\nConstructed', data_c.shape, 'NumPy array for Capacitors')
-        j = 0
-        for _ in cap_keys:
-            i = 0
-            for t in times:
-                ary = lst_c[str(t)][cap_keys[j]]
-                data_c[j, i, :] = ary
-                i = i + 1
-            j = j + 1
         print('Total cap switchings =', data_c[:, -1, idx_c['CAP_COUNT_IDX']].sum())
 
     idx_r = {}
     data_r = None
-    lst_r.pop('StartTime')
-    meta_r = lst_r.pop('Metadata')
+    meta_r = lst_r['metadata']
     #  print('\nRegulator Metadata for', len(reg_keys), 'objects')
     for key, val in meta_r.items():
         if key == 'operation_count':
             idx_r['REG_COUNT_IDX'] = val['index']
             idx_r['REG_COUNT_UNITS'] = val['units']
     if len(reg_keys) > 0 and bCollectedRegCapMetrics:
-        data_r = np.empty(shape=(len(reg_keys), len(times), len(lst_r[time_key][reg_keys[0]])), dtype=float)
+        reg_keys = lst_r['keys']
+        data_r = lst_r['data']
         print('\nConstructed', data_r.shape, 'NumPy array for Regulators')
-        j = 0
-        for _ in reg_keys:
-            i = 0
-            for t in times:
-                ary = lst_r[str(t)][reg_keys[j]]
-                data_r[j, i, :] = ary
-                i = i + 1
-            j = j + 1
         print('Total tap changes =', data_r[:, -1, idx_r['REG_COUNT_IDX']].sum())
 
     if data_m is not None:
@@ -587,7 +525,7 @@ def plot_gld(diction, save_file=None, save_only=False):
         plt.show()
 
 
-def process_gld(name_root, diction_name='', save_file=None, save_only=False):
+def process_gld(name_root, diction_name='', save_file=None, save_only=False, cache=False):
     """ Plots a summary/sample of power, air temperature and voltage
 
     This function reads *substation_[name_root]_metrics.json*,
@@ -607,7 +545,8 @@ def process_gld(name_root, diction_name='', save_file=None, save_only=False):
       diction_name (str): metafile name (with json extension) for a different GLM dictionary, if it's not *[name_root]_glm_dict.json*. Defaults to empty.
       save_file (str): name of a file to save plot, should include the *png* or *pdf* extension to determine type.
       save_only (bool): set True with *save_file* to skip the display of the plot. Otherwise, script waits for user keypress.
+      cache (bool): set True to keep a binary *npz* copy next to each metrics file, so later calls skip the JSON parsing.
     """
     path = os.getcwd()
-    diction = read_gld_metrics(path, name_root, diction_name)
+    diction = read_gld_metrics(path, name_root, diction_name, cache)
     plot_gld(diction, save_file, save_only)
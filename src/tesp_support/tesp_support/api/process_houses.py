@@ -14,11 +14,13 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 
+from .metrics_reader import read_metrics_file
+
 # Setting up logging
 logger = logging.getLogger(__name__)
 
 
-def read_houses_metrics(path, name_root, diction_name=''):
+def read_houses_metrics(path, name_root, diction_name='', cache=False):
     gld_dict_path = os.path.join(path, f'{name_root}_glm_dict.json')
     house_dict_path = os.path.join(path, f'house_{name_root}_metrics.json')
     # first, read and print a dictionary of all the monitored GridLAB-D objects
@@ -42,18 +44,15 @@ def read_houses_metrics(path, name_root, diction_name=''):
     #   # row['feeder_id'] is also available
 
     # Houses
-    lp_h = open(house_dict_path).read()
-    lst_h = json.loads(lp_h)
-    lst_h.pop('StartTime')
-    meta_h = lst_h.pop('Metadata')
-    times = list(map(int, list(lst_h.keys())))
-    times.sort()
+    lst_h = read_metrics_file(house_dict_path, hse_keys, cache)
+    meta_h = lst_h['metadata']
+    times = lst_h['times'].tolist()
     print("There are", len(times), "sample times at", times[1] - times[0], "second intervals")
     hrs = np.array(times, dtype=float)
     denom = 3600.0
     hrs /= denom
 
-    #  print("\nHouse Metadata for", len(lst_h[time_key]), "objects")
+    #  print("\nHouse Metadata for", lst_h['count'], "objects")
     idx_h = {}
     for key, val in meta_h.items():
         # print (key, val['index'], val['units'])
@@ -86,17 +85,9 @@ def read_houses_metrics(path, name_root, diction_name=''):
         elif key == 'air_temperature_setpoint_heating':
             idx_h['HSE_SET_HEAT_IDX'] = val['index']
 
-    time_key = str(times[0])
-    data_h = np.empty(shape=(len(hse_keys), len(times), len(lst_h[time_key][hse_keys[0]])), dtype=float)
+    hse_keys = lst_h['keys']
+    data_h = lst_h['data']
     print("\nConstructed", data_h.shape, "NumPy array for Houses")
-    j = 0
-    for _ in hse_keys:
-        i = 0
-        for t in times:
-            ary = lst_h[str(t)][hse_keys[j]]
-            data_h[j, i, :] = ary
-            i = i + 1
-        j = j + 1
 
     return {
         'hrs': hrs,
@@ -130,7 +121,7 @@ def plot_houses(diction, save_file=None, save_only=False):
         plt.show()
 
 
-def process_houses(name_root, diction_name='', save_file=None, save_only=True):
+def process_houses(name_root, diction_name='', save_file=None, save_only=True, cache=False):
     """ Plots the temperature and HVAC power for every house
 
     This function reads *substation_[name_root]_metrics.json* and
@@ -147,7 +138,8 @@ def process_houses(name_root, diction_name='', save_file=None, save_only=True):
       diction_name (str): metafile name (with json extension) for a different GLM dictionary, if it's not *[name_root]_glm_dict.json*. Defaults to empty.
       save_file (str): name of a file to save plot, should include the *png* or *pdf* extension to determine type.
       save_only (bool): set True with *save_file* to skip the display of the plot. Otherwise, script waits for user keypress.
+      cache (bool): set True to keep a binary *npz* copy next to the metrics file, so later calls skip the JSON parsing.
     """
     path = os.getcwd()
-    diction = read_houses_metrics(path, name_root, diction_name)
+    diction = read_houses_metrics(path, name_root, diction_name, cache)
     plot_houses(diction, save_file, save_only)
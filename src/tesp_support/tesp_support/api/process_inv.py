@@ -14,11 +14,13 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 
+from .metrics_reader import read_metrics_file
+
 # Setting up logging
 logger = logging.getLogger(__name__)
 
 
-def read_inv_metrics(path, name_root, diction_name=''):
+def read_inv_metrics(path, name_root, diction_name='', cache=False):
     glm_dict_path = os.path.join(path, f'{name_root}_glm_dict.json')
     sub_dict_path = os.path.join(path, f'substation_{name_root}_metrics.json')
     house_dict_path = os.path.join(path, f'house_{name_root}_metrics.json')
@@ -76,24 +78,19 @@ def read_inv_metrics(path, name_root, diction_name=''):
 
     # parse the substation metrics file first; there should just be one entity per time sample
     # each metrics file should have matching time points
-    lp_s = open(sub_dict_path).read()
-    lst_s = json.loads(lp_s)
-    print('\nMetrics data starting', lst_s['StartTime'])
+    lst_s = read_metrics_file(sub_dict_path, sub_keys, cache)
+    print('\nMetrics data starting', lst_s['start_time'])
 
     # make a sorted list of the sample times in hours
-    lst_s.pop('StartTime')
-    meta_s = lst_s.pop('Metadata')
-    times = list(map(int, list(lst_s.keys())))
-    times.sort()
+    meta_s = lst_s['metadata']
+    times = lst_s['times'].tolist()
     print('There are', len(times), 'sample times at', times[1] - times[0], 'second intervals')
     hrs = np.array(times, dtype=float)
     denom = 3600.0
     hrs /= denom
 
-    time_key = str(times[0])
-
     # parse the substation metadata for 2 things of specific interest
-    # print ("\nSubstation Metadata for", len(lst_s[time_key]), "objects")
+    # print ("\nSubstation Metadata for", lst_s['count'], "objects")
     for key, val in meta_s.items():
         # print (key, val['index'], val['units'])
         if key == 'real_power_avg':
@@ -104,33 +101,20 @@ def read_inv_metrics(path, name_root, diction_name=''):
             SUB_LOSSES_UNITS = val['units']
 
     # create a NumPy array of all metrics for the substation
-    data_s = np.empty(shape=(len(sub_keys), len(times), len(lst_s[time_key][sub_keys[0]])), dtype=float)
+    sub_keys = lst_s['keys']
+    data_s = lst_s['data']
     # print ("\nConstructed", data_s.shape, "NumPy array for Substations")
-    j = 0
-    for _ in sub_keys:
-        i = 0
-        for t in times:
-            ary = lst_s[str(t)][sub_keys[j]]
-            data_s[j, i, :] = ary
-            i = i + 1
-        j = j + 1
 
     # read the other JSON files; their times (hrs) should be the same
-    lp_h = open(house_dict_path).read()
-    lst_h = json.loads(lp_h)
-    lp_m = open(bm_dict_path).read()
-    lst_m = json.loads(lp_m)
-    lp_i = open(inv_dict_path).read()
-    lst_i = json.loads(lp_i)
-    lp_c = open(cap_dict_path).read()
-    lst_c = json.loads(lp_c)
-    lp_r = open(reg_dict_path).read()
-    lst_r = json.loads(lp_r)
+    lst_h = read_metrics_file(house_dict_path, hse_keys, cache)
+    lst_m = read_metrics_file(bm_dict_path, mtr_keys, cache)
+    lst_i = read_metrics_file(inv_dict_path, inv_keys, cache)
+    lst_c = read_metrics_file(cap_dict_path, cap_keys, cache)
+    lst_r = read_metrics_file(reg_dict_path, reg_keys, cache)
 
     # houses
-    lst_h.pop('StartTime')
-    meta_h = lst_h.pop('Metadata')
-    # print('\nHouse Metadata for', len(lst_h[time_key]), 'objects')
+    meta_h = lst_h['metadata']
+    # print('\nHouse Metadata for', lst_h['count'], 'objects')
     for key, val in meta_h.items():
         # print (key, val['index'], val['units'])
         if key == 'air_temperature_max':
@@ -155,21 +139,13 @@ def read_inv_metrics(path, name_root, diction_name=''):
             HSE_WH_AVG_IDX = val['index']
             HSE_WH_AVG_UNITS = val['units']
 
-    data_h = np.empty(shape=(len(hse_keys), len(times), len(lst_h[time_key][hse_keys[0]])), dtype=float)
+    hse_keys = lst_h['keys']
+    data_h = lst_h['data']
     # print ("\nConstructed", data_h.shape, "NumPy array for Houses")
-    j = 0
-    for _ in hse_keys:
-        i = 0
-        for t in times:
-            ary = lst_h[str(t)][hse_keys[j]]
-            data_h[j, i, :] = ary
-            i = i + 1
-        j = j + 1
 
     # Billing Meters
-    lst_m.pop('StartTime')
-    meta_m = lst_m.pop('Metadata')
-    # print("\nBilling Meter Metadata for", len(lst_m[time_key]), "objects")
+    meta_m = lst_m['metadata']
+    # print("\nBilling Meter Metadata for", lst_m['count'], "objects")
     for key, val in meta_m.items():
         # print (key, val['index'], val['units'])
         if key == 'voltage_max':
@@ -216,16 +192,9 @@ def read_inv_metrics(path, name_root, diction_name=''):
         elif key == 'below_10_percent_NormVol_Duration':
             MTR_OUT_DURATION_IDX = val['index']
 
-    data_m = np.empty(shape=(len(mtr_keys), len(times), len(lst_m[time_key][mtr_keys[0]])), dtype=float)
+    mtr_keys = lst_m['keys']
+    data_m = lst_m['data']
     # print ("\nConstructed", data_m.shape, "NumPy array for Meters")
-    j = 0
-    for _ in mtr_keys:
-        i = 0
-        for t in times:
-            ary = lst_m[str(t)][mtr_keys[j]]
-            data_m[j, i, :] = ary
-            i = i + 1
-        j = j + 1
 
     have_invs = False
     have_precool = False
@@ -236,9 +205,8 @@ def read_inv_metrics(path, name_root, diction_name=''):
     data_i = None
     if len(inv_keys) > 0:
         have_invs = True
-        lst_i.pop('StartTime')
-        meta_i = lst_i.pop('Metadata')
-        # print("\nInverter Metadata for", len(lst_i[time_key]), "objects")
+        meta_i = lst_i['metadata']
+        # print("\nInverter Metadata for", lst_i['count'], "objects")
         for key, val in meta_i.items():
             # print(key, val['index'], val['units'])
             if key == 'real_power_avg':
@@ -248,31 +216,20 @@ def read_inv_metrics(path, name_root, diction_name=''):
                 INV_Q_AVG_IDX = val['index']
                 INV_Q_AVG_UNITS = val['units']
 
-        data_i = np.empty(shape=(len(inv_keys), len(times), len(lst_i[time_key][inv_keys[0]])), dtype=float)
+        inv_keys = lst_i['keys']
+        data_i = lst_i['data']
         print("\nConstructed", data_i.shape, "NumPy array for Inverters")
-        j = 0
-        for _ in inv_keys:
-            i = 0
-            for t in times:
-                ary = lst_i[str(t)][inv_keys[j]]
-                data_i[j, i, :] = ary
-                i = i + 1
-            j = j + 1
 
     # Precooling: won't necessarily have the same times?
     if os.path.exists(pre_dict_path):
         have_precool = True
-        lp_p = open(pre_dict_path).read()
-        lst_p = json.loads(lp_p)
-        lst_p.pop('StartTime')
-        meta_p = lst_p.pop('Metadata')
-        times_p = list(map(int, list(lst_p.keys())))
-        times_p.sort()
+        lst_p = read_metrics_file(pre_dict_path, cache=cache)
+        meta_p = lst_p['metadata']
+        times_p = lst_p['times'].tolist()
         print("There are", len(times_p), "agent sample times at", times_p[1] - times_p[0], "second intervals")
         hrs_p = np.array(times_p, dtype=float)
         denom = 3600.0
         hrs_p /= denom
-        time_p_key = str(times_p[0])
         for key, val in meta_p.items():
             if key == 'temperature_deviation_avg':
                 TEMPDEV_AVG_IDX = val['index']
@@ -283,55 +240,36 @@ def read_inv_metrics(path, name_root, diction_name=''):
             elif key == 'temperature_deviation_max':
                 TEMPDEV_MAX_IDX = val['index']
                 TEMPDEV_MAX_UNITS = val['units']
-        data_p = np.empty(shape=(1, len(times_p), len(lst_p[time_p_key])), dtype=float)
+        data_p = lst_p['data']
         print("\nConstructed", data_p.shape, "NumPy array for Agents")
-        for i, t in enumerate(times_p):
-            ary = lst_p[str(t)]
-            data_p[0, i, :] = ary
 
     # Capacitors
     data_c = None
     if len(cap_keys) > 0:
         have_caps = True
-        lst_c.pop('StartTime')
-        meta_c = lst_c.pop('Metadata')
-        #    print("\nCapacitor Metadata for", len(lst_c[time_key]), "objects")
+        meta_c = lst_c['metadata']
+        #    print("\nCapacitor Metadata for", lst_c['count'], "objects")
         for key, val in meta_c.items():
             if key == 'operation_count':
                 CAP_COUNT_IDX = val['index']
                 CAP_COUNT_UNITS = val['units']
-        data_c = np.empty(shape=(len(cap_keys), len(times), len(lst_c[time_key][cap_keys[0]])), dtype=float)
+        cap_keys = lst_c['keys']
+        data_c = lst_c['data']
         print("\nConstructed", data_c.shape, "NumPy array for Capacitors")
-        j = 0
-        for _ in cap_keys:
-            i = 0
-            for t in times:
-                ary = lst_c[str(t)][cap_keys[j]]
-                data_c[j, i, :] = ary
-                i = i + 1
-            j = j + 1
 
     # Regulators
     data_r = None
     if len(reg_keys) > 0:
         have_regs = True
-        lst_r.pop('StartTime')
-        meta_r = lst_r.pop('Metadata')
-        #    print("\nRegulator Metadata for", len(lst_r[time_key]), "objects")
+        meta_r = lst_r['metadata']
+        #    print("\nRegulator Metadata for", lst_r['count'], "objects")
         for key, val in meta_r.items():
             if key == 'operation_count':
                 REG_COUNT_IDX = val['index']
                 REG_COUNT_UNITS = val['units']
-        data_r = np.empty(shape=(len(reg_keys), len(times), len(lst_r[time_key][reg_keys[0]])), dtype=float)
+        reg_keys = lst_r['keys']
+        data_r = lst_r['data']
         print("\nConstructed", data_r.shape, "NumPy array for Regulators")
-        j = 0
-        for _ in reg_keys:
-            i = 0
-            for t in times:
-                ary = lst_r[str(t)][reg_keys[j]]
-                data_r[j, i, :] = ary
-                i = i + 1
-            j = j + 1
 
     # assemble the total solar and battery inverter power
     j = 0
@@ -610,7 +548,7 @@ def plot_inv(diction, save_file=None, save_only=False):
         plt.show()
 
 
-def process_inv(name_root, diction_name='', title=None, save_file=None, save_only=False):
+def process_inv(name_root, diction_name='', title=None, save_file=None, save_only=False, cache=False):
     """ Plots inverter and volt-var data for the NIST TE Challenge 2 / IEEE 8500 examples
 
     This function reads *substation_[name_root]_metrics.json*,
@@ -641,8 +579,9 @@ def process_inv(name_root, diction_name='', title=None, save_file=None, save_onl
       title (str):
       save_file (str): name of a file to save plot, should include the *png* or *pdf* extension to determine type.
       save_only (bool): set True with *save_file* to skip the display of the plot. Otherwise, script waits for user keypress.
+      cache (bool): set True to keep a binary *npz* copy next to each metrics file, so later calls skip the JSON parsing.
     """
 
     path = os.getcwd()
-    diction = read_inv_metrics(path, name_root, diction_name)
+    diction = read_inv_metrics(path, name_root, diction_name, cache)
     plot_inv(diction, title, save_file, save_only)
@@ -14,11 +14,13 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 
+from .metrics_reader import read_metrics_file
+
 # Setting up logging
 logger = logging.getLogger(__name__)
 
 
-def read_voltages_metrics(path, name_root, diction_name=''):
+def read_voltages_metrics(path, name_root, diction_name='', cache=False):
     glm_dict_path = os.path.join(path, f'{name_root}_glm_dict.json')
     billing_dict_path = os.path.join(path, f'billing_meter_{name_root}_metrics.json')
     # first, read and print a dictionary of all the monitored GridLAB-D objects
@@ -41,18 +43,15 @@ def read_voltages_metrics(path, name_root, diction_name=''):
     # # print (key, "on phase", row['phases'], "of", row['feeder_id'], "with", row['children'])
 
     # make a sorted list of the sample times in hours
-    lp_m = open(billing_dict_path).read()
-    lst_m = json.loads(lp_m)
-    lst_m.pop('StartTime')
-    meta_m = lst_m.pop('Metadata')
-    times = list(map(int, list(lst_m.keys())))
-    times.sort()
+    lst_m = read_metrics_file(billing_dict_path, mtr_keys, cache)
+    meta_m = lst_m['metadata']
+    times = lst_m['times'].tolist()
     print("There are", len(times), "sample times at", times[1] - times[0], "second intervals")
     hrs = np.array(times, dtype=float)
     denom = 3600.0
     hrs /= denom
 
-    # print("\nBilling Meter Metadata for", len(lst_m['3600']), "objects")
+    # print("\nBilling Meter Metadata for", lst_m['count'], "objects")
     idx_m = {}
     for key, val in meta_m.items():
         # print (key, val['index'], val['units'])
@@ -75,17 +74,9 @@ def read_voltages_metrics(path, name_root, diction_name=''):
             idx_m['MTR_VOLTUNB_MAX_IDX'] = val['index']
             idx_m['MTR_VOLTUNB_MAX_UNITS'] = val['units']
 
-    time_key = str(times[0])
-    data_m = np.empty(shape=(len(mtr_keys), len(times), len(lst_m[time_key][mtr_keys[0]])), dtype=float)
+    mtr_keys = lst_m['keys']
+    data_m = lst_m['data']
     print("\nConstructed", data_m.shape, "NumPy array for Meters")
-    j = 0
-    for _ in mtr_keys:
-        i = 0
-        for t in times:
-            ary = lst_m[str(t)][mtr_keys[j]]
-            data_m[j, i, :] = ary
-            i = i + 1
-        j = j + 1
 
     # normalize the meter voltages to 100 percent
     j = 0
@@ -130,7 +121,7 @@ def plot_voltages(diction, save_file=None, save_only=False):
         plt.show()
 
 
-def process_voltages(name_root, diction_name='', save_file=None, save_only=True):
+def process_voltages(name_root, diction_name='', save_file=None, save_only=True, cache=False):
     """ Plots the min and max line-neutral voltages for every billing meter
 
     This function reads *substation_[name_root]_metrics.json* and
@@ -147,7 +138,8 @@ def process_voltages(name_root, diction_name='', save_file=None, save_only=True)
       diction_name (str): metafile name (with json extension) for a different GLM dictionary, if it's not *[name_root]_glm_dict.json*. Defaults to empty.
       save_file (str): name of a file to save plot, should include the *png* or *pdf* extension to determine type.
       save_only (bool): set True with *save_file* to skip the display of the plot. Otherwise, script waits for user keypress.
+      cache (bool): set True to keep a binary *npz* copy next to the metrics file, so later calls skip the JSON parsing.
     """
     path = os.getcwd()
-    diction = read_voltages_metrics(path, name_root, diction_name)
+    diction = read_voltages_metrics(path, name_root, diction_name, cache)
     plot_voltages(diction, save_file, save_only)
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import math
 import os
@@ -8,6 +9,8 @@ import pandas as pd
 
 from tesp_support.api.data import feeders_path
 
+CACHE_VERSION = 1
+
 
 def bin_size_check(sample_data, recs_data, state, housing_dens, inc_lev, binsize, climate_zone, income_str):
     og_bin_size = len(sample_data)
@@ -489,15 +492,41 @@ def get_residential_metadata(metadata, sample_data, state, hsdens_str, inc_lev,
     return metadata, total_dict
 
 
+def _triple_cache_file(cache_dir, recs_data_file, st, hd, il, income_levels, bin_size_thres, climate_zone, wh_shift):
+    info = os.stat(recs_data_file)
+    stamp = json.dumps([CACHE_VERSION, info.st_size, info.st_mtime_ns, st, hd, il, income_levels,
+                        bin_size_thres, climate_zone, wh_shift])
+    digest = hashlib.sha1(stamp.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, '{}_{}_{}_{}.json'.format(st, hd, il, digest[:16]))
+
+
 def get_RECS_jsons(bldg_in, bldg_out, hvac_out,
-                   sample=None, bin_size_thres=100, climate_zone=None, wh_shift=0.0):
+                   sample=None, bin_size_thres=100, climate_zone=None, wh_shift=0.0, cache_dir=None):
+    """
+    Write the residential metadata and thermostat setpoint distributions for
+    each state, housing density and income level of the sample.
 
+    With a cache_dir, the distributions of each (state, housing density,
+    income level) are saved there as .json, keyed by the RECS data file and
+    the sampling parameters, so the RECS data are only read and filtered for
+    the ones not seen before.
+
+    Args:
+        bldg_in (str): residential metadata file with the non-RECS distributions
+        bldg_out (str): residential metadata file to write
+        hvac_out (str): thermostat setpoint file to write
+        sample (dict): lists of 'state', 'housing_density' and 'income_level'
+        bin_size_thres (int): minimum number of RECS samples for a distribution
+        climate_zone (str): IECC climate zone to widen small samples by, or None
+        wh_shift (float): fraction of gas water heaters shifted to electric
+        cache_dir (str): folder of the cached distributions, or None to always derive them from the RECS data
+    """
 
     # Read RECS data file
     if sample is None:
         sample = {'state': [], 'housing_density': [], 'income_level': []}
     recs_data_file = os.path.join(feeders_path,'RECSwIncomeLvl.csv')
-    recs = pd.read_csv(recs_data_file)
+    recs = None
     # Use the right income level data from RECS
     inc_str = 'Income_cat2'
     # Make sure income level is in the right order
@@ -534,21 +563,38 @@ def get_RECS_jsons(bldg_in, bldg_out, hvac_out,
                 res_metadata[key][st].update({hd_str: {}})  # Add new housing density keys to the metadata dictionary
             for key in hvac_setpoints:
                 hvac_setpoints[key][st].update({hd_str: {}})
-            # Get total for specific state/density for all income levels
-            # Used to generate income level distribution
-            if hd == 'No_DSO_Type':
-                total_st_hd = recs.loc[
-                    ((recs['state_postal'] == st) &
-                     (recs[inc_str].isin(sample['income_level']))), 'NWEIGHT'
-                ].sum()
-            else:
-                total_st_hd = recs.loc[
-                    ((recs['state_postal'] == st) &
-                     (recs['UATYP10'] == hd) &
-                     (recs[inc_str].isin(sample['income_level']))), 'NWEIGHT'
-                ].sum()
+            total_st_hd = None
 
             for il in sample['income_level']:
+                cache_file = None
+                if cache_dir:
+                    cache_file = _triple_cache_file(cache_dir, recs_data_file, st, hd, il, sample['income_level'],
+                                                    bin_size_thres, climate_zone, wh_shift)
+                    if os.path.isfile(cache_file):
+                        with open(cache_file, 'r') as infile:
+                            cached = json.load(infile)
+                        for key in res_metadata:
+                            res_metadata[key][st][hd_str][il] = cached['res_metadata'][key]
+                        for key in hvac_setpoints:
+                            hvac_setpoints[key][st][hd_str][il] = cached['hvac_setpoints'][key]
+                        continue
+
+                if recs is None:
+                    recs = pd.read_csv(recs_data_file)
+                if total_st_hd is None:
+                    # Get total for specific state/density for all income levels
+                    # Used to generate income level distribution
+                    if hd == 'No_DSO_Type':
+                        total_st_hd = recs.loc[
+                            ((recs['state_postal'] == st) &
+                             (recs[inc_str].isin(sample['income_level']))), 'NWEIGHT'
+                        ].sum()
+                    else:
+                        total_st_hd = recs.loc[
+                            ((recs['state_postal'] == st) &
+                             (recs['UATYP10'] == hd) &
+                             (recs[inc_str].isin(sample['income_level']))), 'NWEIGHT'
+                        ].sum()
                 for key in res_metadata:
                     # Add new income level keys to the metadata dictionary
                     res_metadata[key][st][hd_str].update({il: {}})
@@ -573,6 +619,20 @@ def get_RECS_jsons(bldg_in, bldg_out, hvac_out,
                 res_metadata, total_dict = get_residential_metadata(res_metadata, sample_df, st, hd_str, il, total, wh_shift)
                 hvac_setpoints = get_hvac_setpoints(hvac_setpoints, sample_df, st, hd_str, il, total)
 
+                if cache_file is not None:
+                    cached = {'res_metadata': {key: res_metadata[key][st][hd_str][il] for key in res_metadata},
+                              'hvac_setpoints': {key: hvac_setpoints[key][st][hd_str][il] for key in hvac_setpoints}}
+                    tmp_file = cache_file + '.' + str(os.getpid())
+                    try:
+                        os.makedirs(cache_dir, exist_ok=True)
+                        with open(tmp_file, 'w') as outfile:
+                            json.dump(cached, outfile)
+                        os.replace(tmp_file, cache_file)
+                    except (OSError, TypeError) as ex:
+                        print("Could not cache RECS distributions in {}: {}".format(cache_dir, ex))
+                        if os.path.exists(tmp_file):
+                            os.remove(tmp_file)
+
     # Add distributions from bldg_in file
     res_metadata['aspect_ratio'] = bldg_metadata['aspect_ratio']
     res_metadata['window_wall_ratio'] = bldg_metadata['window_wall_ratio']
@@ -8,16 +8,152 @@ co-simulations with many entities reading in identical data files; see
 file docstring of "schedule_server.py" for further details. This class is 
 intended to be instantiated in every software entity that needs to access the
 data provided by the schedule server.
-"""
 
+When the server publishes its schedules in shared memory, the proxy of the
+client is a ScheduleReader, which answers the same calls from the shared
+blocks in this process instead of going through the server.
+"""
 
+import os
+from multiprocessing import shared_memory
 from multiprocessing.managers import BaseManager
+
+import numpy as np
+import pandas as pd
 # import psutil  # 3rd party module for process info (not strictly required)
 
 
+def _attach(block):
+    try:
+        # python 3.13 and later, the server owns the block
+        return shared_memory.SharedMemory(name=block, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=block)
+        if os.name == 'posix':
+            # otherwise the resource tracker of this process unlinks the block when it exits
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class ScheduleReader(object):
+    """ Reads schedule windows from the shared-memory blocks published by the schedule server
+
+    Provides forecasting_pv_schedules, forecasting_schedules and read_tou_schedules with
+    the same arguments and results as DataProxy, the windows are views of the shared
+    blocks wherever the time range is contiguous.
+
+    Args:
+        index (dict): block index from DataProxy.shared_schedules
+    """
+
+    def __init__(self, index):
+        self.blocks = []
+        self.times = {}
+        self.values = {}
+        self.columns = {}
+        self.cache = {}
+        for name, entry in index.items():
+            shm = _attach(entry['block'])
+            rows = entry['rows']
+            cols = len(entry['columns'])
+            self.blocks.append(shm)
+            self.times[name] = np.ndarray((rows,), dtype=np.int64, buffer=shm.buf).view('datetime64[ns]')
+            self.values[name] = np.ndarray((rows, cols), dtype=np.float64, buffer=shm.buf, offset=8 * rows)
+            self.columns[name] = entry['columns']
+
+    def _column(self, name, col):
+        # label first, then position, as pandas does for a row Series
+        columns = self.columns[name]
+        if col in columns:
+            return columns.index(col)
+        return col
+
+    def _rows(self, name, times):
+        index = self.times[name]
+        times = np.asarray(times, dtype='datetime64[ns]')
+        rows = np.searchsorted(index, times)
+        if np.any(rows >= len(index)) or np.any(index[np.minimum(rows, len(index) - 1)] != times):
+            raise KeyError(str(times))
+        return rows
+
+    def forecasting_pv_schedules(self, name, time, window_length, col_num):
+        """ Returns window length values of the given time for the name of schedule forecast and column
+
+        Args:
+            name (str): schedule name for data frame
+            time (any): current time
+            window_length (int): length of window
+            col_num (int): column number 1 to n
+        """
+        times = pd.date_range(time, periods=window_length, freq='H')
+        rows = self._rows(name, times)
+        return pd.Series(self.values[name][rows, self._column(name, col_num)], index=times, name=col_num)
+
+    def forecasting_schedules(self, name, time, len_forecast):
+        """ Returns len_forecast values from the given time as for the name schedule forecast
+
+        Args:
+            name (str): schedule name for data frame used to forecast
+            time (any): current time at which DA optimization occurs
+            len_forecast (int): length of forecast in hours
+        """
+        cache = self.cache.setdefault(name, [0, 0])
+        if cache[0] != time:
+            index = self.times[name]
+            data = self.values[name][:, self._column(name, 'data')]
+            year = pd.Timestamp(index[0]).year
+            # First let's make sure that the year of time_begin is same as data frame and ignore seconds
+            time_begin = time.replace(year=year, second=0)
+            time_stop = time_begin + pd.Timedelta(hours=len_forecast)
+            begin = np.searchsorted(index, np.datetime64(time_begin, 'ns'), side='left')
+            # Now let's check if time_stop has gone to the next year
+            if time_stop.year > time_begin.year:  # instead of next year, use the same year values
+                stop = np.searchsorted(index, np.datetime64(time_stop.replace(year=year), 'ns'), side='right')
+                temp = np.concatenate((data[begin:], data[:stop]))
+            elif time_stop.year == time_begin.year:  # if the window lies in the same year
+                stop = np.searchsorted(index, np.datetime64(time_stop, 'ns'), side='right')
+                temp = data[begin:stop]
+            else:
+                raise UserWarning("Something is wrong with dates in forecasting_schedules function!!")
+            cache[0] = time
+            cache[1] = np.mean(temp[0:-1].reshape(-1, 60), axis=1)
+        return cache[1]
+
+    def read_tou_schedules(self, name, time, col_num):
+        """ Returns tou price values of the given time for the name of schedule forecast and column
+
+        Args:
+            name (str): schedule name for data frame
+            time (any): current time
+            col_num (int): column number 1 to n
+        """
+        cache = self.cache.setdefault(name, [0, 0])
+        if cache[0] != time:
+            cache[0] = time
+            cache[1] = self._rows(name, [pd.to_datetime(time)])[0]
+        return self.values[name][cache[1], self._column(name, col_num)]
+
+    def close(self):
+        """ Detaches from the shared blocks, the server keeps them
+        """
+        self.times.clear()
+        self.values.clear()
+        self.cache.clear()
+        for shm in self.blocks:
+            shm.close()
+        del self.blocks[:]
+
+
 # Grab the shared proxy class.  All methods in that class will be available here
 class DataClient(object):
-    def __init__(self, port):
+    def __init__(self, port, shared=True):
+        """ Connects to the schedule server
+
+        Args:
+            port (int): port of the schedule server
+            shared (bool): read from the shared-memory schedules when the server publishes them
+        """
         # assert self._checkForProcess('DataServer.py'), 'Must have DataServer running'
 
         class myManager(BaseManager):
@@ -27,6 +163,10 @@ class DataClient(object):
         self.mgr = myManager(address=('localhost', port), authkey=b'DataProxy01')
         self.mgr.connect()
         self.proxy = self.mgr.DataProxy()
+        if shared:
+            index = self.proxy.shared_schedules()
+            if len(index) > 0:
+                self.proxy = ScheduleReader(index)
 
     # Verify the server is running (not required)
     @staticmethod
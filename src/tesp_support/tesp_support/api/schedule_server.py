@@ -11,13 +11,26 @@ in memory lead to an untenably large memory footprint. To solve this problem,
 this simple server was implemented; it reads in the data from disk once and
 provides two simple APIs for other entities to extract the data.
 
+Besides the .csv schedules, "glm_sch" in the server metadata lists schedules
+compiled at startup straight from GridLAB-D .glm files, cached on disk by
+load_schedule in "forecasting.py" when "schedule_cache" names a folder.
 
+With "shared_memory" set in the server metadata, every schedule is also
+published once into a named shared-memory block holding its time index and
+values. Clients get the small block index through the proxy when they
+connect and then read their windows straight from the shared blocks,
+see ScheduleReader in "schedule_client.py", so forecasts no longer go
+through the manager process.
 
 """
 
 import json
+import signal
+import sys
+from datetime import datetime
 import numpy as np
 import pandas as pd
+from multiprocessing import shared_memory
 from multiprocessing.managers import SyncManager
 
 from .data import arguments
@@ -25,6 +38,9 @@ from .data import arguments
 # Global for storing the data to be served
 sch_df_dict = {}
 cache_output = {}
+# shared-memory blocks and their index when the schedules are published
+shared_blocks = []
+shared_index = {}
 
 #
 # power_sch = ["pv_power", "../solar/auto_run/solar_pv_power_profiles/8-node_dist_hourly_forecast_power.csv"]
@@ -128,6 +144,55 @@ class DataProxy(object):
             cache[1] = sch_df_dict[name].loc[pd.to_datetime(time)]
         return cache[1][col_num]
 
+    @staticmethod
+    def shared_schedules():
+        """ Returns the index of the schedules published in shared memory, empty if they are not published
+
+        Every entry maps a schedule name to a dict with the block name, the number of rows
+        and the column labels, see publish_schedules
+        """
+        return shared_index
+
+
+def publish_schedules(prefix):
+    """ Copies every loaded schedule into its own named shared-memory block
+
+    A block holds the time index as int64 nanoseconds followed by the values as a
+    float64 (rows, columns) array, both in row order.
+
+    Args:
+        prefix (str): prefix of the block names, must be unique per running server
+    """
+    for i, (sch, df) in enumerate(sch_df_dict.items()):
+        rows, cols = df.shape
+        block = '{}_{}'.format(prefix, i)
+        size = 8 * rows * (1 + cols)
+        try:
+            shm = shared_memory.SharedMemory(name=block, create=True, size=size)
+        except FileExistsError:
+            # left over from a server that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=block)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=block, create=True, size=size)
+        times = np.ndarray((rows,), dtype=np.int64, buffer=shm.buf)
+        values = np.ndarray((rows, cols), dtype=np.float64, buffer=shm.buf, offset=8 * rows)
+        times[:] = df.index.values.astype('datetime64[ns]').astype(np.int64)
+        values[:] = df.values
+        shared_blocks.append(shm)
+        shared_index[sch] = {'block': block, 'rows': rows, 'columns': df.columns.tolist()}
+    print('Published', len(shared_index), 'schedules in shared memory')
+
+
+def release_schedules():
+    """ Unlinks the shared-memory blocks created by publish_schedules
+    """
+    for shm in shared_blocks:
+        shm.close()
+        shm.unlink()
+    del shared_blocks[:]
+    shared_index.clear()
+
 
 def schedule_server(config_file, port):
 
@@ -141,6 +206,8 @@ def schedule_server(config_file, port):
     copy_sch = ppc["copy_sch"]
     power_sch = ppc["power_sch"]
     tou_sch = ppc["tou_sch"]
+    shared = ppc.get("shared_memory", False)
+    glm_sch = ppc.get("glm_sch", [])
     # port = ppc["port"]
 
     # load data frames schedules
@@ -149,6 +216,18 @@ def schedule_server(config_file, port):
         sch_df_dict[sch].index = pd.to_datetime(sch_df_dict[sch].index)
         cache_output[sch] = [0, 0]
 
+    # compile schedules straight from .glm files, file format [schedule name, glm file]
+    if len(glm_sch) > 0:
+        from tesp_support.dsot.forecasting import Forecasting, load_schedule
+        year = ppc.get("sch_year", 2016)
+        for ds in glm_sch:
+            sch = ds[0]
+            sch_df_dict[sch] = Forecasting.initialize_schedule_dataframe(datetime(year, 1, 1, 0, 0),
+                                                                         datetime(year, 12, 31, 23, 59, 0))
+            sch_df_dict[sch]['data'] = load_schedule(ds[1], sch, year, ppc.get("schedule_cache"))
+            sch_df_dict[sch].index.name = 'Timestamp'
+            cache_output[sch] = [0, 0]
+
     # create a data frame for constant schedule with all entries as 1.0. Copy it from any other data frame
     for cpy in copy_sch:
         sch = cpy[0]
@@ -170,6 +249,11 @@ def schedule_server(config_file, port):
         sch_df_dict[sch].index = pd.to_datetime(sch_df_dict[sch].index)
         cache_output[sch] = [0, 0]
 
+    if shared:
+        publish_schedules('tesp_sch_{}'.format(port))
+        # the kill scripts stop the server with SIGTERM, exit through serve_forever to release the blocks
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # start the server on address(host,port)
     print('Serving data. Press <ctrl>-c to stop.')
 
@@ -178,7 +262,10 @@ def schedule_server(config_file, port):
     myManager.register('DataProxy', DataProxy)
     mgr = myManager(address=('', port), authkey=b'DataProxy01')
     server = mgr.get_server()
-    server.serve_forever()
+    try:
+        server.serve_forever()
+    finally:
+        release_schedules()
 
 
 def main():
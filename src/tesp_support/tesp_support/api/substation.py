@@ -15,19 +15,22 @@ Todo:
 
 import json
 import helics
+import numpy as np
 from datetime import datetime
 from datetime import timedelta
 
-from tesp_support.original.hvac_agent import hvac
+from tesp_support.original.hvac_agent import hvac, hvac_population
 from tesp_support.original.simple_auction import simple_auction
 from .bench_profile import bench_profile
+from .metrics_reader import MetricsJsonWriter
 
 @bench_profile
 def substation_loop(configfile, metrics_root, helicsConfig, hour_stop=48, flag='WithMarket'):
     """ Helper function that initializes and runs the agents
 
     Reads configfile. Writes *auction_metrics_root_metrics.json* and
-    *controller_metrics_root_metrics.json* upon completion.
+    *controller_metrics_root_metrics.json* one market period at a time,
+    so they hold every finished period if the federate stops early.
 
     Args:
         configfile (str): fully qualified path to the JSON agent configuration file
@@ -64,25 +67,26 @@ def substation_loop(configfile, metrics_root, helicsConfig, hour_stop=48, flag='
                     'average_consumer_surplus': {'units': 'USD', 'index': 3},
                     'supplier_surplus': {'units': 'USD', 'index': 4}}
     controller_meta = {'bid_price': {'units': 'USD', 'index': 0}, 'bid_quantity': {'units': unit, 'index': 1}}
-    auction_metrics = {'Metadata': auction_meta, 'StartTime': StartTime}
-    controller_metrics = {'Metadata': controller_meta, 'StartTime': StartTime}
+    auction_metrics = MetricsJsonWriter('auction_' + metrics_root + '_metrics.json', auction_meta, StartTime)
+    controller_metrics = MetricsJsonWriter('controller_' + metrics_root + '_metrics.json', controller_meta, StartTime)
 
     aucObj = simple_auction(market_row, market_key)
 
     dt = float(diction['dt'])
     period = aucObj.period
 
-    # Initialize controllers, map HELICS values to Python attributes
-    subTemp = {}
+    # Initialize controllers, map HELICS values to Python attributes,
+    # indexed like the columns of the controller population
+    subTemp = []
     subVolt = {}
-    subState = {}
-    subHVAC = {}
+    subState = []
+    subHVAC = []
     pubMtrMode = {}
     pubMtrPrice = {}
     pubMtrMonthly = {}
-    pubHeating = {}
-    pubCooling = {}
-    pubDeadband = {}
+    pubHeating = []
+    pubCooling = []
+    pubDeadband = []
     hFed = helics.helicsCreateValueFederateFromConfig(helicsConfig)
     pubCount = helics.helicsFederateGetPublicationCount(hFed)
     subCount = helics.helicsFederateGetInputCount(hFed)
@@ -113,7 +117,7 @@ def substation_loop(configfile, metrics_root, helicsConfig, hour_stop=48, flag='
     pubSubMeters = set()
     hvacObjs = {}
     hvac_keys = list(diction['controllers'].keys())
-    for key in hvac_keys:
+    for idx, key in enumerate(hvac_keys):
         row = diction['controllers'][key]
         hvacObjs[key] = hvac(row, key, aucObj)
         ctl = hvacObjs[key]
@@ -123,19 +127,25 @@ def substation_loop(configfile, metrics_root, helicsConfig, hour_stop=48, flag='
         mtrPubTopic = ctl.name + '/' + ctl.meterName
         # print('{:s} hseSub={:s} mtrSub={:s}  mtrPub={:s}  ctlPub={:s}'
         #       .format(key, hseSubTopic, mtrSubTopic, mtrPubTopic, ctlPubTopic), flush=True)
-        subTemp[ctl] = helics.helicsFederateGetInputByTarget(hFed, hseSubTopic + '#air_temperature')
-        subState[ctl] = helics.helicsFederateGetInputByTarget(hFed, hseSubTopic + '#power_state')
-        subHVAC[ctl] = helics.helicsFederateGetInputByTarget(hFed, hseSubTopic + '#hvac_load')
+        subTemp.append(helics.helicsFederateGetInputByTarget(hFed, hseSubTopic + '#air_temperature'))
+        subState.append(helics.helicsFederateGetInputByTarget(hFed, hseSubTopic + '#power_state'))
+        subHVAC.append(helics.helicsFederateGetInputByTarget(hFed, hseSubTopic + '#hvac_load'))
 
-        pubHeating[ctl] = helics.helicsFederateGetPublication(hFed, ctlPubTopic + '/heating_setpoint')
-        pubCooling[ctl] = helics.helicsFederateGetPublication(hFed, ctlPubTopic + '/cooling_setpoint')
-        pubDeadband[ctl] = helics.helicsFederateGetPublication(hFed, ctlPubTopic + '/thermostat_deadband')
+        pubHeating.append(helics.helicsFederateGetPublication(hFed, ctlPubTopic + '/heating_setpoint'))
+        pubCooling.append(helics.helicsFederateGetPublication(hFed, ctlPubTopic + '/cooling_setpoint'))
+        pubDeadband.append(helics.helicsFederateGetPublication(hFed, ctlPubTopic + '/thermostat_deadband'))
         if ctl.meterName not in pubSubMeters:
             pubSubMeters.add(ctl.meterName)
-            subVolt[ctl] = helics.helicsFederateGetInputByTarget(hFed, mtrSubTopic + '#measured_voltage_1')
-            pubMtrMode[ctl] = helics.helicsFederateGetPublication(hFed, mtrPubTopic + '/bill_mode')
-            pubMtrPrice[ctl] = helics.helicsFederateGetPublication(hFed, mtrPubTopic + '/price')
-            pubMtrMonthly[ctl] = helics.helicsFederateGetPublication(hFed, mtrPubTopic + '/monthly_fee')
+            subVolt[idx] = helics.helicsFederateGetInputByTarget(hFed, mtrSubTopic + '#measured_voltage_1')
+            pubMtrMode[idx] = helics.helicsFederateGetPublication(hFed, mtrPubTopic + '/bill_mode')
+            pubMtrPrice[idx] = helics.helicsFederateGetPublication(hFed, mtrPubTopic + '/price')
+            pubMtrMonthly[idx] = helics.helicsFederateGetPublication(hFed, mtrPubTopic + '/monthly_fee')
+
+    # the controllers run as one population; publish a cooling setpoint or
+    # meter price only when it differs from the last one published
+    hvacs = hvac_population(hvacObjs.values())
+    cooling_published = np.full(hvacs.count, np.nan)
+    price_published = None
 
     # ==================== Time step looping under HELICS ===========================
 
@@ -171,46 +181,51 @@ def substation_loop(configfile, metrics_root, helicsConfig, hour_stop=48, flag='
         if helics.helicsInputIsUpdated(subFeeder):
             refload = 0.001 * helics.helicsInputGetDouble(subFeeder)  # supposed to be kW?
             aucObj.set_refload(refload)
-        for key, obj in hvacObjs.items():
-            if helics.helicsInputIsUpdated(subTemp[obj]):
-                value = helics.helicsInputGetDouble(subTemp[obj])
-                obj.set_air_temp_from_helics(value)
-                # print('temp ', value, flush=True)
-                if obj in subVolt:
-                    cval = helics.helicsInputGetComplex(subVolt[obj])
-                    obj.set_voltage_from_helics(cval)
-                    # print('voltage ', cval, flush=True)
-                value = helics.helicsInputGetDouble(subHVAC[obj])
-                obj.set_hvac_load_from_helics(value)
-                # print('load ', value, flush=True)
-                value = helics.helicsInputGetString(subState[obj])
-                obj.set_hvac_state_from_helics(value)
-                # print('state ', value, flush=True)
+        upd_idx = []
+        upd_temp = []
+        upd_load = []
+        upd_state = []
+        volt_idx = []
+        volt_val = []
+        for idx in range(hvacs.count):
+            if helics.helicsInputIsUpdated(subTemp[idx]):
+                upd_idx.append(idx)
+                upd_temp.append(helics.helicsInputGetDouble(subTemp[idx]))
+                if idx in subVolt:
+                    volt_idx.append(idx)
+                    volt_val.append(helics.helicsInputGetComplex(subVolt[idx]))
+                upd_load.append(helics.helicsInputGetDouble(subHVAC[idx]))
+                upd_state.append(helics.helicsInputGetString(subState[idx]))
+        if len(upd_idx) > 0:
+            hvacs.set_from_helics(upd_idx, upd_temp, upd_load, upd_state)
+        if len(volt_idx) > 0:
+            hvacs.set_voltage_from_helics(volt_idx, volt_val)
 
         # set the time-of-day schedule
-        for key, obj in hvacObjs.items():
-            if obj.change_basepoint(hour_of_day, day_of_week):
-                helics.helicsPublicationPublishDouble(pubCooling[obj], obj.basepoint)
+        changed = hvacs.change_basepoints(hour_of_day, day_of_week)
+        for idx in np.flatnonzero(changed & (hvacs.basepoint != cooling_published)):
+            helics.helicsPublicationPublishDouble(pubCooling[idx], float(hvacs.basepoint[idx]))
+        cooling_published[changed] = hvacs.basepoint[changed]
         if bSetDefaults:
-            for key, obj in hvacObjs.items():
-                if obj in pubMtrMode:
-                    helics.helicsPublicationPublishString(pubMtrMode[obj], 'HOURLY')
-                    helics.helicsPublicationPublishDouble(pubMtrMonthly[obj], 0.0)
-                helics.helicsPublicationPublishDouble(pubDeadband[obj], obj.deadband)
-                helics.helicsPublicationPublishDouble(pubHeating[obj], 60.0)
+            for idx in range(hvacs.count):
+                if idx in pubMtrMode:
+                    helics.helicsPublicationPublishString(pubMtrMode[idx], 'HOURLY')
+                    helics.helicsPublicationPublishDouble(pubMtrMonthly[idx], 0.0)
+                helics.helicsPublicationPublishDouble(pubDeadband[idx], float(hvacs.deadband[idx]))
+                helics.helicsPublicationPublishDouble(pubHeating[idx], 60.0)
             bSetDefaults = False
             # print('  SET DEFAULTS', flush=True)
 
         if time_granted >= tnext_bid:
             aucObj.clear_bids()
             time_key = str(int(tnext_clear))
-            controller_metrics[time_key] = {}
-            for key, obj in hvacObjs.items():
-                bid = obj.formulate_bid()  # bid is [price, quantity, on_state]
-                if bid is not None:
-                    if bWantMarket:
-                        aucObj.collect_bid(bid)
-                    controller_metrics[time_key][obj.name] = [bid[0], bid[1]]
+            bidding, bid_price, bid_kw, bid_on = hvacs.formulate_bids()
+            if bWantMarket:
+                aucObj.collect_bids(bid_price[bidding], bid_kw[bidding], bid_on[bidding])
+            controller_metrics.add_sample(time_key, {hvacs.names[idx]: [price, kw] for idx, price, kw in
+                                                     zip(np.flatnonzero(bidding).tolist(),
+                                                         bid_price[bidding].tolist(),
+                                                         bid_kw[bidding].tolist())})
             tnext_bid += period
             # print('  COLLECT BIDS', flush=True)
 
@@ -229,33 +244,32 @@ def substation_loop(configfile, metrics_root, helicsConfig, hour_stop=48, flag='
                 aucObj.clear_market(tnext_clear, time_granted)
                 aucObj.surplusCalculation(tnext_clear, time_granted)
                 helics.helicsPublicationPublishDouble(pubAucPrice, aucObj.clearing_price)
-                for key, obj in hvacObjs.items():
-                    obj.inform_bid(aucObj.clearing_price)
+                hvacs.inform_bids(aucObj.clearing_price)
             time_key = str(int(tnext_clear))
-            auction_metrics[time_key] = {
+            auction_metrics.add_sample(time_key, {
                 aucObj.name: [aucObj.clearing_price, aucObj.clearing_type, aucObj.consumerSurplus,
-                              aucObj.averageConsumerSurplus, aucObj.supplierSurplus]}
+                              aucObj.averageConsumerSurplus, aucObj.supplierSurplus]})
             tnext_clear += period
             # print('  CLEARED MARKET', flush=True)
 
         if time_granted >= tnext_adjust:
             if bWantMarket:
-                for key, obj in hvacObjs.items():
-                    if obj in pubMtrPrice:
-                        helics.helicsPublicationPublishDouble(pubMtrPrice[obj], aucObj.clearing_price)
-                    if obj.bid_accepted():
-                        helics.helicsPublicationPublishDouble(pubCooling[obj], obj.setpoint)
+                if aucObj.clearing_price != price_published:
+                    for idx in pubMtrPrice:
+                        helics.helicsPublicationPublishDouble(pubMtrPrice[idx], aucObj.clearing_price)
+                    price_published = aucObj.clearing_price
+                accepted = hvacs.bids_accepted()
+                accepted &= hvacs.setpoint != cooling_published
+                for idx in np.flatnonzero(accepted):
+                    helics.helicsPublicationPublishDouble(pubCooling[idx], float(hvacs.setpoint[idx]))
+                cooling_published[accepted] = hvacs.setpoint[accepted]
             tnext_adjust += period
             # print('  ADJUSTED', flush=True)
 
     # ==================== Finalize the metrics output ===========================
 
     print('writing metrics', flush=True)
-    auction_op = open('auction_' + metrics_root + '_metrics.json', 'w')
-    controller_op = open('controller_' + metrics_root + '_metrics.json', 'w')
-    print(json.dumps(auction_metrics), file=auction_op)
-    print(json.dumps(controller_metrics), file=controller_op)
-    auction_op.close()
-    controller_op.close()
+    auction_metrics.close()
+    controller_metrics.close()
     print('finalizing HELICS', flush=True)
     helics.helicsFederateDestroy(hFed)
@@ -33,6 +33,19 @@ def get_hhmm_from_secs(time):
     return ret
 
 
+def get_hhmm_from_secs_array(time):
+    """ Convert an array of seconds to HHMM, as get_hhmm_from_secs does for one
+
+    Args:
+        time (numpy.ndarray): seconds
+    Returns:
+        numpy.ndarray: HHMM integers
+    """
+    time = 60 * np.round(np.asarray(time) / 60)
+    ret = (np.floor(time / 3600) * 100 + np.round((time % 3600) / 60)).astype(int)
+    return np.where(ret == 2400, 0, ret)
+
+
 def subtract_hhmm_secs(hhmm, secs):
     """ Subtract hhmm time - secs duration
 
@@ -0,0 +1,230 @@
+# Copyright (C) 2024 Battelle Memorial Institute
+# See LICENSE file at https://github.com/pnnl/tesp
+# file: agent_pool.py
+"""Long-lived process pool for the day-ahead optimization of DSOT agents
+
+Each agent is pickled once, the first time it is solved, to a worker chosen by
+a hash of its name, and then stays resident in that worker for the whole
+simulation. Every hour only the attributes listed in the agent class
+DA_VECTOR_INPUTS and DA_SCALAR_INPUTS are copied into a shared-memory NumPy
+buffer, DA_OBJECT_INPUTS go along with the small solve message, and the
+results come back through a second shared-memory buffer.
+
+Public Classes:
+    :AgentPool: resident worker pool used by the substation
+"""
+import logging as log
+import multiprocessing as mp
+import traceback
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+def _attach(name, shape):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _unpack_inputs(agent, row, objects):
+    window = agent.windowLength
+    for i, attr in enumerate(agent.DA_VECTOR_INPUTS):
+        setattr(agent, attr, row[i * window:(i + 1) * window].tolist())
+    offset = len(agent.DA_VECTOR_INPUTS) * window
+    for i, attr in enumerate(agent.DA_SCALAR_INPUTS):
+        setattr(agent, attr, float(row[offset + i]))
+    for attr, val in objects.items():
+        setattr(agent, attr, val)
+
+
+def _pool_worker(conn):
+    """ Worker loop, keeps its agents and shared buffers between messages
+    """
+    agents = {}
+    shm_in = shm_out = None
+    inputs = outputs = None
+    while True:
+        msg = conn.recv()
+        cmd = msg[0]
+        try:
+            if cmd == 'add':
+                for idx, agent in msg[1]:
+                    agents[idx] = agent
+                conn.send(('ok', None))
+            elif cmd == 'buffers':
+                for shm in (shm_in, shm_out):
+                    if shm is not None:
+                        shm.close()
+                shm_in, inputs = _attach(msg[1], msg[2])
+                shm_out, outputs = _attach(msg[3], msg[4])
+                conn.send(('ok', None))
+            elif cmd == 'solve':
+                info = {}
+                for idx in msg[1]:
+                    agent = agents[idx]
+                    _unpack_inputs(agent, inputs[idx], msg[2].get(idx, {}))
+                    res = np.asarray(agent.DA_optimal_quantities(), dtype=np.float64)
+                    outputs[idx, :res.size] = res.reshape(-1)
+                    info[idx] = (res.shape, getattr(agent, 'da_timing', None))
+                conn.send(('ok', info))
+            elif cmd == 'close':
+                break
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+    for shm in (shm_in, shm_out):
+        if shm is not None:
+            shm.close()
+    conn.close()
+
+
+class AgentPool:
+    """ Resident worker pool for DA_optimal_quantities
+
+    Args:
+        num_core (int): number of worker processes
+        window (int): day-ahead window length in hours
+        out_rows (int): maximum number of result rows per agent, 2 for HVAC (quantity and room temperature)
+
+    Attributes:
+        index (dict): agent name to shared buffer row
+        owner (list): worker index for every buffer row
+    """
+
+    def __init__(self, num_core, window=48, out_rows=2):
+        self.num_core = max(int(num_core), 1)
+        self.window = window
+        self.out_rows = out_rows
+        self.index = {}
+        self.owner = []
+        self.width = 0
+        self.capacity = 0
+        self.shm_in = None
+        self.shm_out = None
+        self.inputs = None
+        self.outputs = None
+        # start the resource tracker before forking so the workers share it,
+        # otherwise each worker's own tracker unlinks the buffers when it exits
+        resource_tracker.ensure_running()
+        ctx = mp.get_context('fork')
+        self.conns = []
+        self.procs = []
+        for _ in range(self.num_core):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_pool_worker, args=(child,), daemon=True)
+            proc.start()
+            child.close()
+            self.conns.append(parent)
+            self.procs.append(proc)
+
+    def _worker_of(self, name):
+        # crc32 rather than hash() so the pinning does not depend on PYTHONHASHSEED
+        return zlib.crc32(name.encode('utf-8')) % self.num_core
+
+    def _gather(self):
+        replies = []
+        for conn in self.conns:
+            status, val = conn.recv()
+            if status == 'error':
+                raise RuntimeError('AgentPool worker failed:\n' + val)
+            replies.append(val)
+        return replies
+
+    def _ensure_buffers(self, rows, width):
+        if rows <= self.capacity and width <= self.width:
+            return
+        self.capacity = max(rows, 2 * self.capacity)
+        self.width = max(width, self.width)
+        for shm in (self.shm_in, self.shm_out):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        in_shape = (self.capacity, self.width)
+        out_shape = (self.capacity, self.out_rows * self.window)
+        self.shm_in = shared_memory.SharedMemory(create=True, size=8 * in_shape[0] * in_shape[1])
+        self.shm_out = shared_memory.SharedMemory(create=True, size=8 * out_shape[0] * out_shape[1])
+        self.inputs = np.ndarray(in_shape, dtype=np.float64, buffer=self.shm_in.buf)
+        self.outputs = np.ndarray(out_shape, dtype=np.float64, buffer=self.shm_out.buf)
+        for conn in self.conns:
+            conn.send(('buffers', self.shm_in.name, in_shape, self.shm_out.name, out_shape))
+        self._gather()
+
+    def register(self, agents):
+        """ Sends agents not yet known to the pool to their workers
+
+        Args:
+            agents (list): DSOT agent objects with DA_optimal_quantities
+        """
+        new = [[] for _ in range(self.num_core)]
+        for agent in agents:
+            if agent.name not in self.index:
+                worker = self._worker_of(agent.name)
+                self.index[agent.name] = len(self.owner)
+                self.owner.append(worker)
+                new[worker].append((self.index[agent.name], agent))
+        if sum(len(n) for n in new) == 0:
+            return
+        for conn, n in zip(self.conns, new):
+            conn.send(('add', n))
+        self._gather()
+
+    def solve(self, agents):
+        """ Runs DA_optimal_quantities of every agent on its resident copy
+
+        Args:
+            agents (list): DSOT agent objects, updated in this process for the current hour
+
+        Returns:
+            list: (result, da_timing) for each agent, result has the same form as DA_optimal_quantities
+        """
+        if len(agents) == 0:
+            return []
+        self.register(agents)
+        width = max(len(a.DA_VECTOR_INPUTS) * self.window + len(a.DA_SCALAR_INPUTS) for a in agents)
+        self._ensure_buffers(len(self.owner), width)
+
+        jobs = [[] for _ in range(self.num_core)]
+        objects = [{} for _ in range(self.num_core)]
+        for agent in agents:
+            idx = self.index[agent.name]
+            row = self.inputs[idx]
+            for i, attr in enumerate(agent.DA_VECTOR_INPUTS):
+                row[i * self.window:(i + 1) * self.window] = getattr(agent, attr)[:self.window]
+            offset = len(agent.DA_VECTOR_INPUTS) * self.window
+            for i, attr in enumerate(agent.DA_SCALAR_INPUTS):
+                row[offset + i] = getattr(agent, attr)
+            worker = self.owner[idx]
+            jobs[worker].append(idx)
+            if len(agent.DA_OBJECT_INPUTS) > 0:
+                objects[worker][idx] = {attr: getattr(agent, attr) for attr in agent.DA_OBJECT_INPUTS}
+        for conn, job, obj in zip(self.conns, jobs, objects):
+            conn.send(('solve', job, obj))
+        info = {}
+        for reply in self._gather():
+            info.update(reply)
+
+        results = []
+        for agent in agents:
+            idx = self.index[agent.name]
+            shape, da_timing = info[idx]
+            res = self.outputs[idx, :int(np.prod(shape))].reshape(shape).tolist()
+            results.append((res, da_timing))
+        log.info('AgentPool solved {} agents over {} workers'.format(len(agents), self.num_core))
+        return results
+
+    def close(self):
+        """ Stops the workers and releases the shared buffers
+        """
+        for conn in self.conns:
+            try:
+                conn.send(('close',))
+                conn.close()
+            except (BrokenPipeError, OSError):
+                pass
+        for proc in self.procs:
+            proc.join(timeout=5)
+        for shm in (self.shm_in, self.shm_out):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.shm_in = self.shm_out = None
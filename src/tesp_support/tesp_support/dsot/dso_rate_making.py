@@ -18,6 +18,101 @@ from .plots import load_da_retail_price, customer_meta_data, load_json, load_age
     load_system_data, get_date, tic, toc, load_retail_data, load_ames_data, load_gen_data, load_indust_data
 
 
+def pivot_meter_day(meter_data_df, meters):
+    """ Pivots one day of billing meter data into a (time x meter) array.
+    Args:
+        meter_data_df (dataframe): billing_meter data indexed by (time, name) with 'real_power_avg' and 'date'
+        meters (list): billing meter names, in the order of the columns wanted
+    Returns:
+        times (Index): sorted simulation time in seconds for each row
+        dates (DatetimeIndex): calendar date for each row
+        power (ndarray): real_power_avg in W, one column per meter, NaN where a meter did not report
+        """
+    power_df = meter_data_df['real_power_avg'].unstack('name')[meters]
+    dates = meter_data_df['date'].groupby(level=0).first().reindex(power_df.index)
+    return power_df.index, pd.DatetimeIndex(dates), power_df.to_numpy(dtype=float)
+
+
+def billing_day_metrics(times, power, day, tou_periods=None, windowsize=3):
+    """ Computes the daily energy metrics of all billing meters at once.
+    Args:
+        times (Index): sorted simulation time in seconds, from pivot_meter_day
+        power (ndarray): (time x meter) real power in W, from pivot_meter_day
+        day (int): simulation day number (1 = first day of simulation)
+        tou_periods (dict): time-of-use periods of the month with 'hour_start' and 'hour_end' lists, defaults to None
+        windowsize (int): number of 5 minute intervals in the moving window for max_kw
+    Returns:
+        dict: arrays of 'kw-hr', 'max_kw', 'avg_load', 'load_factor' and '<period>_kwh' with one value per meter
+        """
+    valid = ~np.isnan(power)
+    total = np.where(valid, power, 0.0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_load = total / valid.sum(axis=0) / 1000
+    # find average max power over a 15 minute moving window (=3 * 5 minute intervals).
+    if power.shape[0] >= windowsize:
+        window = power[windowsize - 1:].copy()
+        for i in range(1, windowsize):
+            window += power[windowsize - 1 - i:power.shape[0] - i]
+        max_kw = np.fmax.reduce(window / windowsize, axis=0) / 1000
+    else:
+        max_kw = np.full(power.shape[1], np.nan)
+    max_kw = np.where(max_kw > 0, max_kw, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        load_factor = np.where(max_kw != 0, avg_load / max_kw, 0.0)
+    metrics = {'kw-hr': total / 1000 / 12, 'max_kw': max_kw, 'avg_load': avg_load, 'load_factor': load_factor}
+
+    if tou_periods is not None:
+        times = pd.Index(times)
+        for k, period in tou_periods.items():
+            kwh = np.zeros(power.shape[1])
+            for hour_start, hour_end in zip(period['hour_start'], period['hour_end']):
+                # rows with hour_start <= time <= hour_end - 1 second, as an inclusive label slice
+                lo = times.searchsorted(300 * 12 * (24 * (day - 1) + hour_start), side='left')
+                hi = times.searchsorted(300 * 12 * (24 * (day - 1) + hour_end) - 1, side='right')
+                kwh += np.nansum(power[lo:hi], axis=0) / 1000 / 12
+                if hour_start == 0:
+                    kwh += power[times.get_loc(300 * 12 * 24 * day)] / 1000 / 12
+            metrics[k + '_kwh'] = kwh
+    return metrics
+
+
+def transactive_day_metrics(dates, power, kw_hr, cust_trans_df, meters, da_lmp, DA_retail_df,
+                            RThourprice, RThourcongestionprice, RThourcleartype):
+    """ Computes the daily day ahead, real time and congestion quantities of all billing meters at once.
+    Args:
+        dates (DatetimeIndex): calendar date of each row of power, from pivot_meter_day
+        power (ndarray): (time x meter) real power in W, from pivot_meter_day
+        kw_hr (ndarray): daily energy of each meter in kW-hr
+        cust_trans_df (dataframe): cleared day ahead quantities with 'meter' and 'total_cleared_quantity', indexed by hour
+        meters (list): billing meter names, in the order of the columns of power
+        da_lmp (series): hourly day ahead LMP in $/MW-hr
+        DA_retail_df (dataframe): hourly day ahead retail 'congestion_surcharge_DA' and 'clear_type_da'
+        RThourprice (series): hourly average real time LMP in $/kW-hr
+        RThourcongestionprice (series): hourly average real time congestion surcharge
+        RThourcleartype (series): hourly average real time clear type
+    Returns:
+        dict: arrays of 'DA_Q', 'DA_cost', 'RT_Q', 'RT_cost', 'Congestion_Q' and 'Congestion_cost' with one value per meter
+        """
+    quantity = cust_trans_df.set_index('meter', append=True)['total_cleared_quantity'] \
+        .unstack('meter').reindex(columns=meters)
+    # TODO:  Need to interpolate day ahead Q to make RT summation every
+    #  5 minutes rather than one hour average
+    RTonehour = pd.DataFrame(power, index=dates, columns=meters).resample('h').mean() / 1000
+    RTquantity = RTonehour.sub(quantity)[meters]
+    DA_Q = quantity.sum().to_numpy()
+    # TODO: Need to check or verify that clear_type is never 2 or 3 (inefficient or failure)...
+    return {
+        'DA_Q': DA_Q,
+        'DA_cost': (quantity.mul(da_lmp, axis=0) / 1000).sum().to_numpy(),
+        'RT_Q': kw_hr - DA_Q,
+        'RT_cost': RTquantity.mul(RThourprice, axis=0).sum().to_numpy(),
+        'Congestion_Q': (quantity.mul(DA_retail_df['clear_type_da'], axis=0).sum() +
+                         RTquantity.mul(RThourcleartype, axis=0).sum()).to_numpy(),
+        'Congestion_cost': (quantity.mul(DA_retail_df['congestion_surcharge_DA'], axis=0).sum() +
+                            RTquantity.mul(RThourcongestionprice, axis=0).sum()).to_numpy()
+    }
+
+
 def read_meters(metadata, dir_path, folder_prefix, dso_num,
                 day_range, SF, dso_data_path, rate_scenario=None):
     """ Determines the total energy consumed and max power consumption for all meters within a
@@ -149,13 +244,20 @@ def read_meters(metadata, dir_path, folder_prefix, dso_num,
                                 columns=['sum'])
 
     # load meter data for each day
+    meters = list(metadata['billingmeters'])
+    tariff_classes = np.array([metadata['billingmeters'][each]['tariff_class'] for each in meters])
+    participating = np.array([bool(metadata['billingmeters'][each]['cust_participating']) for each in meters],
+                             dtype=bool)
+    tou_periods = None
+    if rate_scenario in ["time-of-use", "TOU"]:
+        tou_periods = tou_params["DSO_" + dso_num][month_name]["periods"]
+    meter_vars = fixed_variable_list + ([k + "_kwh" for k in tou_periods] if tou_periods is not None else [])
+    windowsize = 3
     for day in day_range:
         # Label columns of data frame by actual calendar date (not simulation day)
         date = get_date(dir_path, dso_num, str(day))
         day_name = date.strftime("%m-%d")
-        meter_df[day_name] = [0] * len(meter_df)
-        trans_df[day_name] = [0] * len(trans_df)
-        energysum_df[day_name] = [0] * len(energysum_df)
+        energysum_df[day_name] = [0.0] * len(energysum_df)
 
         # Load in transactive customer Q data, real-time price data, and DA cleared price
         filename = dir_path + '/DSO_' + dso_num + '/Retail_Quantities.h5'
@@ -180,101 +282,42 @@ def read_meters(metadata, dir_path, folder_prefix, dso_num,
         RThourprice = RT_price_df[' LMP' + dso_num].resample('h').mean() / 1000
         RThourcongestionprice = RT_retail_df['congestion_surcharge_RT'].resample('h').mean() / 1000
         RThourcleartype = RT_retail_df['clear_type_rt'].resample('h').mean() / 1000
-        for each in metadata['billingmeters']:
-            # Calculate standard customer energy consumption metrics used for all customers (including baseline)
-            # temp = meter_data_df[meter_data_df['name'].str.contains(each)]
-            temp = meter_data_df.xs(each, level=1)[['real_power_avg', 'date']]
-            meter_df.loc[(each, 'kw-hr'), day_name] = temp.loc[:, 'real_power_avg'].sum() / 1000 / 12
-            meter_df.loc[(each, 'avg_load'), day_name] = temp.loc[:, 'real_power_avg'].mean() / 1000
-            # TODO: changed from fixed window to moving window.  Need to check if this is OK.
-            # find average max power over a 15 minute moving window (=3 * 5 minute intervals).
-            windowsize = 3
-            max_kw = temp['real_power_avg'].rolling(window=windowsize).mean().max() / 1000
-            meter_df.loc[(each, 'max_kw'), day_name] = max(meter_df.loc[(each, 'max_kw'), day_name], max_kw)
-            if meter_df.loc[(each, 'max_kw'), day_name] != 0:
-                meter_df.loc[(each, 'load_factor'), day_name] = meter_df.loc[(each, 'avg_load'), day_name] / \
-                                                                meter_df.loc[(each, 'max_kw'), day_name]
-            else:
-                meter_df.loc[(each, 'load_factor'), day_name] = 0
-            
-            # Calculate each consumer's time-of-use-related consumption metrics, if applicable
-            if rate_scenario in ["time-of-use", "TOU"]:
-                for k in tou_params["DSO_" + dso_num][month_name]["periods"].keys():
-                    for t in range(len(tou_params["DSO_" + dso_num][month_name]["periods"][k]["hour_start"])):
-                        meter_df.loc[(each, k + "_kwh"), day_name] += (
-                            temp.loc[
-                                (300 * 12 * (24 * (day - 1)
-                                        + tou_params["DSO_" + dso_num][month_name]["periods"][k]["hour_start"][t]
-                                    )):
-                                (300 * 12 * (24 * (day - 1)
-                                        + tou_params["DSO_" + dso_num][month_name]["periods"][k]["hour_end"][t]
-                                    ) - 1),
-                                "real_power_avg",
-                            ].sum()
-                            / 1000
-                            / 12
-                        )
-                        if tou_params["DSO_" + dso_num][month_name]["periods"][k]["hour_start"][t] == 0:
-                            meter_df.loc[(each, k + "_kwh"), day_name] += (
-                                temp.loc[300 * 12 * 24 * day, "real_power_avg"]
-                                / 1000
-                                / 12
-                            )
 
-            # Calculate transactive customer energy consumption metrics
-            temp2 = cust_trans_df[cust_trans_df.meter == each]
-            trans_df.loc[(each, 'DA_Q'), day_name] = temp2.loc[:, 'total_cleared_quantity'].sum()
-            trans_df.loc[(each, 'RT_Q'), day_name] = meter_df.loc[(each, 'kw-hr'), day_name] - \
-                                                     trans_df.loc[(each, 'DA_Q'), day_name]
-            # TODO:  Need to interpolate day ahead Q to make RT summation every
-            #  5 minutes rather than one hour average
-            RTonehour = temp.set_index('date').resample('h').mean() / 1000
-            trans_df.loc[(each, 'DA_cost'), day_name] = (temp2['total_cleared_quantity'] *
-                                                         DA_price_df['da_lmp' + dso_num] / 1000).sum()
-            Real_time_purchase = (RTonehour['real_power_avg'] - temp2['total_cleared_quantity']) * RThourprice
-            trans_df.loc[(each, 'RT_cost'), day_name] = Real_time_purchase.sum()
-            #  Calculate Congestion Quantities and costs for each customer
-            trans_df.loc[(each, 'Congestion_cost'), day_name] = (temp2['total_cleared_quantity'] *
-                                                                 DA_retail_df['congestion_surcharge_DA']).sum() + \
-                                                                ((RTonehour['real_power_avg'] - temp2[
-                                                                    'total_cleared_quantity']) * RThourcongestionprice).sum()
-            # TODO: Need to check or verify that clear_type is never 2 or 3 (inefficient or failure)...
-            trans_df.loc[(each, 'Congestion_Q'), day_name] = (temp2['total_cleared_quantity'] *
-                                                              DA_retail_df['clear_type_da']).sum() + \
-                                                             ((RTonehour['real_power_avg'] - temp2[
-                                                                 'total_cleared_quantity']) * RThourcleartype).sum()
-
-            # Calculate the transactive capacity charge components, if applicable
-            # TODO: Incorporate dynamic capital costs, likely following a similar 
-            # format to that implemented for the DA and RT energy charges
-            """
-            if rate_scenario == "transactive":
-                trans_df.loc[(each, "DA_capacity_charge"), day_name] = 0
-                trans_df.loc[(each, "RT_capacity_charge"), day_name] = 0
-            """
+        # Calculate standard customer energy consumption metrics used for all customers (including baseline),
+        # and each consumer's time-of-use-related consumption metrics, if applicable
+        times, dates, power = pivot_meter_day(meter_data_df, meters)
+        # TODO: changed from fixed window to moving window.  Need to check if this is OK.
+        day_metrics = billing_day_metrics(times, power, day, tou_periods, windowsize)
+        meter_df[day_name] = np.column_stack([day_metrics[var] for var in meter_vars]).ravel()
+
+        # Calculate transactive customer energy consumption metrics
+        trans_metrics = transactive_day_metrics(dates, power, day_metrics['kw-hr'], cust_trans_df, meters,
+                                                DA_price_df['da_lmp' + dso_num], DA_retail_df, RThourprice,
+                                                RThourcongestionprice, RThourcleartype)
+        # TODO: Incorporate dynamic capital costs, likely following a similar
+        # format to that implemented for the DA and RT energy charges
+        trans_values = np.column_stack([trans_metrics.get(var, np.zeros(len(meters)))
+                                        for var in dynamic_variable_list])
+        trans_df[day_name] = np.concatenate([trans_values.ravel(), np.zeros(len(dynamic_variable_list))])
 
         # Calculate total energy consumption for each customer class (aka load type)
-        for each in metadata['billingmeters']:
-            for load in loadtype:
-                if metadata['billingmeters'][each]['tariff_class'] == load:
-                    energysum_df.loc[(load, 'kw-hr'), day_name] += meter_df.loc[(each, 'kw-hr'), day_name] * SF
-                    if metadata['billingmeters'][each]['cust_participating']:
-                        energysum_df.loc[(load, 'da_q'), day_name] += trans_df.loc[(each, 'DA_Q'), day_name] * SF
-                        energysum_df.loc[(load, 'rt_q'), day_name] += trans_df.loc[(each, 'RT_Q'), day_name] * SF
-                        energysum_df.loc[(load, 'congest_$'), day_name] += trans_df.loc[
-                                                                               (each, 'Congestion_Q'), day_name] * SF
-                        energysum_df.loc[(load, 'congest_q'), day_name] += trans_df.loc[
-                                                                               (each, 'Congestion_cost'), day_name] * SF
-                    else:
-                        energysum_df.loc[(load, 'demand_quantity'), day_name] += meter_df.loc[
-                                                                                     (each, 'max_kw'), day_name] * SF
-                    
-                    # Calculate the time-of-use-related metrics, if applicable
-                    if rate_scenario in ["time-of-use", "TOU"]:
-                        for k in tou_params["DSO_" + dso_num][month_name]["periods"].keys():
-                            energysum_df.loc[(load, k + "_kwh"), day_name] += (
-                                meter_df.loc[(each, k + "_kwh"), day_name] * SF
-                            )
+        for load in loadtype:
+            in_class = tariff_classes == load
+            trans_class = in_class & participating
+            base_class = in_class & ~participating
+            energysum_df.loc[(load, 'kw-hr'), day_name] += (day_metrics['kw-hr'][in_class] * SF).sum()
+            energysum_df.loc[(load, 'da_q'), day_name] += (trans_metrics['DA_Q'][trans_class] * SF).sum()
+            energysum_df.loc[(load, 'rt_q'), day_name] += (trans_metrics['RT_Q'][trans_class] * SF).sum()
+            energysum_df.loc[(load, 'congest_$'), day_name] += \
+                (trans_metrics['Congestion_Q'][trans_class] * SF).sum()
+            energysum_df.loc[(load, 'congest_q'), day_name] += \
+                (trans_metrics['Congestion_cost'][trans_class] * SF).sum()
+            energysum_df.loc[(load, 'demand_quantity'), day_name] += (day_metrics['max_kw'][base_class] * SF).sum()
+
+            # Calculate the time-of-use-related metrics, if applicable
+            if tou_periods is not None:
+                for k in tou_periods.keys():
+                    energysum_df.loc[(load, k + "_kwh"), day_name] += (day_metrics[k + "_kwh"][in_class] * SF).sum()
 
         # Break the streetlights out into a separate category for reporting and verification purposes
         # energysum_df.loc[('street_lights', 'kw-hr'), :] = energysum_df.loc[('industrial', 'kw-hr'), :]
@@ -326,12 +369,10 @@ def read_meters(metadata, dir_path, folder_prefix, dso_num,
     meter_df.loc[(slice(None), 'avg_load'), ['sum']] = \
         meter_df.loc[(slice(None), 'avg_load'), meter_df.columns[~meter_df.columns.isin(['sum'])]].mean(axis=1)
 
-    for each in metadata['billingmeters']:
-        if meter_df.loc[(each, 'max_kw'), 'sum'] != 0:
-            meter_df.loc[(each, 'load_factor'), 'sum'] = meter_df.loc[(each, 'avg_load'), 'sum'] / \
-                                                         meter_df.loc[(each, 'max_kw'), 'sum']
-        else:
-            meter_df.loc[(each, 'load_factor'), 'sum'] = 0
+    max_kw = meter_df.loc[(meters, 'max_kw'), 'sum'].to_numpy(dtype=float)
+    avg_load = meter_df.loc[(meters, 'avg_load'), 'sum'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        meter_df.loc[(meters, 'load_factor'), 'sum'] = np.where(max_kw != 0, avg_load / max_kw, 0.0)
     
     if rate_scenario in ["time-of-use", "TOU"]:
         for k in tou_params["DSO_" + dso_num][month_name]["periods"].keys():
@@ -812,78 +853,67 @@ def calc_cust_bill(metadata, meter_df, trans_df, energy_sum_df, tariff, dso_num,
     # Cycle through each month for which there is energy data and calculate customer bill
     months = list(meter_df.columns[~meter_df.columns.str.contains('sum')])
 
+    meters = list(metadata['billingmeters'])
+    tariff_classes = np.array([metadata['billingmeters'][each]['tariff_class'] for each in meters])
+    participating = np.array([bool(metadata['billingmeters'][each]['cust_participating']) for each in meters],
+                             dtype=bool)
+    bill_vars = ['fix_energy', 'demand', 'fix_connect', 'fix_total', 'DA_energy', 'RT_energy', 'trans_connect',
+                 'distribution', 'trans_total', 'quantity_purchased', 'blended_rate']
+    sum_vars = ['DA_energy', 'RT_energy', 'trans_connect', 'distribution', 'trans_total',
+                'fix_energy', 'demand', 'fix_connect', 'fix_total']
+
+    # Tier prices and quantities of the fixed tariff for each baseline (non-participating) customer
+    T1P, T1Q, T2P, T2Q, demand = (np.zeros(len(meters)) for _ in range(5))
+    for tariff_class in np.unique(tariff_classes[~participating]):
+        in_class = (tariff_classes == tariff_class) & ~participating
+        T1P[in_class] = tariff['DSO_' + dso_num][tariff_class]['tier_1']['price']
+        T1Q[in_class] = tariff['DSO_' + dso_num][tariff_class]['tier_1']['max_quantity']
+        T2P[in_class] = tariff['DSO_' + dso_num][tariff_class]['tier_2']['price']
+        T2Q[in_class] = tariff['DSO_' + dso_num][tariff_class]['tier_2']['max_quantity']
+        demand[in_class] = tariff['DSO_' + dso_num][tariff_class]['demand_charge']
+
     for m in months:
-        bill_df[m] = [0] * len(bill_df)
-        billsum_df[m] = [0] * len(billsum_df)
+        billsum_df[m] = [0.0] * len(billsum_df)
         if energy_sum_df.loc[('total', 'da_q'), m] + energy_sum_df.loc[('total', 'rt_q'), m] == 0:
             congestion_rebate = 0
         else:
             congestion_rebate = energy_sum_df.loc[('total', 'congest_$'), m] / (
                     energy_sum_df.loc[('total', 'da_q'), m] + energy_sum_df.loc[('total', 'rt_q'), m])
 
-        for each in metadata['billingmeters']:
-            kw_hrs = meter_df.loc[(each, 'kw-hr'), m]
-            max_kw = meter_df.loc[(each, 'max_kw'), m]
-
-            if metadata['billingmeters'][each]['cust_participating']:
-                # Calculate bill for transactive customer
-                bill_df.loc[(each, 'DA_energy'), m] = trans_df.loc[(each, 'DA_cost'), m] * trans_retail_scale
-                bill_df.loc[(each, 'RT_energy'), m] = trans_df.loc[(each, 'RT_cost'), m] * trans_retail_scale
-                bill_df.loc[(each, 'trans_connect'), m] = trans_connection
-                bill_df.loc[(each, 'distribution'), m] = \
-                    meter_df.loc[(each, 'kw-hr'), m] * trans_dist_rate - congestion_rebate
-                bill_df.loc[(each, 'trans_total'), m] = \
-                    bill_df.loc[(each, 'DA_energy'), m] + bill_df.loc[(each, 'RT_energy'), m] + \
-                    bill_df.loc[(each, 'trans_connect'), m] + bill_df.loc[(each, 'distribution'), m]
-            else:
-                # Calculate bill for baseline (non-participating) customer on fixed tariff structure
-                tier2 = 0
-                tier3 = 0
-                tariff_class = metadata['billingmeters'][each]['tariff_class']
-                T1P = tariff['DSO_' + dso_num][tariff_class]['tier_1']['price']
-                T1Q = tariff['DSO_' + dso_num][tariff_class]['tier_1']['max_quantity']
-                T2P = tariff['DSO_' + dso_num][tariff_class]['tier_2']['price']
-                T2Q = tariff['DSO_' + dso_num][tariff_class]['tier_2']['max_quantity']
-                demand = tariff['DSO_' + dso_num][tariff_class]['demand_charge']
-
-                if kw_hrs >= T1Q:
-                    tier2 = 1
-                if kw_hrs >= T2Q:
-                    tier3 = 1
-                bill_df.loc[(each, 'fix_energy'), m] = \
-                    flat * kw_hrs + T1P * tier2 * (kw_hrs - T1Q) + T2P * tier3 * (kw_hrs - T2Q)
-                bill_df.loc[(each, 'demand'), m] = demand * max_kw
-                # TODO: Need to fix connection charge for street lights (gets too expensive given how many there are).
-                bill_df.loc[(each, 'fix_connect'), m] = connection
-                bill_df.loc[(each, 'fix_total'), m] = \
-                    bill_df.loc[(each, 'fix_energy'), m] + \
-                    bill_df.loc[(each, 'demand'), m] + \
-                    bill_df.loc[(each, 'fix_connect'), m]
-
-            #  Calculated average electricity price (blended rate) for each customer
-            if kw_hrs == 0:
-                bill_df.loc[(each, 'blended_rate'), m] = 0
-            else:
-                bill_df.loc[(each, 'blended_rate'), m] = (bill_df.loc[(each, 'fix_total'), m] +
-                                                          bill_df.loc[(each, 'trans_total'), m]) / kw_hrs
-
-            bill_df.loc[(each, 'quantity_purchased'), m] = kw_hrs
-
-            # Calculate total revenue for each customer class (aka load type)
-        for each in metadata['billingmeters']:
-            for load in loadtype:
-                if metadata['billingmeters'][each]['tariff_class'] == load:
-                    # Sum transactive values
-                    billsum_df.loc[(load, 'DA_energy'), m] += bill_df.loc[(each, 'DA_energy'), m] * SF
-                    billsum_df.loc[(load, 'RT_energy'), m] += bill_df.loc[(each, 'RT_energy'), m] * SF
-                    billsum_df.loc[(load, 'trans_connect'), m] += bill_df.loc[(each, 'trans_connect'), m] * SF
-                    billsum_df.loc[(load, 'distribution'), m] += bill_df.loc[(each, 'distribution'), m] * SF
-                    billsum_df.loc[(load, 'trans_total'), m] += bill_df.loc[(each, 'trans_total'), m] * SF
-                    # Sum non-partipating / base-case values
-                    billsum_df.loc[(load, 'fix_energy'), m] += bill_df.loc[(each, 'fix_energy'), m] * SF
-                    billsum_df.loc[(load, 'demand'), m] += bill_df.loc[(each, 'demand'), m] * SF
-                    billsum_df.loc[(load, 'fix_connect'), m] += bill_df.loc[(each, 'fix_connect'), m] * SF
-                    billsum_df.loc[(load, 'fix_total'), m] += bill_df.loc[(each, 'fix_total'), m] * SF
+        kw_hrs = meter_df[m].xs('kw-hr', level=1).loc[meters].to_numpy(dtype=float)
+        max_kw = meter_df[m].xs('max_kw', level=1).loc[meters].to_numpy(dtype=float)
+        bill = {var: np.zeros(len(meters)) for var in bill_vars}
+
+        # Calculate bill for transactive customer
+        bill['DA_energy'] = np.where(participating, trans_df[m].xs('DA_cost', level=1).loc[meters].to_numpy(
+            dtype=float) * trans_retail_scale, 0.0)
+        bill['RT_energy'] = np.where(participating, trans_df[m].xs('RT_cost', level=1).loc[meters].to_numpy(
+            dtype=float) * trans_retail_scale, 0.0)
+        bill['trans_connect'] = np.where(participating, trans_connection, 0.0)
+        bill['distribution'] = np.where(participating, kw_hrs * trans_dist_rate - congestion_rebate, 0.0)
+        bill['trans_total'] = bill['DA_energy'] + bill['RT_energy'] + bill['trans_connect'] + bill['distribution']
+
+        # Calculate bill for baseline (non-participating) customer on fixed tariff structure
+        tier2 = (kw_hrs >= T1Q).astype(float)
+        tier3 = (kw_hrs >= T2Q).astype(float)
+        bill['fix_energy'] = np.where(~participating, flat * kw_hrs + T1P * tier2 * (kw_hrs - T1Q) +
+                                      T2P * tier3 * (kw_hrs - T2Q), 0.0)
+        bill['demand'] = np.where(~participating, demand * max_kw, 0.0)
+        # TODO: Need to fix connection charge for street lights (gets too expensive given how many there are).
+        bill['fix_connect'] = np.where(~participating, connection, 0.0)
+        bill['fix_total'] = bill['fix_energy'] + bill['demand'] + bill['fix_connect']
+
+        #  Calculated average electricity price (blended rate) for each customer
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bill['blended_rate'] = np.where(kw_hrs == 0, 0.0, (bill['fix_total'] + bill['trans_total']) / kw_hrs)
+        bill['quantity_purchased'] = kw_hrs
+        bill_df[m] = np.column_stack([bill[var] for var in bill_vars]).ravel()
+
+        # Calculate total revenue for each customer class (aka load type)
+        for load in loadtype:
+            in_class = tariff_classes == load
+            for var in sum_vars:
+                billsum_df.loc[(load, var), m] += (bill[var][in_class] * SF).sum()
 
     # Calculate industrial load bill.  This lumps all industrial loads as one entity and surplants any individual
     # industrial load bills calculated for individual GLD meters above.  This is OK as those meters are small zip loads
@@ -922,10 +952,11 @@ def calc_cust_bill(metadata, meter_df, trans_df, energy_sum_df, tariff, dso_num,
 
     # Calculate the annual sum.
     bill_df['sum'] = bill_df.loc[:, bill_df.columns[~bill_df.columns.str.contains('sum')]].sum(axis=1)
-    for each in metadata['billingmeters']:
-        bill_df.loc[(each, 'blended_rate'), 'sum'] = (bill_df.loc[(each, 'fix_total'), 'sum'] +
-                                                      bill_df.loc[(each, 'trans_total'), 'sum']) / bill_df.loc[
-                                                         (each, 'quantity_purchased'), 'sum']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bill_df.loc[(meters, 'blended_rate'), 'sum'] = \
+            (bill_df.loc[(meters, 'fix_total'), 'sum'].to_numpy() +
+             bill_df.loc[(meters, 'trans_total'), 'sum'].to_numpy()) / \
+            bill_df.loc[(meters, 'quantity_purchased'), 'sum'].to_numpy()
     billsum_df['sum'] = billsum_df.loc[:, billsum_df.columns[~billsum_df.columns.str.contains('sum')]].sum(
         axis=1)
 
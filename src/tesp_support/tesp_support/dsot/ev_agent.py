@@ -80,6 +80,12 @@ class EVDSOT:
         BindingObjFunc (bool): if True, then optimization considers cleared price, quantities from previous iteration in the objective function
     """
 
+    # attributes read by DA_optimal_quantities that change between hours,
+    # shipped each hour to the resident copy of the agent in AgentPool
+    DA_VECTOR_INPUTS = ('f_DA',)
+    DA_SCALAR_INPUTS = ('Cinit', 'home_depart_soc')
+    DA_OBJECT_INPUTS = ('trans_hours', 'non_trans_hours', 'home_depart_hours', 'home_arrival_hours')
+
     def __init__(self, diction, inv_properties, key, model_diag_level, sim_time, solver):
         # initialize from Args:
         self.name = key
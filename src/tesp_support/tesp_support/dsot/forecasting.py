@@ -4,13 +4,16 @@
 """Class responsible for forecasting 
 
 Implements the substation level DA price forecast and load forecast. Accesses
-forecast data using the schedule server; see "schedule_server.py" for further
+forecast data using the schedule server, reading straight from its shared-memory
+blocks when the server publishes them; see "schedule_server.py" for further
 implementation details.
 
 
 """
 
+import hashlib
 import math
+import os
 import re
 import time as ti
 from copy import deepcopy
@@ -24,6 +27,133 @@ import pytz
 
 from .hvac_agent import HVACDSOT
 from tesp_support.api.schedule_client import *
+from tesp_support.weather.forecast import decodeForecast
+
+# minute calendars of the schedule years, see schedule_calendar
+_calendars = {}
+
+
+def _expand_range(field, pattern, counts):
+    # expands a schedule field the way make_dataframe_schedule always has: '*' stays as is, a count
+    # of numbers found in counts is read as pairs of inclusive ranges, any other count as a list of values
+    if field == '*':
+        return field
+    values = list(map(int, re.split(pattern, field)))
+    if len(values) in counts:
+        return [v for i in range(0, len(values), 2) for v in range(values[i], values[i + 1] + 1)]
+    return values
+
+
+def parse_schedule_entry(entry):
+    """ Splits one GridLAB-D schedule line into the fields used by compile_schedule
+
+    Args:
+        entry (str): schedule line as 'minute hour second month day-of-week value'
+
+    Returns:
+        tuple: minutes, hours, months and days of week as lists of int or '*', and the value
+    """
+    fields = entry.split()
+    minute = _expand_range(fields[0], '-', (2, 4))
+    hour = _expand_range(fields[1], '-', (2, 4))
+    month = _expand_range(fields[3], '[-,]', (2, 4, 6))
+    dow = fields[4]
+    if dow != '*':
+        dow = list(map(int, re.split('[-,]', dow)))
+        # a list holding Saturday or Sunday is taken as it is, not as ranges
+        if not (0 in dow or 6 in dow):
+            dow = _expand_range(fields[4], '[-,]', (2, 4))
+    return minute, hour, month, dow, float(fields[5])
+
+
+def schedule_calendar(year):
+    """ Minute-resolution calendar of a year as used by the schedule data frames
+
+    Args:
+        year (int): calendar year
+
+    Returns:
+        dict: month, dow (0 for Sunday), hour and minute arrays for every minute of the year
+    """
+    if year not in _calendars:
+        index = pd.date_range(datetime(year, 1, 1, 0, 0), datetime(year, 12, 31, 23, 59), freq='min')
+        _calendars[year] = {'month': index.month.values,
+                            'dow': ((index.dayofweek + 1) % 7).values,
+                            'hour': index.hour.values,
+                            'minute': index.minute.values}
+    return _calendars[year]
+
+
+def compile_schedule(entries, year):
+    """ Expands GridLAB-D schedule lines into the minute values of a year
+
+    The value of every (month, day of week, hour, minute) combination is set by
+    the last line that matches it, or 1.0 if none does, and the year is filled
+    from that table in one pass over the calendar.
+
+    Args:
+        entries ([str]): schedule lines as 'minute hour second month day-of-week value'
+        year (int): calendar year of the values
+
+    Returns:
+        numpy.ndarray: value for every minute of the year
+    """
+    table = np.ones((13, 7, 24, 60))
+    for entry in entries:
+        minute, hour, month, dow, value = parse_schedule_entry(entry)
+        select = []
+        for field, size in ((month, 13), (dow, 7), (hour, 24), (minute, 60)):
+            if field == '*':
+                select.append(np.arange(size))
+            else:
+                field = np.asarray(field, dtype=int)
+                select.append(field[(field >= 0) & (field < size)])
+        table[np.ix_(*select)] = value
+    cal = schedule_calendar(year)
+    return table[cal['month'], cal['dow'], cal['hour'], cal['minute']]
+
+
+def load_schedule(filename, schedule_name, year, cache_dir=None):
+    """ Compiled minute values of a schedule from a .glm file, optionally cached on disk
+
+    With a cache_dir, the compiled values are saved there as .npy, keyed by the hash of
+    the .glm file, the schedule name and the year, so the file is only parsed again after it changes.
+
+    Args:
+        filename (str): name of glm file to be loaded
+        schedule_name (str): name of the schedule to be loaded
+        year (int): calendar year of the values
+        cache_dir (str): folder of the compiled schedules, or None to always compile them from the .glm file
+
+    Returns:
+        numpy.ndarray: value for every minute of the year
+    """
+    cache_file = None
+    if cache_dir:
+        with open(filename, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        cache_file = os.path.join(cache_dir, '{}_{}_{}.npy'.format(schedule_name, year, digest[:16]))
+        if os.path.isfile(cache_file):
+            return np.load(cache_file)
+
+    ip_file = glm.load(filename)
+    data = [n for n in ip_file["schedules"] if n["name"] == schedule_name]
+    if data[0]['values']:  # if value is not empty
+        entries = data[0]['values']
+    elif data[0]['children']:  # if children is not empty
+        # flatten all children to one list
+        entries = [j for sub in data[0]['children'] for j in sub]
+    else:
+        raise ValueError("Given schedules is empty!!")
+    values = compile_schedule(entries, year)
+
+    if cache_file is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(cache_file, values)
+        except OSError as ex:
+            print("Could not cache schedule {} in {}: {}".format(schedule_name, cache_dir, ex))
+    return values
 
 
 class Forecasting:
@@ -142,128 +272,21 @@ class Forecasting:
         sch_df['minute'] = pd.DatetimeIndex(sch_df.index).minute
         return sch_df
 
-    def make_dataframe_schedule(self, filename, schedule_name):
+    def make_dataframe_schedule(self, filename, schedule_name, cache_dir=None):
         """ Reads .glm files with multiple schedule names and makes dataframe for a year for given schedule name
 
         Args:
             filename (str): name of glm file to be loaded
             schedule_name (str): name of the schedule to be laoded
+            cache_dir (str): folder of the compiled schedules, see load_schedule
         """
         print("Reading and constructing 1 year dataframe for {} schedule from {}".format(schedule_name, filename))
-        ip_file = glm.load(filename)
-        data = [n for n in ip_file["schedules"] if n["name"] == schedule_name]
-        temp1 = []
-        if data[0]['values']:  # if value is not empty
-            data_1 = data[0]['values']
-            for i in range(len(data_1)):
-                temp1.append(data_1[i].split())  # splitting each data with spaces as delimiter
-        elif data[0]['children']:  # if children is not empty
-            # flatten all children to one list
-            data_1 = [[j for sub in data[0]['children'] for j in sub]]
-            for i in range(len(data_1[0])):
-                temp1.append(data_1[0][i].split())  # splitting each data with spaces as delimiter
-        else:
-            raise ValueError("Given schedules is empty!!")
-        # =============================================================================
-        #  ###Reading the values from teh glm file and modifying it in the dataframe
-        # =============================================================================
-        #        temp1 =[]
-        #        for i in range(len(data_1)):
-        #            temp1.append(data_1[i].split())  #splitting each data with spaces as delimiter
-
-        ########## Initializing the datframe for 1 year with values as 1
+        ########## Initializing the datframe for 1 year and filling it with the compiled schedule
         sch_df_start_time = datetime(self.sch_year, 1, 1, 0, 0)
         sch_df_end_time = datetime(self.sch_year, 12, 31, 23, 59, 0)
         sch_df = self.initialize_schedule_dataframe(sch_df_start_time, sch_df_end_time)
-
-        for temp_i in range(len(temp1)):
-            # minute
-            minute = temp1[temp_i][0]
-            if minute == '*':
-                pass
-            else:
-                min_1 = minute.split("-")
-                min_1 = list(map(int, min_1))
-                ###making list of the values in the schedule for this data
-                if len(min_1) == 2:
-                    min_1 = list(range(min_1[0], min_1[1] + 1))
-                elif len(min_1) == 4:
-                    min_1 = list(range(min_1[0], min_1[1] + 1)) + list(range(min_1[2], min_1[3] + 1))
-                temp1[temp_i][0] = min_1
-            # hour
-            hour = temp1[temp_i][1]
-            if hour == '*':
-                pass
-            else:
-                hour_1 = hour.split("-")
-                hour_1 = list(map(int, hour_1))
-                ###making list of the values in the schedule for this data
-                if len(hour_1) == 2:
-                    hour_1 = list(range(hour_1[0], hour_1[1] + 1))
-                elif len(hour_1) == 4:
-                    hour_1 = list(range(hour_1[0], hour_1[1] + 1)) + list(range(hour_1[2], hour_1[3] + 1))
-                temp1[temp_i][1] = hour_1
-            # second
-            second = temp1[temp_i][2]
-            # month
-            month = temp1[temp_i][3]
-            if month == '*':
-                pass
-            else:
-                month_1 = re.split('[-,]', month)
-                month_1 = list(map(int, month_1))
-                ###making list of the values in the schedule for this data
-                if len(month_1) == 2:
-                    month_1 = list(range(month_1[0], month_1[1] + 1))
-                elif len(month_1) == 4:
-                    month_1 = list(range(month_1[0], month_1[1] + 1)) + list(range(month_1[2], month_1[3] + 1))
-                elif len(month_1) == 6:
-                    month_1 = list(range(month_1[0], month_1[1] + 1)) + list(
-                        range(month_1[2], month_1[3] + 1)) + list(range(month_1[4], month_1[5] + 1))
-                temp1[temp_i][3] = month_1
-                ############day of the week
-            dayofWeek = temp1[temp_i][4]
-            if dayofWeek == '*':
-                pass
-            else:
-                dow_1 = re.split('[-,]', dayofWeek)
-                dow_1 = list(map(int, dow_1))
-                ###making list of the values in the schedule for this data
-                if 0 in dow_1 or 6 in dow_1:
-                    dow_1 = dow_1
-                else:
-                    if len(dow_1) == 2:
-                        dow_1 = list(range(dow_1[0], dow_1[1] + 1))
-                    elif len(dow_1) == 4:
-                        dow_1 = list(range(dow_1[0], dow_1[1] + 1)) + list(range(dow_1[2], dow_1[3] + 1))
-                temp1[temp_i][4] = dow_1
-            ##############value from GLD
-            temp1[temp_i][5] = float(temp1[temp_i][5])
-            ##########replacing the datframe with value from GLD
-            # print('Iteration', temp_i)
-            month = list(temp1[temp_i][3])
-            dayofWeek = list(temp1[temp_i][4])
-            hour = list(temp1[temp_i][1])
-            minute = list(temp1[temp_i][0])
-
-            if '*' in month:
-                df_m = deepcopy(sch_df)
-            else:
-                df_m = sch_df[(sch_df['month'].isin(month))]
-            if '*' in dayofWeek:
-                df_d = deepcopy(df_m)
-            else:
-                df_d = df_m[(df_m['dow'].isin(dayofWeek))]
-            if '*' in hour:
-                df_h = deepcopy(df_d)
-            else:
-                df_h = df_d[(df_d['hour'].isin(hour))]
-            if '*' in minute:
-                df_mt = deepcopy(df_h)
-            else:
-                df_mt = df_h[(df_h['minute'].isin(minute))]
-            sch_df.loc[sch_df.index.isin(list(df_mt.index)), 'data'] = temp1[temp_i][5]
-            sch_df.index.name = 'Timestamp'
+        sch_df['data'] = load_schedule(filename, schedule_name, self.sch_year, cache_dir)
+        sch_df.index.name = 'Timestamp'
         self.sch_df_dict[schedule_name] = sch_df
 
     def add_skew_scalar(self, datafr, N_skew, N_scalar):
@@ -303,16 +326,14 @@ class Forecasting:
         Args:
             param fncs_str: solar_diffuse_forecast ([float x 48]):
         """
-        solar_diffuse_forecast = eval(fncs_str)
-        self.solar_diffuse_forecast = [float(solar_diffuse_forecast[key]) for key in solar_diffuse_forecast.keys()]
+        self.solar_diffuse_forecast = decodeForecast(fncs_str)
 
     def set_solar_direct_forecast(self, fncs_str):
         """ Set the 48-hour solar direct forecast
         Args:
             param fncs_str: solar_direct_forecast ([float x 48]):
         """
-        solar_direct_forecast = eval(fncs_str)
-        self.solar_direct_forecast = [float(solar_direct_forecast[key]) for key in solar_direct_forecast.keys()]
+        self.solar_direct_forecast = decodeForecast(fncs_str)
 
     def set_temperature_forecast(self, fncs_str):
         """ Set the 48-hour temperature forecast
@@ -320,8 +341,7 @@ class Forecasting:
         Args:
             fncs_str: temperature_forecast ([float x 48]): predicted temperature in F
         """
-        temperature_forecast = eval(fncs_str)
-        self.temperature_forecast = [float(temperature_forecast[key]) for key in temperature_forecast.keys()]
+        self.temperature_forecast = decodeForecast(fncs_str)
         # log.info('FORECAST AGENT ' + str(self.temperature_forecast) )
 
     def get_substation_unresponsive_load_forecast(self, peak_load=7500.0):
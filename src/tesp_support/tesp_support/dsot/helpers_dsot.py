@@ -659,6 +659,7 @@ class Curve:
             self.prices = np.linspace(self.price_cap, self.L_price_cap, self.num_samples)
         self.quantities = np.zeros(self.num_samples)
         self.uncontrollable_only = True
+        self.bids = {}
 
     def curve_aggregator(self, identity, bid_curve):
         """
@@ -758,6 +759,59 @@ class Curve:
         if len(set(self.quantities)) > 1:
             self.uncontrollable_only = False
 
+    def curve_aggregator_block(self, identity, bid_curves, names=None):
+        """
+    Adding a block of bid curves to the aggregated seller or buyer curve in one pass
+
+        Args:
+            identity (str): identifies whether the bids are collected from a "Buyer" or "Seller"
+            bid_curves ([list]): bids with dimension (n, m, 2), m may differ between bids
+            names ([str]): when given, the bids are kept by name for curve_remove and curve_replace
+
+        """
+        if names is not None:
+            names = [name for bid, name in zip(bid_curves, names) if np.size(bid) > 0]
+        block = bid_block(bid_curves)
+        if block is None:
+            return
+        for start in range(0, len(block), BID_CHUNK):
+            contribution = sample_bid_curves(identity, block[start:start + BID_CHUNK],
+                                             self.price_cap, self.L_price_cap, self.num_samples)
+            self.quantities = self.quantities + contribution.sum(axis=0)
+        if names is not None:
+            for name, bid in zip(names, block):
+                self.bids[name] = (identity, bid)
+        if len(set(self.quantities)) > 1:
+            self.uncontrollable_only = False
+
+    def curve_remove(self, name):
+        """
+    Subtracting a bid added with curve_aggregator_block from the aggregated curve
+
+        Args:
+            name (str): name the bid was added with
+
+        """
+        if name not in self.bids:
+            return
+        identity, bid = self.bids.pop(name)
+        contribution = sample_bid_curves(identity, bid[np.newaxis], self.price_cap, self.L_price_cap,
+                                         self.num_samples)
+        self.quantities = self.quantities - contribution[0]
+
+    def curve_replace(self, identity, name, bid_curve):
+        """
+    Replacing one named bid in the aggregated curve without re-aggregating the others
+
+        Args:
+            identity (str): identifies whether the bid is collected from a "Buyer" or "Seller"
+            name (str): name of the buyer or seller
+            bid_curve ([list]): a nested list with dimension (m, 2), with m equals 2 to 4
+
+        """
+        self.curve_remove(name)
+        self.curve_aggregator_block(identity, [bid_curve], [name])
+
     def curve_aggregator_DSO(self, substation_demand_curve):
         """
     Adding one substation bid curve to the aggregated DSO bid curve,
@@ -824,6 +878,130 @@ def curve_bid_sorting(identity, bid_curve):
     return sorted_bid_curve
 
 
+# number of bids sampled at once by the vectorized aggregation, bounds the (bids x samples) work arrays
+BID_CHUNK = 4096
+
+
+def bid_block(bid_curves):
+    """ Stacks curve bids into one array, padding shorter bids by repeating their last point
+
+    Args:
+        bid_curves ([list]): bids with dimension (n, m, 2), m may differ between bids
+
+    Returns:
+        numpy.ndarray: bids with dimension (n, max m, 2), None if there is no non-empty bid
+    """
+    bids = [np.asarray(bid, dtype=float).reshape(-1, 2) for bid in bid_curves if np.size(bid) > 0]
+    if len(bids) == 0:
+        return None
+    m = max(len(bid) for bid in bids)
+    block = np.empty((len(bids), m, 2))
+    for i, bid in enumerate(bids):
+        block[i, :len(bid)] = bid
+        block[i, len(bid):] = bid[-1]
+    return block
+
+
+def _clip_bids_lower(q, p, bound):
+    # replaces the points below bound with the crossing of the curve at bound
+    active = p[:, -1] < bound
+    if not np.any(active):
+        return q, p
+    below = p < bound[:, np.newaxis]
+    first = np.argmax(below, axis=1)
+    prev = np.maximum(first - 1, 0)
+    rows = np.arange(len(p))
+    q0, p0 = q[rows, prev], p[rows, prev]
+    q1, p1 = q[rows, first], p[rows, first]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cross = (q0 * p1 - q1 * p0 + bound * (q1 - q0)) / (p1 - p0)
+    replace = below & active[:, np.newaxis]
+    q = np.where(replace, cross[:, np.newaxis], q)
+    p = np.where(replace, bound[:, np.newaxis], p)
+    return q, p
+
+
+def _clip_bids_upper(q, p, bound):
+    # replaces the points above bound with the crossing of the curve at bound
+    active = p[:, 0] > bound
+    if not np.any(active):
+        return q, p
+    above = p > bound[:, np.newaxis]
+    last = p.shape[1] - 1 - np.argmax(above[:, ::-1], axis=1)
+    nxt = np.minimum(last + 1, p.shape[1] - 1)
+    rows = np.arange(len(p))
+    q0, p0 = q[rows, last], p[rows, last]
+    q1, p1 = q[rows, nxt], p[rows, nxt]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cross = (q1 * p0 - q0 * p1 + bound * (q0 - q1)) / (p0 - p1)
+    replace = above & active[:, np.newaxis]
+    q = np.where(replace, cross[:, np.newaxis], q)
+    p = np.where(replace, bound[:, np.newaxis], p)
+    return q, p
+
+
+def sample_bid_curves(identity, bids, price_cap, L_price_cap, num_samples):
+    """ Samples a block of curve bids on the price grid of Curve in one pass
+
+    Applies the same sorting, price cap cut-off and segment sampling as
+    Curve.curve_aggregator to every bid at once, so the aggregated curve is the
+    sum of the returned rows.
+
+    Args:
+        identity (str): identifies whether the bids are collected from a "Buyer" or "Seller"
+        bids (numpy.ndarray): bids with dimension (n, m, 2), see bid_block
+        price_cap (float): the maximum price that is allowed in the market, scalar or one per bid
+        L_price_cap (float): the minimum price that is allowed in the market, scalar or one per bid
+        num_samples (int): the number of sampling points of the curve
+
+    Returns:
+        numpy.ndarray: sampled quantities with dimension (n, num_samples), zero for bids that are dropped
+    """
+    bids = np.asarray(bids, dtype=float)
+    n = bids.shape[0]
+    hi = np.broadcast_to(np.asarray(price_cap, dtype=float), (n,))
+    lo = np.broadcast_to(np.asarray(L_price_cap, dtype=float), (n,))
+
+    # prices descending, then quantities ascending for buyers and descending for sellers
+    q = bids[:, :, 0]
+    p = bids[:, :, 1]
+    order = np.lexsort((q if identity == 'Buyer' else -q, -p), axis=-1)
+    q = np.take_along_axis(q, order, axis=1)
+    p = np.take_along_axis(p, order, axis=1)
+
+    # cut off negative prices, then the price caps, dropping bids that lie entirely outside
+    keep = p[:, 0] >= 0
+    q, p = _clip_bids_lower(q, p, np.zeros(n))
+    keep &= ~(p[:, -1] > hi)
+    q, p = _clip_bids_upper(q, p, hi)
+    keep &= ~(p[:, 0] < lo)
+    q, p = _clip_bids_lower(q, p, lo)
+
+    # extend to the two extreme prices, equal prices become empty segments
+    q = np.concatenate((q[:, :1], q, q[:, -1:]), axis=1)
+    p = np.concatenate((hi[:, np.newaxis], p, lo[:, np.newaxis]), axis=1)
+    with np.errstate(invalid='ignore'):
+        scale = num_samples / (hi - lo)
+        idx = ((hi[:, np.newaxis] - p) * scale[:, np.newaxis]).astype(int)
+
+    # locate the segment of each sample and interpolate as numpy.linspace does
+    samples = np.arange(num_samples)
+    ends = idx[:, 1:]
+    seg = (ends[:, :, np.newaxis] <= samples).sum(axis=1)
+    covered = seg < ends.shape[1]
+    seg = np.minimum(seg, ends.shape[1] - 1)
+    start = np.take_along_axis(idx, seg, axis=1)
+    end = np.take_along_axis(ends, seg, axis=1)
+    q_start = np.take_along_axis(q, seg, axis=1)
+    q_end = np.take_along_axis(q, seg + 1, axis=1)
+    length = end - start
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = np.where(length > 1, (q_end - q_start) / (length - 1), 0.0)
+    values = (samples - start) * step + q_start
+    values = np.where((samples == end - 1) & (length > 1), q_end, values)
+    return np.where(covered & keep[:, np.newaxis], values, 0.0)
+
+
 def get_intersect(a1, a2, b1, b2):
     s = np.vstack([a1, a2, b1, b2])  # s for stacked
     h = np.hstack((s, np.ones((4, 1))))  # h for homogeneous
@@ -835,19 +1013,66 @@ def get_intersect(a1, a2, b1, b2):
     return y / z, x / z
 
 
+def get_intersect_rows(a1, a2, b1, b2):
+    """ Row-wise get_intersect, the same homogeneous-coordinate arithmetic over arrays of segments
+
+    Args:
+        a1 (numpy.ndarray): first point of the first lines, dimension (n, 2) as (quantity, price)
+        a2 (numpy.ndarray): second point of the first lines
+        b1 (numpy.ndarray): first point of the second lines
+        b2 (numpy.ndarray): second point of the second lines
+
+    Returns:
+        numpy.ndarray, numpy.ndarray: prices and quantities of the intersections, inf for parallel lines
+    """
+    def _line(p1, p2):
+        # numpy.cross of (x1, y1, 1) and (x2, y2, 1)
+        return p1[:, 1] - p2[:, 1], p2[:, 0] - p1[:, 0], p1[:, 0] * p2[:, 1] - p1[:, 1] * p2[:, 0]
+
+    l1 = _line(np.asarray(a1, dtype=float), np.asarray(a2, dtype=float))
+    l2 = _line(np.asarray(b1, dtype=float), np.asarray(b2, dtype=float))
+    x = l1[1] * l2[2] - l1[2] * l2[1]
+    y = l1[2] * l2[0] - l1[0] * l2[2]
+    z = l1[0] * l2[1] - l1[1] * l2[0]
+    parallel = z == 0
+    z = np.where(parallel, 1.0, z)
+    return np.where(parallel, np.inf, y / z), np.where(parallel, np.inf, x / z)
+
+
+def first_crossing(buyer_prices, seller_prices):
+    """ Finds the first sample where the buyer curve crosses the seller curve
+
+    A crossing is a segment where the buyer price starts above and ends below
+    the seller price, or a sample where both prices are equal, whichever comes
+    first. Works on single curves or on rows of stacked curves sampled at the
+    same quantities.
+
+    Args:
+        buyer_prices (numpy.ndarray): buyer prices, dimension (num_samples,) or (n, num_samples)
+        seller_prices (numpy.ndarray): seller prices with the same dimension
+
+    Returns:
+        numpy.ndarray, numpy.ndarray, numpy.ndarray: index of the first crossing, whether it
+        is a segment crossing (False for equal prices) and whether any crossing was found
+    """
+    bp = np.asarray(buyer_prices, dtype=float)
+    sp = np.asarray(seller_prices, dtype=float)
+    cross = (bp[..., :-1] > sp[..., :-1]) & (bp[..., 1:] < sp[..., 1:])
+    hit = cross | (bp[..., :-1] == sp[..., :-1])
+    idx = np.argmax(hit, axis=-1)
+    found = np.any(hit, axis=-1)
+    is_cross = np.take_along_axis(cross, np.expand_dims(idx, -1), axis=-1)[..., 0]
+    return idx, is_cross, found
+
+
 def resample_curve(x_vec, y_vec, min_q, max_q, num_samples):
     new_q = np.linspace(min_q, max_q, num_samples)
-    new_p = []
-    for val in new_q:
-        new_p.append(np.interp(val, x_vec, y_vec))
+    new_p = np.interp(new_q, x_vec, y_vec).tolist()
     return new_q, new_p
 
 
 def resample_curve_for_price_only(x_vec_1, x_vec_2, y_vec_2):
-    new_p_2 = []
-    for val in x_vec_1:
-        new_p_2.append(np.interp(val, x_vec_2, y_vec_2))
-    return new_p_2
+    return np.interp(x_vec_1, x_vec_2, y_vec_2).tolist()
 
 
 def resample_curve_for_market(x_vec_1, y_vec_1, x_vec_2, y_vec_2):  # , min_q, max_q, num_samples):
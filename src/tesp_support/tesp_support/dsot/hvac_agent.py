@@ -8,6 +8,7 @@ TODO: update the purpose of this Agent
 """
 import logging as log
 import math
+import time
 from datetime import datetime, timedelta
 from math import cos as cos
 from math import sin as sin
@@ -20,6 +21,7 @@ from scipy import linalg
 
 from tesp_support.api.helpers import get_run_solver
 from tesp_support.api.parse_helpers import parse_number, parse_magnitude
+from tesp_support.weather.forecast import decodeForecast
 
 logger = log.getLogger()
 log.getLogger('pyomo.core').setLevel(log.ERROR)
@@ -44,6 +46,17 @@ class HVACDSOT:  # TODO: update class name
 
     """
 
+    # attributes read by DA_optimal_quantities that change between hours,
+    # shipped each hour to the resident copy of the agent in AgentPool
+    DA_VECTOR_INPUTS = ('price_forecast', 'temperature_forecast', 'solargain_forecast', 'internalgain_forecast',
+                        'temp_desired_48hour_cool', 'temp_desired_48hour_heat', 'latent_factor', 'cooling_cop_adj',
+                        'heating_cop_adj')
+    DA_SCALAR_INPUTS = ('hvac_kw', 'eps', 'UA', 'solar_heatgain_factor', 'temp_room_init', 'temp_outside_init',
+                        'price_delta', 'price_std_dev', 'temp_delta', 'range_low_cool', 'range_high_cool',
+                        'range_low_heat', 'range_high_heat', 'temp_min_cool', 'temp_max_cool', 'temp_min_heat',
+                        'temp_max_heat')
+    DA_OBJECT_INPUTS = ('thermostat_mode',)
+
     def __init__(self, hvac_dict, house_properties, key, model_diag_level, sim_time, solver):
         # TODO: update inputs for class
         """ Initializes the class
@@ -109,6 +122,11 @@ class HVACDSOT:  # TODO: update class name
         self.windowLength = 48
         self.TIME = range(self.windowLength)
         self.optimized_Quantity = [[]] * self.windowLength
+        # persistent day-ahead model, only forecasts and limits are updated each hour
+        self.persistent_model = bool(hvac_dict.get('persistent_model', True))
+        self.da_model = None
+        self.da_solver = None
+        self.da_timing = {'build': 0.0, 'solve': 0.0}
 
         # calculated in calc_thermostat_settings
         self.range_low_cool = 0.0
@@ -813,8 +831,7 @@ class HVACDSOT:  # TODO: update class name
             fncs_str: temperature_forecast ([float x 48]): predicted temperature in F
         """
 
-        temperature_forecast = eval(fncs_str)
-        self.temperature_forecast = [float(temperature_forecast[key]) for key in temperature_forecast.keys()]
+        self.temperature_forecast = decodeForecast(fncs_str)
         # print ("temperature forecast inside function")
         # print(self)
         # print (self.temperature_forecast)
@@ -828,8 +845,7 @@ class HVACDSOT:  # TODO: update class name
             fncs_str: temperature_forecast ([float x 48]): predicted temperature in F
         """
 
-        humidity_forecast = eval(fncs_str)
-        self.humidity_forecast = [float(humidity_forecast[key]) for key in humidity_forecast.keys()]
+        self.humidity_forecast = decodeForecast(fncs_str)
 
     def set_solargain_forecast(self, solargain_array):
         """ Set the 48-hour solargain forecast
@@ -1953,6 +1969,105 @@ class HVACDSOT:  # TODO: update class name
             return (self.temp_desired_48hour_heat[t] - self.range_low_heat,
                     self.temp_desired_48hour_heat[t] + self.range_high_heat)
 
+    def __getstate__(self):
+        """ Drop the persistent day-ahead model and solver when the agent is pickled,
+        they are rebuilt on the first solve in the receiving process
+        """
+        state = self.__dict__.copy()
+        state['da_model'] = None
+        state['da_solver'] = None
+        return state
+
+    def build_DA_model(self):
+        """ Builds the parameterized day-ahead model used by DA_optimal_quantities
+
+        Forecasts, comfort limits and thermostat mode enter the model only through
+        mutable Params and variable bounds, so the model is built once per agent
+        and updated in place by update_DA_model every hour.
+        """
+        model = pyo.ConcreteModel()
+        model.price_coef = pyo.Param(self.TIME, initialize=0.0, mutable=True)
+        model.temp_desired = pyo.Param(self.TIME, initialize=0.0, mutable=True)
+        model.ambient = pyo.Param(self.TIME, initialize=0.0, mutable=True)
+        model.hvac_gain = pyo.Param(self.TIME, initialize=0.0, mutable=True)
+        model.comfort_coef = pyo.Param(initialize=0.0, mutable=True)
+        model.quad_coef = pyo.Param(initialize=0.0, mutable=True)
+        model.eps = pyo.Param(initialize=0.0, mutable=True)
+        model.temp_init = pyo.Param(initialize=0.0, mutable=True)
+        # Decision variables, bounds are set by update_DA_model
+        model.quan_hvac = pyo.Var(self.TIME)
+        model.temp_room = pyo.Var(self.TIME)
+
+        def obj_rule(m):
+            return sum(m.price_coef[t] * m.quan_hvac[t]
+                       + m.comfort_coef * (m.temp_room[t] - m.temp_desired[t]) ** 2
+                       + m.quad_coef * m.quan_hvac[t] * m.quan_hvac[t]
+                       for t in self.TIME)
+
+        def con_rule_eq1(m, t):
+            if t == 0:
+                prev = m.temp_init
+            else:
+                prev = m.temp_room[t - 1]
+            return m.temp_room[t] == m.eps * prev + (1 - m.eps) * (m.ambient[t] + m.hvac_gain[t] * m.quan_hvac[t])
+
+        model.obj = pyo.Objective(rule=obj_rule, sense=pyo.minimize)
+        model.con1 = pyo.Constraint(self.TIME, rule=con_rule_eq1)
+        return model
+
+    def update_DA_model(self, model, warm_start=True):
+        """ Updates the Params and bounds of the day-ahead model for the current hour
+
+        Args:
+            model (ConcreteModel): model built by build_DA_model
+            warm_start (bool): shift the previous hour's solution into the variables as the initial point
+        """
+        if self.thermostat_mode == 'Cooling':
+            temp = self.temp_desired_48hour_cool
+            range_low = self.range_low_cool
+            range_high = self.range_high_cool
+        else:
+            temp = self.temp_desired_48hour_heat
+            range_low = self.range_low_heat
+            range_high = self.range_high_heat
+        if self.hvac_kw != 0 and self.price_delta != 0 and (self.range_low_limit + self.range_high_limit) != 0:
+            min_price = np.min(self.price_forecast)
+            price_scale = self.slider / self.price_delta / self.hvac_kw
+            model.comfort_coef = 0.1 / (self.range_low_limit + self.range_high_limit) ** 2
+            model.quad_coef = 0.001 * self.slider / self.hvac_kw ** 2
+        else:
+            min_price = 0.0
+            price_scale = 0.0
+            model.comfort_coef = 0.0
+            model.quad_coef = 0.0
+        model.eps = self.eps
+        model.temp_init = self.temp_room_init
+
+        if warm_start:
+            prev_quan = [model.quan_hvac[t].value for t in self.TIME]
+            prev_temp = [model.temp_room[t].value for t in self.TIME]
+        for t in self.TIME:
+            model.price_coef[t] = price_scale * (self.price_forecast[t] - min_price)
+            model.temp_desired[t] = temp[t]
+            model.ambient[t] = self.temperature_forecast[t] + \
+                (self.internalgain_forecast[t] + self.solargain_forecast[t] * self.solar_heatgain_factor) / self.UA
+            if self.thermostat_mode == 'Cooling':
+                cop = -self.cooling_cop_adj[t] * 0.98
+            else:
+                cop = self.heating_cop_adj[t] * 1.02
+            model.hvac_gain[t] = cop * 3412.1416331279 / self.latent_factor[t] / self.UA
+            model.quan_hvac[t].setlb(0.0)
+            model.quan_hvac[t].setub(self.hvac_kw)
+            model.temp_room[t].setlb(temp[t] - range_low)
+            model.temp_room[t].setub(temp[t] + range_high)
+            if warm_start:
+                # the window moved one hour, so the previous hour t + 1 is this hour t
+                nxt = min(t + 1, self.windowLength - 1)
+                if prev_quan[nxt] is not None:
+                    model.quan_hvac[t].set_value(min(max(prev_quan[nxt], 0.0), self.hvac_kw), skip_validation=True)
+                if prev_temp[nxt] is not None:
+                    model.temp_room[t].set_value(prev_temp[nxt], skip_validation=True)
+
     def DA_optimal_quantities(self):
         """ Generates Day Ahead optimized quantities for Water Heater according to the forecasted prices
         and water draw schedule, called by DA_formulate_bid function
@@ -1973,8 +2088,27 @@ class HVACDSOT:  # TODO: update class name
         nonlinear = True
         # Initialize the problem
 
-        if nonlinear:
+        if nonlinear and self.persistent_model:
+            # Reuse the model and solver kept on the agent, only the Params change
+            build_start = time.perf_counter()
+            warm_start = self.da_model is not None
+            if self.da_model is None:
+                self.da_model = self.build_DA_model()
+                self.da_solver = pyo.SolverFactory(self.solver)
+            self.update_DA_model(self.da_model, warm_start)
+            solve_start = time.perf_counter()
+            if warm_start and self.da_solver.warm_start_capable():
+                self.da_solver.solve(self.da_model, tee=False, warmstart=True)
+            else:
+                self.da_solver.solve(self.da_model, tee=False)
+            solve_end = time.perf_counter()
+            self.da_timing = {'build': solve_start - build_start, 'solve': solve_end - solve_start}
+            Quantity = [pyo.value(self.da_model.quan_hvac[t]) for t in self.TIME]
+            temp_room = [pyo.value(self.da_model.temp_room[t]) for t in self.TIME]
+
+        elif nonlinear:
             # Create model
+            build_start = time.perf_counter()
             model = pyo.ConcreteModel()
             # Decision variables
             model.quan_hvac = pyo.Var(self.TIME, bounds=(0.0, self.hvac_kw))
@@ -1984,7 +2118,9 @@ class HVACDSOT:  # TODO: update class name
             # Constraints
             model.con1 = pyo.Constraint(self.TIME, rule=self.con_rule_eq1)
             # Solve
+            solve_start = time.perf_counter()
             results = get_run_solver("hvac_" + self.name, pyo, model, self.solver)
+            self.da_timing = {'build': solve_start - build_start, 'solve': time.perf_counter() - solve_start}
             Quantity = [0 for _ in self.TIME]
             temp_room = [0 for _ in self.TIME]
             TOL = 0.00001  # Tolerance for checking bid
@@ -0,0 +1,327 @@
+# Copyright (C) 2024 Battelle Memorial Institute
+# See LICENSE file at https://github.com/pnnl/tesp
+# file: metrics_catalog.py
+"""Case-level catalog of the DSOT metrics files for post-processing
+
+The catalog lists the DSO and substation folders of a case once, finds the metrics file
+of each system with the same rules as the loaders in plots.py, and serves the rows of one
+simulation day and only the requested columns, without changing the working directory.
+
+The first time a table is read it is converted, in chunks, to one array per column
+(strings as integer codes) and kept for the life of the catalog. Given a cache folder, the
+columns are saved there as .npy files instead, so later runs memory-map just the columns
+asked for. Reads slice the rows of the day from the sorted time index, so looping over days,
+DSOs and variables reads little more than the values plotted. A saved table is rebuilt when
+the size or modification time of its HDF5 file changes.
+
+Public Classes:
+    :MetricsCatalog: catalog of the metrics files of one case
+
+Public Functions:
+    :get_catalog: shared catalog of a case
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# rows converted per read of the HDF5 table
+CHUNK_ROWS = 1000000
+# agent systems whose day frame is indexed by (time, uid), as returned by plots.load_agent_data
+UID_INDEXED = ['battery_agent', 'retail_market', 'water_heater_agent', 'dso_market']
+GLD_SYSTEMS = ['substation', 'house', 'billing_meter', 'inverter', 'evchargerdet']
+
+_catalogs = {}
+
+
+class _ColumnTable:
+    """ One HDF5 table stored as memory-mapped column files
+
+    Args:
+        folder (str): folder of the column files, None to keep the columns in memory
+        h5_file (str): HDF5 file of the table
+        key (str): key of the table
+
+    Attributes:
+        meta (dict): columns, dtypes, string categories, index name and whether the index is sorted
+    """
+
+    def __init__(self, folder, h5_file, key):
+        self.folder = folder
+        self.columns = {}
+        meta_file = None if folder is None else os.path.join(folder, 'meta.json')
+        if meta_file is not None and os.path.isfile(meta_file):
+            with open(meta_file) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = self._convert(h5_file, key)
+            if self.folder is not None:
+                try:
+                    with open(meta_file, 'w') as f:
+                        json.dump(self.meta, f)
+                except OSError as ex:
+                    print("Could not save the columns of {} {} in {}: {}".format(h5_file, key, folder, ex))
+                    self.folder = None
+        self.categories = {c: np.array(cats + [np.nan], dtype=object)
+                           for c, cats in self.meta['categories'].items()}
+
+    def _convert(self, h5_file, key):
+        meta = {'columns': [], 'categories': {}, 'index': None, 'sorted': True, 'nrows': 0}
+        lookups = {}
+        arrays = {}
+        last = None
+        with pd.HDFStore(h5_file, 'r') as store:
+            nrows = store.get_storer(key).nrows
+            nrows = 0 if nrows is None else int(nrows)
+            meta['nrows'] = nrows
+            if nrows == 0:
+                # nothing to map, keep the empty columns in memory
+                self.folder = None
+            for start in range(0, max(nrows, 1), CHUNK_ROWS):
+                df = store.select(key, start=start, stop=min(start + CHUNK_ROWS, nrows))
+                if start == 0:
+                    meta['index'] = df.index.name
+                    meta['columns'] = ['_index'] + [str(c) for c in df.columns]
+                cols = [df.index.to_numpy()] + [df[c].to_numpy() for c in df.columns]
+                for name, values in zip(meta['columns'], cols):
+                    if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+                        # strings are saved as codes into the categories of the column
+                        lookup = lookups.setdefault(name, {})
+                        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+                        ids = np.array([lookup.setdefault(u, len(lookup)) for u in uniques], dtype=np.int32)
+                        values = np.where(codes >= 0, ids[codes] if len(ids) else codes, -1).astype(np.int32)
+                    if name not in arrays:
+                        arrays[name] = self._allocate(name, values.dtype, nrows)
+                    arrays[name][start:start + len(values)] = values
+                index = cols[0]
+                if len(index) > 0:
+                    try:
+                        if (last is not None and index[0] < last) or np.any(index[1:] < index[:-1]):
+                            meta['sorted'] = False
+                        last = index[-1]
+                    except TypeError:
+                        meta['sorted'] = False
+        for name, lookup in lookups.items():
+            meta['categories'][name] = [u if isinstance(u, str) else str(u) for u in lookup]
+        for name, values in arrays.items():
+            if isinstance(values, np.memmap):
+                values.flush()
+            self.columns[name] = values
+        return meta
+
+    def _allocate(self, name, dtype, nrows):
+        if self.folder is not None:
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+                return np.lib.format.open_memmap(os.path.join(self.folder, name + '.npy'), mode='w+',
+                                                 dtype=dtype, shape=(nrows,))
+            except OSError as ex:
+                print("Could not save column {} in {}: {}".format(name, self.folder, ex))
+                self.folder = None
+        return np.empty(nrows, dtype=dtype)
+
+    def column(self, name):
+        """ Memory-mapped (or in memory) values of a column, string columns as codes
+        """
+        if name not in self.columns:
+            self.columns[name] = np.load(os.path.join(self.folder, name + '.npy'), mmap_mode='r')
+        return self.columns[name]
+
+    def rows(self, low=None, high=None):
+        """ Row slice, or mask, of the index values in [low, high]
+        """
+        if low is None and high is None:
+            return slice(0, self.meta['nrows'])
+        index = self.column('_index')
+        if self.meta['sorted']:
+            start = 0 if low is None else int(np.searchsorted(index, low, side='left'))
+            stop = len(index) if high is None else int(np.searchsorted(index, high, side='right'))
+            return slice(start, stop)
+        mask = np.ones(len(index), dtype=bool)
+        if low is not None:
+            mask &= index >= low
+        if high is not None:
+            mask &= index <= high
+        return mask
+
+    def frame(self, columns=None, rows=None):
+        """ DataFrame of the rows and columns asked for, with the index of the HDF5 table
+
+        Args:
+            columns (list): column names, all if None
+            rows (slice or ndarray): rows from rows(), all if None
+        Returns:
+            DataFrame
+        """
+        if columns is None:
+            columns = self.meta['columns'][1:]
+        if rows is None:
+            rows = slice(0, self.meta['nrows'])
+        missing = [c for c in columns if c not in self.meta['columns']]
+        if len(missing) > 0:
+            raise KeyError('Columns {} are not in the metrics table'.format(missing))
+        data = {}
+        for name in ['_index'] + list(columns):
+            values = np.array(self.column(name)[rows])
+            if name in self.categories:
+                values = self.categories[name][values]
+            data[name] = values
+        index = pd.Index(data.pop('_index'), name=self.meta['index'])
+        return pd.DataFrame(data, index=index, columns=list(columns))
+
+
+class MetricsCatalog:
+    """ Catalog of the metrics files of one case
+
+    Args:
+        case (str): path of the case folder
+        agent_prefix (str): prefix of the agent folders (e.g. '/DSO_')
+        gld_prefix (str): prefix of the GridLAB-D folders (e.g. '/Substation_')
+        cache_dir (str): folder of the converted tables, None or False to keep them in memory only
+
+    Attributes:
+        listings (dict): file names of each folder, listed once
+        tables (dict): converted tables by (file, key)
+    """
+
+    def __init__(self, case, agent_prefix='/DSO_', gld_prefix='/Substation_', cache_dir=None):
+        # absolute, so the catalog survives the os.chdir calls of the plotting functions
+        self.case = os.path.abspath(case)
+        self.agent_prefix = agent_prefix
+        self.gld_prefix = gld_prefix
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir else None
+        self.listings = {}
+        self.tables = {}
+        self.starts = {}
+
+    def _listing(self, folder):
+        if folder not in self.listings:
+            self.listings[folder] = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+        return self.listings[folder]
+
+    def sim_start(self, dso):
+        """ Start time of the simulation of a DSO, from its case_config file
+        """
+        dso = str(dso)
+        if dso not in self.starts:
+            with open(os.path.join(self.case, 'case_config_' + dso + '.json')) as f:
+                case_config = json.load(f)
+            self.starts[dso] = datetime.strptime(case_config['SimulationConfig']['StartTime'], '%Y-%m-%d %H:%M:%S')
+        return self.starts[dso]
+
+    def get_date(self, dso, day):
+        """ Start time (datetime format) of simulation day (1 = first day of simulation)
+        """
+        return self.sim_start(dso) + timedelta(days=int(day) - 1)
+
+    def system_file(self, dso, system):
+        """ Path of the metrics file of a system, chosen like plots.load_agent_data and plots.load_system_data
+
+        Args:
+            dso (str): number of the DSO
+            system (str): system name (e.g. 'house', 'billing_meter', 'hvac_agent', 'retail_market')
+        Returns:
+            str: file path
+        """
+        dso = str(dso)
+        if system in GLD_SYSTEMS:
+            folder = self.case + self.gld_prefix + dso
+            names = [f for f in self._listing(folder) if f.endswith('.h5') and system in f]
+        else:
+            folder = self.case + self.agent_prefix + dso
+            if system == 'retail_site':
+                names = [f for f in self._listing(folder) if ('_' + dso) in f and f.startswith(system)]
+            else:
+                names = [f for f in self._listing(folder) if '300' in f and f.startswith(system)]
+        if len(names) == 0:
+            raise FileNotFoundError('No metrics file for {} in {}'.format(system, folder))
+        return os.path.join(folder, names[0])
+
+    def table(self, h5_file, key):
+        """ Converted table of an HDF5 file, converted on first use
+
+        Args:
+            h5_file (str): path of the HDF5 file
+            key (str): key of the table
+        Returns:
+            _ColumnTable
+        """
+        if (h5_file, key) not in self.tables:
+            folder = None
+            if self.cache_dir is not None:
+                stat = os.stat(h5_file)
+                stamp = '{}|{}|{}'.format(os.path.abspath(h5_file), stat.st_size, stat.st_mtime_ns)
+                name = os.path.basename(h5_file)[:-3] + key.replace('/', '_')
+                folder = os.path.join(self.cache_dir, name + '_' + hashlib.sha1(stamp.encode('utf-8')).hexdigest()[:12])
+            self.tables[(h5_file, key)] = _ColumnTable(folder, h5_file, key)
+        return self.tables[(h5_file, key)]
+
+    def day_frame(self, dso, system, day, columns=None):
+        """ Rows of one simulation day of a system, in the format of plots.load_agent_data and
+        plots.load_system_data
+
+        Args:
+            dso (str): number of the DSO
+            system (str): system name (e.g. 'house', 'billing_meter', 'hvac_agent', 'retail_market')
+            day (str): simulation day number (1 = first day of simulation)
+            columns (list): columns wanted, all if None
+        Returns:
+            DataFrame
+        """
+        h5_file = self.system_file(dso, system)
+        if system in GLD_SYSTEMS:
+            return self.table(h5_file, '/index' + str(day)).frame(columns)
+
+        if columns is not None and system in UID_INDEXED and 'uid' not in columns:
+            columns = ['uid'] + list(columns)
+        table = self.table(h5_file, '/metrics_df0')
+        date = self.get_date(dso, day)
+        stop_time = date + timedelta(days=1) - timedelta(minutes=5)
+        df = table.frame(columns, table.rows(np.datetime64(date), np.datetime64(stop_time)))
+        if system in UID_INDEXED:
+            df = df.set_index([df.index, df['uid']])
+        return df
+
+    def entries(self, dso):
+        """ Tables of the metrics files of a DSO, read from the HDF5 metadata only
+
+        Args:
+            dso (str): number of the DSO
+        Returns:
+            DataFrame: folder, file, key, day (for daily GridLAB-D tables), nrows and columns of each table
+        """
+        dso = str(dso)
+        rows = []
+        for folder in [self.case + self.agent_prefix + dso, self.case + self.gld_prefix + dso]:
+            for name in self._listing(folder):
+                if not name.endswith('.h5'):
+                    continue
+                with pd.HDFStore(os.path.join(folder, name), 'r') as store:
+                    for key in store.keys():
+                        storer = store.get_storer(key)
+                        columns = []
+                        if getattr(storer, 'non_index_axes', None):
+                            columns = list(storer.non_index_axes[0][1])
+                        day = int(key[6:]) if key.startswith('/index') and key[6:].isdigit() else None
+                        rows.append([folder, name, key, day, storer.nrows, columns])
+        return pd.DataFrame(rows, columns=['folder', 'file', 'key', 'day', 'nrows', 'columns'])
+
+
+def get_catalog(case, agent_prefix='/DSO_', gld_prefix='/Substation_', cache_dir=False):
+    """ Catalog of a case shared by the plotting functions
+
+    Args:
+        case (str): path of the case folder
+        agent_prefix (str): prefix of the agent folders (e.g. '/DSO_')
+        gld_prefix (str): prefix of the GridLAB-D folders (e.g. '/Substation_')
+        cache_dir (str): folder of the converted tables, False to keep them in memory only
+    Returns:
+        MetricsCatalog
+    """
+    name = (os.path.abspath(case), agent_prefix, gld_prefix, os.path.abspath(cache_dir) if cache_dir else None)
+    if name not in _catalogs:
+        _catalogs[name] = MetricsCatalog(case, agent_prefix, gld_prefix, cache_dir)
+    return _catalogs[name]
@@ -13,6 +13,8 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
+from .metrics_catalog import get_catalog
+
 plt.switch_backend('Agg')
 cache_output = {}
 cache_df = {}
@@ -4710,9 +4712,12 @@ def house_check(dso_range, sourceCase, targetCase, houseProperties):
     # return log_list
 
 
-def get_day_df(dso, system, subsystem, variable, day, case, agent_prefix, gld_prefix):
+def get_day_df(dso, system, subsystem, variable, day, case, agent_prefix, gld_prefix, catalog=None,
+               cache_dir=False):
     """
     This utility loads and returns a dataframe for the desired variable for the day and dso in question.
+    Agent and GridLAB-D data are read through the metrics catalog of the case, so only the rows of the day
+    and the columns needed for the variable are read.
     Args:
         dso (str): the DSO that the data should be plotted for (e.g. '1')
         system (str): the system to be plotted (e.g. 'substation', 'house', 'HVAC_agent')
@@ -4723,14 +4728,25 @@ def get_day_df(dso, system, subsystem, variable, day, case, agent_prefix, gld_pr
         case (str): folder extension of case of interest
         agent_prefix (str): folder extension for agent data
         gld_prefix (str): folder extension for GridLAB-D data
+        catalog (MetricsCatalog): catalog of the metrics files of the case, the shared catalog of case if None
+        cache_dir (str): folder of the converted tables of the shared catalog, False to keep them in memory only
     Returns:
         df (dataframe): reduced dataframe
     """
+    if catalog is None:
+        catalog = get_catalog(case, agent_prefix, gld_prefix, cache_dir)
+    # Infer house zip loads from total loads and HVAC and WH loads.
+    if variable == 'zip_loads':
+        columns = ['total_load_avg', 'hvac_load_avg', 'waterheater_load_avg']
+    else:
+        columns = [variable]
     # =================   core code for agent data  ================
     if system in ['hvac_agent', 'battery_agent', 'retail_market', 'dso_market', 'water_heater_agent']:
-        system_df, agent_bid_df = load_agent_data(case, agent_prefix, dso, day, system)
-    elif system in ['substation', 'house', 'billing_meter', 'inverter', 'evchargerdet']:
-        system_meta_df, system_df = load_system_data(case, gld_prefix, dso, day, system)
+        system_df = catalog.day_frame(dso, system, day, ['uid'] + columns)
+    elif system == 'substation':
+        system_df = catalog.day_frame(dso, system, day, columns)
+    elif system in ['house', 'billing_meter', 'inverter', 'evchargerdet']:
+        system_df = catalog.day_frame(dso, system, day, ['time', 'name'] + columns)
     elif system == 'weather':
         system_df = load_weather_data(case, agent_prefix, dso, day)
     else:
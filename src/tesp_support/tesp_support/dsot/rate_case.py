@@ -0,0 +1,302 @@
+# Copyright (C) 2024 Battelle Memorial Institute
+# See LICENSE file at https://github.com/pnnl/tesp
+# file: rate_case.py
+"""Parallel driver for the monthly meter reading and the rate making of a multi-DSO case
+
+The meter reading of every (DSO, month) is an independent unit that runs the retail
+data preprocessing and read_meters in a process pool. The energy_metrics_data.h5 and
+transactive_metrics_data.h5 files of each unit are saved in a content-addressed cache,
+keyed by the hash of every file the unit reads and the tariff parameters it depends on,
+so rerunning a case after changing a tariff or scenario only recomputes the units whose
+inputs changed.
+
+Public Functions:
+    :month_unit_key: cache key of one (DSO, month) unit
+    :read_month_meters: runs or restores one (DSO, month) unit
+    :read_rate_case_meters: runs all (DSO, month) units and aggregates them by year
+    :rate_making_parallel: runs DSO_rate_making for several DSOs in a process pool
+"""
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .dso_rate_making import read_meters, annual_energy, DSO_rate_making
+from .plots import load_json, load_retail_data
+
+# bump when read_meters changes its results, to invalidate the cache
+CACHE_VERSION = 1
+ENERGY_FILE = 'energy_metrics_data.h5'
+TRANS_FILE = 'transactive_metrics_data.h5'
+
+
+def _file_digest(path, digests):
+    """ sha1 of a file, reused from digests while its size and modification time are unchanged
+    """
+    if not os.path.isfile(path):
+        return 'missing'
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    known = digests.get(path)
+    if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+        return known[2]
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    digests[path] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+    return digests[path][2]
+
+
+def _listdir(dir_path, match):
+    if not os.path.isdir(dir_path):
+        return []
+    return [os.path.join(dir_path, f) for f in sorted(os.listdir(dir_path)) if match(f)]
+
+
+def unit_inputs(dir_path, agent_prefix, folder_prefix, dso_num, dso_data_path, rate_scenario=None):
+    """ Files read by the retail data preprocessing and read_meters for one DSO and month.
+
+    Args:
+        dir_path (str): directory path of the month case
+        agent_prefix (str): prefix of the agent folder name (e.g. '/DSO_')
+        folder_prefix (str): prefix of GLD folder name (e.g. '/Substation_')
+        dso_num (str): number of the DSO
+        dso_data_path (str): data path given to read_meters, relative to the agent folder
+        rate_scenario (str): rate scenario given to read_meters, defaults to None
+    Returns:
+        list: file paths, including the ones that do not exist
+    """
+    agent_path = dir_path + agent_prefix + dso_num
+    gld_path = dir_path + folder_prefix + dso_num
+    files = [os.path.join(dir_path, 'generate_case_config.json'),
+             os.path.join(dir_path, 'case_config_' + dso_num + '.json'),
+             os.path.join(dir_path, 'opf.csv')]
+    files += _listdir(dir_path, lambda f: f.startswith('da_lmp_') and f.endswith('.h5'))
+    files += _listdir(agent_path, lambda f: ('_' + dso_num) in f and f.startswith('retail_site'))
+    files += _listdir(agent_path, lambda f: f.startswith('retail_market') and
+                      ('300' in f or f == 'retail_market_Substation_' + dso_num + '_3600_metrics.h5'))
+    files += _listdir(gld_path, lambda f: f.endswith('.h5') and ('substation' in f or 'billing_meter' in f))
+    # read_meters opens its data files relative to the agent folder, where the preprocessing leaves it
+    data_path = os.path.normpath(os.path.join(agent_path, '../' + dso_data_path))
+    case_config = load_json(dir_path, 'generate_case_config.json')
+    files.append(os.path.join(data_path, case_config['indLoad'][5].split('/')[-1]))
+    if rate_scenario in ["time-of-use", "TOU"]:
+        files.append(os.path.join(data_path, 'time_of_use_parameters.json'))
+    return files
+
+
+def month_unit_key(metadata, dir_path, agent_prefix, folder_prefix, dso_num, day_range, SF, dso_data_path,
+                   rate_scenario=None, digests=None):
+    """ Content-addressed cache key of one (DSO, month) unit.
+
+    Args:
+        metadata (dict): metadata structure for the DSO, with tariff_class and cust_participating of the billing meters
+        dir_path (str): directory path of the month case
+        agent_prefix (str): prefix of the agent folder name (e.g. '/DSO_')
+        folder_prefix (str): prefix of GLD folder name (e.g. '/Substation_')
+        dso_num (str): number of the DSO
+        day_range (list): simulation days of the month
+        SF (float): scaling factor of the DSO
+        dso_data_path (str): data path given to read_meters
+        rate_scenario (str): rate scenario given to read_meters, defaults to None
+        digests (dict): file digests by path, updated with the files hashed here
+    Returns:
+        str: sha1 hex digest
+    """
+    if digests is None:
+        digests = {}
+    files = unit_inputs(dir_path, agent_prefix, folder_prefix, dso_num, dso_data_path, rate_scenario)
+    unit = {
+        'version': CACHE_VERSION,
+        'files': [[os.path.basename(f), _file_digest(f, digests)] for f in files],
+        'dso': dso_num,
+        'days': [int(day) for day in day_range],
+        'SF': float(SF),
+        'rate_scenario': rate_scenario,
+        'meters': [[each, metadata['billingmeters'][each]['tariff_class'],
+                    bool(metadata['billingmeters'][each]['cust_participating'])]
+                   for each in metadata['billingmeters']]
+    }
+    return hashlib.sha1(json.dumps(unit, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _copy_file(src, dst):
+    tmp = dst + '.tmp' + str(os.getpid())
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def read_month_meters(metadata, dir_path, agent_prefix, folder_prefix, dso_num, day_range, SF, dso_data_path,
+                      rate_scenario=None, key=None, cache_dir=None, cwd=None):
+    """ Runs the retail data preprocessing and read_meters for one DSO and month, or restores its results
+    from the cache.
+
+    Args:
+        metadata (dict): metadata structure for the DSO
+        dir_path (str): directory path of the month case
+        agent_prefix (str): prefix of the agent folder name (e.g. '/DSO_')
+        folder_prefix (str): prefix of GLD folder name (e.g. '/Substation_')
+        dso_num (str): number of the DSO
+        day_range (list): simulation days of the month
+        SF (float): scaling factor of the DSO
+        dso_data_path (str): data path given to read_meters
+        rate_scenario (str): rate scenario given to read_meters, defaults to None
+        key (str): cache key from month_unit_key, None to always recompute
+        cache_dir (str): folder of the cached results, None to disable the cache
+        cwd (str): working directory the relative paths are resolved from, the current one if None
+    Returns:
+        bool: True if the results were restored from the cache
+    """
+    save_path = dir_path + folder_prefix + dso_num
+    cached = None
+    if key is not None and cache_dir is not None:
+        cached = [os.path.join(cache_dir, key + '_energy.h5'), os.path.join(cache_dir, key + '_trans.h5')]
+        if os.path.isfile(cached[0]) and os.path.isfile(cached[1]):
+            _copy_file(cached[0], os.path.join(save_path, ENERGY_FILE))
+            _copy_file(cached[1], os.path.join(save_path, TRANS_FILE))
+            return True
+
+    # the loaders change the working directory, restore it for the next unit of this process
+    start = os.getcwd()
+    try:
+        if cwd is not None:
+            os.chdir(cwd)
+        for day_num in day_range:
+            load_retail_data(dir_path, agent_prefix, dso_num, str(day_num), 'retail_site')
+        read_meters(metadata, dir_path, folder_prefix, dso_num, day_range, SF, dso_data_path,
+                    rate_scenario=rate_scenario)
+    finally:
+        os.chdir(start)
+
+    if cached is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            _copy_file(os.path.join(save_path, ENERGY_FILE), cached[0])
+            _copy_file(os.path.join(save_path, TRANS_FILE), cached[1])
+        except OSError as ex:
+            print("Could not cache meter data of DSO {} in {}: {}".format(dso_num, cache_dir, ex))
+    return False
+
+
+def _run_pool(func, jobs, num_core):
+    if num_core is None or num_core > 1:
+        with ProcessPoolExecutor(max_workers=num_core) as pool:
+            futures = [pool.submit(func, **job) for job in jobs]
+            return [f.result() for f in futures]
+    return [func(**job) for job in jobs]
+
+
+def read_rate_case_meters(month_def, dso_range, metadata, scaling_factors, dso_data_path, case_path=None,
+                          rate_scenario=None, agent_prefix='/DSO_', folder_prefix='/Substation_',
+                          cache_dir=None, num_core=None):
+    """ Reads the meters of all DSOs and months in a process pool and creates the annual energy summaries.
+
+    Only the (DSO, month) units whose input files, metadata, scaling factor or rate scenario
+    changed since they were cached are recomputed.
+
+    Args:
+        month_def (list): list of lists, each with month name (str), directory path (str), first day and
+            end day (exclusive) of the month
+        dso_range (list): DSO numbers
+        metadata (dict): metadata structure by DSO number, with tariff_class and cust_participating set
+        scaling_factors (dict): scaling factor by DSO number
+        dso_data_path (str): data path given to read_meters, relative to the agent folders
+        case_path (str): folder where the annual energy_dso and transactive_dso h5 files are saved,
+            not saved if None
+        rate_scenario (str): rate scenario given to read_meters, defaults to None
+        agent_prefix (str): prefix of the agent folder name
+        folder_prefix (str): prefix of GLD folder name
+        cache_dir (str): folder of the cached results, rate_case_cache in case_path (or the current
+            directory) if None, False to disable the cache
+        num_core (int): number of worker processes, all cores if None, 1 to run in this process
+    Returns:
+        dict: (year_meter_df, year_energysum_df, year_trans_sum_df) by DSO number
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(case_path if case_path is not None else os.getcwd(), 'rate_case_cache')
+    if cache_dir is not False:
+        cache_dir = os.path.abspath(cache_dir)
+    cwd = os.getcwd()
+
+    jobs = []
+    for dso_num in dso_range:
+        for month in month_def:
+            jobs.append({
+                'metadata': metadata[dso_num],
+                'dir_path': month[1],
+                'agent_prefix': agent_prefix,
+                'folder_prefix': folder_prefix,
+                'dso_num': str(dso_num),
+                'day_range': list(range(month[2], month[3])),
+                'SF': scaling_factors[dso_num],
+                'dso_data_path': dso_data_path,
+                'rate_scenario': rate_scenario,
+                'cache_dir': cache_dir if cache_dir is not False else None,
+                'cwd': cwd
+            })
+
+    if cache_dir is not False:
+        # hash the input files in threads, digests of unchanged files are kept between runs
+        digest_file = os.path.join(cache_dir, 'file_digests.json')
+        digests = {}
+        if os.path.isfile(digest_file):
+            with open(digest_file) as f:
+                digests = json.load(f)
+        files = set()
+        for job in jobs:
+            files.update(unit_inputs(job['dir_path'], agent_prefix, folder_prefix, job['dso_num'],
+                                     dso_data_path, rate_scenario))
+        with ThreadPoolExecutor(max_workers=num_core) as pool:
+            list(pool.map(lambda f: _file_digest(f, digests), sorted(files)))
+        for job in jobs:
+            job['key'] = month_unit_key(job['metadata'], job['dir_path'], agent_prefix, folder_prefix,
+                                        job['dso_num'], job['day_range'], job['SF'], dso_data_path,
+                                        rate_scenario, digests)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(digest_file, 'w') as f:
+            json.dump(digests, f, indent=1)
+
+    restored = _run_pool(read_month_meters, jobs, num_core)
+    print('Meter reading complete: {} units recomputed, {} restored from cache'.format(
+        restored.count(False), restored.count(True)))
+
+    results = {}
+    for dso_num in dso_range:
+        results[dso_num] = annual_energy(month_def, folder_prefix, str(dso_num), metadata[dso_num])
+        if case_path is not None:
+            year_meter_df, year_energysum_df, year_trans_sum_df = results[dso_num]
+            year_meter_df.to_hdf(os.path.join(case_path, 'energy_dso_' + str(dso_num) + '_data.h5'),
+                                 key='energy_data')
+            year_energysum_df.to_hdf(os.path.join(case_path, 'energy_dso_' + str(dso_num) + '_data.h5'),
+                                     key='energy_sums')
+            year_trans_sum_df.to_hdf(os.path.join(case_path, 'transactive_dso_' + str(dso_num) + '_data.h5'),
+                                     key='trans_data')
+    return results
+
+
+def _rate_making(cwd, kwargs):
+    start = os.getcwd()
+    try:
+        os.chdir(cwd)
+        return DSO_rate_making(**kwargs)
+    finally:
+        os.chdir(start)
+
+
+def rate_making_parallel(rate_args, num_core=None):
+    """ Runs DSO_rate_making for several DSOs in a process pool.
+
+    The rate making reads the annual energy files of its DSO only, so DSOs are independent.
+
+    Args:
+        rate_args (dict): keyword arguments of DSO_rate_making by DSO number
+        num_core (int): number of worker processes, all cores if None, 1 to run in this process
+    Returns:
+        dict: DSO_rate_making results (DSO_Cash_Flows, DSO_Revenues_and_Energy_Sales, tariff, surplus) by DSO number
+    """
+    cwd = os.getcwd()
+    dso_nums = list(rate_args)
+    results = _run_pool(_rate_making, [{'cwd': cwd, 'kwargs': rate_args[dso]} for dso in dso_nums], num_core)
+    return dict(zip(dso_nums, results))
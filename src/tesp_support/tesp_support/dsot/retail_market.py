@@ -16,13 +16,16 @@ The function call order for this agent is:
         curve_aggregator_DA(identity, bid, id)
         ...
         curve_aggregator_DA(identity, bid, id)
+        (or curve_aggregator_DA_block(identity, bids, ids) for all agents at once)
         clear_market_DA(transformer_degradation, Q_max)
+        (or clear_market_DA_all(transformer_degradation, Q_max) for all hours at once)
         
         Repeats at every 5 min:
             clean_bids_RT()
             curve_aggregator_RT(identity, bid, id)
             ...
             curve_aggregator_RT(identity, bid, id)
+            (or curve_aggregator_RT_block(identity, bids, ids) for all agents at once)
             clear_market_RT(transformer_degradation, Q_max)
 
 """
@@ -32,7 +35,8 @@ from copy import deepcopy
 
 import numpy as np
 
-from tesp_support.dsot.helpers_dsot import Curve, get_intersect, MarketClearingType, resample_curve, resample_curve_for_price_only
+from tesp_support.dsot.helpers_dsot import Curve, get_intersect, MarketClearingType, resample_curve, \
+    bid_block, sample_bid_curves, BID_CHUNK, first_crossing, get_intersect_rows
 from tesp_support.api.schedule_client import *
 
 
@@ -233,7 +237,86 @@ class RetailMarket:
             for i in range(self.windowLength):
                 self.curve_seller_DA[i].curve_aggregator(identity, bid_DA[i])
 
-    def clear_market(self, curve_buyer, curve_seller, transformer_degradation, Q_max):
+    def curve_aggregator_RT_block(self, identity, bids_RT, names):
+        """ Function used to collect a block of RT bids and update the accumulated buyer or seller curve in one pass
+
+        Args:
+            identity (str): identifies whether the bids are collected from a "Buyer" or "Seller"
+            bids_RT (list): a nested list with dimension (agents, m, 2), with m equals 2 to 4
+            names ([str]): names of the buyers or sellers, kept for curve_replace_RT
+
+        """
+        if identity == 'Buyer':
+            self.curve_buyer_RT.curve_aggregator_block(identity, bids_RT, names)
+        else:
+            self.curve_seller_RT.curve_aggregator_block(identity, bids_RT, names)
+
+    def curve_replace_RT(self, identity, bid_RT, name):
+        """ Function used to replace one agent's RT bid in the accumulated curve without re-aggregating
+
+        Args:
+            identity (str): identifies whether the bid is collected from a "Buyer" or "Seller"
+            bid_RT (list): a nested list with dimension (m, 2), with m equals 2 to 4, empty to only remove the bid
+            name (str): name of the buyer or seller
+
+        """
+        curve = self.curve_buyer_RT if identity == 'Buyer' else self.curve_seller_RT
+        curve.curve_replace(identity, name, bid_RT)
+
+    def curve_aggregator_DA_block(self, identity, bids_DA, names):
+        """ Function used to collect a block of DA bids and update all accumulated buyer or seller curves in one pass
+
+        Args:
+            identity (str): identifies whether the bids are collected from a "Buyer" or "Seller"
+            bids_DA (list): a nested list with dimension (agents, self.windowLength, m, 2), with m equals 2 to 4
+            names ([str]): names of the buyers or sellers, kept for curve_replace_DA
+
+        """
+        if len(bids_DA) == 0:
+            return
+        curves = self.curve_buyer_DA if identity == 'Buyer' else self.curve_seller_DA
+        window = self.windowLength
+        block = bid_block([bid for bid_DA in bids_DA for bid in bid_DA[:window]])
+        if block is None:
+            return
+        if len(block) != len(bids_DA) * window:
+            # some hours are empty, keep the exact per hour path
+            for bid_DA, name in zip(bids_DA, names):
+                for i in range(window):
+                    curves[i].curve_aggregator_block(identity, [bid_DA[i]], [name])
+            return
+        block = block.reshape(len(bids_DA), window, block.shape[1], 2)
+        price_cap = np.array([curves[i].price_cap for i in range(window)])
+        L_price_cap = np.array([curves[i].L_price_cap for i in range(window)])
+        total = np.zeros((window, self.num_samples))
+        chunk = max(BID_CHUNK // window, 1)
+        for start in range(0, len(block), chunk):
+            part = block[start:start + chunk]
+            contribution = sample_bid_curves(identity, part.reshape(-1, part.shape[2], 2),
+                                             np.tile(price_cap, len(part)), np.tile(L_price_cap, len(part)),
+                                             self.num_samples)
+            total += contribution.reshape(len(part), window, self.num_samples).sum(axis=0)
+        for i in range(window):
+            curves[i].quantities = curves[i].quantities + total[i]
+            for name, bid in zip(names, block[:, i]):
+                curves[i].bids[name] = (identity, bid)
+            if len(set(curves[i].quantities)) > 1:
+                curves[i].uncontrollable_only = False
+
+    def curve_replace_DA(self, identity, bid_DA, name):
+        """ Function used to replace one agent's DA bid in all accumulated curves without re-aggregating
+
+        Args:
+            identity (str): identifies whether the bid is collected from a "Buyer" or "Seller"
+            bid_DA (list): a nested list with dimension (self.windowLength, m, 2), with m equals 2 to 4
+            name (str): name of the buyer or seller
+
+        """
+        curves = self.curve_buyer_DA if identity == 'Buyer' else self.curve_seller_DA
+        for i in range(self.windowLength):
+            curves[i].curve_replace(identity, name, bid_DA[i])
+
+    def clear_market(self, curve_buyer, curve_seller, transformer_degradation, Q_max, tou_price=None):
         """ Shared function called by both clear_market_RT and clear_market_DA functions
         to find the intersection between supply curve and demand curve
         
@@ -242,6 +325,7 @@ class RetailMarket:
             curve_seller (Curve): aggregated seller curve
             transformer_degradation (bool): equals to 1 if transformer_degradation is considered in the supply curve
             Q_max (float): substation capacity, in kWh
+            tou_price (float): TOU price already read for this clearing, read from the schedule if None
             
         Outputs:
             clear_type (int)
@@ -249,177 +333,229 @@ class RetailMarket:
             cleared_quantity (float)
             congestion_surcharge (float)
         """
-        cleared_price = 0.0
-        cleared_quantity = 0.0
-        clear_type = 0
+        if self.rate == 'TOU' and tou_price is None:
+            tou_price = self.gproxy.read_tou_schedules("tou_price", self.current_time, self.dso_bus - 1)
 
         if curve_buyer.uncontrollable_only:
-            temp = curve_buyer.quantities[0]
-            if temp < 0.0:
-                log.info("Warning quantities submitted to retail are negative." +
-                         "The returns are MarketClearingType.UNCONGESTED, " +
-                         "price set to 0, first quantity of the curve, " +
-                         "and congestion price is set to 0. BAU case.")
-                return MarketClearingType.UNCONGESTED, 0.0, temp, 0.0
-            # log.info("Uncontrollable true, temp:" + str(temp) +
-            #          " min: " + str(min(curve_seller.quantities)) +
-            #          " max: " + str(max(curve_seller.quantities)))
-            if min(curve_seller.quantities) <= temp <= max(curve_seller.quantities):
-                cleared_quantity = temp
-                for idx in range(1, self.num_samples):
-                    if self.rate == 'TOU':
-                        cleared_price = self.gproxy.read_tou_schedules("tou_price", self.current_time, self.dso_bus-1)
-                    else:
-                        if curve_seller.quantities[idx - 1] < cleared_quantity < curve_seller.quantities[idx]:
-                            cleared_price = curve_seller.prices[idx - 1] + (
-                                        cleared_quantity - curve_seller.quantities[idx - 1]) * (
-                                                        curve_seller.prices[idx] - curve_seller.prices[idx - 1]) / (
-                                                        curve_seller.quantities[idx] - curve_seller.quantities[idx - 1])
-                        elif curve_seller.quantities[idx - 1] == cleared_quantity:
-                            cleared_price = curve_seller.prices[idx - 1]
-                        elif curve_seller.quantities[idx] == cleared_quantity:
-                            cleared_price = curve_seller.prices[idx]
-                # if cleared_quantity > self.Q_max:
-                #     clear_type = MarketClearingType.CONGESTED
-                # else:
-                #     clear_type = MarketClearingType.UNCONGESTED
-                if cleared_quantity > self.Q_max:
-                    clear_type = MarketClearingType.CONGESTED
-                    uncongested_price = curve_seller.prices[0]
-                    # uncongested_price = cleared_price - (cleared_quantity-Q_max) * self.FeederCongPrice
-                    if uncongested_price < 0:
-                        # that means that approximation was too crude which led to uncongested price negative
-                        # the congestion charge is simply the difference between any two points across the line
-                        price_diff = curve_seller.prices[-1] - curve_seller.prices[-2]
-                        uncongested_price = cleared_price - price_diff
-                    congestion_surcharge = cleared_price - uncongested_price
-                    if congestion_surcharge > self.price_cap:
-                        congestion_surcharge = self.price_cap
-                        log.info("congestion surcharge is beyond price cap, scale is too high!")
+            return self.clear_uncontrollable(curve_buyer, curve_seller, tou_price)
+
+        curves = self.resample_seller(curve_buyer, curve_seller, tou_price)
+        if curves is None:
+            return MarketClearingType.FAILURE, float('inf'), float('inf'), float('inf')
+        buyer_quantities, buyer_prices, seller_quantities, seller_prices = curves
+
+        idx, is_cross, found = first_crossing(buyer_prices, seller_prices)
+        if found:
+            if is_cross:
+                if idx < self.num_samples and buyer_quantities[idx] == buyer_quantities[idx + 1]:
+                    delta = 0.1
                 else:
-                    clear_type = MarketClearingType.UNCONGESTED
-                    congestion_surcharge = 0.0
-                return clear_type, cleared_price, cleared_quantity, congestion_surcharge
-            else:
-                log.info("dso quantities: " + str(curve_buyer.quantities))
-                log.info("ERROR retail min: " + str(min(curve_seller.quantities)) +
-                         ", max: " + str(max(curve_seller.quantities)))
-                return MarketClearingType.FAILURE, float('inf'), float('inf'), float('inf')
+                    delta = 0.0
+                p1 = (buyer_quantities[idx], buyer_prices[idx])
+                p2 = (buyer_quantities[idx + 1], buyer_prices[idx + 1])
+                p3 = (seller_quantities[idx] - delta, seller_prices[idx])
+                p4 = (seller_quantities[idx + 1] + delta, seller_prices[idx + 1])
+                cleared_price, cleared_quantity = get_intersect(p1, p2, p3, p4)
+                return self.clear_crossing(curve_seller, cleared_price, cleared_quantity)
+            log.info("Buyer and seller prices are identical!")
+            return MarketClearingType.UNCONGESTED, buyer_prices[idx], buyer_quantities[idx], 0
+        return self.clear_no_crossing(curve_buyer, curve_seller, curves, Q_max, tou_price)
+
+    def clear_uncontrollable(self, curve_buyer, curve_seller, tou_price):
+        """ Clears a market where the buyer curve only holds uncontrollable load
+
+        The cleared quantity is the uncontrollable load and the cleared price is read
+        from the seller curve at that quantity, or the TOU price.
+
+        Args:
+            curve_buyer (Curve): aggregated buyer curve
+            curve_seller (Curve): aggregated seller curve
+            tou_price (float): TOU price of this clearing, None if the rate is not TOU
+
+        Returns:
+            clear_type, cleared_price, cleared_quantity, congestion_surcharge as clear_market
+        """
+        temp = curve_buyer.quantities[0]
+        if temp < 0.0:
+            log.info("Warning quantities submitted to retail are negative." +
+                     "The returns are MarketClearingType.UNCONGESTED, " +
+                     "price set to 0, first quantity of the curve, " +
+                     "and congestion price is set to 0. BAU case.")
+            return MarketClearingType.UNCONGESTED, 0.0, temp, 0.0
+        # log.info("Uncontrollable true, temp:" + str(temp) +
+        #          " min: " + str(min(curve_seller.quantities)) +
+        #          " max: " + str(max(curve_seller.quantities)))
+        if not min(curve_seller.quantities) <= temp <= max(curve_seller.quantities):
+            log.info("dso quantities: " + str(curve_buyer.quantities))
+            log.info("ERROR retail min: " + str(min(curve_seller.quantities)) +
+                     ", max: " + str(max(curve_seller.quantities)))
+            return MarketClearingType.FAILURE, float('inf'), float('inf'), float('inf')
+
+        cleared_quantity = temp
+        cleared_price = 0.0
+        if self.rate == 'TOU':
+            if self.num_samples > 1:
+                cleared_price = tou_price
         else:
-            max_q = min(max(curve_seller.quantities), max(curve_buyer.quantities))
-            min_q = max(min(curve_seller.quantities), min(curve_buyer.quantities))
-            # log.info("Uncontrollable false, min: " + str(min_q) + "  max: " + str(max_q))
-            if max_q < min_q:
-                log.info("ERROR retail min_q: " + str(min_q) + ", max_q:" + str(max_q))
-                return MarketClearingType.FAILURE, float('inf'), float('inf'), float('inf')
-
-            # x,buyer_prices,seller_prices=resample_curve_for_market(curve_buyer.quantities, curve_buyer.prices,curve_seller.quantities, curve_seller.prices)
-            # buyer_quantities=x
-            # seller_quantities=x
-            # buyer_quantities, buyer_prices = resample_curve(curve_buyer.quantities, curve_buyer.prices,
-            #                                                        min_q, max_q, self.num_samples)
-            # seller_quantities, seller_prices = resample_curve(curve_seller.quantities, curve_seller.prices,
-            #                                                          min_q, max_q, self.num_samples)
-            buyer_prices = curve_buyer.prices
-            buyer_quantities = curve_buyer.quantities
-            seller_quantities = buyer_quantities
-            # log.info("curve_seller.prices: "+str(curve_seller.prices))
-            tou_price = 0.0
-            if self.rate == 'TOU':
-                seller_prices = []
-                tou_price = self.gproxy.read_tou_schedules("tou_price", self.current_time, self.dso_bus - 1)
-                for _ in curve_seller.prices:
-                    seller_prices.append(tou_price)
-            else:
-                seller_prices = resample_curve_for_price_only(buyer_quantities, curve_seller.quantities, curve_seller.prices)
-
-            # seller_prices[0]=0.0
-            seller_prices[-1] = self.price_cap
-
-            for idx in range(len(buyer_quantities) - 1):
-                if buyer_prices[idx] > seller_prices[idx] and buyer_prices[idx + 1] < seller_prices[idx + 1]:
-                    index_delta = 1
-                    if idx < self.num_samples and buyer_quantities[idx] == buyer_quantities[idx + index_delta]:
-                        p1 = (buyer_quantities[idx], buyer_prices[idx])
-                        p2 = (buyer_quantities[idx + 1], buyer_prices[idx + 1])
-                        p3 = (seller_quantities[idx] - 0.1, seller_prices[idx])
-                        p4 = (seller_quantities[idx + 1] + 0.1, seller_prices[idx + 1])
-                        cleared_price, cleared_quantity = get_intersect(p1, p2, p3, p4)
-                    else:
-                        p1 = (buyer_quantities[idx], buyer_prices[idx])
-                        p2 = (buyer_quantities[idx + 1], buyer_prices[idx + 1])
-                        p3 = (seller_quantities[idx], seller_prices[idx])
-                        p4 = (seller_quantities[idx + 1], seller_prices[idx + 1])
-                        cleared_price, cleared_quantity = get_intersect(p1, p2, p3, p4)
-                    if cleared_quantity > self.Q_max:
-                        clear_type = MarketClearingType.CONGESTED
-                        # uncongested_price = cleared_price - (cleared_quantity - Q_max) * self.FeederCongPrice
-                        uncongested_price = curve_seller.prices[0]
-                        if uncongested_price < 0:
-                            uncongested_price = 0
-                        congestion_surcharge = cleared_price - uncongested_price
-                        if congestion_surcharge > self.price_cap:
-                            congestion_surcharge = self.price_cap
-                            log.info("congestion surcharge is beyond price cap, scale is too high!")
-                    else:
-                        clear_type = MarketClearingType.UNCONGESTED
-                        congestion_surcharge = 0.0
-                    return clear_type, cleared_price, cleared_quantity, congestion_surcharge
-                elif buyer_prices[idx] == seller_prices[idx]:
-                    cleared_price = buyer_prices[idx]
-                    cleared_quantity = buyer_quantities[idx]
-                    clear_type = MarketClearingType.UNCONGESTED
-                    congestion_surcharge = 0
-                    log.info("Buyer and seller prices are identical!")
-                    return clear_type, cleared_price, cleared_quantity, congestion_surcharge
-
-            log.info("ERROR retail intersection not found (not supposed to happen)" +
-                     "\n  quantities: " + str(buyer_quantities) +
-                     "\n  buyer_prices: " + str(buyer_prices) +
-                     "\n  seller_prices: " + str(seller_prices))
-
-            if buyer_prices[0] > seller_prices[0]:
-                if max_q == max(curve_seller.quantities):
-                    if self.rate == 'TOU':
-                        cleared_price = tou_price
-                    else:
-                        cleared_price = buyer_prices[-1]
-                    cleared_quantity = buyer_quantities[-1]
-                    clear_type = MarketClearingType.CONGESTED
-                elif max_q == max(curve_buyer.quantities):
-                    if self.rate == 'TOU':
-                        cleared_price = tou_price
-                    else:
-                        cleared_price = seller_prices[-1]
-                    cleared_quantity = seller_quantities[-1]
-                    clear_type = MarketClearingType.UNCONGESTED
-            else:
-                if min_q == min(curve_seller.quantities):
-                    if self.rate == 'TOU':
-                        cleared_price = tou_price
-                    else:
-                        cleared_price = buyer_prices[0]
-                    cleared_quantity = buyer_quantities[0]
-                    clear_type = MarketClearingType.UNCONGESTED
-                elif min_q == min(curve_buyer.quantities):
-                    if self.rate == 'TOU':
-                        cleared_price = tou_price
-                    else:
-                        cleared_price = seller_prices[0]
-                    cleared_quantity = seller_quantities[0]
-                    clear_type = MarketClearingType.UNCONGESTED
-            if cleared_quantity > Q_max:
+            q = np.asarray(curve_seller.quantities[:self.num_samples], dtype=float)
+            p = np.asarray(curve_seller.prices[:self.num_samples], dtype=float)
+            inside = (q[:-1] < cleared_quantity) & (cleared_quantity < q[1:])
+            left = q[:-1] == cleared_quantity
+            right = q[1:] == cleared_quantity
+            # the last segment that holds the quantity sets the price
+            hits = np.flatnonzero(inside | left | right)
+            if hits.size > 0:
+                k = hits[-1]
+                if inside[k]:
+                    cleared_price = p[k] + (cleared_quantity - q[k]) * (p[k + 1] - p[k]) / (q[k + 1] - q[k])
+                elif left[k]:
+                    cleared_price = p[k]
+                else:
+                    cleared_price = p[k + 1]
+        # if cleared_quantity > self.Q_max:
+        #     clear_type = MarketClearingType.CONGESTED
+        # else:
+        #     clear_type = MarketClearingType.UNCONGESTED
+        if cleared_quantity > self.Q_max:
+            clear_type = MarketClearingType.CONGESTED
+            uncongested_price = curve_seller.prices[0]
+            # uncongested_price = cleared_price - (cleared_quantity-Q_max) * self.FeederCongPrice
+            if uncongested_price < 0:
+                # that means that approximation was too crude which led to uncongested price negative
+                # the congestion charge is simply the difference between any two points across the line
+                price_diff = curve_seller.prices[-1] - curve_seller.prices[-2]
+                uncongested_price = cleared_price - price_diff
+            congestion_surcharge = cleared_price - uncongested_price
+            if congestion_surcharge > self.price_cap:
+                congestion_surcharge = self.price_cap
+                log.info("congestion surcharge is beyond price cap, scale is too high!")
+        else:
+            clear_type = MarketClearingType.UNCONGESTED
+            congestion_surcharge = 0.0
+        return clear_type, cleared_price, cleared_quantity, congestion_surcharge
+
+    def resample_seller(self, curve_buyer, curve_seller, tou_price):
+        """ Samples the seller prices at the buyer quantities
+
+        Args:
+            curve_buyer (Curve): aggregated buyer curve
+            curve_seller (Curve): aggregated seller curve
+            tou_price (float): TOU price of this clearing, None if the rate is not TOU
+
+        Returns:
+            tuple: buyer quantities, buyer prices, seller quantities and seller prices as arrays,
+            None if the curves do not overlap
+        """
+        max_q = min(max(curve_seller.quantities), max(curve_buyer.quantities))
+        min_q = max(min(curve_seller.quantities), min(curve_buyer.quantities))
+        # log.info("Uncontrollable false, min: " + str(min_q) + "  max: " + str(max_q))
+        if max_q < min_q:
+            log.info("ERROR retail min_q: " + str(min_q) + ", max_q:" + str(max_q))
+            return None
+
+        # x,buyer_prices,seller_prices=resample_curve_for_market(curve_buyer.quantities, curve_buyer.prices,curve_seller.quantities, curve_seller.prices)
+        buyer_prices = np.asarray(curve_buyer.prices, dtype=float)
+        buyer_quantities = np.asarray(curve_buyer.quantities, dtype=float)
+        seller_quantities = buyer_quantities
+        if self.rate == 'TOU':
+            seller_prices = np.full(len(curve_seller.prices), tou_price, dtype=float)
+        else:
+            seller_prices = np.interp(buyer_quantities, curve_seller.quantities, curve_seller.prices)
+        seller_prices[-1] = self.price_cap
+        return buyer_quantities, buyer_prices, seller_quantities, seller_prices[:len(buyer_quantities)]
+
+    def clear_crossing(self, curve_seller, cleared_price, cleared_quantity):
+        """ Sets the clearing type and congestion surcharge for an intersection of the curves
+
+        Args:
+            curve_seller (Curve): aggregated seller curve
+            cleared_price (float): price at the intersection
+            cleared_quantity (float): quantity at the intersection
+
+        Returns:
+            clear_type, cleared_price, cleared_quantity, congestion_surcharge as clear_market
+        """
+        if cleared_quantity > self.Q_max:
+            clear_type = MarketClearingType.CONGESTED
+            # uncongested_price = cleared_price - (cleared_quantity - Q_max) * self.FeederCongPrice
+            uncongested_price = curve_seller.prices[0]
+            if uncongested_price < 0:
+                uncongested_price = 0
+            congestion_surcharge = cleared_price - uncongested_price
+            if congestion_surcharge > self.price_cap:
+                congestion_surcharge = self.price_cap
+                log.info("congestion surcharge is beyond price cap, scale is too high!")
+        else:
+            clear_type = MarketClearingType.UNCONGESTED
+            congestion_surcharge = 0.0
+        return clear_type, cleared_price, cleared_quantity, congestion_surcharge
+
+    def clear_no_crossing(self, curve_buyer, curve_seller, curves, Q_max, tou_price):
+        """ Clears at the end of the curves when they do not intersect
+
+        Args:
+            curve_buyer (Curve): aggregated buyer curve
+            curve_seller (Curve): aggregated seller curve
+            curves (tuple): resampled curves from resample_seller
+            Q_max (float): substation capacity, in kWh
+            tou_price (float): TOU price of this clearing, None if the rate is not TOU
+
+        Returns:
+            clear_type, cleared_price, cleared_quantity, congestion_surcharge as clear_market
+        """
+        buyer_quantities, buyer_prices, seller_quantities, seller_prices = curves
+        cleared_price = 0.0
+        cleared_quantity = 0.0
+        clear_type = 0
+        max_q = min(max(curve_seller.quantities), max(curve_buyer.quantities))
+        min_q = max(min(curve_seller.quantities), min(curve_buyer.quantities))
+        log.info("ERROR retail intersection not found (not supposed to happen)" +
+                 "\n  quantities: " + str(buyer_quantities.tolist()) +
+                 "\n  buyer_prices: " + str(buyer_prices.tolist()) +
+                 "\n  seller_prices: " + str(seller_prices.tolist()))
+
+        if buyer_prices[0] > seller_prices[0]:
+            if max_q == max(curve_seller.quantities):
+                if self.rate == 'TOU':
+                    cleared_price = tou_price
+                else:
+                    cleared_price = buyer_prices[-1]
+                cleared_quantity = buyer_quantities[-1]
                 clear_type = MarketClearingType.CONGESTED
-                uncongested_price = cleared_price - (cleared_quantity - Q_max) * self.FeederCongPrice
-                if uncongested_price < 0:
-                    uncongested_price = 0
-                congestion_surcharge = cleared_price - uncongested_price
-                if congestion_surcharge > self.price_cap:
-                    congestion_surcharge = self.price_cap
-                    log.info("congestion surcharge is beyond price cap, scale is too high!")
-            else:
-                congestion_surcharge = 0.0
-            return clear_type, cleared_price, cleared_quantity, congestion_surcharge
+            elif max_q == max(curve_buyer.quantities):
+                if self.rate == 'TOU':
+                    cleared_price = tou_price
+                else:
+                    cleared_price = seller_prices[-1]
+                cleared_quantity = seller_quantities[-1]
+                clear_type = MarketClearingType.UNCONGESTED
+        else:
+            if min_q == min(curve_seller.quantities):
+                if self.rate == 'TOU':
+                    cleared_price = tou_price
+                else:
+                    cleared_price = buyer_prices[0]
+                cleared_quantity = buyer_quantities[0]
+                clear_type = MarketClearingType.UNCONGESTED
+            elif min_q == min(curve_buyer.quantities):
+                if self.rate == 'TOU':
+                    cleared_price = tou_price
+                else:
+                    cleared_price = seller_prices[0]
+                cleared_quantity = seller_quantities[0]
+                clear_type = MarketClearingType.UNCONGESTED
+        if cleared_quantity > Q_max:
+            clear_type = MarketClearingType.CONGESTED
+            uncongested_price = cleared_price - (cleared_quantity - Q_max) * self.FeederCongPrice
+            if uncongested_price < 0:
+                uncongested_price = 0
+            congestion_surcharge = cleared_price - uncongested_price
+            if congestion_surcharge > self.price_cap:
+                congestion_surcharge = self.price_cap
+                log.info("congestion surcharge is beyond price cap, scale is too high!")
+        else:
+            congestion_surcharge = 0.0
+        return clear_type, cleared_price, cleared_quantity, congestion_surcharge
 
     def clear_market_RT(self, transformer_degradation, Q_max):
         """ Function used for clearing the RT market
@@ -444,10 +580,72 @@ class RetailMarket:
         buyer_info_DA and seller_info_DA, clear_type_DA, cleared_price_DA and cleared_quantity_DA are updated with cleared results        
         
         """
-
+        tou_price = None
+        if self.rate == 'TOU':
+            tou_price = self.gproxy.read_tou_schedules("tou_price", self.current_time, self.dso_bus - 1)
         for i in range(self.windowLength):
             clear_type, cleared_price, cleared_quantity, congestion_surcharge = \
-                self.clear_market(self.curve_buyer_DA[i], self.curve_seller_DA[i], transformer_degradation, Q_max)
+                self.clear_market(self.curve_buyer_DA[i], self.curve_seller_DA[i], transformer_degradation, Q_max,
+                                  tou_price)
+            self.clear_type_DA.append(clear_type)
+            self.cleared_price_DA.append(cleared_price)
+            self.cleared_quantity_DA.append(cleared_quantity)
+            self.congestion_surcharge_DA.append(congestion_surcharge)
+
+    def clear_market_DA_all(self, transformer_degradation, Q_max):
+        """ Clears all hours of the DA market at once, with the same results as clear_market_DA
+
+        The curves of the hours with controllable load are stacked and the first
+        crossing and the intersection of every hour are found in one vectorized
+        pass; hours with only uncontrollable load, or curves that are not sampled
+        at num_samples points, are cleared one by one with clear_market.
+
+        Args:
+            transformer_degradation (bool): equals to 1 if transformer_degradation is considered in the supply curve
+            Q_max (float): substation capacity, in kWh
+        """
+        tou_price = None
+        if self.rate == 'TOU':
+            tou_price = self.gproxy.read_tou_schedules("tou_price", self.current_time, self.dso_bus - 1)
+        results = [None] * self.windowLength
+        hours = []
+        stack = []
+        for i in range(self.windowLength):
+            curve_buyer = self.curve_buyer_DA[i]
+            curve_seller = self.curve_seller_DA[i]
+            if curve_buyer.uncontrollable_only or len(curve_buyer.quantities) != self.num_samples or \
+                    len(curve_seller.prices) != self.num_samples:
+                results[i] = self.clear_market(curve_buyer, curve_seller, transformer_degradation, Q_max, tou_price)
+                continue
+            curves = self.resample_seller(curve_buyer, curve_seller, tou_price)
+            if curves is None:
+                results[i] = MarketClearingType.FAILURE, float('inf'), float('inf'), float('inf')
+                continue
+            hours.append(i)
+            stack.append(curves)
+
+        if len(hours) > 0:
+            bq, bp, sq, sp = (np.array(a) for a in zip(*stack))
+            idx, is_cross, found = first_crossing(bp, sp)
+            rows = np.arange(len(hours))
+            # the seller quantities are widened around vertical buyer segments, as in clear_market
+            delta = np.where(bq[rows, idx] == bq[rows, idx + 1], 0.1, 0.0)
+            price, quantity = get_intersect_rows(
+                np.column_stack((bq[rows, idx], bp[rows, idx])),
+                np.column_stack((bq[rows, idx + 1], bp[rows, idx + 1])),
+                np.column_stack((sq[rows, idx] - delta, sp[rows, idx])),
+                np.column_stack((sq[rows, idx + 1] + delta, sp[rows, idx + 1])))
+            for r, i in enumerate(hours):
+                if not found[r]:
+                    results[i] = self.clear_no_crossing(self.curve_buyer_DA[i], self.curve_seller_DA[i], stack[r],
+                                                        Q_max, tou_price)
+                elif is_cross[r]:
+                    results[i] = self.clear_crossing(self.curve_seller_DA[i], price[r], quantity[r])
+                else:
+                    log.info("Buyer and seller prices are identical!")
+                    results[i] = MarketClearingType.UNCONGESTED, bp[r, idx[r]], bq[r, idx[r]], 0
+
+        for clear_type, cleared_price, cleared_quantity, congestion_surcharge in results:
             self.clear_type_DA.append(clear_type)
             self.cleared_price_DA.append(cleared_price)
             self.cleared_quantity_DA.append(cleared_quantity)
@@ -736,6 +934,130 @@ class RetailMarket:
         return self.site_quantity_DA
 
 
+def load_DA_curves(filename, uid=None):
+    """ Reads recorded DA curves from a retail market metrics JSON file
+
+    The file is the retail_market_*_3600 metrics written with retail_full_metrics,
+    which holds the aggregated buyer and seller curves of every DA clearing.
+
+    Args:
+        filename (str): path of the metrics JSON file
+        uid (str): name of the retail market to read, the first one found if None
+
+    Returns:
+        list: (curve_buyer_DA, curve_seller_DA) dictionaries of Curve, one pair per recorded clearing
+    """
+    import json
+    with open(filename) as f:
+        metrics = json.load(f)
+    meta = metrics['Metadata']
+    columns = [meta[c]['index'] for c in ('curve_buyer_da_quantities', 'curve_buyer_da_prices',
+                                          'curve_seller_da_quantities', 'curve_seller_da_prices')]
+    recorded = []
+    for t in sorted((k for k in metrics if k not in ('Metadata', 'StartTime')), key=int):
+        for name, data in metrics[t].items():
+            if uid is not None and name != uid:
+                continue
+            bq, bp, sq, sp = (np.asarray(data[c], dtype=float) for c in columns)
+            curve_buyer = dict()
+            curve_seller = dict()
+            for i in range(len(bq)):
+                curve_buyer[i] = Curve(float(bp[i][0]), len(bq[i]))
+                curve_buyer[i].quantities = bq[i]
+                curve_buyer[i].prices = bp[i]
+                curve_buyer[i].uncontrollable_only = bool(np.all(bq[i] == bq[i][0]))
+                curve_seller[i] = Curve(float(sp[i][-1]), len(sq[i]))
+                curve_seller[i].quantities = sq[i]
+                curve_seller[i].prices = sp[i]
+            recorded.append((curve_buyer, curve_seller))
+            break
+    return recorded
+
+
+def _clear_crossing_loop(market, curve_buyer, curve_seller):
+    # the per-sample search clear_market used before the vectorized one, for benchmark_clear_market
+    if curve_buyer.uncontrollable_only:
+        cleared_price = 0.0
+        cleared_quantity = curve_buyer.quantities[0]
+        for idx in range(1, market.num_samples):
+            if curve_seller.quantities[idx - 1] < cleared_quantity < curve_seller.quantities[idx]:
+                cleared_price = curve_seller.prices[idx - 1] + (
+                    cleared_quantity - curve_seller.quantities[idx - 1]) * (
+                    curve_seller.prices[idx] - curve_seller.prices[idx - 1]) / (
+                    curve_seller.quantities[idx] - curve_seller.quantities[idx - 1])
+            elif curve_seller.quantities[idx - 1] == cleared_quantity:
+                cleared_price = curve_seller.prices[idx - 1]
+            elif curve_seller.quantities[idx] == cleared_quantity:
+                cleared_price = curve_seller.prices[idx]
+        return cleared_price, cleared_quantity
+    buyer_prices = curve_buyer.prices
+    buyer_quantities = curve_buyer.quantities
+    seller_prices = []
+    for val in buyer_quantities:
+        seller_prices.append(np.interp(val, curve_seller.quantities, curve_seller.prices))
+    seller_prices[-1] = market.price_cap
+    for idx in range(len(buyer_quantities) - 1):
+        if buyer_prices[idx] > seller_prices[idx] and buyer_prices[idx + 1] < seller_prices[idx + 1]:
+            delta = 0.1 if buyer_quantities[idx] == buyer_quantities[idx + 1] else 0.0
+            return get_intersect((buyer_quantities[idx], buyer_prices[idx]),
+                                 (buyer_quantities[idx + 1], buyer_prices[idx + 1]),
+                                 (buyer_quantities[idx] - delta, seller_prices[idx]),
+                                 (buyer_quantities[idx + 1] + delta, seller_prices[idx + 1]))
+        elif buyer_prices[idx] == seller_prices[idx]:
+            return buyer_prices[idx], buyer_quantities[idx]
+    return None
+
+
+def benchmark_clear_market(market, recorded, repeat=10):
+    """ Times the DA clearing of recorded curves
+
+    Compares the former per-sample intersection search, clear_market_DA and
+    clear_market_DA_all on the same curves and checks that the two clearing
+    functions agree. The market is only used for its settings and cleared lists,
+    the TOU rate is not benchmarked since it reads the schedule server.
+
+    Args:
+        market (RetailMarket): retail market with num_samples, price_cap, Q_max and windowLength set
+        recorded (list): (curve_buyer_DA, curve_seller_DA) pairs, see load_DA_curves
+        repeat (int): number of times every clearing is repeated
+
+    Returns:
+        dict: mean seconds per DA clearing for 'loop', 'clear_market_DA' and 'clear_market_DA_all'
+    """
+    import time
+    rate = market.rate
+    market.rate = ''
+    timing = {'loop': 0.0, 'clear_market_DA': 0.0, 'clear_market_DA_all': 0.0}
+    for curve_buyer, curve_seller in recorded:
+        market.windowLength = len(curve_buyer)
+        market.curve_buyer_DA = curve_buyer
+        market.curve_seller_DA = curve_seller
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for i in range(market.windowLength):
+                _clear_crossing_loop(market, curve_buyer[i], curve_seller[i])
+        timing['loop'] += time.perf_counter() - start
+        cleared = {}
+        for fn in ('clear_market_DA', 'clear_market_DA_all'):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                market.clear_type_DA = []
+                market.cleared_price_DA = []
+                market.cleared_quantity_DA = []
+                market.congestion_surcharge_DA = []
+                getattr(market, fn)(False, market.Q_max)
+            timing[fn] += time.perf_counter() - start
+            cleared[fn] = (market.cleared_price_DA, market.cleared_quantity_DA)
+        if not np.array_equal(cleared['clear_market_DA'], cleared['clear_market_DA_all'], equal_nan=True):
+            log.warning("clear_market_DA_all differs from clear_market_DA")
+    market.rate = rate
+    runs = max(len(recorded) * repeat, 1)
+    for fn in timing:
+        timing[fn] /= runs
+    log.info("DA clearing, seconds per window: " + str(timing))
+    return timing
+
+
 def test():
     """ Testing AMES
     """
@@ -22,10 +22,11 @@ from .hvac_agent import HVACDSOT
 from .water_heater_agent import WaterHeaterDSOT
 from .ev_agent import EVDSOT
 from .pv_agent import PVDSOT
-from .battery_agent import BatteryDSOT
+from .battery_agent import BatteryDSOT, batch_DA_optimal_quantities
 from .dso_market import DSOMarket
 from .retail_market import RetailMarket
 from .forecasting import Forecasting
+from .agent_pool import AgentPool
 from tesp_support.api.metrics_collector import MetricsStore, MetricsCollector
 from tesp_support.api.bench_profile import bench_profile
 
@@ -61,7 +62,7 @@ def inner_substation_loop(metrics_root, with_market):
         timing(arg.__class__.__name__, True)
         worker_results = arg.DA_optimal_quantities()
         timing(arg.__class__.__name__, False)
-        return worker_results
+        return worker_results, getattr(arg, 'da_timing', None)
         # return arg.DA_optimal_quantities()
 
     def timing(agent_name, start_stop):
@@ -96,7 +97,9 @@ def inner_substation_loop(metrics_root, with_market):
             'EVDSOT',
             'da_opt',
             'granted',
-            'metrics']
+            'metrics',
+            'HVACDSOT_build',
+            'HVACDSOT_solve']
 
     if profile:
         for p in proc:
@@ -156,6 +159,18 @@ def inner_substation_loop(metrics_root, with_market):
     # Document on joblib
     # https://joblib.readthedocs.io/en/latest/generated/joblib.Parallel.html#joblib.Parallel
     parallel = Parallel(n_jobs=_NUM_CORE, backend=_backend, verbose=_verbose)
+    # solve all participating batteries in one stacked day-ahead model,
+    # falling back to the per-agent path when the cross-check disagrees
+    batch_battery_da = config.get('batchBatteryDA', True)
+    batch_battery_check = config.get('batchBatteryCheck', 1)
+    batch_battery_tol = config.get('batchBatteryTol', 1e-3)
+    # keep the agents resident in a long-lived pool so only the hourly forecasts cross process boundaries
+    agent_pool = None
+    if config.get('residentAgentPool', False):
+        agent_pool = AgentPool(_NUM_CORE)
+    # solve HVAC agents in this process so their persistent day-ahead models are reused every hour,
+    # the resident pool keeps them alive in its workers instead
+    persistent_hvac_da = config.get('persistentHVACDA', False) and agent_pool is None
 
     dso_config = {}
     topic_map = {}  # Map to dispatch incoming messages. Format [<key>][<receiving object function>]
@@ -362,7 +377,13 @@ def inner_substation_loop(metrics_root, with_market):
     write_metrics = (config['MetricsInterval'] > 0)
     if write_metrics:
         write_h5 = (config['MetricsType'] == 'h5')
-        collector = MetricsCollector.factory(start_time=start_time, write_hdf5=write_h5)
+        write_parquet = (config['MetricsType'] == 'parquet')
+        # with metricsFlushMB a store is written out as soon as its buffered rows reach that size
+        flush_mb = config.get('metricsFlushMB', None)
+        collector = MetricsCollector.factory(start_time=start_time, write_hdf5=write_h5, write_parquet=write_parquet,
+                                             flush_bytes=None if flush_mb is None else int(flush_mb * 1024 * 1024),
+                                             background=config.get('metricsBackgroundWrite', False),
+                                             num_threads=config.get('metricsWriteThreads', 1))
 
         dso_86400 = MetricsStore(
             name_units_pairs=[
@@ -816,6 +837,9 @@ def inner_substation_loop(metrics_root, with_market):
             gld_load_rolling_mean = np.array(gld_load).mean()
 
             if with_market:
+                # real-time bids are collected and aggregated in one vectorized pass
+                rt_bids = []
+                rt_names = []
                 # HVAC bidding
                 timing(proc[3], True)
                 for key, obj in hvac_agent_objs.items():
@@ -825,7 +849,8 @@ def inner_substation_loop(metrics_root, with_market):
                         # formulate the real-time bid
                         bid = obj.formulate_bid_rt(11, current_time)
                         # add real-time bid to the retail market
-                        retail_market_obj.curve_aggregator_RT('Buyer', bid, obj.name)
+                        rt_bids.append(bid)
+                        rt_names.append(obj.name)
                 timing(proc[3], False)
 
                 # Water heater bidding
@@ -835,7 +860,8 @@ def inner_substation_loop(metrics_root, with_market):
                         # formulate the real-time bid
                         bid = obj.formulate_bid_rt(11, current_time)
                         # add real-time bid to the retail market
-                        retail_market_obj.curve_aggregator_RT('Buyer', bid, obj.name)
+                        rt_bids.append(bid)
+                        rt_names.append(obj.name)
                 timing(proc[4], False)
 
                 # Battery bidding
@@ -845,7 +871,8 @@ def inner_substation_loop(metrics_root, with_market):
                         # formulate the real-time bid
                         bid = obj.formulate_bid_rt()
                         # add real-time bid to the retail market
-                        retail_market_obj.curve_aggregator_RT('Buyer', bid, obj.name)
+                        rt_bids.append(bid)
+                        rt_names.append(obj.name)
                 timing(proc[2], False)
 
                 # EV bidding
@@ -855,8 +882,10 @@ def inner_substation_loop(metrics_root, with_market):
                         # formulate the real-time bid
                         bid = obj.formulate_bid_rt()
                         # add real-time bid to the retail market
-                        retail_market_obj.curve_aggregator_RT('Buyer', bid, obj.name)
+                        rt_bids.append(bid)
+                        rt_names.append(obj.name)
                 timing(proc[5], False)
+                retail_market_obj.curve_aggregator_RT_block('Buyer', rt_bids, rt_names)
 
             # collect agent only RT quantities and price
             # retail_market_obj.AMES_RT_agent_quantities = np.array( retail_market_obj.curve_buyer_RT.quantities )
@@ -918,6 +947,7 @@ def inner_substation_loop(metrics_root, with_market):
             # clean the day-ahead bids
             retail_market_obj.clean_bids_DA()
             P_age_DA = list()
+            hvac_DA = list()
 
             uncntrl_hvac = []  # list to store uncontrolled hvac loads
             zip_loads = []  # list to store uncontrolled zip loads
@@ -936,9 +966,13 @@ def inner_substation_loop(metrics_root, with_market):
 
             # Battery bidding
             timing(proc[6], True)
+            batt_DA = list()
             for key, obj in battery_agent_objs.items():
                 if obj.participating and with_market:
-                    P_age_DA.append(obj)
+                    if batch_battery_da:
+                        batt_DA.append(obj)
+                    else:
+                        P_age_DA.append(obj)
                 # else:
             timing(proc[6], True)
             log.debug('uncontrolled battery ***')
@@ -973,7 +1007,10 @@ def inner_substation_loop(metrics_root, with_market):
                 zip_loads.append(obj.forecast_ziploads)
                 if obj.participating and with_market:
                     obj.DA_model_parameters(minute_of_hour, hour_of_day, day_of_week)
-                    P_age_DA.append(obj)
+                    if persistent_hvac_da:
+                        hvac_DA.append(obj)
+                    else:
+                        P_age_DA.append(obj)
                 else:
                     # if not participating, use hvac model equation without optimization to get forecast hvac load
                     temp = obj.get_uncntrl_hvac_load(minute_of_hour, hour_of_day, day_of_week)
@@ -1062,17 +1099,47 @@ def inner_substation_loop(metrics_root, with_market):
             log.debug('uncontrolled total site load ***')
             log.debug(site_da_total_quantities_uncntrl)
 
+            # batteries share one stacked optimization, the rest go to the parallel solve
+            batt_results = []
+            if len(batt_DA) > 0:
+                timing(proc[11], True)
+                batt_results, batt_saved = batch_DA_optimal_quantities(batt_DA, solver, batch_battery_check,
+                                                                       batch_battery_tol)
+                timing(proc[11], False)
+                if batt_results is None:
+                    batt_results = []
+                    P_age_DA = batt_DA + P_age_DA
+                else:
+                    log.info('Battery batch DA saved {:.3f} s this window'.format(batt_saved))
+            da_bids = []
+            da_names = []
+            for res, p_age in zip(batt_results, batt_DA):
+                p_age.optimized_Quantity = res[:]
+                da_bids.append(p_age.formulate_bid_da())
+                da_names.append(p_age.name)
+
             # formulating bid DA with multiprocessing library
             # created pyomo models in serial, but solves in parallel
             # (sending only the pyomo model, rather than whole batter object to the processes)
             if len(P_age_DA) > 0:
                 log.info('About to solve {} parallel opts (over available processes)'.format(len(P_age_DA)))
-                results = parallel(delayed(worker)(p) for p in P_age_DA)
+                if agent_pool is not None:
+                    results = agent_pool.solve(P_age_DA)
+                else:
+                    results = parallel(delayed(worker)(p) for p in P_age_DA)
             else:
                 log.info('No opts need solving, skipping use of "parallel" obj!')
                 results = []
+            # HVAC agents holding persistent models are solved here
+            for p_age in hvac_DA:
+                results.append(worker(p_age))
+            P_age_DA += hvac_DA
             # add participating agents to day-ahead bid to the retail market
-            for i, (res, p_age) in enumerate(zip(results, P_age_DA)):  # range(len(P_age_DA)):
+            for i, ((res, da_timing), p_age) in enumerate(zip(results, P_age_DA)):  # range(len(P_age_DA)):
+                if profile and da_timing is not None and p_age.__class__.__name__ == "HVACDSOT":
+                    for step in ['build', 'solve']:
+                        proc_time['HVACDSOT_' + step] += da_timing[step]
+                        wall_time['HVACDSOT_' + step] += da_timing[step]
                 timing(p_age.__class__.__name__, True)
                 # passing the optimization output to the agent
                 if p_age.__class__.__name__ == "HVACDSOT":
@@ -1083,8 +1150,10 @@ def inner_substation_loop(metrics_root, with_market):
                 # formulate the day-ahead bid
                 bid = p_age.formulate_bid_da()
                 timing(p_age.__class__.__name__, False)
-                retail_market_obj.curve_aggregator_DA('Buyer', bid, p_age.name)
+                da_bids.append(bid)
+                da_names.append(p_age.name)
             del results
+            retail_market_obj.curve_aggregator_DA_block('Buyer', da_bids, da_names)
 
             # collect agent only DA quantities and price
             # retail_market_obj.AMES_DA_agent_quantities=dict()
@@ -1615,7 +1684,7 @@ def inner_substation_loop(metrics_root, with_market):
         if time_granted >= tnext_retail_clear_da:
             log.info("-- retail day-ahead clearing --")
             # clear the retail real-time market
-            retail_market_obj.clear_market_DA(dso_market_obj.transformer_degradation, retail_market_obj.Q_max)
+            retail_market_obj.clear_market_DA_all(dso_market_obj.transformer_degradation, retail_market_obj.Q_max)
             retail_cleared_quantity_DA = retail_market_obj.cleared_quantity_DA
             # print("DA cleared price", retail_market_obj.cleared_price_DA)
             log.info('current day-ahead price -> ' + str(retail_market_obj.cleared_price_DA) + ' $/kWh')
@@ -1961,6 +2030,8 @@ def inner_substation_loop(metrics_root, with_market):
     print(proc_time, sep=', ', file=op, flush=True)
     print(wall_time, sep=', ', file=op, flush=True)
     op.close()
+    if agent_pool is not None:
+        agent_pool.close()
     helics.helicsFederateDestroy(hFed)
 
 
@@ -115,6 +115,12 @@ class WaterHeaterDSOT:
         RT_Q_min (float): lower quantity boundary of the RT bid curve, in kWh
     """
 
+    # attributes read by DA_optimal_quantities that change between hours,
+    # shipped each hour to the resident copy of the agent in AgentPool
+    DA_VECTOR_INPUTS = ('f_DA_price', 'f_DA_schedule')
+    DA_SCALAR_INPUTS = ('SOHC', 'Phw', 'price_std_dev')
+    DA_OBJECT_INPUTS = ()
+
     def __init__(self, wh_dict, wh_properties, key, model_diag_level, sim_time, solver):
         """ Initializes the class
         """
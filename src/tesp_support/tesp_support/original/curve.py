@@ -22,6 +22,11 @@ class curve:
     """ Accumulates a set of price, quantity bids for later aggregation.
     The default order is descending by price.
 
+    Bids are appended to preallocated arrays and sorted only when the
+    price or quantity is next read, so collecting n bids costs O(n log n)
+    instead of the O(n^2) of inserting each one in place.  Among bids at
+    the same price, the later bid comes first in descending order.
+
     Attributes:
         price ([float]): array of prices, in $/kWh
         quantity ([float]): array of quantities, in kW
@@ -31,23 +36,62 @@ class curve:
         total_off (float): the total kW bidding that are currently off
     """
 
-    def __init__(self):
-        self.price = []
-        self.quantity = []
+    def __init__(self, capacity=64):
+        self._price = np.empty(capacity)
+        self._quantity = np.empty(capacity)
+        self._seq = np.empty(capacity, dtype=np.int64)
+        self._ascending = False
+        self._sorted = True
+        self._cumulative = None
         self.count = 0
         self.total = 0.0
         self.total_on = 0.0
         self.total_off = 0.0
 
+    @property
+    def price(self):
+        self._sort()
+        return self._price[:self.count]
+
+    @property
+    def quantity(self):
+        self._sort()
+        return self._quantity[:self.count]
+
+    def _sort(self):
+        if self._sorted:
+            return
+        n = self.count
+        order = np.lexsort((-self._seq[:n], -self._price[:n]))
+        if self._ascending:
+            order = order[::-1]
+        self._price[:n] = self._price[order]
+        self._quantity[:n] = self._quantity[order]
+        self._seq[:n] = self._seq[order]
+        self._sorted = True
+        self._cumulative = None
+
     def set_curve_order(self, flag):
         """ Set the curve order (by price) to ascending or descending
 
         Args:
             flag (str): 'ascending' or 'descending'
         """
-        if flag == 'ascending':
-            self.price.reverse()
-            self.quantity.reverse()
+        ascending = flag == 'ascending'
+        if ascending != self._ascending:
+            self._ascending = ascending
+            self._sorted = False
+
+    def cumulative_quantity(self):
+        """ Running total of the quantity, in the current curve order
+
+        Returns:
+            [float]: array of count cumulative quantities, in kW
+        """
+        self._sort()
+        if self._cumulative is None:
+            self._cumulative = np.cumsum(self._quantity[:self.count])
+        return self._cumulative
 
     def add_to_curve(self, price, quantity, is_on):
         """ Add one point to the curve
@@ -65,36 +109,64 @@ class curve:
         else:
             self.total_off += quantity
 
-        if self.count == 0:
-            # Since it is the first time assigning values to the curve, define an empty array for the price and mean
-            self.price = []
-            self.quantity = []
-            self.price.append(price)
-            self.quantity.append(quantity)
-            self.count += 1
-        else:
-            value_insert_flag = 0
-            for i in range(0, self.count):
-                # If the price is larger than the compared curve section price,
-                # price inserted before that section of the curve
-                if price >= self.price[i]:
-                    if i == 0:
-                        # If the price is larger than that of all the curve sections,
-                        # insert at the beginning of the curve
-                        self.price.insert(0, price)
-                        self.quantity.insert(0, quantity)
-                    else:
-                        self.price.insert(i, price)
-                        self.quantity.insert(i, quantity)
-                    self.count += 1
-                    value_insert_flag = 1
-                    break
-
-            # If the price is smaller than that of all the curve sections, insert at the end of the curve
-            if value_insert_flag == 0:
-                self.price.append(price)
-                self.quantity.append(quantity)
-                self.count += 1
+        n = self.count
+        if n == self._price.size:
+            size = max(2 * n, 64)
+            self._price = np.resize(self._price, size)
+            self._quantity = np.resize(self._quantity, size)
+            self._seq = np.resize(self._seq, size)
+        self._price[n] = price
+        self._quantity[n] = quantity
+        self._seq[n] = n
+        self.count += 1
+        self._sorted = False
+        self._cumulative = None
+
+    def add_bids(self, price, quantity, is_on):
+        """ Add many points to the curve, in the same order as calling add_to_curve for each
+
+        Args:
+            price ([float]): the bid prices, should be $/kWhr
+            quantity ([float]): the bid quantities, should be kW
+            is_on ([bool]): True where the load is currently on, False if not
+        """
+        quantity = np.asarray(quantity, dtype=float)
+        keep = quantity != 0
+        price = np.asarray(price, dtype=float)[keep]
+        quantity = quantity[keep]
+        is_on = np.asarray(is_on, dtype=bool)[keep]
+        m = quantity.size
+        if m == 0:
+            return
+        self.total = running_sum(self.total, quantity)
+        self.total_on = running_sum(self.total_on, quantity[is_on])
+        self.total_off = running_sum(self.total_off, quantity[~is_on])
+
+        n = self.count
+        if n + m > self._price.size:
+            size = max(2 * (n + m), 64)
+            self._price = np.resize(self._price, size)
+            self._quantity = np.resize(self._quantity, size)
+            self._seq = np.resize(self._seq, size)
+        self._price[n:n + m] = price
+        self._quantity[n:n + m] = quantity
+        self._seq[n:n + m] = np.arange(n, n + m)
+        self.count += m
+        self._sorted = False
+        self._cumulative = None
+
+
+def running_sum(start, values):
+    """ Adds values to start one at a time, in order, as a Python loop would
+
+    Args:
+        start (float): the initial total
+        values ([float]): the values to add
+
+    Returns:
+        float: the total
+    """
+    return float(np.cumsum(np.concatenate(([start], values)))[-1])
 
 
 def aggregate_bid(crv):
@@ -108,9 +180,10 @@ def aggregate_bid(crv):
     """
     unresp = 0
     idx = 0
-    pInd = np.flip(np.argsort(np.array(crv.price)), 0)
-    p = 1000.0 * np.array(crv.price)[pInd]  # $/MW
-    q = 0.001 * np.array(crv.quantity)[pInd]  # MWhr
+    # already descending after set_curve_order, when the stable sort is a single pass
+    pInd = np.argsort(-crv.price, kind='stable')
+    p = 1000.0 * crv.price[pInd]  # $/MW
+    q = 0.001 * crv.quantity[pInd]  # MWhr
     if p.size > 0:
         idx = np.argwhere(p == p[0])[-1][0]
         unresp = np.cumsum(q[:idx + 1])[-1]
@@ -1,12 +1,14 @@
 # Copyright (C) 2017-2023 Battelle Memorial Institute
 # file: hvac_agent.py
-"""Class that controls the responsive thermostat for one house.
+"""Classes that control the responsive thermostats for one house, or many.
 
 Implements the ramp bidding method, with HVAC power as the
 bid quantity, and thermostat setting changes as the response
 mechanism.
 """
 
+import numpy as np
+
 from tesp_support.api.parse_helpers import parse_number, parse_magnitude
 
 
@@ -226,3 +228,164 @@ class hvac:
 
     def set_voltage_from_helics(self, val):
         self.mtr_v = abs(val)
+
+
+class hvac_population:
+    """
+    This agent manages thermostat setpoints and bidding for many houses at once
+
+    Each attribute of the hvac agents is one NumPy column, indexed in the
+    order of the agents given, and the bidding, schedule and price response
+    of hvac are computed for all houses in one pass.
+
+    Args:
+        agents ([hvac]): the hvac agents, whose settings and current state are copied
+
+    Attributes:
+        names ([str]): names of the agents
+        count (int): number of agents
+        ramp_mode (bool array): True where the control mode is CN_RAMP
+        bidding (bool array): True where the control mode is not CN_NONE
+        deadband (float array): thermostat deadbands in deg F
+        offset_limit (float array): maximum allowed changes from the time-scheduled setpoints, in deg F
+        ramp (float array): bidding ramp denominators in multiples of the price standard deviation
+        price_cap (float array): the highest allowed bid prices in $/kwh
+        std_dev (float array): standard deviations of expected price
+        mean (float array): means of the expected price
+        Trange (float array): the allowed ranges of setpoint variation
+        air_temp (float array): current air temperatures of the houses in deg F
+        hvac_kw (float array): most recent non-zero HVAC powers in kW, these will be the bid quantities
+        mtr_v (float array): current line-neutral voltages at the triplex meters
+        hvac_on (bool array): True where the house HVAC is currently running
+        basepoint (float array): the preferred time-scheduled thermostat setpoints in deg F
+        setpoint (float array): the thermostat setpoints, including price response, in deg F
+        bid_price (float array): the current bid prices in $/kwh
+        cleared_price (float array): the cleared market prices in $/kwh
+    """
+
+    def __init__(self, agents):
+        """ Initializes the class
+        """
+        agents = list(agents)
+
+        def column(attr, dtype=float):
+            return np.array([getattr(obj, attr) for obj in agents], dtype=dtype)
+
+        self.names = [obj.name for obj in agents]
+        self.count = len(agents)
+        self.ramp_mode = np.array([obj.control_mode == 'CN_RAMP' for obj in agents], dtype=bool)
+        self.bidding = np.array([obj.control_mode != 'CN_NONE' for obj in agents], dtype=bool)
+        self.wakeup_start = column('wakeup_start')
+        self.daylight_start = column('daylight_start')
+        self.evening_start = column('evening_start')
+        self.night_start = column('night_start')
+        self.wakeup_set = column('wakeup_set')
+        self.daylight_set = column('daylight_set')
+        self.evening_set = column('evening_set')
+        self.night_set = column('night_set')
+        self.weekend_day_start = column('weekend_day_start')
+        self.weekend_day_set = column('weekend_day_set')
+        self.weekend_night_start = column('weekend_night_start')
+        self.weekend_night_set = column('weekend_night_set')
+        self.deadband = column('deadband')
+        self.offset_limit = column('offset_limit')
+        self.ramp = column('ramp')
+        self.price_cap = column('price_cap')
+        self.std_dev = column('std_dev')
+        self.mean = column('mean')
+        self.Trange = column('Trange')
+
+        self.air_temp = column('air_temp')
+        self.hvac_kw = column('hvac_kw')
+        self.mtr_v = column('mtr_v')
+        self.hvac_on = column('hvac_on', bool)
+
+        self.basepoint = column('basepoint')
+        self.setpoint = column('setpoint')
+        self.cleared_price = column('cleared_price')
+        self.bid_price = column('bid_price')
+
+    def inform_bids(self, price):
+        """ Set the cleared_price of every agent
+
+        Args:
+            price (float): cleared price in $/kwh
+        """
+        self.cleared_price[:] = price
+
+    def bids_accepted(self):
+        """ Update the thermostat settings for the last bids, as in hvac.bid_accepted
+
+        Returns:
+            bool array: True where the thermostat setting changes
+        """
+        accepted = self.ramp_mode & (self.std_dev > 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            offset = (self.cleared_price - self.mean) * self.Trange / self.ramp / self.std_dev
+        limit = self.offset_limit
+        offset = np.where(offset < -limit, -limit, np.where(offset > limit, limit, offset))
+        self.setpoint = np.where(accepted, self.basepoint + offset, self.setpoint)
+        return accepted
+
+    def formulate_bids(self):
+        """ Bid to run the air conditioners through the next period, as in hvac.formulate_bid
+
+        The bid prices of agents in CN_NONE mode are left unchanged.
+
+        Returns:
+            bool array, float array, float array, bool array: True where the agent bids, then the bid prices
+            in $/kwh, bid quantities in kW and current HVAC on states of all agents
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = self.mean + (self.air_temp - self.basepoint) * self.ramp * self.std_dev / self.Trange
+        p = np.where(p >= self.price_cap, self.price_cap, np.where(p <= 0.0, 0.0, p))
+        self.bid_price = np.where(self.bidding, p, self.bid_price)
+        return self.bidding, self.bid_price, self.hvac_kw, self.hvac_on
+
+    def change_basepoints(self, hod, dow):
+        """ Updates the time-scheduled thermostat settings
+
+        Args:
+            hod (float): the hour of the day, from 0 to 24
+            dow (int): the day of the week, zero being Monday
+
+        Returns:
+            bool array: True where the setting changed
+        """
+        if dow > 4:  # a weekend
+            val = np.where((self.weekend_day_start <= hod) & (hod < self.weekend_night_start),
+                           self.weekend_day_set, self.weekend_night_set)
+        else:  # a weekday
+            val = np.select([(self.wakeup_start <= hod) & (hod < self.daylight_start),
+                             (self.daylight_start <= hod) & (hod < self.evening_start),
+                             (self.evening_start <= hod) & (hod < self.night_start)],
+                            [self.wakeup_set, self.daylight_set, self.evening_set],
+                            self.night_set)
+        changed = np.abs(self.basepoint - val) > 0.1
+        self.basepoint = np.where(changed, val, self.basepoint)
+        return changed
+
+    def set_from_helics(self, idx, air_temp, hvac_load, hvac_state):
+        """ Sets the air_temp, hvac_kw and hvac_on of some agents, as the hvac set_*_from_helics methods do
+
+        Args:
+            idx ([int]): indices of the agents updated
+            air_temp ([float]): air temperatures in degrees Fahrenheit
+            hvac_load ([float]): HVAC loads in kW, only those greater than zero are kept
+            hvac_state ([str]): HVAC states, ON or OFF
+        """
+        idx = np.asarray(idx, dtype=int)
+        hvac_load = np.asarray(hvac_load, dtype=float)
+        self.air_temp[idx] = air_temp
+        loaded = hvac_load > 0.0
+        self.hvac_kw[idx[loaded]] = hvac_load[loaded]
+        self.hvac_on[idx] = [val != 'OFF' for val in hvac_state]
+
+    def set_voltage_from_helics(self, idx, val):
+        """ Sets the mtr_v of some agents
+
+        Args:
+            idx ([int]): indices of the agents updated
+            val ([complex]): meter line-neutral voltages
+        """
+        self.mtr_v[np.asarray(idx, dtype=int)] = np.abs(np.asarray(val, dtype=complex))
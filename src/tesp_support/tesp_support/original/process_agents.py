@@ -13,6 +13,8 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 
+from tesp_support.api.metrics_reader import read_metrics_file
+
 # Setting up logging
 logger = logging.getLogger(__name__)
 
@@ -51,16 +53,13 @@ def read_agent_metrics(path, name_root, diction_name='', print_dictionary=False)
             print(key, row['houseName'], row['control_mode'], row['daylight_set'], row['ramp'], row['offset_limit'],
                   row['price_cap'])
 
-    # read the auction metrics file
-    lp_a = open(auction_dict_path).read()
-    lst_a = json.loads(lp_a)
-    print('\nAuction Metrics data starting', lst_a['StartTime'])
+    # read the auction metrics file, including the finished periods of a run that stopped early
+    lst_a = read_metrics_file(auction_dict_path, a_keys, partial=True)
+    print('\nAuction Metrics data starting', lst_a['start_time'])
 
     # make a sorted list of the times, and NumPy array of times in hours
-    lst_a.pop('StartTime')
-    meta_a = lst_a.pop('Metadata')
-    times = list(map(int, list(lst_a.keys())))
-    times.sort()
+    meta_a = lst_a['metadata']
+    times = lst_a['times']
     print('There are', len(times), 'sample times at', times[1] - times[0], 'second intervals')
     hrs = np.array(times, dtype=float)
     denom = 3600.0
@@ -87,27 +86,17 @@ def read_agent_metrics(path, name_root, diction_name='', print_dictionary=False)
             idx_a['SUPPLIER_SURPLUS_IDX'] = val['index']
             idx_a['SUPPLIER_SURPLUS_UNITS'] = val['units']
 
-    # create a NumPy array of all auction metrics
-    data_a = np.empty(shape=(len(a_keys), len(times), len(lst_a[str(times[0])][a_keys[0]])), dtype=float)
+    # NumPy array of all auction metrics
+    data_a = lst_a['data']
     print('\nConstructed', data_a.shape, 'NumPy array for Auctions')
-    j = 0
-    for _ in a_keys:
-        i = 0
-        for t in times:
-            ary = lst_a[str(t)][a_keys[j]]
-            data_a[j, i, :] = ary
-            i = i + 1
-        j = j + 1
 
     # read the controller metrics file
-    lp_c = open(controller_dict_path).read()
-    lst_c = json.loads(lp_c)
-    print('\nController Metrics data starting', lst_c['StartTime'])
+    lst_c = read_metrics_file(controller_dict_path, c_keys, partial=True, fill=0.0)
+    print('\nController Metrics data starting', lst_c['start_time'])
 
     # parse the metadata for things of specific interest
     # c_keys = ['house1_R1_12_47_1_tm_507_thermostat_controller']
-    lst_c.pop('StartTime')
-    meta_c = lst_c.pop('Metadata')
+    meta_c = lst_c['metadata']
     # print ('\nController Metadata [Variable Index Units]')
     idx_c = {}
     for key, val in meta_c.items():
@@ -119,21 +108,10 @@ def read_agent_metrics(path, name_root, diction_name='', print_dictionary=False)
             idx_c['BID_Q_IDX'] = val['index']
             idx_c['BID_Q_UNITS'] = val['units']
 
-    # create a NumPy array of all controller metrics - many are 'missing' zero-bids
-    data_c = np.empty(shape=(len(c_keys), len(times), len(meta_c.items())), dtype=float)
+    # create a NumPy array of all controller metrics at the auction times - many are 'missing' zero-bids
+    data_c = np.zeros(shape=(len(c_keys), len(times), len(meta_c.items())), dtype=float)
     print('\nConstructed', data_c.shape, 'NumPy array for Controllers')
-    zary = np.zeros(len(meta_c.items()))
-    j = 0
-    for _ in c_keys:
-        i = 0
-        for t in times:
-            if c_keys[j] in lst_c[str(t)]:
-                ary = lst_c[str(t)][c_keys[j]]
-            else:
-                ary = zary
-            data_c[j, i, :] = ary
-            i = i + 1
-        j = j + 1
+    data_c[:, np.isin(times, lst_c['times']), :] = lst_c['data'][:, np.isin(lst_c['times'], times), :]
 
     # identify the controller that put in the highest bid
     cidx = 0
@@ -21,7 +21,43 @@ I think we should refactor this so that these assumptions are not so
 tightly integrated with the formulation.
 
 """
-from tesp_support.original.curve import ClearingType, curve, aggregate_bid
+import numpy as np
+
+from tesp_support.original.curve import ClearingType, curve, aggregate_bid, running_sum
+
+
+def _masked_sum(values, mask):
+    """ Sums values where mask is True, adding them in order as a running total would
+    """
+    if values.size == 0:
+        return 0.0
+    return float(np.cumsum(np.where(mask, values, 0.0))[-1])
+
+
+def _leading(mask):
+    """ Number of leading True entries in mask
+    """
+    return mask.size if mask.all() else int(np.argmin(mask))
+
+
+def _marginal_split(crv, clearing_quantity, clearing_price):
+    """ Splits off the quantity of the marginal bids at the clearing price
+
+    Args:
+        crv (curve): the marginal side of the market
+        clearing_quantity (float): quantity at the market clearing
+        clearing_price (float): price at the market clearing
+
+    Returns:
+        float, float: the quantity left for the marginal bids and their total quantity
+    """
+    price = crv.price
+    total = crv.cumulative_quantity()
+    i = _leading(price > clearing_price)
+    subtotal = total[i - 1] if i > 0 else 0
+    n = _leading(price[i:] == clearing_price)
+    marginal_total = _masked_sum(crv.quantity[i:i + n], True)
+    return clearing_quantity - subtotal, marginal_total
 
 
 # Class definition
@@ -176,6 +212,21 @@ class simple_auction:
         if price > 0.0:
             self.curve_buyer.add_to_curve(price, quantity, is_on)
 
+    def collect_bids(self, price, quantity, is_on):
+        """ Gather many HVAC bids into curve_buyer, as collect_bid does for each
+
+        Args:
+            price ([float]): prices in $/kwh
+            quantity ([float]): quantities in kW
+            is_on ([bool]): the HVAC on states
+        """
+        price = np.asarray(price, dtype=float)
+        quantity = np.asarray(quantity, dtype=float)
+        is_on = np.asarray(is_on, dtype=bool)
+        self.unresp = running_sum(self.unresp, -quantity[is_on])
+        positive = price > 0.0
+        self.curve_buyer.add_bids(price[positive], quantity[positive], is_on[positive])
+
     def add_unresponsive_load(self, quantity):
         self.unresp += quantity
 
@@ -221,47 +272,50 @@ class simple_auction:
             a = self.price_cap
             b = -self.price_cap
             check = 0
-            demand_quantity = supply_quantity = 0
-            for i in range(self.curve_seller.count):
-                if self.curve_seller.price[i] == self.price_cap:
-                    self.unresponsive_sell += self.curve_seller.quantity[i]
-                else:
-                    self.responsive_sell += self.curve_seller.quantity[i]
-            for i in range(self.curve_buyer.count):
-                if self.curve_buyer.price[i] == self.price_cap:
-                    self.unresponsive_buy += self.curve_buyer.quantity[i]
-                else:
-                    self.responsive_buy += self.curve_buyer.quantity[i]
+            buy_price = self.curve_buyer.price
+            sell_price = self.curve_seller.price
+            buy_total = self.curve_buyer.cumulative_quantity()
+            sell_total = self.curve_seller.cumulative_quantity()
+            self.unresponsive_sell = _masked_sum(self.curve_seller.quantity, sell_price == self.price_cap)
+            self.responsive_sell = _masked_sum(self.curve_seller.quantity, sell_price != self.price_cap)
+            self.unresponsive_buy = _masked_sum(self.curve_buyer.quantity, buy_price == self.price_cap)
+            self.responsive_buy = _masked_sum(self.curve_buyer.quantity, buy_price != self.price_cap)
             # Calculate clearing quantity and price here
             # Define the section number of the buyer and the seller curves respectively as i and j
-            i = j = 0
+            # With positive bid quantities, walking down the buyers and up the sellers uses up whichever bid has the smaller
+            # cumulative quantity, or both when they are equal, so after using up everything to
+            # quantity v the walk is at i = #(buy_total <= v), j = #(sell_total <= v). It stops
+            # at the first of those positions that runs off a curve or where the prices cross.
+            reached = np.union1d(buy_total, sell_total)
+            walk_i = np.concatenate(([0], np.searchsorted(buy_total, reached, side='right')))
+            walk_j = np.concatenate(([0], np.searchsorted(sell_total, reached, side='right')))
+            live = (walk_i < self.curve_buyer.count) & (walk_j < self.curve_seller.count)
+            live[live] = buy_price[walk_i[live]] >= sell_price[walk_j[live]]
+            steps = int(np.argmin(live))
+            i = int(walk_i[steps])
+            j = int(walk_j[steps])
+            demand_quantity = float(buy_total[i - 1]) if i > 0 else 0
+            supply_quantity = float(sell_total[j - 1]) if j > 0 else 0
             self.clearing_type = ClearingType.NULL
             self.clearing_quantity = self.clearing_price = 0
-            while i < self.curve_buyer.count and j < self.curve_seller.count and \
-                    self.curve_buyer.price[i] >= self.curve_seller.price[j]:
-                buy_quantity = demand_quantity + self.curve_buyer.quantity[i]
-                sell_quantity = supply_quantity + self.curve_seller.quantity[j]
+            if steps > 0:
+                last_i = int(walk_i[steps - 1])
+                last_j = int(walk_j[steps - 1])
                 # If marginal buyer currently:
-                if buy_quantity > sell_quantity:
-                    self.clearing_quantity = supply_quantity = sell_quantity
-                    a = b = self.curve_buyer.price[i]
-                    j += 1
-                    check = 0
+                if i == last_i:
+                    self.clearing_quantity = supply_quantity
+                    a = b = float(buy_price[last_i])
                     self.clearing_type = ClearingType.BUYER
                 # If marginal seller currently:
-                elif buy_quantity < sell_quantity:
-                    self.clearing_quantity = demand_quantity = buy_quantity
-                    a = b = self.curve_seller.price[j]
-                    i += 1
-                    check = 0
+                elif j == last_j:
+                    self.clearing_quantity = demand_quantity
+                    a = b = float(sell_price[last_j])
                     self.clearing_type = ClearingType.SELLER
-                # Buy quantity equal sell quantity but price split  
+                # Buy quantity equal sell quantity but price split
                 else:
-                    self.clearing_quantity = demand_quantity = supply_quantity = buy_quantity
-                    a = self.curve_buyer.price[i]
-                    b = self.curve_seller.price[j]
-                    i += 1
-                    j += 1
+                    self.clearing_quantity = demand_quantity
+                    a = float(buy_price[last_i])
+                    b = float(sell_price[last_j])
                     check = 1
             # End of the curve comparison, and if EXACT, get the clear price
             if a == b:
@@ -400,36 +454,14 @@ class simple_auction:
         # Calculation of the marginal 
         marginal_total = self.marginal_quantity = self.marginal_frac = 0.0
         if self.clearing_type == ClearingType.BUYER:
-            marginal_subtotal = 0
-            i = 0
-            for i in range(self.curve_buyer.count):
-                if self.curve_buyer.price[i] > self.clearing_price:
-                    marginal_subtotal = marginal_subtotal + self.curve_buyer.quantity[i]
-                else:
-                    break
-            self.marginal_quantity = self.clearing_quantity - marginal_subtotal
-            for j in range(i, self.curve_buyer.count):
-                if self.curve_buyer.price[i] == self.clearing_price:
-                    marginal_total += self.curve_buyer.quantity[i]
-                else:
-                    break
+            self.marginal_quantity, marginal_total = _marginal_split(self.curve_buyer, self.clearing_quantity,
+                                                                     self.clearing_price)
             if marginal_total > 0.0:
                 self.marginal_frac = float(self.marginal_quantity) / marginal_total
 
         elif self.clearing_type == ClearingType.SELLER:
-            marginal_subtotal = 0
-            i = 0
-            for i in range(0, self.curve_seller.count):
-                if self.curve_seller.price[i] > self.clearing_price:
-                    marginal_subtotal = marginal_subtotal + self.curve_seller.quantity[i]
-                else:
-                    break
-            self.marginal_quantity = self.clearing_quantity - marginal_subtotal
-            for j in range(i, self.curve_seller.count):
-                if self.curve_seller.price[i] == self.clearing_price:
-                    marginal_total += self.curve_seller.quantity[i]
-                else:
-                    break
+            self.marginal_quantity, marginal_total = _marginal_split(self.curve_seller, self.clearing_quantity,
+                                                                     self.clearing_price)
             if marginal_total > 0.0:
                 self.marginal_frac = float(self.marginal_quantity) / marginal_total
 
@@ -456,32 +488,21 @@ class simple_auction:
             tnext_clear (int): next clearing time in seconds, should be <= time_granted, for the log file only
             time_granted (int): the current time in seconds, for the log file only
         """
-        numberOfUnrespBuyerAboveClearingPrice = 0
-        numberOfResponsiveBuyerAboveClearingPrice = 0
         self.supplierSurplus = 0.0
         self.averageConsumerSurplus = 0.0
-        self.consumerSurplus = 0.0
         self.unrespSupplierSurplus = 0.0
-        grantedRespQuantity = 0.0
-        grantedUnrespQuantity = 0.0
-        declinedQuantity = 0.0
-        # assuming the buyers are ordered descending by price
-        for i in range(self.curve_buyer.count):
-            # if a buyer pays higher than clearing_price, the power is granted
-            if self.curve_buyer.price[i] >= self.clearing_price:
-                # unresponsive load, they pay infinite amount price, here it is set at self.price_cap
-                if self.curve_buyer.price[i] == self.price_cap:
-                    grantedUnrespQuantity += self.curve_buyer.quantity[i]
-                    numberOfUnrespBuyerAboveClearingPrice += 1
-                # responsive load, this is the part consumer surplus is calculated
-                else:
-                    grantedRespQuantity += self.curve_buyer.quantity[i]
-                    numberOfResponsiveBuyerAboveClearingPrice += 1
-                    self.consumerSurplus += \
-                        (self.curve_buyer.price[i] - self.clearing_price) * self.curve_buyer.quantity[i]
-            # if a buy pays lower than clearing_price, it does not get the quantity requested
-            else:
-                declinedQuantity += self.curve_buyer.quantity[i]
+        # if a buyer pays higher than clearing_price, the power is granted
+        buy_price = self.curve_buyer.price
+        buy_quantity = self.curve_buyer.quantity
+        granted = buy_price >= self.clearing_price
+        # unresponsive load, they pay infinite amount price, here it is set at self.price_cap
+        unresp = granted & (buy_price == self.price_cap)
+        grantedUnrespQuantity = _masked_sum(buy_quantity, unresp)
+        # responsive load, this is the part consumer surplus is calculated
+        resp = granted & (buy_price != self.price_cap)
+        grantedRespQuantity = _masked_sum(buy_quantity, resp)
+        numberOfResponsiveBuyerAboveClearingPrice = int(np.count_nonzero(resp))
+        self.consumerSurplus = _masked_sum((buy_price - self.clearing_price) * buy_quantity, resp)
         if numberOfResponsiveBuyerAboveClearingPrice != 0:
             self.averageConsumerSurplus = self.consumerSurplus / numberOfResponsiveBuyerAboveClearingPrice
         # assuming the sellers are ordered ascending by their price
@@ -21,6 +21,7 @@ from tesp_support.api.parse_helpers import parse_magnitude, parse_kw
 from .hvac_agent import hvac
 from .simple_auction import simple_auction
 from tesp_support.api.bench_profile import bench_profile
+from tesp_support.api.metrics_reader import MetricsJsonWriter
 
 
 @bench_profile
@@ -28,7 +29,8 @@ def substation_loop_f(configfile, metrics_root, hour_stop=48, flag='WithMarket')
     """ Helper function that initializes and runs the agents
 
     Reads configfile. Writes *auction_metrics_root_metrics.json* and
-    *controller_metrics_root_metrics.json* upon completion.
+    *controller_metrics_root_metrics.json* one market period at a time,
+    so they hold every finished period if the federate stops early.
 
     Args:
         configfile (str): fully qualified path to the JSON agent configuration file
@@ -64,8 +66,8 @@ def substation_loop_f(configfile, metrics_root, hour_stop=48, flag='WithMarket')
                     'average_consumer_surplus': {'units': 'USD', 'index': 3},
                     'supplier_surplus': {'units': 'USD', 'index': 4}}
     controller_meta = {'bid_price': {'units': 'USD', 'index': 0}, 'bid_quantity': {'units': unit, 'index': 1}}
-    auction_metrics = {'Metadata': auction_meta, 'StartTime': StartTime}
-    controller_metrics = {'Metadata': controller_meta, 'StartTime': StartTime}
+    auction_metrics = MetricsJsonWriter('auction_' + metrics_root + '_metrics.json', auction_meta, StartTime)
+    controller_metrics = MetricsJsonWriter('controller_' + metrics_root + '_metrics.json', controller_meta, StartTime)
 
     aucObj = simple_auction(market_row, market_key)
 
@@ -156,13 +158,14 @@ def substation_loop_f(configfile, metrics_root, hour_stop=48, flag='WithMarket')
         if time_granted >= tnext_bid:
             aucObj.clear_bids()
             time_key = str(int(tnext_clear))
-            controller_metrics[time_key] = {}
+            bids = {}
             for key, obj in hvacObjs.items():
                 bid = obj.formulate_bid()  # bid is [price, quantity, on_state]
                 if bid is not None:
                     if bWantMarket:
                         aucObj.collect_bid(bid)
-                    controller_metrics[time_key][obj.name] = [bid[0], bid[1]]
+                    bids[obj.name] = [bid[0], bid[1]]
+            controller_metrics.add_sample(time_key, bids)
             tnext_bid += period
             # print('  COLLECT BIDS', flush=True)
 
@@ -184,9 +187,9 @@ def substation_loop_f(configfile, metrics_root, hour_stop=48, flag='WithMarket')
                 for key, obj in hvacObjs.items():
                     obj.inform_bid(aucObj.clearing_price)
             time_key = str(int(tnext_clear))
-            auction_metrics[time_key] = {
+            auction_metrics.add_sample(time_key, {
                 aucObj.name: [aucObj.clearing_price, aucObj.clearing_type, aucObj.consumerSurplus,
-                              aucObj.averageConsumerSurplus, aucObj.supplierSurplus]}
+                              aucObj.averageConsumerSurplus, aucObj.supplierSurplus]})
             tnext_clear += period
             # print('  CLEARED MARKET', flush=True)
 
@@ -202,11 +205,7 @@ def substation_loop_f(configfile, metrics_root, hour_stop=48, flag='WithMarket')
     # ==================== Finalize the metrics output ===========================
 
     print('writing metrics', flush=True)
-    auction_op = open('auction_' + metrics_root + '_metrics.json', 'w')
-    controller_op = open('controller_' + metrics_root + '_metrics.json', 'w')
-    print(json.dumps(auction_metrics), file=auction_op)
-    print(json.dumps(controller_metrics), file=controller_op)
-    auction_op.close()
-    controller_op.close()
+    auction_metrics.close()
+    controller_metrics.close()
     print('finalizing FNCS', flush=True)
     fncs.finalize()
@@ -2,11 +2,15 @@
 # See LICENSE file at https://github.com/pnnl/tesp
 # file: forecast.py
 
-import random
+import base64
+import json
 
 import numpy
 from scipy.stats import truncnorm
 
+# marks a forecast payload packed by encodeForecast, the rest is base64 of little-endian float64 values
+PACKED_FORECAST = '@f8'
+
 
 def convertTimeToSeconds(time):
     """ Convert time string with unit to integer in seconds
@@ -83,6 +87,36 @@ def findDeltaTimeMultiplier(time):
         raise Exception("unrecognized time unit '" + unit + "'.")
 
 
+def encodeForecast(data):
+    """ Pack forecast values into a compact string payload
+
+    The values follow each other hourly from the publish time, so no timestamps are sent.
+
+    Args:
+        data (float) (1 x number of hours ahead): forecast values
+    Returns:
+        str: payload starting with PACKED_FORECAST
+    """
+    packed = numpy.asarray(data, dtype='<f8').tobytes()
+    return PACKED_FORECAST + base64.b64encode(packed).decode('ascii')
+
+
+def decodeForecast(payload):
+    """ Read the forecast values from a weather agent payload
+
+    Accepts both the packed payload of encodeForecast and the JSON dictionary of values keyed by time.
+
+    Args:
+        payload (str): forecast as published by the weather agent
+    Returns:
+        list: forecast values in time order
+    """
+    if payload.startswith(PACKED_FORECAST):
+        return numpy.frombuffer(base64.b64decode(payload[len(PACKED_FORECAST):]), dtype='<f8').tolist()
+    values = json.loads(payload)
+    return [float(values[key]) for key in values.keys()]
+
+
 """Class that includes error to the known Weather data 
 
 Implements the range of values the errors are randomly selected. The range is time
@@ -117,9 +151,10 @@ class weather_forecast:
         # Bias variable
         biasM (float) (1 X period): sinusoidal bias for altering the error envelope
         Period_bias (int): period of the sinusoidal bias
+        rng (numpy.random.Generator): random generator for the errors, seed it for reproducible forecasts
     """
 
-    def __init__(self, variable, period, W_dict):
+    def __init__(self, variable, period, W_dict, rng=None):
         """ Initializes the class
         """
         self.weather_variable = variable
@@ -133,6 +168,8 @@ class weather_forecast:
         self.P_e_bias = W_dict[variable]["P_e_bias"]
         self.P_e_envelope = W_dict[variable]["P_e_envelope"]
         self.Lower_e_bound = W_dict[variable]["Lower_e_bound"]
+        # accepts a seed, a Generator to share between variables, or None for a fresh one
+        self.rng = numpy.random.default_rng(rng)
 
     def get_truncated_normal(self, EL, EH):
         """
@@ -144,49 +181,64 @@ class weather_forecast:
             return 0.0
         a = (EL - mean) / sd
         b = (EH - mean) / sd
-        sample = truncnorm.rvs(a, b, loc=mean, scale=sd, size=1)[0]
+        sample = truncnorm.rvs(a, b, loc=mean, scale=sd, size=1, random_state=self.rng)[0]
         return sample
 
+    def sample_error(self, EL, EH):
+        """ Draw one error for every pair of bounds at once
+
+        Args:
+            EL (float) (array): lower bounds of the error
+            EH (float) (array): upper bounds of the error
+
+        Returns:
+            error (float) (array): errors with the shape of the bounds
+        """
+        EL = numpy.asarray(EL, dtype=float)
+        EH = numpy.asarray(EH, dtype=float)
+        if self.distribution == 0:  # uniform
+            return self.rng.uniform(EL, EH)
+        elif self.distribution == 1:  # triangular, with the mode in the middle as random.triangular
+            u = self.rng.random(EL.shape)
+            width = EH - EL
+            return numpy.where(u <= 0.5, EL + width * numpy.sqrt(u * 0.5), EH - width * numpy.sqrt((1.0 - u) * 0.5))
+        elif self.distribution == 2:  # truncated normal 95%
+            mean = (EL + EH) / 2
+            sd = (numpy.abs(EL) + numpy.abs(EH)) / 4  # 95% of values are within bounds remaining is truncated
+            valid = sd > 0.0
+            sd = numpy.where(valid, sd, 1.0)
+            a = numpy.where(valid, (EL - mean) / sd, -1.0)
+            b = numpy.where(valid, (EH - mean) / sd, 1.0)
+            sample = truncnorm.rvs(a, b, loc=mean, scale=sd, size=EL.shape, random_state=self.rng)
+            return numpy.where(valid, sample, 0.0)
+        return numpy.zeros(EL.shape)
+
     def make_forecast(self, weather, t=0):
         """ Include error to a known weather variable
 
+        Every hour, and every forecast when weather is 2-D, is sampled in one call.
+
         Args:
-            weather (float) (1 x desired number of hours ahead): known weather variable
+            weather (float) (1 x desired number of hours ahead): known weather variable,
+                or (number of forecasts x desired number of hours ahead) to make many forecasts at once
             t (int): time in hours
 
         Returns:
             weather_f (float) (1 x desired number of hours ahead): weather variable with included error
-            ENV_U (float) (1 x desired number of hours ahead): envelope with bias upper bound
-            ENV_l (float) (1 x desired number of hours ahead): envelope with bias lower bound
 
         """
+        weather = numpy.asarray(weather, dtype=float)
+        n = weather.shape[-1]
         ############## Making the error envelope
-        scale = numpy.linspace(self.Lower_e_bound, 1, num=len(weather))  # error increases true time
-        envelope = scale * numpy.mean(weather) * self.P_e_envelope
+        scale = numpy.linspace(self.Lower_e_bound, 1, num=n)  # error increases true time
+        envelope = scale * numpy.mean(weather, axis=-1, keepdims=True) * self.P_e_envelope
         ############## Including a bias to the envelope
-        bias = self.biasM * (min(envelope) * 2 * self.P_e_bias)
-        bias = numpy.roll(bias, -t)
-        ############## making the error array
-        n = len(weather)
-        error = numpy.zeros(n)
+        bias = numpy.roll(self.biasM, -t)[:n] * (numpy.min(envelope, axis=-1, keepdims=True) * 2 * self.P_e_bias)
+        ############## the bias displaces one side of the envelope
+        positive = bias > 0
+        ENV_l = numpy.where(positive, -envelope + bias, -envelope)
+        ENV_U = numpy.where(positive, envelope, envelope + bias)
         ############## sampling the error distribution
-        ENV_l = list()
-        ENV_U = list()
-        for i in range(n):
-            if bias[i] > 0:
-                EL = -envelope[i] + bias[i]
-                EH = envelope[i]
-            else:
-                EL = -envelope[i]
-                EH = envelope[i] + bias[i]
-            ENV_l.append(EL)
-            ENV_U.append(EH)
-            if self.distribution == 0:  # uniform
-                error[i] = random.uniform(EL, EH)
-            elif self.distribution == 1:  # triangular
-                error[i] = random.triangular(EL, EH)
-            elif self.distribution == 2:  # truncated normal 95%
-                error[i] = self.get_truncated_normal(EL, EH)
-
+        error = self.sample_error(ENV_l, ENV_U)
         weather_f = error + weather
         return weather_f
@@ -12,10 +12,83 @@ import sys
 from datetime import datetime
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 
 import helics
-from tesp_support.weather.forecast import convertTimeToSeconds, weather_forecast
+from tesp_support.weather.forecast import convertTimeToSeconds, encodeForecast, weather_forecast
+
+# columns whose small values, left by resampling, are set to zero
+clampedColumns = ['solar_direct', 'solar_diffuse', 'wind_speed', 'humidity', 'pressure']
+
+
+def publishTimeline(timeStopInSeconds, publishIntervalInSeconds, publishTimeAhead, forecast):
+    """ Find all the time points that weather data need to be published for
+
+    Args:
+        timeStopInSeconds (int): simulation stop time in seconds
+        publishIntervalInSeconds (int): interval of the real time data in seconds
+        publishTimeAhead (int): how long before its time the data is published, in seconds
+        forecast (int): 1 if the hourly forecasts are published
+
+    Returns:
+        dict: arrays with one entry per publication, 'time' the time the data is for, 'request' the time to
+        request from HELICS to publish it, 'realtime' and 'forecast' masks of what is published then
+    """
+    # real time need to publish
+    realtime = np.arange(0, timeStopInSeconds + 1, publishIntervalInSeconds, dtype=np.int64)
+    if forecast == 1:
+        # time need to publish forecast, which is on the hour
+        hourly = np.arange(0, timeStopInSeconds + 1, 3600, dtype=np.int64)
+    else:
+        hourly = np.zeros(0, dtype=np.int64)
+    # combine real time and forecast time, sorted
+    times = np.union1d(realtime, hourly)
+    return {'time': times,
+            # each time point to publish pairs with the time point its data is for
+            'request': np.maximum(times - publishTimeAhead, 0),
+            'realtime': np.isin(times, realtime),
+            'forecast': np.isin(times, hourly)}
+
+
+def precomputeForecasts(hourlyWeatherData, forecastStarts, forecastLength, forecasters=None):
+    """ Make every hourly forecast of the simulation up front
+
+    The forecast windows of all the publish times are sliced from the hourly data at once, and when
+    forecasters are given their errors are sampled for all the windows of a variable in one call.
+
+    Args:
+        hourlyWeatherData (DataFrame): hourly weather data with a datetime index
+        forecastStarts (DatetimeIndex): start time of each forecast
+        forecastLength (int): length of each forecast in seconds
+        forecasters (dict): weather_forecast object for each column, None to publish the data without error
+
+    Returns:
+        tuple: first row of each forecast in hourlyWeatherData (array), number of rows of each forecast (array),
+        and the forecast values for each column (dict of 2-D arrays, one row per forecast)
+    """
+    index = hourlyWeatherData.index
+    first = index.searchsorted(forecastStarts)
+    lengths = index.searchsorted(forecastStarts + pd.Timedelta(seconds=forecastLength)) - first
+    window = max(int(lengths.max()), 1) if len(lengths) > 0 else 1
+    full = lengths == window
+    forecasts = {}
+    for col in hourlyWeatherData.columns:
+        values = hourlyWeatherData[col].to_numpy(dtype=float)
+        if col in clampedColumns:
+            values = np.where(values < 1e-4, 0.0, values)
+        # pad so the windows at the end of the data can be sliced too
+        padded = np.concatenate([values, np.full(window, np.nan)])
+        data = np.lib.stride_tricks.sliding_window_view(padded, window)[first].copy()
+        if forecasters is not None:
+            data[full] = forecasters[col].make_forecast(data[full], window)
+            for k in np.flatnonzero(~full):
+                data[k, :lengths[k]] = forecasters[col].make_forecast(data[k, :lengths[k]], int(lengths[k]))
+        if col != "temperature":
+            data[data < 1e-4] = 0
+        forecasts[col] = data
+    return first, lengths, forecasts
+
 
 def startWeatherAgent(file):
     """ The weather agent publishes weather data as configured by the json file
@@ -26,11 +99,19 @@ def startWeatherAgent(file):
     # read the weather data file, arguments to mimic deprecated from_csv function
     weatherData = pd.read_csv(file, index_col=0, parse_dates=True)
     broker_address = None
+    # optional, a seed makes the forecast errors the same from run to run
+    forecastSeed = None
+    precomputeForecast = 0
+    # 'packed' publishes the forecast values as a compact string instead of json keyed by time
+    forecastPayload = 'json'
     config = os.environ['WEATHER_CONFIG']  # read the weather config json file
     if os.path.isfile(config):
         with open(config, 'r') as stream:
             try:
                 conf = json.load(stream)
+                forecastSeed = conf.get('ForecastSeed', None)
+                precomputeForecast = conf.get('PrecomputeForecast', 0)
+                forecastPayload = conf.get('ForecastPayload', 'json')
                 agentName = conf['name']
                 broker = conf['broker']
                 timeStop = conf['time_stop']
@@ -73,26 +154,35 @@ def startWeatherAgent(file):
     hourlyWeatherData = weatherData.resample('60min').mean()
 
     # find all the time point that the data at that time need to be published
-    timeNeedToPublishRealtime = [0]
-    timeNeedToPublishForecast = [0]
-    # real time need to publish
-    numberOfRealtimeBroadcast = timeStopInSeconds // publishIntervalInSeconds + 1
-    for i in range(1, numberOfRealtimeBroadcast):
-        timeNeedToPublishRealtime.append(i * publishIntervalInSeconds)
-    if forecast == 1:
-        # time need to publish forecast, which is on the hour
-        numberOfForecast = timeStopInSeconds // 3600 + 1
-        for i in range(1, numberOfForecast):
-            timeNeedToPublishForecast.append(i * 3600)
-        # combine real time and forecast time
-        timeNeedToBePublished = list(set([0] + timeNeedToPublishRealtime + timeNeedToPublishForecast))
-    else:
-        timeNeedToBePublished = timeNeedToPublishRealtime
-    timeNeedToBePublished.sort()
+    timeline = publishTimeline(timeStopInSeconds, publishIntervalInSeconds, publishTimeAhead, forecast)
+    timeNeedToBePublished = timeline['time']
+    timeNeedToPublish = timeline['request']
+    timeNeedToPublishForecast = timeNeedToBePublished[timeline['forecast']]
+
+    # row of every real time publication, with the improper values generated by interpolation removed
+    realtimeColumns = list(weatherData2.columns)
+    realtimeValues = weatherData2.to_numpy(dtype=float, copy=True)
+    for j, key in enumerate(realtimeColumns):
+        if key != "temperature":
+            realtimeValues[realtimeValues[:, j] < 1e-4, j] = 0
+    realtimeRows = weatherData2.index.get_indexer(
+        dtStart + pd.to_timedelta(timeNeedToBePublished[timeline['realtime']], unit='s'))
+    if (realtimeRows < 0).any():
+        raise KeyError('no weather data at ' +
+                       str(dtStart + timedelta(seconds=int(timeNeedToBePublished[timeline['realtime']][realtimeRows < 0][0]))))
 
-    # find all the time point that need to publish weather data,
-    # each time point in this list pairs with each time point in timeNeedToBePublished list
-    timeNeedToPublish = [(i - publishTimeAhead) if (i - publishTimeAhead) >= 0 else 0 for i in timeNeedToBePublished]
+    # one forecaster per weather variable for the whole run, all drawing from the same generator
+    forecasters = None
+    if forecast == 1 and addErrorToForecast == 1:
+        rng = np.random.default_rng(forecastSeed)
+        forecasters = {col: weather_forecast(col, forecastPeriod * 2, forecastParameters, rng)
+                       for col in hourlyWeatherData.columns}
+    precomputed = None
+    if forecast == 1 and precomputeForecast == 1:
+        forecastStarts = pd.DatetimeIndex(dtStart + pd.to_timedelta(timeNeedToPublishForecast, unit='s'))
+        precomputed = precomputeForecasts(hourlyWeatherData, forecastStarts, forecastLength, forecasters)
+        print('precomputed', len(forecastStarts), 'forecasts', flush=True)
+    forecastIndex = 0
 
     # other weather agents could be initializing from FNCS.zpl, so we might have a race condition
     #  file locking didn't work, because fncs.initialize() doesn't return until broker hears from all other simulators
@@ -117,42 +207,52 @@ def startWeatherAgent(file):
     print('HELICS initialized to publish', hPubs, flush=True)
 
     time_granted = 0
+    realtimeIndex = 0
     for i in range(len(timeNeedToPublish)):
         if i > 0:
-            timeToRequest = timeNeedToPublish[i]
+            timeToRequest = int(timeNeedToPublish[i])
             time_granted = int(helics.helicsFederateRequestTime(hFed, timeToRequest))
-        if timeNeedToBePublished[i] in timeNeedToPublishRealtime:
+        if timeline['realtime'][i]:
             # find the data by the time point and publish them
-            row = weatherData2.loc[dtStart + timedelta(seconds=timeNeedToBePublished[i])]
-            # print('publishing at ' + str(dtStart + timedelta(seconds=timeNeedToPublish[i])) +
-            #       ' for weather at ' + str(dtStart + timedelta(seconds=timeNeedToBePublished[i])), flush=True)
-            for key, value in row.items():
-                # remove the improper value generated by interpolation
-                if key != "temperature" and value < 1e-4:
-                    value = 0
+            row = realtimeValues[realtimeRows[realtimeIndex]]
+            realtimeIndex += 1
+            # print('publishing at ' + str(dtStart + timedelta(seconds=int(timeNeedToPublish[i]))) +
+            #       ' for weather at ' + str(dtStart + timedelta(seconds=int(timeNeedToBePublished[i]))), flush=True)
+            for key, value in zip(realtimeColumns, row.tolist()):
                 helics.helicsPublicationPublishDouble(hPubs[key], value)
         # if forecasting needed and the time is on the hour
-        if forecast == 1 and timeNeedToBePublished[i] in timeNeedToPublishForecast:
-            print('forecasting at ' + str(dtStart + timedelta(seconds=timeNeedToPublish[i])) +
-                  ' for weather starting from ' + str(dtStart + timedelta(seconds=timeNeedToBePublished[i])),
-                  flush=True)
-            forecastStart = dtStart + timedelta(seconds=timeNeedToBePublished[i])
-            forecastEnd = dtStart + timedelta(seconds=forecastLength) + timedelta(seconds=timeNeedToBePublished[i])
-            # find the data by forecast starting and ending time, should be multiple data point for each weather factor
-            rows = hourlyWeatherData.loc[
-                (hourlyWeatherData.index >= forecastStart) & (hourlyWeatherData.index < forecastEnd)].copy()
-            rows.loc[rows.solar_direct < 1e-4, 'solar_direct'] = 0
-            rows.loc[rows.solar_diffuse < 1e-4, 'solar_diffuse'] = 0
-            rows.loc[rows.wind_speed < 1e-4, 'wind_speed'] = 0
-            rows.loc[rows.humidity < 1e-4, 'humidity'] = 0
-            rows.loc[rows.pressure < 1e-4, 'pressure'] = 0
-            for col in rows.columns:
-                data = rows[col].values
+        if forecast == 1 and timeline['forecast'][i]:
+            publishedFor = dtStart + timedelta(seconds=int(timeNeedToBePublished[i]))
+            print('forecasting at ' + str(dtStart + timedelta(seconds=int(timeNeedToPublish[i]))) +
+                  ' for weather starting from ' + str(publishedFor), flush=True)
+            if precomputed is not None:
+                # slice the forecast made before the loop
+                first, lengths, forecasts = precomputed
+                rowRange = slice(first[forecastIndex], first[forecastIndex] + lengths[forecastIndex])
+                rows = {col: forecasts[col][forecastIndex, :lengths[forecastIndex]] for col in forecasts}
+                times = hourlyWeatherData.index[rowRange]
+            else:
+                forecastStart = publishedFor
+                forecastEnd = publishedFor + timedelta(seconds=forecastLength)
+                # find the data by forecast starting and ending time, should be multiple data point for each weather factor
+                rows = hourlyWeatherData.loc[
+                    (hourlyWeatherData.index >= forecastStart) & (hourlyWeatherData.index < forecastEnd)].copy()
+                for col in clampedColumns:
+                    rows.loc[rows[col] < 1e-4, col] = 0
                 times = rows.index
-                # if user wants to add error to the forecasted data to mimic weather forecast
-                if addErrorToForecast == 1:
-                    WF_obj = weather_forecast(col, forecastPeriod * 2, forecastParameters)  # make object
-                    data = WF_obj.make_forecast(data, len(data))
+            forecastIndex += 1
+            for col in rows:
+                data = rows[col]
+                if precomputed is None:
+                    data = data.to_numpy(copy=True)
+                    # if user wants to add error to the forecasted data to mimic weather forecast
+                    if addErrorToForecast == 1:
+                        data = forecasters[col].make_forecast(data, len(data))
+                if forecastPayload == 'packed':
+                    if col != "temperature":
+                        data = np.where(data < 1e-4, 0.0, data)
+                    helics.helicsPublicationPublishString(hPubs[col + '/forecast'], encodeForecast(data))
+                    continue
                 wd = dict()
                 # convert data to a dictionary with time as the key, so it can be published as json string
                 for v in range(len(data)):
@@ -163,7 +263,7 @@ def startWeatherAgent(file):
                 helics.helicsPublicationPublishString(hPubs[col + '/forecast'], json.dumps(wd))
 
     # if the last time step/stop time is not requested
-    if timeStopInSeconds not in timeNeedToPublish:
+    if not (timeNeedToPublish == timeStopInSeconds).any():
         time_granted = int(helics.helicsFederateRequestTime(hFed, timeStopInSeconds))
 
     print('finalizing HELICS', flush=True)